@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Account fan-out helpers for AWS Organizations.
+- CredentialCache: sts assume-role per member account, reused until shortly before expiry
+- run_across_accounts: runs a collector over accounts x regions on one bounded pool
+Credentials are applied through common.aws_env, so every backend (CLI or in-process) picks them up.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from common import aws_base, aws_env, ensure_region, iter_paginate, resolve_regions, shell_json
+
+
+@dataclass(frozen=True)
+class Credentials:
+    access_key_id: str
+    secret_access_key: str
+    session_token: str
+    expiration: float  # epoch seconds
+
+    def env(self) -> Dict[str, str]:
+        return {
+            "AWS_ACCESS_KEY_ID": self.access_key_id,
+            "AWS_SECRET_ACCESS_KEY": self.secret_access_key,
+            "AWS_SESSION_TOKEN": self.session_token,
+        }
+
+
+def _epoch(value: Any) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+class CredentialCache:
+    """
+    Assumes `role_name` in each account on first use and hands out the cached credentials until they are
+    within `refresh_margin` seconds of expiring. Concurrent requests for the same account share one
+    assume-role call; different accounts proceed in parallel.
+    `sts_endpoint_url` and `clock` exist so a local stand-in STS and a fake clock can drive it.
+    """
+
+    def __init__(
+        self,
+        role_name: str,
+        session_name: str = "aws-cost-optimization",
+        duration_seconds: int = 3600,
+        refresh_margin: float = 300.0,
+        external_id: Optional[str] = None,
+        sts_endpoint_url: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.role_name = role_name
+        self.session_name = session_name
+        self.duration_seconds = duration_seconds
+        self.refresh_margin = refresh_margin
+        self.external_id = external_id
+        self.sts_endpoint_url = sts_endpoint_url
+        self.clock = clock
+        self._creds: Dict[str, Credentials] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self.assume_calls = 0
+
+    def role_arn(self, account_id: str) -> str:
+        return f"arn:aws:iam::{account_id}:role/{self.role_name}"
+
+    def _lock_for(self, account_id: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(account_id, threading.Lock())
+
+    def fresh(self, creds: Optional[Credentials]) -> bool:
+        return creds is not None and creds.expiration - self.refresh_margin > self.clock()
+
+    def get(self, account_id: str) -> Credentials:
+        creds = self._creds.get(account_id)
+        if self.fresh(creds):
+            return creds  # type: ignore[return-value]
+        with self._lock_for(account_id):
+            creds = self._creds.get(account_id)
+            if not self.fresh(creds):
+                creds = self._assume(account_id)
+                self._creds[account_id] = creds
+            return creds  # type: ignore[return-value]
+
+    def _assume(self, account_id: str) -> Credentials:
+        cmd = aws_base() + [
+            "sts",
+            "assume-role",
+            "--role-arn",
+            self.role_arn(account_id),
+            "--role-session-name",
+            self.session_name,
+            "--duration-seconds",
+            str(self.duration_seconds),
+        ]
+        if self.external_id:
+            cmd += ["--external-id", self.external_id]
+        if self.sts_endpoint_url:
+            cmd += ["--endpoint-url", self.sts_endpoint_url]
+        # Always assume from the caller's own credentials, never from another member account's.
+        with aws_env(None):
+            res = shell_json(cmd)
+        with self._guard:
+            self.assume_calls += 1
+        c = res.get("Credentials") or {}
+        if not c.get("AccessKeyId"):
+            raise RuntimeError(f"assume-role into {account_id} returned no credentials")
+        return Credentials(c["AccessKeyId"], c["SecretAccessKey"], c.get("SessionToken", ""), _epoch(c["Expiration"]))
+
+
+def caller_account() -> str:
+    return str(shell_json(aws_base() + ["sts", "get-caller-identity"]).get("Account", ""))
+
+
+def member_accounts() -> List[str]:
+    """Active accounts of the organization (requires organizations:ListAccounts on the payer)."""
+    return [
+        a["Id"]
+        for a in iter_paginate(aws_base() + ["organizations", "list-accounts"], result_key="Accounts", page_items=20)
+        if a.get("Status", "ACTIVE") == "ACTIVE" and a.get("Id")
+    ]
+
+
+def resolve_accounts(spec: Optional[str]) -> List[str]:
+    """`all` -> every active member account; otherwise a comma-separated list of account IDs."""
+    if not spec or spec.strip().lower() == "all":
+        return member_accounts()
+    return list(dict.fromkeys(a.strip() for a in spec.split(",") if a.strip()))
+
+
+def run_across_accounts(
+    fn: Callable[[str], Any],
+    accounts: Iterable[str],
+    regions_spec: Optional[str],
+    cache: CredentialCache,
+    max_workers: int = 16,
+    default_region: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Runs fn(region) for every (account, region) pair under that account's credentials, with at most
+    `max_workers` pairs in flight across all accounts. The caller's own account runs with ambient credentials.
+    `regions_spec` follows --regions (all|list); `all` is resolved per account since opt-ins differ.
+    Result: {"accounts": {id: {"regions": {region: doc}}}, "failed": [...]}; failures never abort other pairs.
+    """
+    accounts = list(accounts)
+    me = caller_account()
+    out: Dict[str, Dict[str, Any]] = {a: {"regions": {}} for a in accounts}
+    failed: List[Dict[str, str]] = []
+
+    def account_env(account_id: str) -> Optional[Dict[str, str]]:
+        return None if account_id == me else cache.get(account_id).env()
+
+    def regions_for(account_id: str) -> List[str]:
+        with aws_env(account_env(account_id)):
+            return resolve_regions(regions_spec) or [ensure_region(default_region)]
+
+    def run_pair(account_id: str, region: str) -> Any:
+        # Fetch credentials per pair so long runs pick up refreshed ones.
+        with aws_env(account_env(account_id)):
+            return fn(region)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        region_futs = {pool.submit(regions_for, a): a for a in accounts}
+        pair_futs: Dict[Any, Tuple[str, str]] = {}
+        for fut in as_completed(region_futs):
+            a = region_futs[fut]
+            try:
+                regions = fut.result()
+            except Exception as e:
+                out[a]["error"] = str(e)
+                failed.append({"account": a, "error": str(e)})
+                continue
+            for r in regions:
+                pair_futs[pool.submit(run_pair, a, r)] = (a, r)
+        for fut in as_completed(pair_futs):
+            a, r = pair_futs[fut]
+            try:
+                out[a]["regions"][r] = fut.result()
+            except Exception as e:
+                out[a]["regions"][r] = {"region": r, "error": str(e)}
+                failed.append({"account": a, "region": r, "error": str(e)})
+    for a in accounts:
+        out[a]["regions"] = dict(sorted(out[a]["regions"].items()))
+    return {"accounts": out, "accountCount": len(accounts), "failed": failed, "assumeRoleCalls": cache.assume_calls}
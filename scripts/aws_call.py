@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+Run one AWS CLI command through common.shell_json (rate limiting, retries, backend selection) and print its JSON.
+Usage: aws_call.py aws <service> <operation> [options]. Used by collect_report.py for its plain CLI tasks.
+"""
+from __future__ import annotations
+
+import sys
+
+from common import shell_json, write_stdout_json
+
+
+def main() -> None:
+    argv = sys.argv[1:]
+    if not argv or argv[0] != "aws":
+        sys.exit("usage: aws_call.py aws <service> <operation> [options]")
+    write_stdout_json(shell_json(argv))
+
+
+if __name__ == "__main__":
+    main()
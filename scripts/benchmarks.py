@@ -0,0 +1,1192 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the collector plumbing. Everything runs against local stand-ins, never real AWS.
+- backends: pages/second of the subprocess vs in-process backend against a local stub endpoint
+- pagination-memory: peak Python heap of paginate (list) vs iter_paginate (stream) on a synthetic fixture
+- prefetch: wall time of iter_paginate with and without read-ahead behind a latency-injecting backend
+- cost-history: Cost Explorer requests/bytes of a full 90-day re-download vs the incremental store over N daily runs
+- cost-store: report aggregates from nested ResultsByTime JSON vs the columnar cost store (numpy and stdlib paths)
+- query: cost_query.py latency per query shape over a multi-million-row synthetic store
+- report-memory: peak RSS of generate_analysis reading whole documents (json.load) vs streaming them (jsonstream)
+- anomaly: local anomaly detection time and recall/precision on synthetic series with injected spikes
+- forecast: local per-series forecasting time and backtest accuracy on synthetic series
+- commitment: SP/RI commitment sweep over a year of hourly usage per family vs naive re-simulation
+- tags: tag policy evaluation of a synthetic Tagging API stream (N resources x M rules), results to JSONL
+- graviton: graviton-migration.py over a synthetic 100k-instance inventory (catalog lookups vs per-instance search)
+- spot: spot pool analytics (types x AZs x days of price history) time and peak heap vs holding raw records
+- metrics: cw_metrics.py batched GetMetricData behind injected latency vs one call per instance, plus scoring time
+- nat: nat-gateway-optimizer.py attribution of N gateways across R regions fetched concurrently vs one call per metric
+- logs: logs-retention-optimizer.py over N synthetic log groups, peak heap vs N and vs ranking a full list
+- snapshots: snapshot_lineage.py index + analysis of N synthetic snapshots vs holding them as a list of records
+Each subcommand prints a JSON result; components that are not installed here are reported as skipped.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import commitment_sim
+import cost_anomaly
+import cw_metrics
+import snapshot_lineage
+import cost_forecast
+import cost_history
+import cost_query
+import cost_store
+import generate_analysis
+import instance_catalog
+import spot_analytics
+import tag_policy
+from common import (
+    DEFAULT_RATE, RATE_LIMITS, aws_base, iter_paginate, make_backend, paginate, set_backend, set_rate_limit, shell_json,
+    write_stdout_json,
+)
+
+BENCH_ENV = {
+    "AWS_ACCESS_KEY_ID": "bench",
+    "AWS_SECRET_ACCESS_KEY": "bench",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_EC2_METADATA_DISABLED": "true",
+}
+
+
+class _StubLogsHandler(BaseHTTPRequestHandler):
+    """Answers CloudWatch Logs DescribeLogGroups (JSON protocol) with `pages` pages of `page_size` groups."""
+
+    pages = 20
+    page_size = 50
+    requests = 0
+    lock = threading.Lock()
+
+    def do_POST(self) -> None:  # noqa: N802 (http.server API)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        req = json.loads(body or b"{}")
+        page = int(req.get("nextToken") or 0)
+        with self.lock:
+            type(self).requests += 1
+        resp: Dict[str, Any] = {
+            "logGroups": [
+                {"logGroupName": f"/bench/{page}/{i}", "storedBytes": i * 1024, "creationTime": 1700000000000}
+                for i in range(self.page_size)
+            ]
+        }
+        if page + 1 < self.pages:
+            resp["nextToken"] = str(page + 1)
+        raw = json.dumps(resp).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-amz-json-1.1")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+def bench_backends(pages: int, page_size: int, rounds: int) -> Dict[str, Any]:
+    _StubLogsHandler.pages, _StubLogsHandler.page_size = pages, page_size
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubLogsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    os.environ.update(BENCH_ENV)
+    cmd = aws_base() + ["logs", "describe-log-groups", "--endpoint-url", endpoint, "--region", "us-east-1",
+                        "--max-items", str(page_size)]
+    results: Dict[str, Any] = {"pages": pages, "pageSize": page_size, "rounds": rounds}
+    # Measure the backends, not the per-service token bucket (logs is paced at RATE_LIMITS["logs"] calls/s).
+    logs_rate = RATE_LIMITS.get("logs", DEFAULT_RATE)
+    set_rate_limit("logs", 1e9)
+    try:
+        for name in ("subprocess", "inprocess"):
+            if name == "subprocess" and not shutil.which("aws"):
+                results[name] = {"skipped": "aws CLI not on PATH"}
+                continue
+            try:
+                backend = make_backend(name)
+            except ImportError as e:
+                results[name] = {"skipped": str(e)}
+                continue
+            set_backend(backend)
+            _StubLogsHandler.requests = 0
+            t0 = time.perf_counter()
+            items = 0
+            for _ in range(rounds):
+                items += len(paginate(cmd, result_key="logGroups"))
+            elapsed = time.perf_counter() - t0
+            results[name] = {
+                "seconds": round(elapsed, 3),
+                "httpRequests": _StubLogsHandler.requests,
+                "items": items,
+                "pagesPerSecond": round(_StubLogsHandler.requests / elapsed, 1) if elapsed else None,
+            }
+    finally:
+        set_rate_limit("logs", logs_rate)
+        server.shutdown()
+    if all("pagesPerSecond" in results.get(n, {}) for n in ("subprocess", "inprocess")):
+        results["speedup"] = round(results["inprocess"]["pagesPerSecond"] / results["subprocess"]["pagesPerSecond"], 1)
+    return results
+
+
+class SyntheticPagesBackend:
+    """
+    Backend stand-in that fabricates describe-snapshots pages on demand (nothing precomputed), honouring
+    --max-items/--starting-token like the CLI. Records are shaped like real Snapshots entries.
+    """
+
+    name = "synthetic"
+
+    def __init__(self, total: int, result_key: str = "Snapshots") -> None:
+        self.total = total
+        self.result_key = result_key
+        self.calls = 0
+
+    @staticmethod
+    def _opt(cmd: List[str], flag: str) -> Optional[str]:
+        return cmd[cmd.index(flag) + 1] if flag in cmd else None
+
+    def call(self, cmd: List[str], env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        self.calls += 1
+        start = int(self._opt(cmd, "--starting-token") or 0)
+        size = int(self._opt(cmd, "--max-items") or self.total)
+        end = min(self.total, start + size)
+        page: Dict[str, Any] = {self.result_key: [self.record(i) for i in range(start, end)]}
+        if end < self.total:
+            page["NextToken"] = str(end)
+        return page
+
+    @staticmethod
+    def record(i: int) -> Dict[str, Any]:
+        return {
+            "SnapshotId": f"snap-{i:017x}",
+            "VolumeId": f"vol-{i // 7:017x}",
+            "VolumeSize": 8 + i % 500,
+            "StartTime": f"20{20 + i % 5}-0{1 + i % 9}-1{i % 10}T00:00:00.000Z",
+            "State": "completed",
+            "StorageTier": "standard",
+            "Description": f"Created by CreateImage(i-{i:017x}) for ami-{i:017x}",
+            "OwnerId": "123456789012",
+            "Encrypted": bool(i % 2),
+            "Tags": [{"Key": "Name", "Value": f"backup-{i}"}],
+        }
+
+
+class LatencyBackend:
+    """Wraps another backend and sleeps `latency` seconds per call, like a round-trip to a remote API."""
+
+    name = "latency"
+
+    def __init__(self, inner: Any, latency: float) -> None:
+        self.inner = inner
+        self.latency = latency
+
+    def call(self, cmd: List[str], env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        time.sleep(self.latency)
+        return self.inner.call(cmd, env)
+
+
+def _peak(fn: Any) -> Dict[str, Any]:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(elapsed, 3), "peakMiB": round(peak / 2**20, 1), "result": result}
+
+
+def bench_pagination_memory(total: int, page_items: int) -> Dict[str, Any]:
+    cmd = aws_base() + ["ec2", "describe-snapshots", "--owner-ids", "self", "--region", "us-east-1"]
+
+    def as_list() -> int:
+        set_backend(SyntheticPagesBackend(total))
+        snaps = paginate(cmd + ["--max-items", str(page_items)], result_key="Snapshots")
+        return sum(1 for s in snaps if s["VolumeSize"] > 256)
+
+    def as_stream() -> int:
+        set_backend(SyntheticPagesBackend(total))
+        snaps = iter_paginate(cmd, result_key="Snapshots", page_items=page_items, select=lambda s: s["VolumeSize"])
+        return sum(1 for size in snaps if size > 256)
+
+    def first_500() -> Dict[str, int]:
+        backend = SyntheticPagesBackend(total)
+        set_backend(backend)
+        kept = list(iter_paginate(cmd, result_key="Snapshots", page_items=page_items, limit=500))
+        return {"kept": len(kept), "pagesFetched": backend.calls}
+
+    return {
+        "items": total,
+        "pageItems": page_items,
+        "paginateList": _peak(as_list),
+        "iterPaginate": _peak(as_stream),
+        "iterPaginateLimit500": _peak(first_500),
+    }
+
+
+def bench_prefetch(pages: int, page_items: int, latency: float, work: float) -> Dict[str, Any]:
+    """`work` is the simulated per-page processing time of the caller (parsing, projecting, writing)."""
+    cmd = aws_base() + ["ec2", "describe-instances", "--region", "us-east-1"]
+    results: Dict[str, Any] = {"pages": pages, "latency": latency, "workPerPage": work}
+    for depth in (0, 1, 2, 4):
+        set_backend(LatencyBackend(SyntheticPagesBackend(pages * page_items), latency))
+        t0 = time.perf_counter()
+        seen = 0
+        for i, _ in enumerate(iter_paginate(cmd, result_key="Snapshots", page_items=page_items, prefetch=depth)):
+            seen += 1
+            if i % page_items == page_items - 1:
+                time.sleep(work)
+        results[f"prefetch{depth}"] = {"seconds": round(time.perf_counter() - t0, 3), "items": seen}
+    base = results["prefetch0"]["seconds"]
+    for depth in (1, 2, 4):
+        results[f"prefetch{depth}"]["speedup"] = round(base / results[f"prefetch{depth}"]["seconds"], 2)
+    return results
+
+
+class SyntheticCostBackend:
+    """
+    Cost Explorer stand-in for get-cost-and-usage DAILY/SERVICE: deterministic amounts per (day, service),
+    the last `estimated_days` before `today` flagged Estimated, and NextPageToken after `page_groups` groups.
+    """
+
+    name = "synthetic-ce"
+
+    def __init__(self, today: date, services: int = 60, page_groups: int = 5000, estimated_days: int = 2) -> None:
+        self.today = today
+        self.services = services
+        self.page_groups = page_groups
+        self.estimated_days = estimated_days
+        self.calls = 0
+        self.bytes = 0
+
+    def call(self, cmd: List[str], env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        self.calls += 1
+        period = dict(kv.split("=", 1) for kv in cmd[cmd.index("--time-period") + 1].split(","))
+        start, end = date.fromisoformat(period["Start"]), date.fromisoformat(period["End"])
+        skip = int(cmd[cmd.index("--next-page-token") + 1]) if "--next-page-token" in cmd else 0
+        results: List[Dict[str, Any]] = []
+        budget, offset = self.page_groups, 0
+        d = start
+        while d < end and budget > 0:
+            for s in range(self.services):
+                if offset >= skip and budget > 0:
+                    if not results or results[-1]["TimePeriod"]["Start"] != d.isoformat():
+                        results.append({
+                            "TimePeriod": {"Start": d.isoformat(), "End": (d + timedelta(days=1)).isoformat()},
+                            "Total": {}, "Groups": [],
+                            "Estimated": d >= self.today - timedelta(days=self.estimated_days),
+                        })
+                    amount = ((d.toordinal() * 31 + s * 17) % 1000) / 10
+                    metrics = {"UnblendedCost": {"Amount": f"{amount}", "Unit": "USD"}}
+                    results[-1]["Groups"].append({"Keys": [f"Service {s:02d}"], "Metrics": metrics})
+                    budget -= 1
+                offset += 1
+            d += timedelta(days=1)
+        page: Dict[str, Any] = {"ResultsByTime": results}
+        if d < end or (budget == 0 and offset < (end - start).days * self.services):
+            page["NextPageToken"] = str(skip + self.page_groups)
+        self.bytes += len(json.dumps(page))
+        return page
+
+
+def bench_cost_history(runs: int, days: int, services: int, latency: float) -> Dict[str, Any]:
+    """`latency` models Cost Explorer's per-request round trip, which dominates real collection time."""
+    first = date(2024, 1, 1)
+    full = {"ceRequests": 0, "responseMiB": 0.0, "seconds": 0.0}
+    incr = {"ceRequests": 0, "responseMiB": 0.0, "seconds": 0.0}
+    with tempfile.TemporaryDirectory(prefix="bench-cost-") as store:
+        for i in range(runs):
+            today = first + timedelta(days=i)
+            backend = SyntheticCostBackend(today, services)
+            set_backend(LatencyBackend(backend, latency))
+            t0 = time.perf_counter()
+            start = today - timedelta(days=days)
+            cmd = aws_base() + ["ce", "get-cost-and-usage", "--time-period", f"Start={start},End={today}",
+                                "--granularity", "DAILY", "--metrics", "UnblendedCost"]
+            token = None
+            while True:
+                page = shell_json(cmd + (["--next-page-token", token] if token else []))
+                token = page.get("NextPageToken")
+                if not token:
+                    break
+            full["seconds"] += time.perf_counter() - t0
+            full["ceRequests"] += backend.calls
+            full["responseMiB"] += backend.bytes / 2**20
+
+            backend = SyntheticCostBackend(today, services)
+            set_backend(LatencyBackend(backend, latency))
+            t0 = time.perf_counter()
+            doc = cost_history.collect(store, days=days, today=today)
+            incr["seconds"] += time.perf_counter() - t0
+            incr["ceRequests"] += backend.calls
+            incr["responseMiB"] += backend.bytes / 2**20
+            assert len(doc["ResultsByTime"]) == days
+    for d in (full, incr):
+        d["seconds"], d["responseMiB"] = round(d["seconds"], 3), round(d["responseMiB"], 2)
+    return {
+        "runs": runs, "days": days, "services": services, "latency": latency,
+        "fullRefetch": full, "incremental": incr,
+        "requestRatio": round(incr["ceRequests"] / full["ceRequests"], 3) if full["ceRequests"] else None,
+        "bytesRatio": round(incr["responseMiB"] / full["responseMiB"], 3) if full["responseMiB"] else None,
+    }
+
+
+def write_synthetic_costs(path: str, days: int, services: int, accounts: int, density: float) -> int:
+    """
+    Streams a DAILY get-cost-and-usage document grouped by SERVICE and LINKED_ACCOUNT to `path`.
+    Each account uses a fixed subset of max(1, services * density) services every day. Returns the group count.
+    """
+    per_account = max(1, int(services * density))
+    first = date(2023, 1, 1)
+    rows = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"GroupDefinitions":[{"Type":"DIMENSION","Key":"SERVICE"},{"Type":"DIMENSION","Key":"LINKED_ACCOUNT"}],'
+                '"ResultsByTime":[')
+        for d in range(days):
+            day = first + timedelta(days=d)
+            groups = []
+            for a in range(accounts):
+                for j in range(per_account):
+                    s = (a * 7 + j * 13) % services
+                    amount = ((d * 31 + a * 17 + s * 7) % 10000) / 100
+                    groups.append({"Keys": [f"Service {s:03d}", f"{100000000000 + a}"],
+                                   "Metrics": {"UnblendedCost": {"Amount": str(amount), "Unit": "USD"}}})
+            rows += len(groups)
+            period = {"TimePeriod": {"Start": day.isoformat(), "End": (day + timedelta(days=1)).isoformat()},
+                      "Total": {}, "Groups": groups, "Estimated": False}
+            f.write(("," if d else "") + json.dumps(period))
+        f.write("]}")
+    return rows
+
+
+def _json_report_aggregates(path: str) -> Dict[str, Any]:
+    """What generate_analysis did before the store: json.load, then walk every group and float() each amount."""
+    with open(path, "r", encoding="utf-8") as f:
+        d = json.load(f)
+    agg: Dict[str, float] = {}
+    for period in d.get("ResultsByTime", []):
+        for g in period.get("Groups", []):
+            keys = g.get("Keys", [])
+            svc = keys[0] if keys else "Unknown"
+            amt = float(g.get("Metrics", {}).get("UnblendedCost", {}).get("Amount", 0.0) or 0.0)
+            agg[svc] = agg.get(svc, 0.0) + amt
+    last30 = 0.0
+    for p in d.get("ResultsByTime", [])[-30:]:
+        for g in p.get("Groups", []):
+            last30 += float(g.get("Metrics", {}).get("UnblendedCost", {}).get("Amount", 0.0) or 0.0)
+    top = sorted(agg.items(), key=lambda kv: kv[1], reverse=True)[:10]
+    return {"top": top, "last30": last30}
+
+
+def _store_report_aggregates(path: str) -> Dict[str, Any]:
+    store = cost_store.CostStore.load(path)
+    top = [(k[0], v) for k, v in store.top_n(("service",), 10)]
+    return {"top": top, "last30": store.last_days_total(30), "topAccounts": store.top_n(("account",), 10)}
+
+
+def _timed(fn: Any, *args: Any) -> Tuple[float, Any]:
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return round(time.perf_counter() - t0, 3), out
+
+
+def bench_cost_store(days: int, services: int, accounts: int, density: float, skip_json: bool) -> Dict[str, Any]:
+    results: Dict[str, Any] = {"days": days, "services": services, "accounts": accounts, "density": density}
+    with tempfile.TemporaryDirectory(prefix="bench-store-") as tmp:
+        src, out = os.path.join(tmp, "costs.json"), os.path.join(tmp, "costs.bin")
+        results["rows"] = write_synthetic_costs(src, days, services, accounts, density)
+        results["jsonMiB"] = round(os.path.getsize(src) / 2**20, 1)
+
+        def build() -> None:
+            store = cost_store.CostStore()
+            with open(src, "r", encoding="utf-8") as f:
+                store.ingest(json.load(f))
+            store.save(out)
+
+        results["ingestOnceSeconds"], _ = _timed(build)
+        results["storeMiB"] = round(os.path.getsize(out) / 2**20, 1)
+        if not skip_json:
+            results["jsonWalkSeconds"], ref = _timed(_json_report_aggregates, src)
+        numpy_mod = cost_store.np
+        for label, mod in (("numpy", numpy_mod), ("stdlib", None)):
+            if label == "numpy" and mod is None:
+                results["storeQuerySeconds.numpy"] = {"skipped": "numpy not installed"}
+                continue
+            cost_store.np = mod
+            try:
+                results[f"storeQuerySeconds.{label}"], got = _timed(_store_report_aggregates, out)
+            finally:
+                cost_store.np = numpy_mod
+            if not skip_json:
+                same_top = [k for k, _ in got["top"]] == [k for k, _ in ref["top"]]
+                same_last30 = abs(got["last30"] - ref["last30"]) < 1e-6 * max(1.0, ref["last30"])
+                results[f"matchesJson.{label}"] = same_top and same_last30
+    if "jsonWalkSeconds" in results and isinstance(results.get("storeQuerySeconds.numpy"), float):
+        results["speedup.numpy"] = round(results["jsonWalkSeconds"] / max(results["storeQuerySeconds.numpy"], 1e-6), 1)
+    if "jsonWalkSeconds" in results:
+        results["speedup.stdlib"] = round(results["jsonWalkSeconds"] / max(results["storeQuerySeconds.stdlib"], 1e-6), 1)
+    return results
+
+
+def synthetic_store(days: int, services: int, accounts: int, per_account: int) -> cost_store.CostStore:
+    """Columns generated directly (no JSON): every account uses `per_account` services every day."""
+    store = cost_store.CostStore()
+    for dim, n, fmt in (("service", services, "Service {:03d}"), ("account", accounts, "{:012d}")):
+        for i in range(n):
+            store.dicts[dim].encode("NAT Gateway" if dim == "service" and i == 0 else fmt.format(i))
+    first = cost_store.day_number("2023-01-01")
+    np = cost_store.np
+    if np is not None:
+        d = np.repeat(np.arange(days, dtype=np.int32) + first, accounts * per_account)
+        a = np.tile(np.repeat(np.arange(accounts, dtype=np.int32), per_account), days)
+        j = np.tile(np.arange(per_account, dtype=np.int32), days * accounts)
+        s = (a * 7 + j * 13) % services
+        amount = ((d.astype(np.int64) * 31 + a * 17 + s * 7) % 10000) / 100
+        store.date, store.account, store.service = (array("i", x.astype(np.int32).tobytes()) for x in (d, a + 1, s + 1))
+        store.amount = array("d", amount.astype(np.float64).tobytes())
+        return store
+    for day in range(days):
+        for acct in range(accounts):
+            for j in range(per_account):
+                s = (acct * 7 + j * 13) % services
+                store.date.append(first + day)
+                store.account.append(acct + 1)
+                store.service.append(s + 1)
+                store.amount.append((((first + day) * 31 + acct * 17 + s * 7) % 10000) / 100)
+    return store
+
+
+def bench_query(days: int, services: int, accounts: int, per_account: int) -> Dict[str, Any]:
+    results: Dict[str, Any] = {"days": days, "services": services, "accounts": accounts,
+                               "numpy": cost_store.np is not None}
+    with tempfile.TemporaryDirectory(prefix="bench-query-") as tmp:
+        path = os.path.join(tmp, "costs.bin")
+        results["buildSeconds"], store = _timed(synthetic_store, days, services, accounts, per_account)
+        results["rows"] = len(store)
+        results["saveWithIndexesSeconds"], _ = _timed(store.save, path)
+        results["loadSeconds"], loaded = _timed(cost_store.CostStore.load, path)
+        engine = cost_query.QueryEngine(loaded)
+        last = cost_store.day_string(loaded.date_bounds()[1])
+        queries = {
+            "topServicesTotal": cost_query.Query(top=10),
+            "oneAccountByServiceMonthly": cost_query.Query(where={"account": ["000000000042"]}, bucket="month"),
+            "natWeekly": cost_query.Query(where={"service": ["~nat"]}, bucket="week"),
+            "serviceAccountTop20Last90d": cost_query.Query(group_by=["service", "account"], top=20,
+                                                            start=str(date.fromisoformat(last) - timedelta(days=90))),
+            "fiveAccountsTwoServicesDaily": cost_query.Query(
+                where={"account": [f"{i:012d}" for i in range(5)], "service": ["Service 007", "Service 014"]},
+                bucket="day"),
+        }
+        timings: Dict[str, Any] = {}
+        for name, q in queries.items():
+            seconds, rows = _timed(engine.run, q)
+            timings[name] = {"seconds": seconds, "resultRows": len(rows)}
+        seconds, rows = _timed(engine.movers, cost_query.Query(), 10)
+        timings["weeklyMoversByService"] = {"seconds": seconds, "resultRows": len(rows)}
+        results["queries"] = timings
+    return results
+
+
+def write_synthetic_report_data(data_dir: str, days: int, services: int, regions: int, volumes: int) -> Dict[str, Any]:
+    """A collect_report.py data dir scaled up: big CE history plus multi-region optimizer outputs."""
+    os.makedirs(data_dir, exist_ok=True)
+    rows = write_synthetic_costs(os.path.join(data_dir, "cost_by_service_90d.json"), days, services, 1, 1.0)
+    names = [f"bench-{i}" for i in range(regions)]
+    with open(os.path.join(data_dir, "ebs_optimizer.json"), "w", encoding="utf-8") as f:
+        f.write('{"regions":{')
+        for n, region in enumerate(names):
+            vols = [{"VolumeId": f"vol-{n:04d}{i:08d}", "Size": 100 + i % 400, "VolumeType": "gp2",
+                     "Tags": [{"Key": "Name", "Value": f"data-{i}"}]} for i in range(volumes)]
+            recs = [{"volumeArn": f"arn:aws:ec2:{region}:123456789012:volume/vol-{n:04d}{i:08d}", "finding": "NotOptimized",
+                     "currentConfiguration": {"volumeType": "gp2", "volumeSize": 100 + i % 400},
+                     "volumeRecommendationOptions": [{"configuration": {"volumeType": "gp3"}, "rank": r,
+                                                      "performanceRisk": 0.0} for r in range(3)]}
+                    for i in range(volumes)]
+            doc = {"region": region, "unattached": vols[: volumes // 10], "computeOptimizer": recs}
+            f.write(("," if n else "") + json.dumps(region) + ":" + json.dumps(doc))
+        f.write("}}")
+    with open(os.path.join(data_dir, "nat.json"), "w", encoding="utf-8") as f:
+        f.write(json.dumps({"regions": {r: {"region": r, "totalNatGateways": 2, "natServiceCosts": [
+            {"TimePeriod": {"Start": f"2024-{m:02d}-01"}, "Total": {"UnblendedCost": {"Amount": str(100 + m)}}}
+            for m in range(1, 13)]} for r in names}}))
+    with open(os.path.join(data_dir, "identity.json"), "w", encoding="utf-8") as f:
+        f.write(json.dumps({"Account": "123456789012"}))
+    mib = sum(os.path.getsize(os.path.join(data_dir, n)) for n in os.listdir(data_dir)) / 2**20
+    return {"costRows": rows, "volumes": regions * volumes, "dataMiB": round(mib, 1)}
+
+
+def _jload_report_figures(data_dir: str) -> Dict[str, Any]:
+    """report_figures as generate_analysis computed them before streaming: every document json.load-ed whole."""
+    def doc(name: str) -> Dict[str, Any]:
+        return generate_analysis.flatten_regions(generate_analysis.first_existing(name, data_dir=data_dir) or {})
+
+    costs = cost_store.CostStore.from_results(generate_analysis.first_existing("cost_by_service_90d.json",
+                                                                               data_dir=data_dir))
+    svc_map = generate_analysis.cost_by_service_summary(costs)
+    sp = doc("sp_recommendations.json")
+    sp_recs = (sp.get("SavingsPlansPurchaseRecommendation", {}).get("SavingsPlansPurchaseRecommendationDetails") or [])
+    ri = doc("ri_ec2_recommendations.json")
+    nat = doc("nat.json")
+    nat_costs = nat.get("natServiceCosts") or [{}]
+    return {
+        "account": doc("identity.json").get("Account", "N/A"),
+        "last30": generate_analysis.sum_last_30_days(costs),
+        "topServices": sorted(svc_map.items(), key=lambda kv: kv[1], reverse=True)[:10],
+        "sp": {"count": len(sp_recs),
+               "estimatedSavings": sum(float(r.get("EstimatedSavingsAmount", 0.0) or 0.0) for r in sp_recs)},
+        "ri": len(ri.get("Recommendations") or ri.get("RecommendationSummaries") or []),
+        "ec2Candidates": doc("ec2_idle.json").get("count", 0),
+        "ebsUnattached": len(doc("ebs_optimizer.json").get("unattached", [])),
+        "lambdaRecs": len(doc("lambda_optimizer.json").get("computeOptimizer", [])),
+        "rdsRecs": len((doc("rds_rightsizing.json").get("rightsizing") or {}).get("recommendations", [])),
+        "natGateways": nat.get("totalNatGateways", 0),
+        "natLastCost": float(nat_costs[-1].get("Total", {}).get("UnblendedCost", {}).get("Amount", 0.0) or 0.0),
+        "logsWithoutRetention": doc("logs_retention.json").get("withoutRetention", 0),
+        "s3WithoutLifecycle": doc("s3_lifecycle.json").get("withoutLifecycle", 0),
+        "oldSnapshots": doc("ebs_snapshots.json").get("olderThanThreshold", 0),
+        "tagsNonCompliant": doc("tag_compliance.json").get("nonCompliant", 0),
+        "costAnomalies": generate_analysis.local_anomalies(
+            generate_analysis.existing_path("cost_anomalies.json", data_dir=data_dir)),
+        "forecast": generate_analysis.local_forecast(
+            generate_analysis.existing_path("forecast_local_30d.json", data_dir=data_dir)),
+    }
+
+
+REPORT_PATHS = {
+    "baseline": lambda data_dir: {},  # interpreter + imports only
+    "jload": _jload_report_figures,
+    "stream": generate_analysis.report_figures,
+}
+# Each path runs in a fresh interpreter so ru_maxrss is its own peak, not the benchmark's.
+_REPORT_CHILD = """
+import json, resource, sys, time
+import benchmarks
+t0 = time.perf_counter()
+figures = benchmarks.REPORT_PATHS[sys.argv[1]](sys.argv[2])
+seconds = time.perf_counter() - t0
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+print(json.dumps({"seconds": round(seconds, 3), "peakRssMiB": round(rss, 1), "figures": figures}))
+"""
+
+
+def bench_report_memory(days: int, services: int, regions: int, volumes: int) -> Dict[str, Any]:
+    if importlib.util.find_spec("resource") is None:  # POSIX only; the child processes use it
+        return {"skipped": "resource module not available on this platform"}
+    results: Dict[str, Any] = {"days": days, "services": services, "regions": regions}
+    with tempfile.TemporaryDirectory(prefix="bench-report-") as tmp:
+        results.update(write_synthetic_report_data(tmp, days, services, regions, volumes))
+        runs: Dict[str, Any] = {}
+        for mode in REPORT_PATHS:
+            proc = subprocess.run([sys.executable, "-c", _REPORT_CHILD, mode, tmp], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+            runs[mode] = json.loads(proc.stdout)
+    for mode, run in runs.items():
+        results[mode] = {"seconds": run["seconds"], "peakRssMiB": run["peakRssMiB"]}
+    base = runs["baseline"]["peakRssMiB"]
+    for mode in ("jload", "stream"):
+        results[mode]["aboveBaselineMiB"] = round(runs[mode]["peakRssMiB"] - base, 1)
+    results["sameFigures"] = runs["jload"]["figures"] == runs["stream"]["figures"]
+    results["peakRssRatio"] = round(runs["jload"]["peakRssMiB"] / max(runs["stream"]["peakRssMiB"], 0.1), 1)
+    return results
+
+
+def synthetic_cost_series(series: int, days: int, spikes: int, eval_days: int, seed: int = 7) -> Tuple[List[List[float]], set]:
+    """
+    Daily series with a per-series level, slow trend, weekend dip (half of them) and 5% noise, plus `spikes`
+    one-day spikes injected in the last `eval_days` days. -> (rows, {(series, day)} injected).
+    """
+    rng = random.Random(seed)
+    rows: List[List[float]] = []
+    for _ in range(series):
+        base = rng.lognormvariate(3.0, 1.5)
+        trend = rng.uniform(-0.002, 0.004)
+        weekend = rng.choice((1.0, 0.6))
+        rows.append([max(0.0, base * (1 + trend * d) * (weekend if d % 7 in (5, 6) else 1.0) * rng.gauss(1.0, 0.05))
+                     for d in range(days)])
+    injected = set()
+    for s in rng.sample(range(series), min(spikes, series)):
+        t = days - 1 - rng.randrange(eval_days)
+        rows[s][t] += rows[s][t] * rng.uniform(0.5, 3.0) + 20.0
+        injected.add((s, t))
+    return rows, injected
+
+
+def bench_anomaly(series: int, days: int, spikes: int, stdlib_series: int) -> Dict[str, Any]:
+    """cost_anomaly.detect recall/precision on injected spikes, numpy (all series) vs stdlib (a subset)."""
+    results: Dict[str, Any] = {"series": series, "days": days, "injected": spikes, "numpy": cost_store.np is not None}
+    results["generateSeconds"], (rows, injected) = _timed(synthetic_cost_series, series, days, spikes, 7)
+    keys = [(f"Service {i % 400:03d}", f"{i // 400:012d}") for i in range(series)]
+    first = cost_store.day_number("2024-01-01")
+
+    def score(hits: List[Dict[str, Any]], n: int) -> Dict[str, Any]:
+        index = {k: i for i, k in enumerate(keys[:n])}
+        found = {(index[(h["service"], h["account"])], cost_store.day_number(h["date"]) - first) for h in hits}
+        truth = {(s, t) for s, t in injected if s < n}
+        tp = len(found & truth)
+        return {"flagged": len(found), "recall": round(tp / max(len(truth), 1), 3),
+                "precision": round(tp / max(len(found), 1), 3)}
+
+    if cost_store.np is not None:
+        matrix = cost_store.np.asarray(rows)
+        seconds, hits = _timed(cost_anomaly.detect, keys, first, matrix)
+        results["vectorized"] = {"seconds": seconds, "seriesPerSecond": round(series / max(seconds, 1e-6)),
+                                 **score(hits, series)}
+    n = min(stdlib_series, series)
+    np_mod, cost_anomaly.np = cost_anomaly.np, None
+    try:
+        seconds, hits = _timed(cost_anomaly.detect, keys[:n], first, rows[:n])
+    finally:
+        cost_anomaly.np = np_mod
+    results["stdlib"] = {"series": n, "seconds": seconds, "seriesPerSecond": round(n / max(seconds, 1e-6)),
+                         **score(hits, n)}
+    return results
+
+
+def bench_forecast(series: int, days: int, horizon: int, stdlib_series: int) -> Dict[str, Any]:
+    """cost_forecast.build_forecast time and backtest accuracy on synthetic series, numpy vs stdlib (a subset)."""
+    results: Dict[str, Any] = {"series": series, "days": days, "horizon": horizon,
+                               "numpy": cost_store.np is not None}
+    results["generateSeconds"], (rows, _) = _timed(synthetic_cost_series, series, days, 0, 7)
+    keys = [(f"Service {i % 400:03d}", f"{i // 400:012d}") for i in range(series)]
+    first = cost_store.day_number("2024-01-01")
+
+    def summary(seconds: float, doc: Dict[str, Any], n: int) -> Dict[str, Any]:
+        return {"series": n, "seconds": seconds, "seriesPerSecond": round(n / max(seconds, 1e-6)),
+                "models": doc["Model"]["models"], "backtest": doc.get("Backtest")}
+
+    if cost_store.np is not None:
+        matrix = cost_store.np.asarray(rows)
+        seconds, doc = _timed(cost_forecast.build_forecast, keys, first, matrix, horizon)
+        results["vectorized"] = summary(seconds, doc, series)
+    n = min(stdlib_series, series)
+    np_mod, cost_forecast.np = cost_forecast.np, None
+    try:
+        seconds, doc = _timed(cost_forecast.build_forecast, keys[:n], first, rows[:n], horizon)
+    finally:
+        cost_forecast.np = np_mod
+    results["stdlib"] = summary(seconds, doc, n)
+    return results
+
+
+def synthetic_hourly_usage(families: int, hours: int, seed: int = 11) -> List[List[float]]:
+    """Hourly on-demand cost per family: lognormal size, daily cycle, slow growth, 15% noise, some late starters."""
+    rng = random.Random(seed)
+    rows: List[List[float]] = []
+    for _ in range(families):
+        size, swing, start = rng.lognormvariate(1.5, 1.2), rng.uniform(0.0, 0.4), rng.choice((0, 0, 0, hours // 3))
+        cycle = [1 + swing * math.sin(2 * math.pi * h / 24) for h in range(24)]
+        rows.append([0.0 if h < start else max(0.0, size * cycle[h % 24] * (1 + 0.0001 * h) * rng.gauss(1.0, 0.15))
+                     for h in range(hours)])
+    return rows
+
+
+def _resimulate(row: List[float], discount: float, candidates: int) -> float:
+    """The naive sweep: savings re-simulated hour by hour for every candidate commitment; best one."""
+    peak = max(row) or 1.0
+    best = 0.0
+    for i in range(candidates + 1):
+        k = peak * i / candidates
+        best = max(best, sum(min(u, k) for u in row) - len(row) * k * (1 - discount))
+    return best
+
+
+def bench_commitment(families: int, hours: int, check: int, candidates: int) -> Dict[str, Any]:
+    """commitment_sim.simulate over families x hours, with a naive re-simulation of a few families as reference."""
+    results: Dict[str, Any] = {"families": families, "hours": hours, "numpy": cost_store.np is not None}
+    results["generateSeconds"], rows = _timed(synthetic_hourly_usage, families, hours)
+    keys = [f"fam{i:03d}" for i in range(families)]
+    matrix = cost_store.np.asarray(rows) if cost_store.np is not None else rows
+    results["simulateSeconds"], doc = _timed(commitment_sim.simulate, keys, 0, matrix, tuple(commitment_sim.DISCOUNTS),
+                                             None, 21, 0)
+    results["options"] = len(commitment_sim.TERMS) * len(commitment_sim.PAYMENTS) * len(commitment_sim.DISCOUNTS)
+    results["best"] = {plan: doc["plans"][plan]["best"] for plan in doc["plans"]}
+    fams = {f["family"]: f for f in doc["plans"]["standard-ri"]["families"]}
+    d = commitment_sim.DISCOUNTS["standard-ri"][("1yr", "no-upfront")]
+    t0 = time.perf_counter()
+    naive = [_resimulate(rows[i], d, candidates) for i in range(min(check, families))]
+    seconds = time.perf_counter() - t0
+    swept = [fams[keys[i]]["options"]["1yr/no-upfront"]["savings"] for i in range(len(naive))]
+    results["naive"] = {
+        "families": len(naive),
+        "candidates": candidates,
+        "seconds": round(seconds, 3),
+        "extrapolatedAllOptionsSeconds": round(seconds / max(len(naive), 1) * families * results["options"], 1),
+        # The sweep's optimum is exact; the naive grid can only match or fall short of it.
+        "sweepAtLeastAsGood": all(s >= n - 0.01 for s, n in zip(swept, naive)),
+    }
+    return results
+
+
+def synthetic_tag_mappings(resources: int, required: int, keys: int, seed: int = 19) -> Any:
+    """
+    get-resources items over 20 resource types. Tag sets come from a pool of 5,000: each required key (Key00..)
+    is present 99% of the time, plus 2-8 other keys; about 1% of values fall outside the allowed ones.
+    """
+    rng = random.Random(seed)
+    types = [f"svc{i % 7}:type{i}" for i in range(20)]
+    good = ["prod", "staging", "dev"] + [f"v{j}" for j in range(10)]
+    pool = []
+    for _ in range(5000):
+        chosen = [k for k in range(required) if rng.random() < 0.99] + rng.sample(range(required, keys), rng.randint(2, 8))
+        pool.append([{"Key": f"Key{k:02d}", "Value": rng.choice(good) if rng.random() < 0.99 else "Prod "}
+                     for k in chosen])
+    for n in range(resources):
+        service, kind = types[n % len(types)].split(":")
+        yield {"ResourceARN": f"arn:aws:{service}:us-east-1:123456789012:{kind}/r-{n:012d}", "Tags": pool[n % 4999]}
+
+
+def bench_tags(resources: int, rules: int) -> Dict[str, Any]:
+    """tag_policy over a synthetic stream: `rules` = required keys + value regexes + 3 overrides."""
+    required = max((rules - 3) // 4, 1)
+    policy_doc = {
+        "required": [f"Key{k:02d}" for k in range(required)],
+        "values": {f"Key{k:02d}": r"prod|staging|dev|v[0-9]+" for k in range(max(rules - 3 - required, 0))},
+        "overrides": {"svc1:*": {"optional": ["Key00"]}, "svc2:type2": {"skip": True},
+                      "svc3:type3": {"values": {"Key01": r"v\d+"}}},
+    }
+    policy = tag_policy.TagPolicy(policy_doc)
+    results: Dict[str, Any] = {"resources": resources, "rules": policy.rule_count()}
+    # The generator's own cost (building items like the CLI's parsed JSON) is measured separately.
+    results["generateSeconds"], _ = _timed(lambda: sum(1 for _ in synthetic_tag_mappings(resources, required, 60)))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tag_compliance.jsonl")
+        with open(path, "w", encoding="utf-8") as out:
+            evaluation = tag_policy.Evaluation(out)
+            seconds, _ = _timed(tag_policy.evaluate_mappings, policy, synthetic_tag_mappings(resources, required, 60),
+                                evaluation)
+        size = os.path.getsize(path)
+    summary = evaluation.summary()
+    evaluate = max(seconds - results["generateSeconds"], 0.0)
+    results["evaluate"] = {"seconds": round(evaluate, 3), "resourcesPerSecond": round(resources / max(evaluate, 1e-6)),
+                           "totalSeconds": seconds, "checked": summary["checked"], "skipped": summary["skipped"],
+                           "nonCompliant": summary["nonCompliant"], "jsonlMiB": round(size / 2**20, 1)}
+    return results
+
+
+def _load_collector(script: str) -> Any:
+    spec = importlib.util.spec_from_file_location(script.replace("-", "_")[:-3], os.path.join(os.path.dirname(os.path.abspath(__file__)), script))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_graviton(instances: int, naive: int) -> Dict[str, Any]:
+    """graviton-migration.collect on a synthetic inventory snapshot; the naive reference searches per instance."""
+    instance_catalog.load_catalog.cache_clear()
+    load_seconds, catalog = _timed(instance_catalog.load_catalog)
+    rng = random.Random(17)
+    names = sorted(catalog.types) + ["m7i-flex.large", "c6in.xlarge", "mac1.metal"]  # a few not in the catalog
+    resources = []
+    for n in range(instances):
+        itype = rng.choice(names)
+        data = {"InstanceId": f"i-{n:017x}", "InstanceType": itype, "State": {"Name": "running"},
+                "PlatformDetails": "Windows" if rng.random() < 0.03 else "Linux/UNIX"}
+        resources.append({"id": data["InstanceId"], "type": "ec2:instance", "region": "us-east-1", "data": data})
+    doc = {"coverage": {"us-east-1": ["ec2:instance"]}, "resources": resources}
+    results: Dict[str, Any] = {"instances": instances, "catalogTypes": len(catalog.types),
+                               "catalogLoadSeconds": load_seconds}
+    graviton = _load_collector("graviton-migration.py")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "inventory.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(doc, f)
+        results["firstRunSeconds"], _ = _timed(graviton.collect, "us-east-1", path)  # includes the inventory load
+        seconds, out = _timed(graviton.collect, "us-east-1", path)
+    results["collect"] = {"seconds": seconds, "instancesPerSecond": round(instances / max(seconds, 1e-6)),
+                          "candidates": len(out["candidates"]), "alreadyGraviton": out["alreadyGraviton"],
+                          "estimatedMonthlySavings": out["estimatedMonthlySavings"]}
+    # Reference: search the catalog for every instance instead of reading the precomputed target.
+    sample = [r["data"]["InstanceType"] for r in resources[:naive]]
+    t0 = time.perf_counter()
+    for itype in sample:
+        src = catalog.types.get(itype)
+        if src and src.architecture != instance_catalog.ARM:
+            catalog._target(src, instance_catalog.parse_family(src.family))
+    per = (time.perf_counter() - t0) / max(len(sample), 1)
+    results["perInstanceSearch"] = {"instances": len(sample), "extrapolatedSeconds": round(per * instances, 2)}
+    return results
+
+
+def synthetic_spot_history(types: int, azs: int, days: int, end: datetime, seed: int = 13) -> Any:
+    """(type, AZ, timestamp, price) tuples like describe-spot-price-history items, a few price changes a day."""
+    rng = random.Random(seed)
+    start = int(end.timestamp()) - days * 86400
+    for i in range(types):
+        base = 0.02 * (1 + i % 40)
+        for z in range(azs):
+            t, price = start - rng.randrange(1, 86400), base * rng.uniform(0.25, 0.45)
+            calm = rng.random() < 0.8
+            while t < start + days * 86400:
+                stamp = datetime.fromtimestamp(t, timezone.utc).isoformat()
+                yield f"t{i:03d}.large", f"az-{z}", stamp, f"{price:.6f}"
+                t += rng.randrange(3600, (8 if calm else 3) * 3600)
+                price = min(max(price * rng.uniform(0.92 if calm else 0.7, 1.08 if calm else 1.5), base * 0.1), base * 1.2)
+
+
+def bench_spot(types: int, azs: int, days: int, stdlib_types: int) -> Dict[str, Any]:
+    """spot_analytics over a synthetic history streamed from a generator, with the raw-record list as reference."""
+    end = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    start = end - timedelta(days=days)
+    on_demand = {f"t{i:03d}.large": 0.02 * (1 + i % 40) for i in range(types)}
+    results: Dict[str, Any] = {"types": types, "azs": azs, "days": days, "numpy": cost_store.np is not None}
+
+    def analytics(n: int) -> Dict[str, Any]:
+        history = spot_analytics.stream_records(synthetic_spot_history(n, azs, days, end))
+        return spot_analytics.analyze(history, start, end, on_demand, top=0)
+
+    seconds, doc = _timed(analytics, types)
+    peak = _peak(lambda: analytics(types)["pools"])  # tracemalloc slows the run down; timed separately above
+    results["analytics"] = {"seconds": seconds, "peakMiB": peak["peakMiB"], "records": doc["records"], "pools": doc["pools"], "hours": doc["window"]["hours"],
+                            "historyMiB": round(doc["historyBytes"] / 2**20, 2),
+                            "diversified": [(p["instanceType"], p["availabilityZone"]) for p in doc["diversified"]]}
+    # What the single-type dump holds per query, for every type at once: one dict per price point.
+    raw = _peak(lambda: len([{"InstanceType": t, "AvailabilityZone": z, "Timestamp": s, "SpotPrice": p,
+                              "ProductDescription": "Linux/UNIX"}
+                             for t, z, s, p in synthetic_spot_history(types, azs, days, end)]))
+    results["rawRecords"] = {"peakMiB": raw["peakMiB"]}
+    if cost_store.np is not None:
+        n = min(stdlib_types, types)
+        vectorized = analytics(n)
+        np_mod, spot_analytics.np = spot_analytics.np, None
+        try:
+            seconds, plain = _timed(analytics, n)
+        finally:
+            spot_analytics.np = np_mod
+        order = [[(p["instanceType"], p["availabilityZone"]) for p in d["ranked"]] for d in (plain, vectorized)]
+        results["stdlib"] = {"types": n, "seconds": seconds, "sameRanking": order[0] == order[1]}
+    return results
+
+
+def synthetic_metric_call(latency: float, idle_share: float = 0.2, seed: int = 23) -> Any:
+    """A GetMetricData stand-in: hourly datapoints for every query, rows with an idle_share chance of being idle."""
+    def call(region: str, batch: List[Dict[str, Any]], start: datetime, end: datetime) -> Dict[str, Any]:
+        time.sleep(latency)
+        hours = int((end - start).total_seconds()) // 3600
+        stamps = [(start + timedelta(hours=h)).isoformat() for h in range(hours)]
+        results = []
+        for q in batch:
+            row, m = q["Id"][1:].split("_")
+            rng = random.Random(seed * 100_003 + int(row) * 31 + int(m))
+            idle = random.Random(seed + int(row)).random() < idle_share
+            scale = (1.5 if idle else 40.0) if q["MetricStat"]["Metric"]["MetricName"] == "CPUUtilization" else (
+                1e4 if idle else 5e7)
+            results.append({"Id": q["Id"], "Timestamps": stamps, "Values": [rng.random() * scale for _ in stamps]})
+        return {"MetricDataResults": results}
+    return call
+
+
+def bench_metrics(instances: int, days: int, latency: float, workers: int, per_instance: int) -> Dict[str, Any]:
+    """Batched, concurrent GetMetricData vs one call per instance (what a per-resource loop does)."""
+    preset = cw_metrics.PRESETS["ec2"]
+    ids = [f"i-{n:017x}" for n in range(instances)]
+    end = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    call = synthetic_metric_call(latency)
+    calls = [0]
+
+    def counted(*a: Any) -> Dict[str, Any]:
+        calls[0] += 1
+        return call(*a)
+
+    results: Dict[str, Any] = {"instances": instances, "days": days, "latency": latency,
+                               "numpy": cost_store.np is not None}
+    with tempfile.TemporaryDirectory(prefix="bench-metrics-") as tmp:
+        record = os.path.join(tmp, "metrics.json")
+        seconds, mset = _timed(lambda: cw_metrics.fetch("us-east-1", preset, ids, days=days, max_workers=workers,
+                                                        end=end, record=record, call=counted))
+        results["batched"] = {"calls": calls[0], "workers": workers, "seconds": seconds}
+        seconds, scores = _timed(cw_metrics.idle_scores, mset)
+        results["scoring"] = {"seconds": seconds, "idle": sum(1 for r in scores if r["idle"])}
+        results["recordMiB"] = round(os.path.getsize(record) / 2**20, 1)
+        results["replayMatches"] = cw_metrics.idle_scores(cw_metrics.replay(record)) == scores
+    sample = ids[:per_instance]
+    t0 = time.perf_counter()
+    for rid in sample:
+        cw_metrics.fetch("us-east-1", preset, [rid], days=days, max_workers=1, end=end, call=call)
+    per = (time.perf_counter() - t0) / max(len(sample), 1)
+    results["perInstance"] = {"instances": len(sample), "extrapolatedCalls": instances,
+                              "extrapolatedSeconds": round(per * instances, 1)}
+    if cost_store.np is not None:
+        np_mod, cw_metrics.np = cw_metrics.np, None
+        try:
+            seconds, plain = _timed(lambda: cw_metrics.idle_scores(
+                cw_metrics.fetch("us-east-1", preset, ids, days=days, max_workers=workers, end=end,
+                                 call=synthetic_metric_call(0.0))))
+        finally:
+            cw_metrics.np = np_mod
+        results["stdlib"] = {"seconds": seconds, "sameScores": plain == scores}
+    return results
+
+
+def synthetic_nat_topology(gateways: List[str], azs: int = 3, seed: int = 29) -> Dict[str, Any]:
+    """describe_topology() output: one VPC per gateway with a subnet per AZ, some routed across AZs."""
+    rng = random.Random(seed)
+    subnets: Dict[str, Any] = {}
+    tables, endpoints = [], {"s3": set(), "dynamodb": set()}
+    for n, nid in enumerate(gateways):
+        vpc, ids = f"vpc-{n}", [f"subnet-{n}-{z}" for z in range(azs)]
+        subnets.update({sid: (vpc, f"az-{z}") for z, sid in enumerate(ids)})
+        routed = ids if rng.random() < 0.3 else ids[:1]  # one NAT for the whole VPC vs one per AZ
+        tables.append({"id": f"rtb-{n}", "vpc": vpc, "nats": {nid}, "subnets": routed, "main": False})
+        for service in ("s3", "dynamodb"):
+            if rng.random() < 0.5:
+                endpoints[service].add(f"rtb-{n}")
+    return {"subnets": subnets, "tables": tables, "endpoints": endpoints}
+
+
+def bench_nat(gateways: int, regions: int, days: int, latency: float, per_metric: int) -> Dict[str, Any]:
+    """Per-region metric fetch + attribution for every region at once; the reference is one call per metric."""
+    nat = _load_collector("nat-gateway-optimizer.py")
+    preset = cw_metrics.PRESETS["nat"]
+    end = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    call = synthetic_metric_call(latency)
+    calls = [0]
+
+    def counted(*a: Any) -> Dict[str, Any]:
+        calls[0] += 1
+        return call(*a)
+
+    def region_pass(r: int) -> List[Dict[str, Any]]:
+        ids = [f"nat-{r:02d}{n:015x}" for n in range(gateways // regions)]
+        items = [{"NatGatewayId": i, "SubnetId": f"subnet-{n}-0", "ConnectivityType": "public"} for n, i in enumerate(ids)]
+        mset = cw_metrics.fetch(f"region-{r}", preset, ids, days=days, end=end, call=counted)
+        return nat.attribute(items, mset, synthetic_nat_topology(ids), nat.DEFAULT_RATES)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=regions) as pool:
+        ranked = [rec for items in pool.map(region_pass, range(regions)) for rec in items]
+    seconds = round(time.perf_counter() - t0, 3)
+    flags: Dict[str, int] = {}
+    for rec in ranked:
+        for f in rec["flags"]:
+            flags[f] = flags.get(f, 0) + 1
+    results: Dict[str, Any] = {"gateways": len(ranked), "regions": regions, "days": days, "latency": latency,
+                               "batched": {"calls": calls[0], "seconds": seconds}, "flagged": flags}
+    # One GetMetricData call per (gateway, metric), serially: what a per-resource loop would issue.
+    queries = cw_metrics.build_queries(preset, [ranked[0]["NatGatewayId"]])
+    start = end - timedelta(days=days)
+    t0 = time.perf_counter()
+    for n in range(per_metric):
+        call("us-east-1", [queries[n % len(queries)]], start, end)
+    per = (time.perf_counter() - t0) / max(per_metric, 1)
+    total = len(ranked) * len(preset.metrics)
+    results["perMetric"] = {"calls": per_metric, "extrapolatedCalls": total,
+                            "extrapolatedSeconds": round(per * total, 1)}
+    return results
+
+
+def synthetic_log_groups(groups: int, now_ms: int, seed: int = 31) -> Any:
+    """describe-log-groups items: a long tail of small groups, 1 in 5 without retention."""
+    rng = random.Random(seed)
+    retentions = (None, 1, 3, 7, 14, 30, 60, 90, 180, 365, 731, 3653)
+    for n in range(groups):
+        age = rng.uniform(1, 1500)
+        retention = retentions[0] if rng.random() < 0.2 else rng.choice(retentions[1:])
+        held = min(age, retention) if retention else age
+        item = {"logGroupName": f"/aws/lambda/service-{n:07d}", "creationTime": int(now_ms - age * 86_400_000),
+                "storedBytes": int(rng.paretovariate(1.2) * 2**20 * held), "metricFilterCount": 0,
+                "arn": f"arn:aws:logs:us-east-1:123456789012:log-group:/aws/lambda/service-{n:07d}:*"}
+        if retention:
+            item["retentionInDays"] = retention
+        yield item
+
+
+def bench_logs(groups: int, top: int) -> Dict[str, Any]:
+    """Streaming scan with a top-N heap (peak heap at N/10 and N) vs simulating into a list and sorting it."""
+    logs = _load_collector("logs-retention-optimizer.py")
+    now_ms = int(datetime(2024, 3, 1, tzinfo=timezone.utc).timestamp() * 1000)
+
+    def streamed(n: int) -> Any:
+        return logs.scan(synthetic_log_groups(n, now_ms), top=top, now_ms=now_ms)
+
+    results: Dict[str, Any] = {"groups": groups, "top": top}
+    seconds, s = _timed(streamed, groups)
+    results["stream"] = {"seconds": seconds, "groupsPerSecond": int(groups / max(seconds, 1e-9)),
+                         "savingsByPolicy": {str(d): round(v, 2) for d, v in s.savings.items()}}
+    for n in (groups // 10, groups):
+        results["stream"][f"peakMiB@{n}"] = _peak(lambda: streamed(n).groups)["peakMiB"]
+
+    def listed() -> List[str]:
+        recs = [logs.simulate(g, now_ms, logs.POLICIES, logs.STORAGE_GB_MONTH) for g in
+                list(synthetic_log_groups(groups, now_ms))]
+        recs.sort(key=lambda r: -r["savings"][30])
+        return [r["logGroupName"] for r in recs[:top]]
+
+    ref = _peak(listed)
+    results["list"] = {"peakMiB": ref["peakMiB"],
+                       "sameRanking": ref["result"] == [r["logGroupName"] for r in s.ranked()]}
+    return results
+
+
+def synthetic_snapshots(snapshots: int, per_volume: int, seed: int = 37) -> Any:
+    """describe-snapshots items (projected): daily-ish chains of `per_volume` snapshots, interleaved by volume."""
+    rng = random.Random(seed)
+    base = int(datetime(2024, 3, 1, tzinfo=timezone.utc).timestamp())
+    volumes = max(snapshots // per_volume, 1)
+    sizes = [rng.choice((8, 20, 50, 100, 500)) for _ in range(volumes)]
+    for n in range(snapshots):
+        v, step = n % volumes, n // volumes
+        stamp = base - (per_volume - step) * 86400 * rng.choice((1, 1, 7)) - rng.randrange(3600)
+        yield {"SnapshotId": f"snap-{n:017x}", "VolumeId": f"vol-{v:017x}", "VolumeSize": sizes[v],
+               "StartTime": datetime.fromtimestamp(stamp, timezone.utc).isoformat().replace("+00:00", "Z"),
+               "StorageTier": "archive" if rng.random() < 0.02 else "standard"}
+
+
+def bench_snapshots(snapshots: int, per_volume: int, gone: float) -> Dict[str, Any]:
+    """Streaming the snapshots into the lineage index and analyzing every chain vs keeping a list of records."""
+    volumes = max(snapshots // per_volume, 1)
+    live = {f"vol-{v:017x}" for v in range(volumes) if (v * 7919) % 100 >= gone * 100}
+    amis = {f"snap-{n:017x}" for n in range(0, snapshots, 997)}
+    cutoff = int(datetime(2024, 3, 1, tzinfo=timezone.utc).timestamp()) - 90 * 86400
+    results: Dict[str, Any] = {"snapshots": snapshots, "volumes": volumes, "liveVolumes": len(live)}
+    seconds, index = _timed(lambda: snapshot_lineage.build_index(synthetic_snapshots(snapshots, per_volume)))
+    results["index"] = {"seconds": seconds, "chains": len(index.chains), "arrayMiB": round(index.nbytes() / 2**20, 1)}
+    seconds, doc = _timed(snapshot_lineage.analyze, index, live, amis, cutoff)
+    results["analysis"] = {"seconds": seconds, **{k: doc[k] for k in (
+        "orphanChains", "deletableSnapshots", "estimatedStoredGiB", "estimatedReclaimableGiB")}}
+    # What summing VolumeSize over the same deletable snapshots would claim.
+    naive = sum(chain.sizes[k] for key, chain in index.chains.items()
+                for _, k in snapshot_lineage.analyze_chain(key, chain, key in live, amis, cutoff)[1])
+    reclaimable = doc["estimatedReclaimableGiB"]
+    results["volumeSizeSumGiB"] = round(naive / snapshot_lineage.GIB, 2)
+    results["estimatedShare"] = round((reclaimable["orphans"] + reclaimable["olderThanThreshold"])
+                                      / max(results["volumeSizeSumGiB"], 1e-9), 3)
+    del index
+    results["index"]["peakMiB"] = _peak(
+        lambda: len(snapshot_lineage.build_index(synthetic_snapshots(snapshots, per_volume)).chains))["peakMiB"]
+    results["recordList"] = {"peakMiB": _peak(lambda: len(list(synthetic_snapshots(snapshots, per_volume))))["peakMiB"]}
+    return results
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="bench", required=True)
+    b = sub.add_parser("backends", help="subprocess vs in-process pages/second against a local stub endpoint")
+    b.add_argument("--pages", type=int, default=20)
+    b.add_argument("--page-size", type=int, default=50)
+    b.add_argument("--rounds", type=int, default=3)
+    m = sub.add_parser("pagination-memory", help="paginate vs iter_paginate peak heap on synthetic pages")
+    m.add_argument("--items", type=int, default=500_000)
+    m.add_argument("--page-items", type=int, default=1000)
+    p = sub.add_parser("prefetch", help="iter_paginate read-ahead vs serial behind injected latency")
+    p.add_argument("--pages", type=int, default=20)
+    p.add_argument("--page-items", type=int, default=1000)
+    p.add_argument("--latency", type=float, default=0.05, help="Seconds per simulated API call")
+    p.add_argument("--work", type=float, default=0.05, help="Seconds of caller work per page")
+    c = sub.add_parser("cost-history", help="full 90-day Cost Explorer re-download vs incremental store")
+    c.add_argument("--runs", type=int, default=30, help="Consecutive daily runs to simulate")
+    c.add_argument("--days", type=int, default=90)
+    c.add_argument("--services", type=int, default=60)
+    c.add_argument("--latency", type=float, default=0.3, help="Seconds per simulated Cost Explorer request")
+    s = sub.add_parser("cost-store", help="nested ResultsByTime walk vs columnar store on a synthetic org dataset")
+    s.add_argument("--days", type=int, default=730)
+    s.add_argument("--services", type=int, default=400)
+    s.add_argument("--accounts", type=int, default=200)
+    s.add_argument("--density", type=float, default=0.01, help="Share of services each account uses daily")
+    s.add_argument("--skip-json", action="store_true", help="Only time the store (for datasets too big to json.load)")
+    q = sub.add_parser("query", help="cost_query.py latency over a multi-million-row synthetic store")
+    q.add_argument("--days", type=int, default=730)
+    q.add_argument("--services", type=int, default=400)
+    q.add_argument("--accounts", type=int, default=200)
+    q.add_argument("--per-account", type=int, default=20, help="Services each account uses every day")
+    r = sub.add_parser("report-memory", help="generate_analysis peak RSS: whole-document json.load vs streaming")
+    r.add_argument("--days", type=int, default=90)
+    r.add_argument("--services", type=int, default=3000, help="Services per day in cost_by_service_90d.json")
+    r.add_argument("--regions", type=int, default=16)
+    r.add_argument("--volumes", type=int, default=5000, help="Compute Optimizer volume recommendations per region")
+    a = sub.add_parser("anomaly", help="cost_anomaly.py on synthetic daily series with injected spikes")
+    a.add_argument("--series", type=int, default=50_000)
+    a.add_argument("--days", type=int, default=90)
+    a.add_argument("--spikes", type=int, default=500)
+    a.add_argument("--stdlib-series", type=int, default=2000, help="Series scored by the stdlib path (it is slower)")
+    f = sub.add_parser("forecast", help="cost_forecast.py fit + backtest over synthetic daily series")
+    f.add_argument("--series", type=int, default=10_000)
+    f.add_argument("--days", type=int, default=90)
+    f.add_argument("--horizon", type=int, default=30)
+    f.add_argument("--stdlib-series", type=int, default=500, help="Series forecast by the stdlib path (it is slower)")
+    cm = sub.add_parser("commitment", help="commitment_sim.py sweep vs per-candidate re-simulation")
+    cm.add_argument("--families", type=int, default=300)
+    cm.add_argument("--hours", type=int, default=8760)
+    cm.add_argument("--check", type=int, default=3, help="Families re-simulated naively as a reference")
+    cm.add_argument("--candidates", type=int, default=200, help="Commitment levels per naive re-simulation")
+    tg = sub.add_parser("tags", help="tag_policy.py evaluation over a synthetic Tagging API stream")
+    tg.add_argument("--resources", type=int, default=1_000_000)
+    tg.add_argument("--rules", type=int, default=50)
+    g = sub.add_parser("graviton", help="graviton-migration.py over a synthetic inventory of N instances")
+    g.add_argument("--instances", type=int, default=100_000)
+    g.add_argument("--naive", type=int, default=5000, help="Instances mapped by per-instance catalog search")
+    sp = sub.add_parser("spot", help="spot_analytics.py pool statistics over a synthetic price history")
+    sp.add_argument("--types", type=int, default=200)
+    sp.add_argument("--azs", type=int, default=6)
+    sp.add_argument("--days", type=int, default=30)
+    sp.add_argument("--stdlib-types", type=int, default=20, help="Types analyzed by both paths for the comparison")
+    mt = sub.add_parser("metrics", help="cw_metrics.py batched GetMetricData vs one call per instance")
+    mt.add_argument("--instances", type=int, default=2000)
+    mt.add_argument("--days", type=int, default=14)
+    mt.add_argument("--latency", type=float, default=0.2, help="Seconds per simulated GetMetricData call")
+    mt.add_argument("--workers", type=int, default=4)
+    mt.add_argument("--per-instance", type=int, default=20, help="Instances fetched one call each as a reference")
+    nt = sub.add_parser("nat", help="nat-gateway-optimizer.py attribution over N gateways in R regions")
+    nt.add_argument("--gateways", type=int, default=600)
+    nt.add_argument("--regions", type=int, default=6)
+    nt.add_argument("--days", type=int, default=14)
+    nt.add_argument("--latency", type=float, default=0.2, help="Seconds per simulated GetMetricData call")
+    nt.add_argument("--per-metric", type=int, default=20, help="Single-metric calls timed as a reference")
+    lg = sub.add_parser("logs", help="logs-retention-optimizer.py streaming scan over N synthetic log groups")
+    lg.add_argument("--groups", type=int, default=200_000)
+    lg.add_argument("--top", type=int, default=200)
+    sn = sub.add_parser("snapshots", help="snapshot_lineage.py over N synthetic snapshots")
+    sn.add_argument("--snapshots", type=int, default=1_000_000)
+    sn.add_argument("--per-volume", type=int, default=20, help="Snapshots per volume chain")
+    sn.add_argument("--gone", type=float, default=0.2, help="Share of source volumes that no longer exist")
+    args = ap.parse_args()
+    if args.bench == "backends":
+        write_stdout_json(bench_backends(args.pages, args.page_size, args.rounds))
+    elif args.bench == "pagination-memory":
+        write_stdout_json(bench_pagination_memory(args.items, args.page_items))
+    elif args.bench == "prefetch":
+        write_stdout_json(bench_prefetch(args.pages, args.page_items, args.latency, args.work))
+    elif args.bench == "cost-history":
+        write_stdout_json(bench_cost_history(args.runs, args.days, args.services, args.latency))
+    elif args.bench == "cost-store":
+        write_stdout_json(bench_cost_store(args.days, args.services, args.accounts, args.density, args.skip_json))
+    elif args.bench == "query":
+        write_stdout_json(bench_query(args.days, args.services, args.accounts, args.per_account))
+    elif args.bench == "report-memory":
+        write_stdout_json(bench_report_memory(args.days, args.services, args.regions, args.volumes))
+    elif args.bench == "anomaly":
+        write_stdout_json(bench_anomaly(args.series, args.days, args.spikes, args.stdlib_series))
+    elif args.bench == "forecast":
+        write_stdout_json(bench_forecast(args.series, args.days, args.horizon, args.stdlib_series))
+    elif args.bench == "commitment":
+        write_stdout_json(bench_commitment(args.families, args.hours, args.check, args.candidates))
+    elif args.bench == "tags":
+        write_stdout_json(bench_tags(args.resources, args.rules))
+    elif args.bench == "graviton":
+        write_stdout_json(bench_graviton(args.instances, args.naive))
+    elif args.bench == "spot":
+        write_stdout_json(bench_spot(args.types, args.azs, args.days, args.stdlib_types))
+    elif args.bench == "metrics":
+        write_stdout_json(bench_metrics(args.instances, args.days, args.latency, args.workers, args.per_instance))
+    elif args.bench == "nat":
+        write_stdout_json(bench_nat(args.gateways, args.regions, args.days, args.latency, args.per_metric))
+    elif args.bench == "logs":
+        write_stdout_json(bench_logs(args.groups, args.top))
+    elif args.bench == "snapshots":
+        write_stdout_json(bench_snapshots(args.snapshots, args.per_volume, args.gone))
+
+
+if __name__ == "__main__":
+    main()
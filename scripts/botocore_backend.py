@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+In-process backend for common.shell_json/paginate built on botocore.
+- Translates the same `aws ... <service> <operation> --flags` argv the collectors already build
+- One botocore session per process; clients (and their HTTP connection pools) reused per service/region
+- Pagination mirrors the CLI: full auto-pagination by default, --max-items/--starting-token emit NextToken
+- Anything it cannot translate (s3 high-level commands, --query, ...) is handed to the fallback backend
+"""
+from __future__ import annotations
+
+import base64
+import json
+import os
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import botocore.session
+from botocore import xform_name
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+from common import UnsupportedCommand
+
+# CLI command names that differ from botocore service names.
+CLI_SERVICE_ALIASES = {
+    "s3api": "s3",
+    "configservice": "config",
+    "deploy": "codedeploy",
+}
+GLOBAL_VALUE_OPTIONS = {"--output", "--region", "--endpoint-url", "--profile", "--color"}
+GLOBAL_FLAGS = {"--no-paginate", "--no-cli-pager", "--no-verify-ssl", "--debug"}
+UNSUPPORTED_OPTIONS = {"--query", "--cli-input-json", "--cli-input-yaml", "--generate-cli-skeleton"}
+
+
+class ParsedCommand:
+    def __init__(self) -> None:
+        self.service = ""
+        self.operation = ""
+        self.region: Optional[str] = None
+        self.endpoint_url: Optional[str] = None
+        self.profile: Optional[str] = None
+        self.no_paginate = False
+        self.starting_token: Optional[str] = None
+        self.max_items: Optional[int] = None
+        self.page_size: Optional[int] = None
+        self.options: List[Tuple[str, List[str]]] = []
+
+
+def parse_argv(cmd: List[str]) -> ParsedCommand:
+    """Splits an `aws` argv into global options, service, operation and raw --option values."""
+    if not cmd or os.path.basename(cmd[0]) != "aws":
+        raise UnsupportedCommand("not an aws CLI command")
+    pc = ParsedCommand()
+    positionals: List[str] = []
+    i, n = 1, len(cmd)
+    while i < n:
+        tok = cmd[i]
+        if not tok.startswith("--"):
+            if pc.operation:
+                raise UnsupportedCommand(f"unexpected argument {tok!r}")
+            positionals.append(tok)
+            if len(positionals) == 2:
+                pc.service, pc.operation = CLI_SERVICE_ALIASES.get(positionals[0], positionals[0]), positionals[1]
+            i += 1
+            continue
+        if tok in UNSUPPORTED_OPTIONS:
+            raise UnsupportedCommand(f"{tok} is not supported in-process")
+        if tok in GLOBAL_FLAGS:
+            pc.no_paginate = pc.no_paginate or tok == "--no-paginate"
+            i += 1
+            continue
+        if tok in GLOBAL_VALUE_OPTIONS:
+            if i + 1 >= n:
+                raise UnsupportedCommand(f"{tok} needs a value")
+            value = cmd[i + 1]
+            if tok == "--region":
+                pc.region = value
+            elif tok == "--endpoint-url":
+                pc.endpoint_url = value
+            elif tok == "--profile":
+                pc.profile = value
+            i += 2
+            continue
+        if not pc.operation:
+            raise UnsupportedCommand(f"option {tok} before the operation name")
+        values: List[str] = []
+        j = i + 1
+        while j < n and not cmd[j].startswith("--"):
+            values.append(cmd[j])
+            j += 1
+        if tok == "--starting-token":
+            pc.starting_token = values[0] if values else None
+        elif tok == "--max-items":
+            pc.max_items = int(values[0])
+        elif tok == "--page-size":
+            pc.page_size = int(values[0])
+        else:
+            pc.options.append((tok[2:], values))
+        i = j
+    if not pc.operation:
+        raise UnsupportedCommand("expected `<service> <operation>`")
+    return pc
+
+
+def _split_shorthand(text: str) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    for part in text.split(","):
+        if "=" not in part:
+            raise UnsupportedCommand(f"cannot parse shorthand {text!r}")
+        k, v = part.split("=", 1)
+        out[k.strip()] = v.strip()
+    return out
+
+
+def convert(shape: Any, raw: str) -> Any:
+    """Converts one CLI token into the Python value botocore expects for `shape`."""
+    t = shape.type_name
+    if t in {"structure", "map"}:
+        if raw.lstrip().startswith("{"):
+            return json.loads(raw)
+        pairs = _split_shorthand(raw)
+        if t == "map":
+            return pairs
+        members = {m.lower(): (m, s) for m, s in shape.members.items()}
+        out: Dict[str, Any] = {}
+        for k, v in pairs.items():
+            if k.lower() not in members:
+                raise UnsupportedCommand(f"unknown key {k!r} for {shape.name}")
+            name, sub = members[k.lower()]
+            out[name] = convert(sub, v)
+        return out
+    if t == "list":
+        if raw.lstrip().startswith("["):
+            return json.loads(raw)
+        member = shape.member
+        if member.type_name in {"structure", "map"}:
+            return [convert(member, raw)]
+        return [convert(member, part) for part in raw.split(",")]
+    if t in {"integer", "long"}:
+        return int(raw)
+    if t in {"float", "double"}:
+        return float(raw)
+    if t == "boolean":
+        return raw.lower() == "true"
+    return raw
+
+
+def build_params(operation_model: Any, options: List[Tuple[str, List[str]]]) -> Dict[str, Any]:
+    shape = operation_model.input_shape
+    members = {xform_name(m, "-"): (m, s) for m, s in (shape.members.items() if shape else [])}
+    params: Dict[str, Any] = {}
+    for flag, values in options:
+        negated = flag.startswith("no-") and flag[3:] in members
+        key = flag[3:] if negated else flag
+        if key not in members:
+            raise UnsupportedCommand(f"unknown option --{flag} for {operation_model.name}")
+        name, sub = members[key]
+        if sub.type_name == "boolean" and not values:
+            params[name] = not negated
+        elif sub.type_name == "list":
+            # The CLI accepts both `--ids a b` and repeated flags; keep every value in order.
+            items = params.setdefault(name, [])
+            for v in values:
+                items.extend(convert(sub, v))
+        else:
+            if len(values) != 1:
+                raise UnsupportedCommand(f"--{flag} expects one value")
+            params[name] = convert(sub, values[0])
+    return params
+
+
+def _jsonable(obj: Any) -> Any:
+    if isinstance(obj, dict):
+        return {k: _jsonable(v) for k, v in obj.items() if k != "ResponseMetadata"}
+    if isinstance(obj, list):
+        return [_jsonable(v) for v in obj]
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode("ascii")
+    if hasattr(obj, "read"):
+        return None
+    return obj
+
+
+class InProcessBackend:
+    """
+    Executes CLI-shaped commands with botocore, reusing one session and a client per
+    (service, region, endpoint, credentials). Thread-safe; clients carry their own connection pool.
+    """
+
+    name = "inprocess"
+
+    def __init__(self, fallback: Optional[Any] = None, max_pool_connections: int = 32) -> None:
+        self._session = botocore.session.get_session()
+        # Retries are handled once, in common.shell_json, so botocore makes a single attempt per call.
+        self._config = Config(max_pool_connections=max_pool_connections, retries={"total_max_attempts": 1})
+        self._clients: Dict[Tuple[Any, ...], Any] = {}
+        self._lock = threading.Lock()
+        self.fallback = fallback
+
+    def client(self, service: str, region: Optional[str], endpoint_url: Optional[str] = None,
+               env: Optional[Dict[str, str]] = None) -> Any:
+        env = env or {}
+        creds = (env.get("AWS_ACCESS_KEY_ID"), env.get("AWS_SECRET_ACCESS_KEY"), env.get("AWS_SESSION_TOKEN"))
+        region = region or env.get("AWS_REGION") or os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION")
+        key = (service, region, endpoint_url, creds)
+        with self._lock:
+            c = self._clients.get(key)
+            if c is None:
+                kwargs: Dict[str, Any] = {"region_name": region, "config": self._config}
+                if endpoint_url:
+                    kwargs["endpoint_url"] = endpoint_url
+                if creds[0]:
+                    kwargs.update(aws_access_key_id=creds[0], aws_secret_access_key=creds[1], aws_session_token=creds[2])
+                # Session-level client creation is not thread-safe, hence the lock around it.
+                c = self._session.create_client(service, **kwargs)
+                self._clients[key] = c
+            return c
+
+    def call(self, cmd: List[str], env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        try:
+            pc = parse_argv(cmd)
+            if pc.profile:
+                raise UnsupportedCommand("--profile is handled by the CLI")
+            client = self.client(pc.service, pc.region, pc.endpoint_url, env)
+            op_name = self._operation_name(client, pc.operation)
+            params = build_params(client.meta.service_model.operation_model(op_name), pc.options)
+        except (UnsupportedCommand, ValueError, BotoCoreError) as e:
+            if self.fallback is None:
+                raise RuntimeError(f"Cannot run in-process: {' '.join(cmd)}\n{e}")
+            return self.fallback.call(cmd, env)
+        try:
+            return _jsonable(self._invoke(client, op_name, params, pc))
+        except ClientError as e:
+            # Same text the CLI prints on stderr, so callers can classify errors identically.
+            raise RuntimeError(f"Command failed: {' '.join(cmd)}\n{e}")
+        except BotoCoreError as e:
+            raise RuntimeError(f"Command failed: {' '.join(cmd)}\n{e}")
+
+    @staticmethod
+    def _operation_name(client: Any, cli_name: str) -> str:
+        for op in client.meta.service_model.operation_names:
+            if xform_name(op, "-") == cli_name:
+                return op
+        raise UnsupportedCommand(f"unknown operation {cli_name}")
+
+    @staticmethod
+    def _invoke(client: Any, op_name: str, params: Dict[str, Any], pc: ParsedCommand) -> Dict[str, Any]:
+        method = xform_name(op_name)
+        if pc.no_paginate or not client.can_paginate(method):
+            return getattr(client, method)(**params)
+        cfg: Dict[str, Any] = {}
+        if pc.max_items:
+            cfg["MaxItems"] = pc.max_items
+        if pc.page_size:
+            cfg["PageSize"] = pc.page_size
+        if pc.starting_token:
+            cfg["StartingToken"] = pc.starting_token
+        # build_full_result is what the CLI uses too: merged result keys plus NextToken when truncated.
+        return client.get_paginator(method).paginate(**params, PaginationConfig=cfg).build_full_result()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Parallel collector orchestrator: writes the FinOps JSON set into reports/data and builds analysis.txt.
+- Each collector is a Task with a declared output file and optional dependencies
+- Independent tasks run concurrently on a bounded worker pool, each with its own timeout
+- Failed or timed-out tasks leave '{}' behind (same contract as the old shell pipeline)
+- Per-task wall-clock timings and AWS call counters (calls, retries, throttles, wait time) are written
+  to reports/data/run_manifest.json
+- --cache read (default) serves slow-changing APIs (CE recommendations, Compute Optimizer enrollment, ...)
+  from the on-disk response cache shared by all tasks; --cache refresh re-fetches them once per run
+Only `aws` on PATH and the Python collectors are invoked, so a fake `aws` binary is enough to exercise it.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from common import CACHE_MODES, aws_base, ensure_region
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SCRIPTS = os.path.join(ROOT, "scripts")
+DATA = os.path.join(ROOT, "reports", "data")
+MANIFEST = "run_manifest.json"
+
+
+@dataclass
+class Task:
+    name: str
+    cmd: List[str]
+    output: Optional[str] = None  # file name under the data dir; None discards stdout
+    needs: Tuple[str, ...] = ()
+    timeout: Optional[float] = None
+
+
+@dataclass
+class TaskResult:
+    name: str
+    output: Optional[str]
+    status: str = "pending"  # ok | failed | timeout | skipped
+    returncode: Optional[int] = None
+    started_at: Optional[str] = None
+    seconds: float = 0.0
+    error: str = ""
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        d: Dict[str, Any] = {
+            "name": self.name,
+            "output": self.output,
+            "status": self.status,
+            "returncode": self.returncode,
+            "startedAt": self.started_at,
+            "seconds": round(self.seconds, 3),
+        }
+        if self.error:
+            d["error"] = self.error
+        d.update(self.extra)
+        return d
+
+
+def log(msg: str) -> None:
+    sys.stderr.write(f"[collect] {msg}\n")
+    sys.stderr.flush()
+
+
+def _utcnow() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def collector(script: str, region: str, *extra: str, regions: Optional[str] = None) -> List[str]:
+    """`regions` is only passed to collectors built on common.add_region_args."""
+    cmd = [sys.executable, os.path.join(SCRIPTS, script), "--region", region, *extra]
+    if regions:
+        cmd += ["--regions", regions]
+    return cmd
+
+
+def aws_call() -> List[str]:
+    """Plain CLI tasks go through aws_call.py so they get the same pacing and retries as the collectors."""
+    return [sys.executable, os.path.join(SCRIPTS, "aws_call.py")] + aws_base()
+
+
+def build_tasks(region: str, data_dir: str = DATA, regions: Optional[str] = None) -> List[Task]:
+    history_dir = os.path.join(data_dir, "cost_history")
+
+    def cost_store(*args: str) -> List[str]:
+        return [sys.executable, os.path.join(SCRIPTS, "cost_store.py"), *args]
+
+    def cost_history(group_by: str, granularity: str) -> List[str]:
+        return [sys.executable, os.path.join(SCRIPTS, "cost_history.py"), "--store-dir", history_dir, "--days", "90",
+                "--group-by", group_by, "--granularity", granularity]
+
+    # Cost Explorer forecasting usually starts on the next UTC day
+    today = datetime.now(timezone.utc).date()
+    f_start, f_end = (today + timedelta(days=1)).isoformat(), (today + timedelta(days=31)).isoformat()
+    ce = aws_call() + ["ce"]
+    bucket_scan = os.path.join(data_dir, "s3_buckets.json")
+    inv = ("--inventory", os.path.join(data_dir, "inventory.json"))
+    tasks = [
+        Task("identity", aws_call() + ["sts", "get-caller-identity"], "identity.json"),
+        # Incremental: only days Cost Explorer may still revise (or never fetched) are queried again.
+        Task("cost-by-service", cost_history("SERVICE", "DAILY"), "cost_by_service_90d.json"),
+        Task("cost-by-account", cost_history("LINKED_ACCOUNT", "MONTHLY"), "cost_by_account_90d.json"),
+        # Daily per service x account series for the local anomaly detector and forecast.
+        Task("cost-by-service-account", cost_history("SERVICE,LINKED_ACCOUNT", "DAILY"),
+             "cost_by_service_account_90d.json"),
+        Task(
+            "forecast",
+            ce + ["get-cost-forecast", "--metric", "UNBLENDED_COST", "--time-period", f"Start={f_start},End={f_end}",
+                  "--granularity", "DAILY"],
+            "forecast_30d.json",
+        ),
+        Task(
+            "sp-recommendations",
+            ce + ["get-savings-plans-purchase-recommendation", "--savings-plans-type", "COMPUTE_SP",
+                  "--term-in-years", "ONE_YEAR", "--payment-option", "NO_UPFRONT",
+                  "--lookback-period-in-days", "THIRTY_DAYS"],
+            "sp_recommendations.json",
+        ),
+        Task(
+            "ri-recommendations",
+            ce + ["get-reservation-purchase-recommendation", "--service", "Amazon Elastic Compute Cloud - Compute",
+                  "--term-in-years", "ONE_YEAR", "--payment-option", "NO_UPFRONT",
+                  "--lookback-period-in-days", "THIRTY_DAYS"],
+            "ri_ec2_recommendations.json",
+        ),
+        # One describe-* pass per resource type and region, shared by the EC2-side collectors below.
+        Task("inventory", collector("inventory.py", region, regions=regions), "inventory.json"),
+        Task("ec2-idle", collector("ec2-idle-detector.py", region, *inv, regions=regions), "ec2_idle.json",
+             needs=("inventory",)),
+        Task("ebs-optimizer", collector("ebs-volume-optimizer.py", region, *inv, regions=regions), "ebs_optimizer.json",
+             needs=("inventory",)),
+        Task("lambda-optimizer", collector("lambda-cost-optimizer.py", region, regions=regions), "lambda_optimizer.json"),
+        Task("rds-rightsizing", collector("rds-rightsizing.py", region), "rds_rightsizing.json"),
+        Task("nat", collector("nat-gateway-optimizer.py", region, *inv, regions=regions), "nat.json", needs=("inventory",)),
+        Task("graviton", collector("graviton-migration.py", region, *inv, regions=regions), "graviton.json",
+             needs=("inventory",)),
+        # Spot pools of every instance type in the fleet, ranked for diversification.
+        Task("spot-pools", collector("spot-advisor.py", region, "--from-inventory", *inv, regions=regions),
+             "spot_pools.json", needs=("inventory",)),
+        Task("logs-retention", collector("logs-retention-optimizer.py", region), "logs_retention.json"),
+        # One bucket pass (lifecycle + tagging) shared by the S3 lifecycle and tag compliance collectors.
+        Task("s3-scan", [sys.executable, os.path.join(SCRIPTS, "s3_scan.py"), "--fields", "lifecycle,tagging"],
+             "s3_buckets.json"),
+        Task("s3-lifecycle", collector("s3-lifecycle-optimizer.py", region, "--bucket-scan", bucket_scan),
+             "s3_lifecycle.json", needs=("s3-scan",)),
+        # Streams its own describe-snapshots pass; snapshots are not in the inventory every collector loads.
+        Task("ebs-snapshots", collector("snapshot-cleanup.py", region, "--days", "180", regions=regions),
+             "ebs_snapshots.json"),
+        # Every taggable resource in one Tagging API pass; all offenders in tag_compliance.jsonl.
+        Task("tag-compliance", collector("tag-compliance-checker.py", region, "--include-untagged", "--bucket-scan",
+                                         bucket_scan, *inv, "--out", os.path.join(data_dir, "tag_compliance.jsonl")),
+             "tag_compliance.json", needs=("s3-scan", "inventory")),
+        # Columnar copy of the daily cost history for the report and the dashboard (no ResultsByTime walks).
+        Task("cost-store", cost_store("build", "--input", os.path.join(data_dir, "cost_by_service_90d.json"),
+                                      "--out", os.path.join(data_dir, "cost_store.bin")),
+             None, needs=("cost-by-service",)),
+        Task("dashboard-export", cost_store("export-dashboard", "--store", os.path.join(data_dir, "cost_store.bin")),
+             "dashboard_costs.json", needs=("cost-store",)),
+        # Weekday-aware z-scores over our own daily series; no API calls, a day ahead of the AWS monitors.
+        Task("cost-anomalies", collector("cost-anomaly-detector.py", region, "--mode", "local", "--source",
+                                         "service-account", "--data-dir", data_dir),
+             "cost_anomalies.json", needs=("cost-by-service-account",)),
+        # Offline per-series forecast in the forecast_30d.json shape, broken down per service x account.
+        Task("forecast-local", collector("cost-forecasting.py", region, "--mode", "local", "--source",
+                                         "service-account", "--data-dir", data_dir),
+             "forecast_local_30d.json", needs=("cost-by-service-account",)),
+    ]
+    # Versions the item lists against the previous run (versions/<output>/N.json deltas, changes.json summary).
+    versioned = ("inventory", "tag-compliance", "lambda-optimizer", "ebs-optimizer", "ebs-snapshots", "rds-rightsizing")
+    tasks.append(Task("versions", [sys.executable, os.path.join(SCRIPTS, "delta.py"), "record", "--data-dir", data_dir],
+                      "changes.json", needs=versioned))
+    tasks.append(
+        Task("analysis", [sys.executable, os.path.join(SCRIPTS, "generate_analysis.py"), "--data-dir", data_dir,
+                          "--out", os.path.join(os.path.dirname(data_dir), "analysis.txt")], None,
+             needs=tuple(t.name for t in tasks))
+    )
+    return tasks
+
+
+def _write_fallback(path: str) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{}\n")
+
+
+def _read_stats(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def run_task(task: Task, data_dir: str, default_timeout: float, stats_dir: Optional[str] = None) -> TaskResult:
+    res = TaskResult(task.name, task.output, started_at=_utcnow())
+    timeout = task.timeout or default_timeout
+    out_path = os.path.join(data_dir, task.output) if task.output else None
+    tmp_path = f"{out_path}.tmp" if out_path else None
+    env = dict(os.environ)
+    stats_path = os.path.join(stats_dir, f"{task.name}.json") if stats_dir else None
+    if stats_path:
+        env["AWS_COLLECTOR_STATS_FILE"] = stats_path
+    t0 = time.monotonic()
+    try:
+        with open(tmp_path or os.devnull, "w", encoding="utf-8") as out:
+            proc = subprocess.run(task.cmd, stdout=out, stderr=subprocess.PIPE, text=True, timeout=timeout, env=env)
+        res.returncode = proc.returncode
+        res.status = "ok" if proc.returncode == 0 else "failed"
+        if proc.returncode != 0:
+            res.error = (proc.stderr or "").strip()[-2000:]
+    except subprocess.TimeoutExpired:
+        res.status, res.error = "timeout", f"exceeded {timeout:.0f}s"
+    except OSError as e:
+        res.status, res.error = "failed", str(e)
+    res.seconds = time.monotonic() - t0
+    stats = _read_stats(stats_path) if stats_path else None
+    if stats and stats.get("calls"):
+        res.extra["api"] = stats
+    if out_path and tmp_path:
+        if res.status == "ok":
+            os.replace(tmp_path, out_path)
+        else:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            _write_fallback(out_path)
+    return res
+
+
+def run_tasks(
+    tasks: List[Task], data_dir: str, workers: int, default_timeout: float, stats_dir: Optional[str] = None
+) -> List[TaskResult]:
+    """
+    Runs tasks on a bounded pool, starting each one as soon as everything it needs has finished.
+    A dependency that failed still counts as finished: consumers get the '{}' fallback, like before.
+    """
+    by_name = {t.name: t for t in tasks}
+    for t in tasks:
+        unknown = [n for n in t.needs if n not in by_name]
+        if unknown:
+            raise ValueError(f"Task {t.name} needs unknown task(s): {', '.join(unknown)}")
+    results: Dict[str, TaskResult] = {}
+    pending = list(tasks)
+    running: Dict[Future, Task] = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while pending or running:
+            ready = [t for t in pending if all(n in results for n in t.needs)]
+            for t in ready:
+                pending.remove(t)
+                log(f"start {t.name}")
+                running[pool.submit(run_task, t, data_dir, default_timeout, stats_dir)] = t
+            if not running:
+                # Dependency cycle: nothing can start and nothing is in flight.
+                for t in pending:
+                    results[t.name] = TaskResult(t.name, t.output, status="skipped", error="unsatisfiable needs")
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in done:
+                t = running.pop(fut)
+                r = fut.result()
+                results[t.name] = r
+                log(f"{r.status:<7} {t.name} ({r.seconds:.1f}s)")
+    return [results[t.name] for t in tasks]
+
+
+def write_manifest(data_dir: str, manifest: Dict[str, Any]) -> str:
+    path = os.path.join(data_dir, MANIFEST)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True, default=str)
+        f.write("\n")
+    return path
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--region", default=None)
+    ap.add_argument("--regions", default=None, help="all | comma-separated list, for collectors that support it")
+    ap.add_argument("--workers", type=int, default=6, help="Max tasks running at once")
+    ap.add_argument("--timeout", type=float, default=600.0, help="Per-task timeout in seconds")
+    ap.add_argument("--only", default=None, help="Comma-separated task names to run (dependencies are not implied)")
+    ap.add_argument("--data-dir", default=DATA)
+    ap.add_argument("--cache", choices=CACHE_MODES, default=os.environ.get("AWS_COLLECTOR_CACHE", "read"),
+                    help="Response cache for slow-changing APIs: off | read (default) | refresh")
+    ap.add_argument("--cache-dir", default=None, help="Default: ~/.cache/aws-cost-optimization/responses")
+    args = ap.parse_args()
+
+    # Tasks inherit the cache settings; in refresh mode they share one cut-off so the first fetch is reused.
+    os.environ["AWS_COLLECTOR_CACHE"] = args.cache
+    if args.cache == "refresh":
+        os.environ["AWS_COLLECTOR_CACHE_SINCE"] = str(time.time())
+    if args.cache_dir:
+        os.environ["AWS_COLLECTOR_CACHE_DIR"] = os.path.abspath(args.cache_dir)
+
+    region = ensure_region(args.region)
+    os.makedirs(args.data_dir, exist_ok=True)
+    tasks = build_tasks(region, args.data_dir, args.regions)
+    if args.only:
+        wanted = {n.strip() for n in args.only.split(",") if n.strip()}
+        tasks = [Task(t.name, t.cmd, t.output, tuple(n for n in t.needs if n in wanted), t.timeout)
+                 for t in tasks if t.name in wanted]
+
+    started = _utcnow()
+    t0 = time.monotonic()
+    with tempfile.TemporaryDirectory(prefix="collect-stats-") as stats_dir:
+        results = run_tasks(tasks, args.data_dir, args.workers, args.timeout, stats_dir)
+    wall = time.monotonic() - t0
+    api_totals: Dict[str, float] = {}
+    for r in results:
+        for k, v in (r.extra.get("api") or {}).items():
+            if isinstance(v, (int, float)):
+                api_totals[k] = round(api_totals.get(k, 0) + v, 3)
+    path = write_manifest(args.data_dir, {
+        "startedAt": started,
+        "finishedAt": _utcnow(),
+        "region": region,
+        "regions": args.regions,
+        "workers": args.workers,
+        "cache": args.cache,
+        "wallSeconds": round(wall, 3),
+        "serialSeconds": round(sum(r.seconds for r in results), 3),
+        "api": api_totals,
+        "tasks": [r.as_dict() for r in results],
+    })
+    failed = [r.name for r in results if r.status != "ok"]
+    if failed:
+        log(f"Tasks without data: {', '.join(failed)}")
+    log(f"Done in {wall:.1f}s. Data at {args.data_dir} (manifest: {path})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Savings Plan / Reserved Instance commitment simulator over hourly on-demand usage.
+- Input: hourly on-demand cost per series (instance family, or one total), from a CE HOURLY get-cost-and-usage
+  JSON, a CSV (e.g. a CUR query: hour, family, cost) or --fetch (CE keeps hourly data for 14 days only)
+- A commitment is expressed as the on-demand spend k it covers per hour; at discount d it costs k * (1 - d) every
+  hour, used or not. Over H hours: covered = sum(min(u, k)), savings = covered - H * k * (1 - d),
+  coverage = covered / sum(u), utilization = covered / (H * k)
+- Usage is sorted once per series with prefix sums, so covered(k) for any candidate is one binary search;
+  savings is concave in k and peaks at the d-quantile of hourly usage, which is where the optimum is taken
+- compute-sp commits on the total across series; ec2-instance-sp and standard-ri commit per series (family)
+- Every term x payment option is evaluated with its discount (DISCOUNTS: typical list rates; --rates overrides,
+  per plan and optionally per family). Upfront payments are amortized over the term with no cost of capital,
+  and usage is assumed to continue at the observed pattern for the whole term
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import math
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import jsonstream
+from common import write_stdout_json
+from cost_history import fetch_cost_and_usage
+from cost_store import np
+
+TERMS = ("1yr", "3yr")
+PAYMENTS = ("no-upfront", "partial-upfront", "all-upfront")
+# Plan -> (term, payment) -> discount off on-demand. Typical published Linux rates; real ones vary by family/region.
+DISCOUNTS: Dict[str, Dict[Tuple[str, str], float]] = {
+    "compute-sp": {
+        ("1yr", "no-upfront"): 0.28, ("1yr", "partial-upfront"): 0.31, ("1yr", "all-upfront"): 0.33,
+        ("3yr", "no-upfront"): 0.47, ("3yr", "partial-upfront"): 0.50, ("3yr", "all-upfront"): 0.52,
+    },
+    "ec2-instance-sp": {
+        ("1yr", "no-upfront"): 0.37, ("1yr", "partial-upfront"): 0.40, ("1yr", "all-upfront"): 0.42,
+        ("3yr", "no-upfront"): 0.55, ("3yr", "partial-upfront"): 0.58, ("3yr", "all-upfront"): 0.60,
+    },
+    "standard-ri": {
+        ("1yr", "no-upfront"): 0.36, ("1yr", "partial-upfront"): 0.39, ("1yr", "all-upfront"): 0.41,
+        ("3yr", "no-upfront"): 0.56, ("3yr", "partial-upfront"): 0.59, ("3yr", "all-upfront"): 0.62,
+    },
+}
+AGGREGATE_PLANS = {"compute-sp"}  # one commitment over the summed usage; the others commit per family
+HOURS_PER_YEAR = 8760
+TOTAL = "Total"
+# On-demand EC2 instance usage per family: what SPs and RIs can cover.
+EC2_ON_DEMAND_FILTER = json.dumps({"And": [
+    {"Dimensions": {"Key": "SERVICE", "Values": ["Amazon Elastic Compute Cloud - Compute"]}},
+    {"Dimensions": {"Key": "PURCHASE_TYPE", "Values": ["On Demand Instances"]}},
+]})
+
+
+# --- usage input ---------------------------------------------------------------------------------------------
+
+def _hour(stamp: str) -> int:
+    """'2026-10-01T13:00:00Z' (or a date) -> hours since the epoch."""
+    value = datetime.fromisoformat(stamp.strip().replace("Z", "+00:00").replace(" ", "T"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp()) // 3600
+
+
+class UsageBuilder:
+    """Collects (hour, series, amount) records in flat columns and lays them out as a dense series x hour matrix."""
+
+    def __init__(self) -> None:
+        self.keys: Dict[str, int] = {}
+        self.hour = array("q")
+        self.row = array("i")
+        self.amount = array("d")
+        self._hours: Dict[str, int] = {}
+
+    def add(self, stamp: str, key: str, amount: float) -> None:
+        hour = self._hours.get(stamp)
+        if hour is None:
+            hour = self._hours[stamp] = _hour(stamp)
+        self.hour.append(hour)
+        self.row.append(self.keys.setdefault(key or TOTAL, len(self.keys)))
+        self.amount.append(amount)
+
+    def build(self) -> Tuple[List[str], int, Any]:
+        """-> (series keys, first hour, series x hours amounts); hours without a record are 0."""
+        if not self.amount:
+            return [], 0, (np.zeros((0, 0)) if np is not None else [])
+        first = min(self.hour)
+        span = max(self.hour) - first + 1
+        keys = sorted(self.keys, key=self.keys.get)
+        if np is not None:
+            cell = np.asarray(self.row, dtype=np.int64) * span + (np.asarray(self.hour) - first)
+            flat = np.bincount(cell, weights=np.asarray(self.amount), minlength=len(keys) * span)
+            return keys, first, flat.reshape(len(keys), span)
+        matrix = [[0.0] * span for _ in keys]
+        for hour, row, amount in zip(self.hour, self.row, self.amount):
+            matrix[row][hour - first] += amount
+        return keys, first, matrix
+
+
+def add_ce_results(builder: UsageBuilder, periods: Any, metric: str = "UnblendedCost") -> None:
+    for period in periods:
+        stamp = (period.get("TimePeriod") or {}).get("Start", "")
+        groups = period.get("Groups") or []
+        if not groups:
+            builder.add(stamp, TOTAL, float(((period.get("Total") or {}).get(metric) or {}).get("Amount", 0) or 0))
+        for g in groups:
+            key = "|".join(g.get("Keys") or []) or TOTAL
+            builder.add(stamp, key, float(((g.get("Metrics") or {}).get(metric) or {}).get("Amount", 0) or 0))
+
+
+def load_usage(path: str, metric: str = "UnblendedCost", columns: Sequence[str] = ("hour", "family", "cost")) -> Tuple[List[str], int, Any]:
+    """A CE HOURLY get-cost-and-usage JSON (streamed period by period) or a CSV with a header naming `columns`."""
+    builder = UsageBuilder()
+    if path.endswith(".json"):
+        add_ce_results(builder, jsonstream.iter_path(path, ("ResultsByTime", "*")), metric)
+        return builder.build()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.reader(f)
+        header = [h.strip().lower() for h in next(reader, [])]
+        missing = [c for c in columns if c not in header]
+        if missing:
+            raise ValueError(f"{path}: CSV header lacks column(s) {', '.join(missing)}; has {', '.join(header)}")
+        hi, ki, ci = (header.index(c) for c in columns)
+        for row in reader:
+            if len(row) > max(hi, ki, ci) and row[hi]:
+                builder.add(row[hi], row[ki], float(row[ci] or 0))
+    return builder.build()
+
+
+def fetch_usage(days: int = 14, group_by: str = "INSTANCE_TYPE_FAMILY") -> Tuple[List[str], int, Any]:
+    """Hourly on-demand EC2 cost per family from Cost Explorer (needs hourly granularity enabled)."""
+    end = datetime.now(timezone.utc).date()
+    start = end - timedelta(days=min(days, 14))
+    builder = UsageBuilder()
+    add_ce_results(builder, fetch_cost_and_usage(start, end, ["UnblendedCost"], [group_by] if group_by else [],
+                                                 granularity="HOURLY", filter_json=EC2_ON_DEMAND_FILTER))
+    return builder.build()
+
+
+# --- sweep ---------------------------------------------------------------------------------------------------
+
+def _sorted_rows(matrix: Any) -> Tuple[Any, Any]:
+    """(ascending usage, prefix sums with a leading 0) per series."""
+    if np is not None:
+        s = np.sort(np.asarray(matrix, dtype=np.float64), axis=1)
+        return s, np.concatenate([np.zeros((len(s), 1)), np.cumsum(s, axis=1)], axis=1)
+    rows = [sorted(r) for r in matrix]
+    return rows, [[0.0] + list(accumulate(r)) for r in rows]
+
+
+def _covered(s: Any, prefix: Any, k: Any) -> Any:
+    """sum(min(u, k)) per series for commitments k (series x candidates): prefix up to k plus k for every hour above."""
+    if np is not None:
+        hours = s.shape[1]
+        j = np.stack([np.searchsorted(s[r], k[r], side="left") for r in range(len(s))]) if len(s) else k.astype(int)
+        return np.take_along_axis(prefix, j, axis=1) + (hours - j) * k
+    out = []
+    for row, pre, ks in zip(s, prefix, k):
+        out.append([pre[j] + (len(row) - j) * kk for kk, j in ((kk, bisect_left(row, kk)) for kk in ks)])
+    return out
+
+
+def _metrics_at(s: Any, prefix: Any, k: Any, discount: Any) -> Dict[str, Any]:
+    """covered, savings, coverage and utilization (series x candidates) for commitments k (series x candidates)."""
+    covered = _covered(s, prefix, k)
+    if np is not None:
+        hours = s.shape[1]
+        total = prefix[:, -1:]
+        d = np.asarray(discount, dtype=np.float64).reshape(-1, 1)
+        return {
+            "covered": covered,
+            "savings": covered - hours * k * (1 - d),
+            "coverage": np.divide(covered, total, out=np.zeros_like(covered), where=total > 0),
+            "utilization": np.divide(covered, hours * k, out=np.ones_like(covered), where=k > 0),
+        }
+    out: Dict[str, Any] = {"covered": covered, "savings": [], "coverage": [], "utilization": []}
+    for row, pre, ks, cov, d in zip(s, prefix, k, covered, discount):
+        hours, total = len(row), pre[-1]
+        out["savings"].append([c - hours * kk * (1 - d) for kk, c in zip(ks, cov)])
+        out["coverage"].append([c / total if total > 0 else 0.0 for c in cov])
+        out["utilization"].append([c / (hours * kk) if kk > 0 else 1.0 for kk, c in zip(ks, cov)])
+    return out
+
+
+def optimal(s: Any, prefix: Any, discount: Any) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Per series, the commitment (on-demand $/h covered) with the highest savings and its metrics.
+    Savings rise while more than a (1 - d) share of hours use at least k, so the peak is at the d-quantile;
+    its neighbours are checked too, which settles ties and rounding.
+    """
+    if np is not None:
+        hours = s.shape[1]
+        d = np.asarray(discount, dtype=np.float64)
+        idx = np.clip(np.ceil(hours * d).astype(np.int64) - 1, 0, max(hours - 1, 0))
+        cand = np.stack([np.clip(idx + o, 0, max(hours - 1, 0)) for o in (-1, 0, 1)], axis=1)
+        k = np.concatenate([np.zeros((len(s), 1)), np.take_along_axis(s, cand, axis=1)], axis=1)
+        m = _metrics_at(s, prefix, k, d)
+        best = np.argmax(m["savings"], axis=1)[:, None]
+        return (np.take_along_axis(k, best, axis=1)[:, 0],
+                {name: np.take_along_axis(v, best, axis=1)[:, 0] for name, v in m.items()})
+    ks = []
+    for row, d in zip(s, discount):
+        hours = len(row)
+        i = min(max(math.ceil(hours * d) - 1, 0), max(hours - 1, 0))
+        ks.append([0.0] + [row[min(max(i + o, 0), hours - 1)] for o in (-1, 0, 1)] if hours else [0.0])
+    m = _metrics_at(s, prefix, ks, discount)
+    best = [max(range(len(sv)), key=sv.__getitem__) for sv in m["savings"]]
+    return [kk[b] for kk, b in zip(ks, best)], {name: [row[b] for row, b in zip(v, best)] for name, v in m.items()}
+
+
+def curve(s: Any, prefix: Any, k_opt: Any, discount: Any, multipliers: Sequence[float]) -> Dict[str, Any]:
+    """Metrics at commitments m * optimum for each multiplier m (series x len(multipliers))."""
+    if np is not None:
+        k = np.asarray(k_opt, dtype=np.float64)[:, None] * np.asarray(multipliers)[None, :]
+    else:
+        k = [[ko * m for m in multipliers] for ko in k_opt]
+    return _metrics_at(s, prefix, k, discount)
+
+
+# --- simulation ----------------------------------------------------------------------------------------------
+
+def _col_sums(x: Any) -> List[float]:
+    return x.sum(axis=0).tolist() if np is not None else [sum(col) for col in zip(*x)]
+
+
+def _discounts(rates: Dict[str, Any], plan: str, term: str, payment: str, keys: Sequence[str]) -> List[float]:
+    """Discount per series: rates[plan]["families"][key][term/payment] when given, else the plan's rate."""
+    base = rates.get(plan, {})
+    default = base.get(f"{term}/{payment}", DISCOUNTS[plan][(term, payment)])
+    families = base.get("families", {})
+    return [float(families.get(key, {}).get(f"{term}/{payment}", default)) for key in keys]
+
+
+def _totals(covered: float, savings: float, committed: float, hours: int, on_demand: float) -> Dict[str, float]:
+    """Summed over series: coverage is of all on-demand spend, utilization of all committed hours."""
+    return {
+        "savings": round(savings, 2),
+        "coverage": round(covered / on_demand, 4) if on_demand else 0.0,
+        "utilization": round(covered / (committed * hours), 4) if committed > 0 else 1.0,
+    }
+
+
+def simulate(
+    keys: Sequence[str], first_hour: int, matrix: Any, plans: Sequence[str] = tuple(DISCOUNTS),
+    rates: Optional[Dict[str, Any]] = None, curve_points: int = 21, top: Optional[int] = 25,
+) -> Dict[str, Any]:
+    """
+    Optimal commitment, savings, coverage and utilization per plan x term x payment option, plus curves of the
+    same figures for commitments from 0 to twice the optimum (each series scaled by the same multiplier).
+    """
+    started = time.monotonic()
+    rates = rates or {}
+    hours = len(matrix[0]) if len(matrix) else 0
+    if not hours:
+        return {"error": "no hourly usage"}
+    scale = HOURS_PER_YEAR / hours
+    multipliers = [2 * i / (curve_points - 1) for i in range(curve_points)] if curve_points > 1 else [1.0]
+    fam_s, fam_prefix = _sorted_rows(matrix)
+    fam_total = fam_prefix[:, -1].tolist() if np is not None else [p[-1] for p in fam_prefix]
+    on_demand = sum(fam_total)
+    agg_s, agg_prefix = _sorted_rows([_col_sums(np.asarray(matrix) if np is not None else matrix)])
+    out: Dict[str, Any] = {
+        "input": {
+            "series": len(keys),
+            "hours": hours,
+            "firstHour": datetime.fromtimestamp(first_hour * 3600, timezone.utc).strftime("%Y-%m-%dT%H:00:00Z"),
+            "onDemand": round(on_demand, 2),
+            "annualizedOnDemand": round(on_demand * scale, 2),
+        },
+        "plans": {},
+    }
+    for plan in plans:
+        aggregate = plan in AGGREGATE_PLANS
+        s, prefix, names = (agg_s, agg_prefix, [TOTAL]) if aggregate else (fam_s, fam_prefix, list(keys))
+        options, curves = [], {}
+        families = [{"family": key, "onDemand": round(fam_total[i], 2), "options": {}} for i, key in enumerate(names)] \
+            if not aggregate else []
+        for term in TERMS:
+            for payment in PAYMENTS:
+                name = f"{term}/{payment}"
+                d = _discounts(rates, plan, term, payment, names)
+                k, m = optimal(s, prefix, d)
+                k, covered, savings = (list(map(float, x)) for x in (k, m["covered"], m["savings"]))
+                committed = sum(k)
+                options.append({
+                    "term": term,
+                    "payment": payment,
+                    "onDemandEquivalentPerHour": round(committed, 4),
+                    "commitmentPerHour": round(sum(kk * (1 - dd) for kk, dd in zip(k, d)), 4),
+                    **_totals(sum(covered), sum(savings), committed, hours, on_demand),
+                    "annualSavings": round(sum(savings) * scale, 2),
+                    "savingsPct": round(100 * sum(savings) / on_demand, 2) if on_demand else 0.0,
+                })
+                c = curve(s, prefix, k, d, multipliers)
+                curves[name] = [
+                    _totals(cov, sav, committed * mult, hours, on_demand)
+                    for cov, sav, mult in zip(_col_sums(c["covered"]), _col_sums(c["savings"]), multipliers)
+                ]
+                for i, fam in enumerate(families):
+                    fam["options"][name] = {
+                        "onDemandEquivalentPerHour": round(k[i], 4),
+                        "savings": round(savings[i], 2),
+                        "coverage": round(float(m["coverage"][i]), 4),
+                        "utilization": round(float(m["utilization"][i]), 4),
+                    }
+        best = max(options, key=lambda o: o["savings"])
+        doc: Dict[str, Any] = {
+            "options": options,
+            "best": best,
+            "curve": {"multipliersOfOptimum": [round(x, 3) for x in multipliers],
+                      **{name: {f: [p[f] for p in pts] for f in ("savings", "coverage", "utilization")}
+                         for name, pts in curves.items()}},
+        }
+        if families:
+            best_key = f"{best['term']}/{best['payment']}"
+            families.sort(key=lambda p: p["options"][best_key]["savings"], reverse=True)
+            doc["families"] = families[:top] if top else families
+        out["plans"][plan] = doc
+    out["stats"] = {"seconds": round(time.monotonic() - started, 3), "numpy": np is not None}
+    return out
+
+
+def add_simulator_args(ap: Any) -> None:
+    ap.add_argument("--usage", default=None, help="Hourly usage: CE HOURLY JSON or CSV (see --columns)")
+    ap.add_argument("--fetch", action="store_true", help="Fetch the last 14 days of hourly EC2 on-demand cost per family")
+    ap.add_argument("--columns", default="hour,family,cost", help="CSV header names: timestamp, series, amount")
+    ap.add_argument("--metric", default="UnblendedCost")
+    ap.add_argument("--rates", default=None, help='JSON {"plan": {"1yr/no-upfront": 0.3, "families": {...}}}')
+    ap.add_argument("--curve-points", type=int, default=21)
+    ap.add_argument("--top", type=int, default=25, help="Families listed per family-level plan (0 = all)")
+
+
+def run_from_args(args: Any, plans: Sequence[str]) -> Dict[str, Any]:
+    if args.usage:
+        keys, first, matrix = load_usage(args.usage, args.metric, [c.strip() for c in args.columns.split(",")])
+    elif args.fetch:
+        keys, first, matrix = fetch_usage()
+    else:
+        raise SystemExit("Pass --usage PATH or --fetch")
+    rates = None
+    if args.rates:
+        with open(args.rates, "r", encoding="utf-8") as f:
+            rates = json.load(f)
+    return simulate(keys, first, matrix, plans, rates, args.curve_points, args.top)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    add_simulator_args(ap)
+    ap.add_argument("--plans", default=",".join(DISCOUNTS), help=f"Comma-separated: {', '.join(DISCOUNTS)}")
+    args = ap.parse_args()
+    write_stdout_json(run_from_args(args, [p.strip() for p in args.plans.split(",") if p.strip()]))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,19 +2,35 @@
 """
 Common helpers for AWS CLI based collectors.
 - Ultra-light dependency footprint: uses subprocess + json
-- Safe pagination: handles --starting-token/NextToken loops
+- Multi-region fan-out: --regions all|list via add_region_args/collect_regions
+- Throttling: token bucket per (service, region) + jittered retries on throttling/transient errors
+- Response cache: slow-changing APIs served from an on-disk TTL cache (AWS_COLLECTOR_CACHE=off|read|refresh)
+- Pluggable backends: AWS_COLLECTOR_BACKEND=subprocess|inprocess|auto (inprocess needs botocore)
+- Safe pagination: handles --starting-token/NextToken loops; iter_paginate streams with bounded memory
 - Clean code: type hints, small functions, clear responsibilities
 """
 from __future__ import annotations
 
+import atexit
+import contextvars
 import json
 import os
+import queue
+import random
+import re
 import shlex
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from response_cache import MODES as CACHE_MODES
+from response_cache import ResponseCache, cache_from_env
 
 
 def _run(cmd: List[str], env: Optional[Dict[str, str]] = None) -> Tuple[int, str, str]:
@@ -29,39 +45,457 @@ def _run(cmd: List[str], env: Optional[Dict[str, str]] = None) -> Tuple[int, str
     return proc.returncode, out, err
 
 
+class SubprocessBackend:
+    """Forks the AWS CLI once per call. Always available; the fallback for every other backend."""
+
+    name = "subprocess"
+
+    def call(self, cmd: List[str], env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        code, out, err = _run(cmd, env)
+        if code != 0:
+            raise RuntimeError(f"Command failed: {' '.join(map(shlex.quote, cmd))}\n{err}")
+        try:
+            return json.loads(out or '{}')
+        except json.JSONDecodeError as e:
+            raise RuntimeError(f"Invalid JSON from: {' '.join(cmd)}\n{out}\n{e}")
+
+
+_ERROR_CODE = re.compile(r"An error occurred \(([A-Za-z0-9_.]+)\)")
+
+
+def aws_error_code(error: Any) -> Optional[str]:
+    """Extracts the AWS error code (e.g. ThrottlingException) from a failed call's message, if present."""
+    m = _ERROR_CODE.search(str(error))
+    return m.group(1) if m else None
+
+
+class UnsupportedCommand(Exception):
+    """Raised by a backend that cannot execute a given CLI argv; callers fall back to the subprocess path."""
+
+
+BACKENDS = ("subprocess", "inprocess", "auto")
+_backend: Optional[Any] = None
+_backend_lock = threading.Lock()
+
+
+def make_backend(name: str) -> Any:
+    """
+    subprocess: fork `aws` per call. inprocess: botocore clients reused per service/region (requires botocore).
+    auto: inprocess when botocore is importable, subprocess otherwise.
+    """
+    if name == "subprocess":
+        return SubprocessBackend()
+    if name in {"inprocess", "auto"}:
+        try:
+            from botocore_backend import InProcessBackend
+        except ImportError:
+            if name == "inprocess":
+                raise
+            return SubprocessBackend()
+        return InProcessBackend(fallback=SubprocessBackend())
+    raise ValueError(f"Unknown backend {name!r}; expected one of {', '.join(BACKENDS)}")
+
+
+def set_backend(backend: Any) -> None:
+    """Installs a backend (name or object with `call(cmd, env)`) for every subsequent shell_json/paginate."""
+    global _backend
+    with _backend_lock:
+        _backend = make_backend(backend) if isinstance(backend, str) else backend
+
+
+def get_backend() -> Any:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = make_backend(os.environ.get("AWS_COLLECTOR_BACKEND", "subprocess"))
+        return _backend
+
+
+# Extra environment (e.g. assumed-role credentials) applied to every AWS call made in the current context.
+_aws_env: contextvars.ContextVar[Optional[Dict[str, str]]] = contextvars.ContextVar("aws_env", default=None)
+
+
+@contextmanager
+def aws_env(env: Optional[Dict[str, str]]) -> Iterator[None]:
+    """
+    Runs the block with `env` layered over os.environ for AWS calls; None restores the ambient credentials.
+    Worker threads started through contextvars.copy_context (prefetch, region fan-out) inherit it.
+    """
+    token = _aws_env.set(dict(env) if env else None)
+    try:
+        yield
+    finally:
+        _aws_env.reset(token)
+
+
+def current_aws_env() -> Optional[Dict[str, str]]:
+    """The aws_env override of the current context (None: ambient credentials)."""
+    return _aws_env.get()
+
+
+# --- Rate limiting and retries -------------------------------------------------------------------------
+
+THROTTLE_CODES = {
+    "Throttling", "ThrottlingException", "ThrottledException", "TooManyRequestsException", "RequestLimitExceeded",
+    "RequestThrottled", "RequestThrottledException", "SlowDown", "LimitExceededException",
+    "ProvisionedThroughputExceededException", "BandwidthLimitExceeded", "PriorRequestNotComplete",
+}
+TRANSIENT_CODES = {
+    "RequestTimeout", "RequestTimeoutException", "InternalError", "InternalFailure", "InternalServerError",
+    "ServiceUnavailable", "ServiceUnavailableException", "Unavailable", "EC2ThrottledException", "IDPCommunicationError",
+}
+_TRANSIENT_TEXT = ("Read timeout", "Connect timeout", "Could not connect to the endpoint", "Connection reset",
+                   "Connection was closed", "EndpointConnectionError")
+
+# Sustained calls/second per service (per region); bursts up to 2x. Conservative versus published API limits.
+RATE_LIMITS: Dict[str, float] = {
+    "ce": 5.0,
+    "compute-optimizer": 5.0,
+    "logs": 5.0,
+    "organizations": 2.0,
+    "sts": 10.0,
+    "ec2": 20.0,
+    "cloudwatch": 20.0,
+    "s3api": 50.0,
+}
+DEFAULT_RATE = 10.0
+
+
+def classify_error(error: Any) -> str:
+    """'throttle', 'transient' (worth retrying) or 'fatal' (access denied, validation, missing resource...)."""
+    code = aws_error_code(error)
+    text = str(error)
+    if code in THROTTLE_CODES or "Rate exceeded" in text:
+        return "throttle"
+    if code in TRANSIENT_CODES or any(t in text for t in _TRANSIENT_TEXT):
+        return "transient"
+    return "fatal"
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every thread calling one (service, region). Adaptive: a throttle halves the
+    sustained rate (down to `floor`); each success wins back 5% of the configured rate.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, floor: float = 0.2) -> None:
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst or max(1.0, rate * 2)
+        self.floor = min(floor, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Takes one token, sleeping as needed. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return waited
+                delay = (1.0 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def throttled(self) -> None:
+        with self._lock:
+            self.rate = max(self.floor, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+
+    def succeeded(self) -> None:
+        if self.rate < self.base_rate:
+            with self._lock:
+                self.rate = min(self.base_rate, self.rate + self.base_rate * 0.05)
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = 6
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given 0-based retry number."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CallStats:
+    """Process-wide counters for AWS calls, reported in collector/run output."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.totals: Dict[str, float] = {
+            "calls": 0, "retries": 0, "throttles": 0, "failures": 0, "waitSeconds": 0.0, "cacheHits": 0,
+        }
+        self.by_key: Dict[str, Dict[str, float]] = {}
+
+    def add(self, key: str, **counts: float) -> None:
+        with self._lock:
+            per = self.by_key.setdefault(key, {k: 0 for k in self.totals})
+            for k, v in counts.items():
+                self.totals[k] += v
+                per[k] += v
+
+    def snapshot(self) -> Dict[str, Any]:
+        def rounded(d: Dict[str, float]) -> Dict[str, float]:
+            return {k: round(v, 3) for k, v in d.items()}
+
+        with self._lock:
+            return {**rounded(self.totals), "byService": {k: rounded(v) for k, v in sorted(self.by_key.items())}}
+
+
+STATS = CallStats()
+_buckets: Dict[Tuple[str, str], TokenBucket] = {}
+_buckets_lock = threading.Lock()
+_retry_policy = RetryPolicy()
+
+
+def set_rate_limit(service: str, rate: float, burst: Optional[float] = None) -> None:
+    """Overrides the calls/second for a service; affects buckets created afterwards and existing ones."""
+    RATE_LIMITS[service] = rate
+    with _buckets_lock:
+        for (svc, region), b in list(_buckets.items()):
+            if svc == service:
+                _buckets[(svc, region)] = TokenBucket(rate, burst)
+
+
+def set_retry_policy(policy: RetryPolicy) -> None:
+    global _retry_policy
+    _retry_policy = policy
+
+
+def limiter_for(service: str, region: str) -> TokenBucket:
+    with _buckets_lock:
+        b = _buckets.get((service, region))
+        if b is None:
+            b = _buckets[(service, region)] = TokenBucket(RATE_LIMITS.get(service, DEFAULT_RATE))
+        return b
+
+
+def service_and_region(cmd: List[str]) -> Tuple[str, str]:
+    """(service, region) of an `aws ... <service> <operation>` argv; region falls back to the default."""
+    service, region = "", ""
+    i = 1
+    while i < len(cmd):
+        tok = cmd[i]
+        if tok in {"--output", "--region", "--endpoint-url", "--profile"}:
+            if tok == "--region" and i + 1 < len(cmd):
+                region = cmd[i + 1]
+            i += 2
+            continue
+        if not tok.startswith("--") and not service:
+            service = tok
+        i += 1
+    return service or "unknown", region or default_region()
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def set_cache(cache: Optional[ResponseCache]) -> None:
+    """Installs the response cache used by shell_json; None re-reads AWS_COLLECTOR_CACHE* on next use."""
+    global _cache
+    with _cache_lock:
+        _cache = cache
+
+
+def get_cache() -> ResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = cache_from_env()
+        return _cache
+
+
+def add_cache_args(ap: Any) -> None:
+    ap.add_argument("--cache", choices=CACHE_MODES, default=None,
+                    help="Response cache for slow-changing APIs (default: $AWS_COLLECTOR_CACHE or off)")
+
+
+def apply_cache_args(args: Any) -> None:
+    """--cache also goes into the environment so child processes (aws_call.py, collectors) follow it."""
+    if getattr(args, "cache", None):
+        os.environ["AWS_COLLECTOR_CACHE"] = args.cache
+        set_cache(None)
+
+
 def shell_json(cmd: List[str]) -> Dict[str, Any]:
     """
-    Executes an AWS CLI command that returns JSON and parses it.
-    Raises RuntimeError if the command fails or output is not JSON.
+    Executes an AWS CLI command that returns JSON and parses it, through the active backend.
+    Responses of slow-changing APIs come from the response cache when fresh (see response_cache.CACHE_TTLS).
+    Calls are paced by a token bucket per (service, region); throttling and transient errors are retried
+    with jittered exponential backoff. Raises RuntimeError if the command fails for good or output is not JSON.
+    """
+    service, region = service_and_region(cmd)
+    fetch = lambda: _call_with_retries(cmd, service, region)  # noqa: E731
+    result, cached = get_cache().get_or_fetch(cmd, region, _aws_env.get(), fetch)
+    if cached:
+        STATS.add(f"{service}/{region}", cacheHits=1)
+    return result
+
+
+def _call_with_retries(cmd: List[str], service: str, region: str) -> Dict[str, Any]:
+    key = f"{service}/{region}"
+    bucket = limiter_for(service, region)
+    policy = _retry_policy
+    env = _aws_env.get()
+    attempt = 0
+    while True:
+        waited = bucket.acquire()
+        try:
+            result = get_backend().call(cmd, env)
+        except RuntimeError as e:
+            kind = classify_error(e)
+            if kind == "throttle":
+                bucket.throttled()
+            if kind == "fatal" or attempt + 1 >= policy.max_attempts:
+                STATS.add(key, calls=1, failures=1, throttles=int(kind == "throttle"), waitSeconds=waited)
+                raise
+            delay = policy.backoff(attempt)
+            STATS.add(key, calls=1, retries=1, throttles=int(kind == "throttle"), waitSeconds=waited + delay)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        bucket.succeeded()
+        STATS.add(key, calls=1, waitSeconds=waited)
+        return result
+
+
+class _PageError:
+    def __init__(self, error: BaseException) -> None:
+        self.error = error
+
+
+_END_OF_PAGES = object()
+
+
+def _prefetch_pages(base: List[str], token_key: str, depth: int) -> Iterator[Dict[str, Any]]:
+    """
+    Fetches pages on a background thread up to `depth` pages ahead of the consumer.
+    Tokens are still followed strictly in order (page N+1 is requested once page N has arrived);
+    what overlaps is the network wait for N+1 with the caller's processing of N.
+    A fetch error is re-raised in the consumer at the position where the failed page would have been.
     """
-    code, out, err = _run(cmd)
-    if code != 0:
-        raise RuntimeError(f"Command failed: {' '.join(map(shlex.quote, cmd))}\n{err}")
+    pages: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def fetch() -> None:
+        token: Optional[str] = None
+        try:
+            while not stop.is_set():
+                page = shell_json(base + (["--starting-token", token] if token else []))
+                token = page.get(token_key)
+                if not put(page) or not token:
+                    break
+        except BaseException as e:  # handed to the consumer thread
+            put(_PageError(e))
+        put(_END_OF_PAGES)
+
+    # Run in a copy of the caller's context so per-call settings travel with the worker thread.
+    worker = threading.Thread(target=contextvars.copy_context().run, args=(fetch,), daemon=True)
+    worker.start()
     try:
-        return json.loads(out or '{}')
-    except json.JSONDecodeError as e:
-        raise RuntimeError(f"Invalid JSON from: {' '.join(cmd)}\n{out}\n{e}")
+        while True:
+            item = pages.get()
+            if item is _END_OF_PAGES:
+                return
+            if isinstance(item, _PageError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
 
 
-def paginate(cmd: List[str], result_key: str, token_key: str = 'NextToken') -> List[Dict[str, Any]]:
+def iter_pages(
+    cmd: List[str], token_key: str = 'NextToken', page_items: Optional[int] = None, prefetch: int = 0
+) -> Iterator[Dict[str, Any]]:
     """
-    Paginates AWS CLI v2 commands that support --starting-token and output NextToken.
-    Returns a flat list aggregated from pages. Expects each page to have a list under `result_key`.
+    Yields raw pages of an AWS CLI v2 command, following NextToken via --starting-token.
+    `page_items` adds --max-items so the CLI returns one bounded chunk per call instead of auto-paginating
+    everything into a single response; the next page is only requested when the caller asks for it.
+    Only use `page_items` with operations the CLI can paginate.
+    `prefetch` > 0 reads that many pages ahead on a background thread (see _prefetch_pages).
     """
-    items: List[Dict[str, Any]] = []
+    base = list(cmd)
+    if page_items:
+        # An explicit limit key (--max-results) turns CLI pagination off and rejects --max-items and
+        # --starting-token, so keep the requested API page size as --page-size instead.
+        if "--max-results" in base:
+            i = base.index("--max-results")
+            base[i] = "--page-size"
+        if "--max-items" not in base:
+            base += ["--max-items", str(page_items)]
+    if prefetch > 0:
+        yield from _prefetch_pages(base, token_key, prefetch)
+        return
     starting_token: Optional[str] = None
     while True:
-        final_cmd = list(cmd)
+        final_cmd = list(base)
         if starting_token:
             final_cmd += ["--starting-token", starting_token]
         page = shell_json(final_cmd)
-        page_items = page.get(result_key, [])
-        if isinstance(page_items, list):
-            items.extend(page_items)
         starting_token = page.get(token_key)
+        yield page
         if not starting_token:
-            break
-    return items
+            return
+
+
+def iter_paginate(
+    cmd: List[str],
+    result_key: str,
+    token_key: str = 'NextToken',
+    page_items: Optional[int] = None,
+    where: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    select: Optional[Callable[[Dict[str, Any]], Any]] = None,
+    limit: Optional[int] = None,
+    prefetch: int = 0,
+) -> Iterator[Any]:
+    """
+    Streams items under `result_key` page by page. Only the current page is held in memory.
+    - where: keep only items for which it returns True (applied before select)
+    - select: project each kept item (e.g. pick a few keys) so callers never hold full records
+    - limit: stop after this many yielded items; no further pages are fetched
+    - prefetch: pages to read ahead on a background thread while the caller works on the current one
+    Closing the generator early also stops fetching.
+    """
+    if limit is not None and limit <= 0:
+        return
+    yielded = 0
+    for page in iter_pages(cmd, token_key, page_items, prefetch):
+        items = page.get(result_key, [])
+        if not isinstance(items, list):
+            continue
+        for item in items:
+            if where is not None and not where(item):
+                continue
+            yield select(item) if select is not None else item
+            yielded += 1
+            if limit is not None and yielded >= limit:
+                return
+
+
+def paginate(cmd: List[str], result_key: str, token_key: str = 'NextToken') -> List[Dict[str, Any]]:
+    """
+    Paginates AWS CLI v2 commands that support --starting-token and output NextToken.
+    Returns a flat list aggregated from pages. Expects each page to have a list under `result_key`.
+    Prefer iter_paginate for large result sets.
+    """
+    return list(iter_paginate(cmd, result_key, token_key))
 
 
 def date_range(days_back: int) -> Tuple[str, str]:
@@ -87,11 +521,93 @@ def with_region(cmd: List[str], region: Optional[str]) -> List[str]:
     return cmd + ["--region", r]
 
 
+def enabled_regions() -> List[str]:
+    """Regions enabled for the account (default + opted-in), via ec2 describe-regions."""
+    res = shell_json(
+        with_region(
+            aws_base() + ["ec2", "describe-regions", "--filters", "Name=opt-in-status,Values=opt-in-not-required,opted-in"],
+            None,
+        )
+    )
+    return sorted(r["RegionName"] for r in res.get("Regions", []) if r.get("RegionName"))
+
+
+def resolve_regions(spec: Optional[str]) -> List[str]:
+    """`all` -> enabled_regions(); otherwise a comma-separated list, order kept, duplicates dropped."""
+    if not spec:
+        return []
+    if spec.strip().lower() == "all":
+        return enabled_regions()
+    return list(dict.fromkeys(r.strip() for r in spec.split(",") if r.strip()))
+
+
+def add_region_args(ap: Any) -> None:
+    ap.add_argument("--region", default=None)
+    ap.add_argument("--regions", default=None, help="all | comma-separated regions; runs each region concurrently")
+    ap.add_argument("--region-workers", type=int, default=8, help="Max regions collected at once with --regions")
+
+
+def fan_out_regions(fn: Callable[[str], Any], regions: Iterable[str], max_workers: int = 8) -> Dict[str, Any]:
+    """
+    Runs fn(region) for every region on a bounded pool and merges the results keyed by region.
+    A failing region yields {"error": ...} under its key and is listed in failedRegions; the others are kept.
+    """
+    regions = list(regions)
+    out: Dict[str, Any] = {}
+    failed: List[str] = []
+    if regions:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(regions)))) as pool:
+            futures = {pool.submit(contextvars.copy_context().run, fn, r): r for r in regions}
+            for fut in as_completed(futures):
+                r = futures[fut]
+                try:
+                    out[r] = fut.result()
+                except Exception as e:
+                    out[r] = {"region": r, "error": str(e)}
+                    failed.append(r)
+    return {
+        "regions": {r: out[r] for r in regions},
+        "regionCount": len(regions),
+        "failedRegions": sorted(failed),
+    }
+
+
+def collect_regions(args: Any, fn: Callable[[str], Any]) -> Any:
+    """Single-region result for --region (the default), merged fan-out document for --regions."""
+    regions = resolve_regions(getattr(args, "regions", None))
+    if not regions:
+        return fn(ensure_region(args.region))
+    return fan_out_regions(fn, regions, getattr(args, "region_workers", 8))
+
+
 def identity() -> Dict[str, Any]:
     return shell_json(aws_base() + ["sts", "get-caller-identity"]) or {}
 
 
+def co_enabled(region: Optional[str]) -> bool:
+    """Compute Optimizer enrollment (Active/Pending); cached like any slow-changing call, so collectors share it."""
+    try:
+        res = shell_json(with_region(aws_base() + ["compute-optimizer", "get-enrollment-status"], region))
+        return res.get("status") in {"Active", "Pending"}
+    except Exception:
+        return False
+
+
 def write_stdout_json(data: Any) -> None:
     json.dump(data, sys.stdout, indent=2, sort_keys=True, default=str)
     sys.stdout.write("\n")
 
+
+def _dump_stats() -> None:
+    path = os.environ.get("AWS_COLLECTOR_STATS_FILE")
+    if not path:
+        return
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(STATS.snapshot(), f, indent=2, sort_keys=True)
+    except OSError:
+        pass
+
+
+# Collectors run as separate processes; AWS_COLLECTOR_STATS_FILE lets the orchestrator read their counters.
+atexit.register(_dump_stats)
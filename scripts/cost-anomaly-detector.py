@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 """
 List AWS Cost Anomaly Detection monitors and recent anomalies.
+- --mode local scores our own daily cost series instead (cost_anomaly.py: weekday-aware z-scores over every
+  service x account series); --mode both prints the AWS view plus a "local" section
 """
 from __future__ import annotations
 
@@ -8,6 +10,7 @@ import argparse
 from datetime import date, timedelta
 from typing import Any, Dict
 
+import cost_anomaly
 from common import aws_base, ensure_region, shell_json, with_region, write_stdout_json
 
 
@@ -39,8 +42,15 @@ def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--region", default=None)
     ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--mode", choices=("aws", "local", "both"), default="aws")
+    cost_anomaly.add_detector_args(ap)
     args = ap.parse_args()
-    write_stdout_json(collect(ensure_region(args.region), args.days))
+    out: Dict[str, Any] = {}
+    if args.mode != "local":
+        out.update(collect(ensure_region(args.region), args.days))
+    if args.mode != "aws":
+        out["local"] = cost_anomaly.run_from_args(args)
+    write_stdout_json(out)
 
 
 if __name__ == "__main__":
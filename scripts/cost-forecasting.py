@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 """
 Generate a 30/60/90 day cost forecast using Cost Explorer.
+- --mode local forecasts offline from the collected daily history instead (cost_forecast.py): same document
+  shape, plus per service/account forecasts (ByService) and backtest accuracy, and no billed CE request
 """
 from __future__ import annotations
 
@@ -8,6 +10,7 @@ import argparse
 from datetime import date, timedelta
 from typing import Any, Dict
 
+import cost_forecast
 from common import aws_base, ensure_region, shell_json, with_region, write_stdout_json
 
 
@@ -40,7 +43,12 @@ def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--region", default=None)
     ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--mode", choices=("aws", "local"), default="aws")
+    cost_forecast.add_forecast_args(ap)
     args = ap.parse_args()
+    if args.mode == "local":
+        write_stdout_json(cost_forecast.run_from_args(args, args.days))
+        return
     write_stdout_json(forecast(ensure_region(args.region), args.days))
 
 
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Local cost anomaly detection over our own daily cost series (AWS monitors report a day late and only on
+the monitors configured there).
+- One series per service x account (whatever the store holds) as a dense series x day matrix (CostStore.daily_matrix);
+  MONTHLY sources are refused, collect_report.py scores the DAILY SERVICE x LINKED_ACCOUNT history
+- Each evaluated day is compared with the `weeks` full weeks before it: level = trailing mean, weekday effect =
+  mean of the same weekday minus the level, expected = level + weekday effect (level only with seasonal=False)
+- z = (actual - expected) / sigma, sigma = std of the window's residuals around their weekday means, widened for
+  the uncertainty of expected itself and floored at MIN_SIGMA_SHARE of expected and MIN_SIGMA, so flat series
+  do not turn cents into anomalies
+- All series are scored at once per evaluated day with numpy; without numpy the same arithmetic runs per series
+- Anomalies need |z| >= threshold and |actual - expected| >= min_impact and are ranked by dollar impact
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from common import write_stdout_json
+from cost_query import DATA, open_store
+from cost_store import DIMENSIONS, np, day_string
+
+WEEK = 7
+MIN_SIGMA = 1.0  # USD/day
+MIN_SIGMA_SHARE = 0.05
+DIRECTIONS = ("up", "down", "both")
+
+
+def score_day(matrix: Any, t: int, weeks: int = 4, seasonal: bool = True) -> Tuple[Any, Any, Any]:
+    """(expected, level, sigma) for column t of every series; needs t >= weeks * 7 (numpy path)."""
+    window = matrix[:, t - weeks * WEEK:t].reshape(len(matrix), weeks, WEEK)
+    level = window.mean(axis=(1, 2))
+    if seasonal:
+        # Column 0 of each reshaped week is the same weekday as t (the window spans whole weeks).
+        by_weekday = window.mean(axis=1)
+        expected = by_weekday[:, 0]
+        resid = window - by_weekday[:, None, :]
+        dof = weeks * WEEK - WEEK
+    else:
+        expected = level
+        resid = window - level[:, None, None]
+        dof = weeks * WEEK - 1
+    # Prediction error, not just noise: expected is itself a mean of `n` noisy days.
+    n = weeks if seasonal else weeks * WEEK
+    sigma = np.sqrt((resid * resid).sum(axis=(1, 2)) / max(dof, 1) * (1 + 1 / n))
+    sigma = np.maximum(np.maximum(sigma, MIN_SIGMA_SHARE * np.abs(expected)), MIN_SIGMA)
+    return expected, level, sigma
+
+
+def score_day_row(row: Sequence[float], t: int, weeks: int = 4, seasonal: bool = True) -> Tuple[float, float, float]:
+    """score_day for one series, stdlib only."""
+    window = row[t - weeks * WEEK:t]
+    level = sum(window) / len(window)
+    if seasonal:
+        by_weekday = [sum(window[p::WEEK]) / weeks for p in range(WEEK)]
+        expected = by_weekday[0]
+        ss = sum((x - by_weekday[i % WEEK]) ** 2 for i, x in enumerate(window))
+        dof = weeks * WEEK - WEEK
+    else:
+        expected = level
+        ss = sum((x - level) ** 2 for x in window)
+        dof = weeks * WEEK - 1
+    n = weeks if seasonal else weeks * WEEK
+    sigma = max(math.sqrt(ss / max(dof, 1) * (1 + 1 / n)), MIN_SIGMA_SHARE * abs(expected), MIN_SIGMA)
+    return expected, level, sigma
+
+
+def detect(
+    keys: Sequence[Tuple[str, ...]],
+    first_day: int,
+    matrix: Any,
+    eval_days: int = 7,
+    weeks: int = 4,
+    threshold: float = 3.5,
+    min_impact: float = 10.0,
+    seasonal: bool = True,
+    direction: str = "up",
+    by: Sequence[str] = DIMENSIONS,
+) -> List[Dict[str, Any]]:
+    """
+    Anomalies among the last `eval_days` columns of `matrix` (rows = `keys`), largest dollar impact first.
+    Days without `weeks` full weeks of history before them are not evaluated.
+    """
+    days = len(matrix[0]) if len(matrix) else 0
+    cols = range(max(weeks * WEEK, days - eval_days), days)
+    hits: List[Tuple[int, int, float, float, float, float]] = []  # (series, day, actual, expected, level, z)
+    if np is not None and len(matrix):
+        m = np.asarray(matrix, dtype=np.float64)
+        for t in cols:
+            expected, level, sigma = score_day(m, t, weeks, seasonal)
+            impact = m[:, t] - expected
+            z = impact / sigma
+            if direction == "up":
+                flagged = (z >= threshold) & (impact >= min_impact)
+            elif direction == "down":
+                flagged = (z <= -threshold) & (impact <= -min_impact)
+            else:
+                flagged = (np.abs(z) >= threshold) & (np.abs(impact) >= min_impact)
+            for s in np.flatnonzero(flagged):
+                hits.append((int(s), t, float(m[s, t]), float(expected[s]), float(level[s]), float(z[s])))
+    else:
+        for s, row in enumerate(matrix):
+            for t in cols:
+                expected, level, sigma = score_day_row(row, t, weeks, seasonal)
+                impact = row[t] - expected
+                z = impact / sigma
+                up = z >= threshold and impact >= min_impact
+                down = z <= -threshold and impact <= -min_impact
+                if (direction == "up" and up) or (direction == "down" and down) or (direction == "both" and (up or down)):
+                    hits.append((s, t, float(row[t]), expected, level, z))
+    hits.sort(key=lambda h: (-abs(h[2] - h[3]), -abs(h[5])))
+    out: List[Dict[str, Any]] = []
+    for s, t, actual, expected, level, z in hits:
+        item: Dict[str, Any] = dict(zip(by, keys[s]))
+        item.update({
+            "date": day_string(first_day + t),
+            "actual": round(actual, 2),
+            "expected": round(expected, 2),
+            "impact": round(actual - expected, 2),
+            "level": round(level, 2),
+            "weekdayEffect": round(expected - level, 2),
+            "zScore": round(z, 2),
+        })
+        out.append(item)
+    return out
+
+
+def run(
+    source: str = "service",
+    data_dir: str = DATA,
+    by: Sequence[str] = DIMENSIONS,
+    top: Optional[int] = 50,
+    **settings: Any,
+) -> Dict[str, Any]:
+    """Detection over a cost_query source (collected CE JSON or a saved store), as the collector prints it."""
+    started = time.monotonic()
+    store = open_store(source, data_dir)
+    try:
+        keys, first_day, matrix = store.daily_matrix(by)
+    except ValueError as e:  # monthly source: no daily series to score
+        return {"error": str(e), "stats": {"seconds": round(time.monotonic() - started, 3), "numpy": np is not None}}
+    anomalies = detect(keys, first_day, matrix, by=by, **settings)
+    days = len(matrix[0]) if len(matrix) else 0
+    return {
+        "series": len(keys),
+        "days": days,
+        "firstDay": day_string(first_day) if days else None,
+        "settings": dict(settings),
+        "count": len(anomalies),
+        "totalImpact": round(sum(a["impact"] for a in anomalies), 2),
+        "anomalies": anomalies[:top] if top else anomalies,
+        "stats": {"seconds": round(time.monotonic() - started, 3), "numpy": np is not None},
+    }
+
+
+def add_detector_args(ap: Any) -> None:
+    ap.add_argument("--source", default="service",
+                    help="service (cost_by_service_90d.json) | service-account (cost_by_service_account_90d.json) "
+                         "| path to .bin/.json (DAILY cost data only)")
+    ap.add_argument("--data-dir", default=DATA)
+    ap.add_argument("--eval-days", type=int, default=7, help="Score the last N days")
+    ap.add_argument("--weeks", type=int, default=4, help="Full weeks of history each day is compared with")
+    ap.add_argument("--threshold", type=float, default=3.5, help="Minimum |z-score|")
+    ap.add_argument("--min-impact", type=float, default=10.0, help="Minimum |actual - expected| in USD")
+    ap.add_argument("--direction", choices=DIRECTIONS, default="up")
+    ap.add_argument("--no-seasonal", action="store_true", help="Compare with the trailing mean only (no weekday effect)")
+    ap.add_argument("--top", type=int, default=50, help="Anomalies to print (0 = all)")
+
+
+def run_from_args(args: Any) -> Dict[str, Any]:
+    return run(args.source, args.data_dir, top=args.top, eval_days=args.eval_days, weeks=args.weeks,
+               threshold=args.threshold, min_impact=args.min_impact, seasonal=not args.no_seasonal,
+               direction=args.direction)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    add_detector_args(ap)
+    write_stdout_json(run_from_args(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Offline cost forecasting over the collected daily history, one model per service x account series.
+- Models: additive Holt-Winters with weekly seasonality (smoothing parameters picked per series from GRID by
+  one-step error) and linear trend + weekday effects (least squares; one projection matrix serves every series)
+- Fitted for all series at once with numpy (series x parameter-grid arrays per day); without numpy the same
+  recursions run one series at a time
+- Backtest: refit on the history minus the last `holdout` days and score that window (MAE, WAPE, sMAPE,
+  interval coverage); model="auto" keeps, per series, the model with the lower backtest error (so its own
+  backtest figures are slightly optimistic)
+- Output has the shape of `ce get-cost-forecast` (forecast_30d.json) for the account total, plus ByService
+  with each series' forecast total and interval. Amounts are strings, as Cost Explorer returns them.
+- Needs DAILY history: MONTHLY sources are refused; collect_report.py forecasts the SERVICE x LINKED_ACCOUNT one
+Daily intervals are mean +- z * sd of the h-step forecast error; series totals treat daily errors as independent.
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import time
+from statistics import NormalDist
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from common import write_stdout_json
+from cost_query import DATA, open_store
+from cost_store import DIMENSIONS, day_string, np
+
+SEASON = 7
+MODELS = ("holt-winters", "linear")
+# (alpha, beta, gamma) candidates: level, trend and seasonal smoothing.
+GRID: List[Tuple[float, float, float]] = [
+    (a, b, g) for a in (0.1, 0.3, 0.6) for b in (0.0, 0.05) for g in (0.05, 0.3)
+]
+MIN_DAYS = 3 * SEASON  # one week to initialize, two to fit
+
+
+# --- models (arithmetic shared by the numpy and stdlib paths) ---------------------------------------------------
+
+def _hw_run(cols: Sequence[Any], a: Any, b: Any, g: Any) -> Tuple[Any, Any, List[Any], Any]:
+    """
+    Holt-Winters over `cols` (per-day values: floats, or (series, 1) arrays broadcasting against (grid,)
+    parameter arrays). -> (level, trend, seasonals by day index % 7, sum of squared one-step errors).
+    """
+    first = list(cols[:SEASON])
+    level = sum(first) / SEASON
+    trend = (sum(cols[SEASON:2 * SEASON]) - sum(first)) / (SEASON * SEASON)
+    season = [c - level for c in first]
+    sse: Any = 0.0
+    for t in range(SEASON, len(cols)):
+        y, s = cols[t], season[t % SEASON]
+        err = y - (level + trend + s)
+        sse = sse + err * err
+        new_level = a * (y - s) + (1 - a) * (level + trend)
+        trend = b * (new_level - level) + (1 - b) * trend
+        season[t % SEASON] = g * (y - new_level) + (1 - g) * s
+        level = new_level
+    return level, trend, season, sse
+
+
+def _hw_paths(level: Any, trend: Any, season: List[Any], sigma2: Any, a: Any, b: Any, g: Any,
+              n: int, horizon: int) -> Tuple[List[Any], List[Any]]:
+    """Per-step (mean, variance) for h = 1..horizon; variance follows the additive Holt-Winters error recursion."""
+    means, variances = [], []
+    acc: Any = 1.0
+    for h in range(1, horizon + 1):
+        means.append(level + h * trend + season[(n + h - 1) % SEASON])
+        variances.append(sigma2 * acc)
+        psi = a * (1 + h * b) + (g if h % SEASON == 0 else 0.0)
+        acc = acc + psi * psi
+    return means, variances
+
+
+def _solve(m: List[List[float]], rhs: List[List[float]]) -> List[List[float]]:
+    """m^-1 @ rhs by Gauss-Jordan with partial pivoting (m is the small normal-equations matrix)."""
+    k = len(m)
+    aug = [list(m[i]) + list(rhs[i]) for i in range(k)]
+    for c in range(k):
+        p = max(range(c, k), key=lambda r: abs(aug[r][c]))
+        aug[c], aug[p] = aug[p], aug[c]
+        piv = aug[c][c] or 1e-12
+        aug[c] = [v / piv for v in aug[c]]
+        for r in range(k):
+            if r != c and aug[r][c]:
+                f = aug[r][c]
+                aug[r] = [x - f * y for x, y in zip(aug[r], aug[c])]
+    return [row[k:] for row in aug]
+
+
+def _design(first_day: int, start: int, stop: int, n: int) -> List[List[float]]:
+    """Rows [1, trend, weekday dummies (6)] for days start..stop-1; the trend is scaled to the fit length n."""
+    rows = []
+    for t in range(start, stop):
+        wd = (first_day + t) % SEASON
+        rows.append([1.0, t / max(n, 1)] + [1.0 if wd == k else 0.0 for k in range(1, SEASON)])
+    return rows
+
+
+def linear_operators(first_day: int, n: int, horizon: int) -> Dict[str, Any]:
+    """
+    Everything the linear model needs that does not depend on the series: the projection P = (X'X)^-1 X'
+    (coefficients = P @ y), the future design rows and their leverage x0 (X'X)^-1 x0'.
+    """
+    x = _design(first_day, 0, n, n)
+    xtx = [[sum(r[i] * r[j] for r in x) for j in range(len(x[0]))] for i in range(len(x[0]))]
+    proj = _solve(xtx, [list(col) for col in zip(*x)])
+    inv = _solve(xtx, [[1.0 if i == j else 0.0 for j in range(len(xtx))] for i in range(len(xtx))])
+    future = _design(first_day, n, n + horizon, n)
+    leverage = [sum(f[i] * inv[i][j] * f[j] for i in range(len(f)) for j in range(len(f))) for f in future]
+    return {"x": x, "proj": proj, "future": future, "leverage": leverage, "dof": max(n - len(x[0]), 1)}
+
+
+# --- batch (numpy) -------------------------------------------------------------------------------------------
+
+def _fit_hw_batch(y: Any, horizon: int) -> Tuple[Any, Any]:
+    """-> (mean, variance), (series, horizon) arrays, each series with its best GRID parameters."""
+    n = y.shape[1]
+    a, b, g = (np.asarray(p) for p in zip(*GRID))
+    cols = [y[:, t, None] for t in range(n)]
+    level, trend, season, sse = _hw_run(cols, a, b, g)
+    best = np.argmin(sse, axis=1)
+    rows = np.arange(len(y))
+
+    def pick(v: Any) -> Any:
+        return v[rows, best]
+
+    sigma2 = pick(sse) / max(n - SEASON, 1)
+    means, variances = _hw_paths(pick(level), pick(trend), [pick(s) for s in season], sigma2,
+                                 a[best], b[best], g[best], n, horizon)
+    return np.stack(means, axis=1), np.stack(variances, axis=1)
+
+
+def _fit_linear_batch(y: Any, first_day: int, horizon: int) -> Tuple[Any, Any]:
+    n = y.shape[1]
+    ops = linear_operators(first_day, n, horizon)
+    coef = y @ np.asarray(ops["proj"]).T
+    resid = y - coef @ np.asarray(ops["x"]).T
+    sigma2 = (resid * resid).sum(axis=1) / ops["dof"]
+    mean = coef @ np.asarray(ops["future"]).T
+    variance = sigma2[:, None] * (1 + np.asarray(ops["leverage"]))[None, :]
+    return mean, variance
+
+
+def _fit_batch(y: Any, first_day: int, horizon: int, model: str) -> Tuple[Any, Any]:
+    if model == "linear":
+        return _fit_linear_batch(y, first_day, horizon)
+    return _fit_hw_batch(y, horizon)
+
+
+# --- per series (stdlib) -------------------------------------------------------------------------------------
+
+def _fit_hw_row(row: Sequence[float], horizon: int) -> Tuple[List[float], List[float]]:
+    n = len(row)
+    best = None
+    for a, b, g in GRID:
+        level, trend, season, sse = _hw_run(row, a, b, g)
+        if best is None or sse < best[0]:
+            best = (sse, level, trend, season, a, b, g)
+    sse, level, trend, season, a, b, g = best  # type: ignore[misc]
+    return _hw_paths(level, trend, season, sse / max(n - SEASON, 1), a, b, g, n, horizon)
+
+
+def _fit_linear_row(row: Sequence[float], ops: Dict[str, Any]) -> Tuple[List[float], List[float]]:
+    coef = [sum(p * v for p, v in zip(prow, row)) for prow in ops["proj"]]
+    resid = [v - sum(c * x for c, x in zip(coef, xr)) for v, xr in zip(row, ops["x"])]
+    sigma2 = sum(r * r for r in resid) / ops["dof"]
+    mean = [sum(c * x for c, x in zip(coef, f)) for f in ops["future"]]
+    return mean, [sigma2 * (1 + lev) for lev in ops["leverage"]]
+
+
+def _fit_rows(rows: Sequence[Sequence[float]], first_day: int, horizon: int, model: str) -> Tuple[List[List[float]], List[List[float]]]:
+    ops = linear_operators(first_day, len(rows[0]), horizon) if model == "linear" and rows else None
+    means, variances = [], []
+    for row in rows:
+        m, v = _fit_linear_row(row, ops) if ops else _fit_hw_row(list(row), horizon)
+        means.append(m)
+        variances.append(v)
+    return means, variances
+
+
+def fit(y: Any, first_day: int, horizon: int, model: str) -> Tuple[Any, Any]:
+    """(mean, variance), series x horizon, of one model for every row of `y` (numpy array or list of lists)."""
+    if np is not None:
+        return _fit_batch(np.asarray(y, dtype=np.float64), first_day, horizon, model)
+    return _fit_rows(y, first_day, horizon, model)
+
+
+# --- engine --------------------------------------------------------------------------------------------------
+# Per-series results are (series x horizon) arrays with numpy and lists of rows without it; the helpers below
+# take either, so forecast_series reads the same on both paths.
+
+def _is_array(x: Any) -> bool:
+    return np is not None and hasattr(x, "shape")
+
+
+def _bounds(mean: Any, variance: Any, z: float) -> Tuple[Any, Any, Any]:
+    """(clipped mean, lower, upper); spend cannot go negative."""
+    if _is_array(mean):
+        sd = np.sqrt(np.maximum(variance, 0.0))
+        return np.maximum(mean, 0.0), np.maximum(mean - z * sd, 0.0), np.maximum(mean + z * sd, 0.0)
+    means, lowers, uppers = [], [], []
+    for m_row, v_row in zip(mean, variance):
+        sd = [math.sqrt(max(v, 0.0)) for v in v_row]
+        means.append([max(m, 0.0) for m in m_row])
+        lowers.append([max(m - z * s, 0.0) for m, s in zip(m_row, sd)])
+        uppers.append([max(m + z * s, 0.0) for m, s in zip(m_row, sd)])
+    return means, lowers, uppers
+
+
+METRICS = ("mae", "wape", "smape", "coverage", "absError", "spend")
+
+
+def _metrics(actual: Any, mean: Any, lower: Any, upper: Any) -> Dict[str, Any]:
+    """Backtest metrics, one value per series for each of METRICS."""
+    if _is_array(mean):
+        actual = np.asarray(actual)
+        diff = np.abs(actual - mean)
+        err, spend = diff.sum(axis=1), np.abs(actual).sum(axis=1)
+        denom = np.abs(actual) + np.abs(mean)
+        ratio = np.divide(2 * diff, denom, out=np.zeros_like(diff), where=denom > 0)
+        terms = (denom > 0).sum(axis=1)
+        return {
+            "mae": err / actual.shape[1],
+            "wape": np.divide(err, spend, out=np.zeros_like(err), where=spend > 0),
+            "smape": np.divide(ratio.sum(axis=1), terms, out=np.zeros_like(err), where=terms > 0),
+            "coverage": ((lower <= actual) & (actual <= upper)).mean(axis=1),
+            "absError": err,
+            "spend": spend,
+        }
+    out: Dict[str, Any] = {k: [] for k in METRICS}
+    for a_row, m_row, lo_row, hi_row in zip(actual, mean, lower, upper):
+        err = sum(abs(a - m) for a, m in zip(a_row, m_row))
+        spend = sum(abs(a) for a in a_row)
+        smape = [2 * abs(a - m) / (abs(a) + abs(m)) for a, m in zip(a_row, m_row) if abs(a) + abs(m) > 0]
+        out["mae"].append(err / len(a_row))
+        out["wape"].append(err / spend if spend else 0.0)
+        out["smape"].append(sum(smape) / len(smape) if smape else 0.0)
+        out["coverage"].append(sum(1 for a, lo, hi in zip(a_row, lo_row, hi_row) if lo <= a <= hi) / len(a_row))
+        out["absError"].append(err)
+        out["spend"].append(spend)
+    return out
+
+
+def _choose(options: List[Any], choice: Any) -> Any:
+    """Per series, the row of options[choice[i]]."""
+    if _is_array(options[0]):
+        return np.stack(options)[choice, np.arange(len(choice))]
+    return [options[c][i] for i, c in enumerate(choice)]
+
+
+def _row_sums(x: Any) -> List[float]:
+    return x.sum(axis=1).tolist() if _is_array(x) else [sum(r) for r in x]
+
+
+def forecast_series(
+    y: Any, first_day: int, horizon: int = 30, model: str = "auto", level: int = 80, holdout: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Forecasts every row of `y` (series x days) `horizon` days past its last column.
+    -> {"mean", "lower", "upper": series x horizon, "model": name per series, "backtest": METRICS per series
+    (None when the history is too short to hold `holdout` days out), ...}.
+    """
+    data = np.asarray(y, dtype=np.float64) if np is not None else [list(r) for r in y]
+    n = len(data[0]) if len(data) else 0
+    if n < MIN_DAYS:
+        raise ValueError(f"need at least {MIN_DAYS} days of history, got {n}")
+    z = NormalDist().inv_cdf(0.5 + level / 200)
+    holdout = min(horizon, 28) if holdout is None else holdout
+    models = MODELS if model == "auto" else (model,)
+    backtests: Dict[str, Dict[str, Any]] = {}
+    if holdout and n - holdout >= MIN_DAYS:
+        past = data[:, :n - holdout] if _is_array(data) else [r[:n - holdout] for r in data]
+        actual = data[:, n - holdout:] if _is_array(data) else [r[n - holdout:] for r in data]
+        for name in models:
+            backtests[name] = _metrics(actual, *_bounds(*fit(past, first_day, holdout, name), z))
+    fits = [_bounds(*fit(data, first_day, horizon, name), z) for name in models]
+    if len(models) > 1 and backtests:
+        errors = [backtests[name]["absError"] for name in models]
+        if _is_array(errors[0]):
+            choice = np.argmin(np.stack(errors), axis=0)
+        else:
+            choice = [min(range(len(models)), key=lambda k: errors[k][i]) for i in range(len(data))]
+    else:
+        choice = np.zeros(len(data), dtype=np.int64) if np is not None else [0] * len(data)
+    out: Dict[str, Any] = {"model": [models[int(c)] for c in choice], "level": level, "z": z}
+    for k, key in enumerate(("mean", "lower", "upper")):
+        out[key] = _choose([f[k] for f in fits], choice)
+    out["backtest"] = {m: _choose([backtests[name][m] for name in models], choice) for m in METRICS} \
+        if backtests else None
+    out["holdout"] = holdout if backtests else 0
+    return out
+
+
+def _amount(v: float) -> str:
+    return f"{v:.10f}".rstrip("0").rstrip(".") if v else "0"
+
+
+def _summary(metrics: Dict[str, List[float]]) -> Dict[str, float]:
+    err, spend, count = sum(metrics["absError"]), sum(metrics["spend"]), len(metrics["absError"])
+    return {
+        "wape": round(err / spend, 4) if spend else 0.0,
+        "smape": round(sum(metrics["smape"]) / count, 4) if count else 0.0,
+        "coverage": round(sum(metrics["coverage"]) / count, 4) if count else 0.0,
+    }
+
+
+def build_forecast(
+    keys: Sequence[Tuple[str, ...]], first_day: int, matrix: Any, horizon: int = 30, model: str = "auto",
+    level: int = 80, by: Sequence[str] = DIMENSIONS, top: Optional[int] = 50, unit: str = "USD",
+) -> Dict[str, Any]:
+    """
+    get-cost-forecast shaped document for the sum of all series (forecast as its own series, like CE does)
+    plus ByService: every series' forecast total with an interval, largest first.
+    """
+    n = len(matrix[0]) if len(matrix) else 0
+    if np is not None:
+        y = np.asarray(matrix, dtype=np.float64).reshape(len(keys), n)
+        y = np.vstack([y, y.sum(axis=0, keepdims=True)])
+    else:
+        y = [list(r) for r in matrix] + [[sum(col) for col in zip(*matrix)] if len(matrix) else [0.0] * n]
+    res = forecast_series(y, first_day, horizon, model, level)
+    mean, lower, upper = res["mean"], res["lower"], res["upper"]
+    total_mean, total_lo, total_hi = (list(x[-1]) for x in (mean, lower, upper))
+    start = first_day + n
+    by_time = [{
+        "TimePeriod": {"Start": day_string(start + h), "End": day_string(start + h + 1)},
+        "MeanValue": _amount(total_mean[h]),
+        "PredictionIntervalLowerBound": _amount(total_lo[h]),
+        "PredictionIntervalUpperBound": _amount(total_hi[h]),
+    } for h in range(horizon)]
+    # Interval of each series' horizon total from its daily ones, errors taken as independent across days.
+    if _is_array(mean):
+        totals = mean.sum(axis=1).tolist()
+        halves = np.sqrt((((upper - lower) / 2) ** 2).sum(axis=1)).tolist()
+    else:
+        totals = _row_sums(mean)
+        halves = [math.sqrt(sum(((hi - lo) / 2) ** 2 for lo, hi in zip(lo_row, hi_row)))
+                  for lo_row, hi_row in zip(lower, upper)]
+    backtest = {k: list(map(float, v)) for k, v in res["backtest"].items()} if res["backtest"] else None
+    breakdown = []
+    for i, key in enumerate(keys):
+        item: Dict[str, Any] = dict(zip(by, key))
+        item.update({
+            "model": res["model"][i],
+            "total": round(totals[i], 2),
+            "lower": round(max(totals[i] - halves[i], 0.0), 2),
+            "upper": round(totals[i] + halves[i], 2),
+        })
+        if backtest:
+            item["backtestWape"] = round(backtest["wape"][i], 4)
+        breakdown.append(item)
+    breakdown.sort(key=lambda it: it["total"], reverse=True)
+    doc: Dict[str, Any] = {
+        "Total": {"Amount": _amount(sum(total_mean)), "Unit": unit},
+        "ForecastResultsByTime": by_time,
+        "PredictionIntervalLevel": level,
+        "Model": {
+            "source": "local",
+            "history": {"start": day_string(first_day), "end": day_string(first_day + n - 1), "days": n},
+            "series": len(keys),
+            "total": res["model"][-1],
+            "models": {m: res["model"][:-1].count(m) for m in MODELS},
+        },
+        "BreakdownTotal": round(sum(totals[:-1]), 2),
+        "ByService": breakdown[:top] if top else breakdown,
+    }
+    if backtest:
+        doc["Backtest"] = {
+            "holdoutDays": res["holdout"],
+            "total": {k: round(backtest[k][-1], 4) for k in ("mae", "wape", "smape", "coverage")},
+            "series": _summary({k: v[:-1] for k, v in backtest.items()}),
+        }
+    return doc
+
+
+def run(source: str = "service", data_dir: str = DATA, by: Sequence[str] = DIMENSIONS, **settings: Any) -> Dict[str, Any]:
+    """Forecast over a cost_query source (collected CE JSON or a saved store)."""
+    started = time.monotonic()
+    store = open_store(source, data_dir)
+    try:
+        keys, first_day, matrix = store.daily_matrix(by)
+        doc = build_forecast(keys, first_day, matrix, by=by, unit=store.unit, **settings)
+    except ValueError as e:  # monthly source or too little history; same shape as cost-forecasting.py's CE failures
+        doc = {"error": str(e)}
+    doc["stats"] = {"seconds": round(time.monotonic() - started, 3), "numpy": np is not None}
+    return doc
+
+
+def add_forecast_args(ap: Any) -> None:
+    ap.add_argument("--source", default="service",
+                    help="service (cost_by_service_90d.json) | service-account (cost_by_service_account_90d.json) "
+                         "| path to .bin/.json (DAILY cost data only)")
+    ap.add_argument("--data-dir", default=DATA)
+    ap.add_argument("--model", choices=("auto",) + MODELS, default="auto",
+                    help="auto: per series, whichever model backtests better")
+    ap.add_argument("--level", type=int, default=80, help="Prediction interval level (percent)")
+    ap.add_argument("--top", type=int, default=50, help="Series in ByService (0 = all)")
+
+
+def run_from_args(args: Any, horizon: int) -> Dict[str, Any]:
+    return run(args.source, args.data_dir, horizon=horizon, model=args.model, level=args.level, top=args.top)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    add_forecast_args(ap)
+    ap.add_argument("--days", type=int, default=30, help="Forecast horizon")
+    args = ap.parse_args()
+    write_stdout_json(run_from_args(args, args.days))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Incremental Cost Explorer history: only days that can still change are re-queried.
+- Daily get-cost-and-usage results are persisted per query (metrics + group-by) in a JSON store
+- A day is final once CE no longer marks it Estimated and it is older than --open-days (default 3)
+- Each run fetches missing or open days only, coalesced into as few contiguous windows as possible,
+  so gaps left by failed runs or a longer --days are backfilled automatically
+- Output has the get-cost-and-usage shape (ResultsByTime), DAILY or rolled up to MONTHLY,
+  so generate_analysis.py reads it unchanged
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from common import aws_base, shell_json, write_stdout_json
+
+STORE_VERSION = 1
+GROUP_BY_TYPES = {"SERVICE": "DIMENSION", "LINKED_ACCOUNT": "DIMENSION", "REGION": "DIMENSION",
+                  "USAGE_TYPE": "DIMENSION", "INSTANCE_TYPE": "DIMENSION", "RECORD_TYPE": "DIMENSION"}
+
+
+def _day(value: str) -> date:
+    return date.fromisoformat(value[:10])
+
+
+def _days(start: date, end: date) -> Iterator[date]:
+    d = start
+    while d < end:
+        yield d
+        d += timedelta(days=1)
+
+
+def coalesce(days: List[date]) -> List[Tuple[date, date]]:
+    """Sorted days -> [start, end) windows of consecutive days."""
+    windows: List[Tuple[date, date]] = []
+    for d in sorted(days):
+        if windows and windows[-1][1] == d:
+            windows[-1] = (windows[-1][0], d + timedelta(days=1))
+        else:
+            windows.append((d, d + timedelta(days=1)))
+    return windows
+
+
+def group_definition(key: str) -> Dict[str, str]:
+    """'SERVICE' -> DIMENSION/SERVICE; 'TAG:team' or 'COST_CATEGORY:x' name the type explicitly."""
+    if ":" in key:
+        kind, name = key.split(":", 1)
+        return {"Type": kind, "Key": name}
+    return {"Type": GROUP_BY_TYPES.get(key, "DIMENSION"), "Key": key}
+
+
+def group_by_args(group_by: List[str]) -> List[str]:
+    args: List[str] = []
+    for key in group_by:
+        g = group_definition(key)
+        args += ["--group-by", f"Type={g['Type']},Key={g['Key']}"]
+    return args
+
+
+def fetch_cost_and_usage(
+    start: date, end: date, metrics: List[str], group_by: List[str], granularity: str = "DAILY",
+    filter_json: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    ResultsByTime entries for [start, end), following NextPageToken (CE has no CLI paginator).
+    HOURLY needs full timestamps and covers at most the last 14 days.
+    """
+    bounds = [d.isoformat() + ("T00:00:00Z" if granularity == "HOURLY" else "") for d in (start, end)]
+    cmd = aws_base() + [
+        "ce", "get-cost-and-usage", "--time-period", f"Start={bounds[0]},End={bounds[1]}",
+        "--granularity", granularity, "--metrics", *metrics,
+    ] + group_by_args(group_by) + (["--filter", filter_json] if filter_json else [])
+    token: Optional[str] = None
+    pending: Dict[str, Dict[str, Any]] = {}
+    while True:
+        page = shell_json(cmd + (["--next-page-token", token] if token else []))
+        # With group-by, one day's groups can be split across pages; merge them before yielding.
+        for period in page.get("ResultsByTime", []):
+            key = (period.get("TimePeriod") or {}).get("Start", "")
+            if key in pending:
+                pending[key]["Groups"] = pending[key].get("Groups", []) + period.get("Groups", [])
+            else:
+                pending[key] = period
+        token = page.get("NextPageToken")
+        if not token:
+            break
+    for key in sorted(pending):
+        yield pending[key]
+
+
+class CostHistory:
+    """
+    Persistent daily history for one (metrics, group-by) query. `fetch` and `today` are injectable so
+    recorded fixtures can drive it; by default it calls Cost Explorer and uses the current UTC date.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        metrics: List[str],
+        group_by: List[str],
+        open_days: int = 3,
+        today: Optional[date] = None,
+        fetch: Optional[Callable[[date, date, List[str], List[str]], Iterator[Dict[str, Any]]]] = None,
+    ) -> None:
+        self.path = path
+        self.metrics = list(metrics)
+        self.group_by = list(group_by)
+        self.open_days = open_days
+        self.today = today or datetime.now(timezone.utc).date()
+        self.fetch = fetch or fetch_cost_and_usage
+        self.days: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    @property
+    def query(self) -> Dict[str, Any]:
+        return {"granularity": "DAILY", "metrics": self.metrics, "groupBy": self.group_by}
+
+    def load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+        except (OSError, ValueError):
+            return
+        # A store written for another query (or format) is ignored rather than mixed in.
+        if doc.get("version") == STORE_VERSION and doc.get("query") == self.query:
+            self.days = doc.get("days") or {}
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        doc = {"version": STORE_VERSION, "query": self.query, "days": dict(sorted(self.days.items()))}
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            # json.dumps uses the C encoder; json.dump would stream through the pure-Python one.
+            f.write(json.dumps(doc, separators=(",", ":"), sort_keys=True))
+        os.replace(tmp, self.path)
+
+    def is_final(self, day: str) -> bool:
+        rec = self.days.get(day)
+        if rec is None or rec.get("Estimated", False):
+            return False
+        return _day(day) <= self.today - timedelta(days=self.open_days)
+
+    def stale_days(self, start: date, end: date) -> List[date]:
+        return [d for d in _days(start, min(end, self.today)) if not self.is_final(d.isoformat())]
+
+    def update(self, start: date, end: date) -> Dict[str, Any]:
+        """Fetches every missing or still-open day of [start, end) and merges it into the store."""
+        stale = self.stale_days(start, end)
+        windows = coalesce(stale)
+        fetched = 0
+        for w_start, w_end in windows:
+            for period in self.fetch(w_start, w_end, self.metrics, self.group_by):
+                day = (period.get("TimePeriod") or {}).get("Start")
+                if not day:
+                    continue
+                self.days[day[:10]] = {k: v for k, v in period.items() if k != "TimePeriod"}
+                fetched += 1
+        total = sum(1 for _ in _days(start, min(end, self.today)))
+        return {
+            "windows": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in windows],
+            "ceWindows": len(windows),  # each window may page through NextPageToken
+            "daysFetched": fetched,
+            "daysReused": total - len(stale),
+        }
+
+    def prune(self, keep_from: date) -> int:
+        old = [d for d in self.days if _day(d) < keep_from]
+        for d in old:
+            del self.days[d]
+        return len(old)
+
+    def results(self, start: date, end: date, granularity: str = "DAILY") -> List[Dict[str, Any]]:
+        daily: List[Dict[str, Any]] = []
+        for d in _days(start, min(end, self.today)):
+            rec = self.days.get(d.isoformat())
+            if rec is not None:
+                period = {"TimePeriod": {"Start": d.isoformat(), "End": (d + timedelta(days=1)).isoformat()}}
+                period.update(rec)
+                daily.append(period)
+        return daily if granularity == "DAILY" else rollup_monthly(daily, end)
+
+
+def _add_metrics(into: Dict[str, Dict[str, Any]], metrics: Dict[str, Any]) -> None:
+    for name, m in (metrics or {}).items():
+        cur = into.setdefault(name, {"Amount": 0.0, "Unit": m.get("Unit", "USD")})
+        cur["Amount"] += float(m.get("Amount") or 0.0)
+
+
+def _format_metrics(metrics: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, str]]:
+    return {k: {"Amount": f"{v['Amount']:.10f}".rstrip("0").rstrip(".") or "0", "Unit": v["Unit"]}
+            for k, v in metrics.items()}
+
+
+def rollup_monthly(daily: List[Dict[str, Any]], end: date) -> List[Dict[str, Any]]:
+    """Daily periods -> calendar-month periods clipped to the window, as a MONTHLY CE query returns them."""
+    months: Dict[str, Dict[str, Any]] = {}
+    for p in daily:
+        start = p["TimePeriod"]["Start"]
+        m = months.setdefault(start[:7], {"start": start, "end": p["TimePeriod"]["End"], "total": {}, "groups": {},
+                                          "estimated": False})
+        m["end"] = p["TimePeriod"]["End"]
+        m["estimated"] = m["estimated"] or bool(p.get("Estimated"))
+        _add_metrics(m["total"], p.get("Total") or {})
+        for g in p.get("Groups", []):
+            _add_metrics(m["groups"].setdefault(tuple(g.get("Keys", [])), {}), g.get("Metrics") or {})
+    out: List[Dict[str, Any]] = []
+    for key in sorted(months):
+        m = months[key]
+        out.append({
+            "TimePeriod": {"Start": m["start"], "End": min(m["end"], end.isoformat())},
+            "Total": _format_metrics(m["total"]),
+            "Groups": [{"Keys": list(k), "Metrics": _format_metrics(v)} for k, v in sorted(m["groups"].items())],
+            "Estimated": m["estimated"],
+        })
+    return out
+
+
+def store_path(store_dir: str, metrics: List[str], group_by: List[str]) -> str:
+    name = "_".join(["daily", *[g.replace(":", "-").lower() for g in group_by], *[m.lower() for m in metrics]])
+    return os.path.join(store_dir, f"{name}.json")
+
+
+def collect(
+    store_dir: str,
+    days: int = 90,
+    group_by: Optional[List[str]] = None,
+    metrics: Optional[List[str]] = None,
+    granularity: str = "DAILY",
+    open_days: int = 3,
+    retain_days: int = 400,
+    today: Optional[date] = None,
+) -> Dict[str, Any]:
+    group_by = group_by if group_by is not None else ["SERVICE"]
+    metrics = metrics or ["UnblendedCost"]
+    history = CostHistory(store_path(store_dir, metrics, group_by), metrics, group_by, open_days, today)
+    end = history.today
+    start = end - timedelta(days=days)
+    stats = history.update(start, end)
+    stats["pruned"] = history.prune(end - timedelta(days=max(retain_days, days)))
+    history.save()
+    sys.stderr.write(
+        f"[cost-history] {stats['daysFetched']} day(s) fetched in {stats['ceWindows']} query window(s), "
+        f"{stats['daysReused']} reused from {history.path}\n"
+    )
+    return {
+        "GroupDefinitions": [group_definition(g) for g in group_by],
+        "ResultsByTime": history.results(start, end, granularity),
+        "DimensionValueAttributes": [],
+        "Collection": {"incremental": True, "store": history.path, **stats},
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--store-dir", required=True, help="Directory holding the persisted daily history")
+    ap.add_argument("--days", type=int, default=90, help="Window to return (and fill in) ending today")
+    ap.add_argument("--group-by", default="SERVICE", help="Comma-separated dimensions (or TYPE:Key); empty for none")
+    ap.add_argument("--metrics", default="UnblendedCost")
+    ap.add_argument("--granularity", choices=("DAILY", "MONTHLY"), default="DAILY")
+    ap.add_argument("--open-days", type=int, default=3, help="Recent days always re-fetched (CE still revises them)")
+    ap.add_argument("--retain-days", type=int, default=400, help="Days of history kept in the store")
+    ap.add_argument("--today", default=None, help="Override the current date (YYYY-MM-DD), e.g. to replay fixtures")
+    args = ap.parse_args()
+    write_stdout_json(collect(
+        args.store_dir,
+        days=args.days,
+        group_by=[g.strip() for g in args.group_by.split(",") if g.strip()],
+        metrics=[m.strip() for m in args.metrics.split(",") if m.strip()],
+        granularity=args.granularity,
+        open_days=args.open_days,
+        retain_days=args.retain_days,
+        today=date.fromisoformat(args.today) if args.today else None,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Ad-hoc cost slicing over the columnar cost store (cost_store.py).
+- Filters per dimension: exact values (service=Amazon EC2) or regex (service~NAT), several values OR-ed
+- Group-by on any of service/account plus a time bucket (day, week, month; total when omitted)
+- Top-N groups by total spend, and "movers": change between the last two buckets per group
+- Execution uses the store's precomputed posting index per dimension and its date ordering:
+  a filter reads only the rows it selects, a date range is a binary search, never a full scan
+Sources are the files generate_analysis.py already reads (cost_by_service_90d.json, cost_by_account_90d.json),
+the daily SERVICE x LINKED_ACCOUNT history collect_report.py keeps for the anomaly detector and the forecast
+(cost_by_service_account_90d.json, sliceable both ways) or a saved store.
+"""
+from __future__ import annotations
+
+import argparse
+import heapq
+import os
+import re
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cost_store
+from common import write_stdout_json
+from cost_store import DIMENSIONS, CostStore, day_number, day_string
+
+BUCKETS = ("total", "day", "week", "month")
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DATA = os.path.join(ROOT, "reports", "data")
+SOURCES = {
+    "service": "cost_by_service_90d.json",
+    "account": "cost_by_account_90d.json",
+    "service-account": "cost_by_service_account_90d.json",
+}
+
+
+@dataclass
+class Query:
+    where: Dict[str, List[str]] = field(default_factory=dict)  # dim -> values; "~pattern" entries are regexes
+    group_by: List[str] = field(default_factory=lambda: ["service"])
+    bucket: str = "total"
+    start: Optional[str] = None  # inclusive YYYY-MM-DD
+    end: Optional[str] = None  # exclusive
+    top: Optional[int] = None
+
+
+def parse_where(items: Sequence[str]) -> Dict[str, List[str]]:
+    """['service=Amazon EC2,AWS Lambda', 'account~^1234'] -> {'service': [...], 'account': ['~^1234']}."""
+    where: Dict[str, List[str]] = {}
+    for item in items:
+        m = re.match(r"^\s*(\w+)\s*(=|~)\s*(.*)$", item)
+        if not m or m.group(1) not in DIMENSIONS:
+            raise ValueError(f"Bad filter {item!r}; use <{'|'.join(DIMENSIONS)}>=v1,v2 or <dim>~regex")
+        dim, op, value = m.groups()
+        values = [value] if op == "~" else [v.strip() for v in value.split(",") if v.strip()]
+        where.setdefault(dim, []).extend(f"~{v}" if op == "~" else v for v in values)
+    return where
+
+
+def _bucket_end(start: int, bucket: str) -> int:
+    """Exclusive end day of the bucket starting at `start`."""
+    if bucket == "week":
+        return start + 7
+    if bucket == "month":
+        d = date.fromordinal(start + cost_store.EPOCH)
+        nxt = date(d.year + d.month // 12, d.month % 12 + 1, 1)
+        return nxt.toordinal() - cost_store.EPOCH
+    return start + 1
+
+
+def _bucket_start(day: int, bucket: str) -> int:
+    if bucket == "day":
+        return day
+    if bucket == "week":
+        return day - (day + 3) % 7  # 1970-01-01 was a Thursday; weeks start on Monday
+    if bucket == "month":
+        d = date.fromordinal(day + cost_store.EPOCH)
+        return day_number(d.replace(day=1).isoformat())
+    return 0
+
+
+class QueryEngine:
+    def __init__(self, store: CostStore) -> None:
+        self.store = store
+        if not store.indexes and len(store):
+            if store._mmap is None:
+                store.sort_by_date()
+            store.build_indexes()
+        self._np = cost_store.np
+
+    def codes(self, dim: str, values: Sequence[str]) -> List[int]:
+        """Resolves exact values and ~regex patterns against the dimension dictionary (hundreds of entries)."""
+        d = self.store.dicts[dim]
+        out: List[int] = []
+        for v in values:
+            if v.startswith("~"):
+                rx = re.compile(v[1:], re.IGNORECASE)
+                out.extend(i for i, name in enumerate(d.values) if i and rx.search(name))
+            elif v in d.codes:
+                out.append(d.codes[v])
+        return sorted(set(out))
+
+    def _date_slice(self, q: Query) -> Tuple[int, int]:
+        dates = self.store.date
+        lo = bisect_left(dates, day_number(q.start)) if q.start else 0
+        hi = bisect_left(dates, day_number(q.end)) if q.end else len(dates)
+        return lo, hi
+
+    def select(self, q: Query) -> Any:
+        """Row ids matching the query: a range when unfiltered, else postings of the most selective filter."""
+        lo, hi = self._date_slice(q)
+        resolved = {dim: self.codes(dim, vals) for dim, vals in q.where.items()}
+        if not resolved:
+            return range(lo, hi)
+        if any(not codes for codes in resolved.values()):
+            return range(0)
+
+        def postings(dim: str) -> int:
+            _, offsets = self.store.indexes[dim]
+            return sum(offsets[c + 1] - offsets[c] for c in resolved[dim])
+
+        lead = min(resolved, key=postings)
+        order, offsets = self.store.indexes[lead]
+        np = self._np
+        parts = []
+        for c in resolved[lead]:
+            seg = order[offsets[c]:offsets[c + 1]]  # ascending row ids, so the date range is a bisect
+            parts.append(seg[bisect_left(seg, lo):bisect_left(seg, hi)])
+        rest = [(self.store.column(d), set(codes)) for d, codes in resolved.items() if d != lead]
+        if np is not None:
+            rows = np.sort(np.concatenate([np.asarray(p) for p in parts])) if parts else np.zeros(0, np.int32)
+            for col, codes in rest:
+                rows = rows[np.isin(np.asarray(col)[rows], np.fromiter(codes, dtype=np.int32))]
+            return rows
+        rows = sorted(r for p in parts for r in p)
+        for col, codes in rest:
+            rows = [r for r in rows if col[r] in codes]
+        return rows
+
+    def run(self, q: Query) -> List[Dict[str, Any]]:
+        if q.bucket not in BUCKETS:
+            raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+        for g in q.group_by:
+            if g not in DIMENSIONS:
+                raise ValueError(f"group-by must be among {', '.join(DIMENSIONS)}")
+        sums = self._aggregate(self.select(q), q.group_by, q.bucket)
+        if q.top:
+            totals: Dict[Tuple[int, ...], float] = {}
+            for (group, _), v in sums.items():
+                totals[group] = totals.get(group, 0.0) + v
+            keep = {g for g, _ in heapq.nlargest(q.top, totals.items(), key=lambda kv: kv[1])}
+            sums = {k: v for k, v in sums.items() if k[0] in keep}
+            rank = {g: i for i, (g, _) in enumerate(sorted(totals.items(), key=lambda kv: -kv[1]))}
+            ordered = sorted(sums.items(), key=lambda kv: (rank[kv[0][0]], kv[0][1]))
+        else:
+            ordered = sorted(sums.items(), key=lambda kv: (kv[0][1], -kv[1]))
+        return [self._row(group, bucket, v, q) for (group, bucket), v in ordered]
+
+    def movers(self, q: Query, n: int = 10) -> List[Dict[str, Any]]:
+        """Largest absolute changes between the last two complete buckets (day/week/month) per group."""
+        bucket = q.bucket if q.bucket != "total" else "week"
+        rows = self.select(q)
+        sums = self._aggregate(rows, q.group_by, bucket)
+        buckets = sorted({b for _, b in sums})
+        last_day = max((self.store.date[r] for r in (rows[-1:] if len(rows) else [])), default=None)
+        if buckets and last_day is not None and _bucket_end(buckets[-1], bucket) > last_day + 1:
+            buckets.pop()  # the running week/month would always look like a drop
+        if len(buckets) < 2:
+            return []
+        prev, last = buckets[-2], buckets[-1]
+        groups = {g for g, _ in sums}
+        changes = []
+        for g in groups:
+            a, b = sums.get((g, prev), 0.0), sums.get((g, last), 0.0)
+            changes.append((g, a, b))
+        changes.sort(key=lambda t: abs(t[2] - t[1]), reverse=True)
+        out = []
+        for g, a, b in changes[:n]:
+            row = {dim: self.store.dicts[dim].values[code] for dim, code in zip(q.group_by, g)}
+            row.update({
+                "previous": round(a, 2), "current": round(b, 2), "change": round(b - a, 2),
+                "changePct": round((b - a) / a * 100, 1) if a else None,
+                "previousBucket": day_string(prev), "currentBucket": day_string(last),
+            })
+            out.append(row)
+        return out
+
+    def _row(self, group: Tuple[int, ...], bucket: int, amount: float, q: Query) -> Dict[str, Any]:
+        row: Dict[str, Any] = {dim: self.store.dicts[dim].values[code] for dim, code in zip(q.group_by, group)}
+        if q.bucket != "total":
+            row[q.bucket] = day_string(bucket)
+        row["amount"] = round(amount, 2)
+        return row
+
+    def _aggregate(self, rows: Any, group_by: Sequence[str], bucket: str) -> Dict[Tuple[Tuple[int, ...], int], float]:
+        """(group codes, bucket start day) -> sum over the selected rows."""
+        store, np = self.store, self._np
+        if np is not None:
+            if isinstance(rows, range):
+                sl = slice(rows.start, rows.stop)
+                take = lambda col: np.asarray(col)[sl]  # noqa: E731
+            else:
+                idx = np.asarray(rows, dtype=np.int64)
+                take = lambda col: np.asarray(col)[idx]  # noqa: E731
+            amount = take(store.amount)
+            if not len(amount):
+                return {}
+            key = np.zeros(len(amount), dtype=np.int64)
+            sizes = []
+            for dim in group_by:
+                size = len(store.dicts[dim])
+                key = key * size + take(store.column(dim))
+                sizes.append(size)
+            days = take(store.date).astype(np.int64)
+            lo = int(days.min())
+            if bucket == "total":
+                bstart = np.zeros(len(days), dtype=np.int64)
+            elif bucket == "month":
+                span = np.arange(lo, int(days.max()) + 1)
+                table = np.array([_bucket_start(int(d), "month") for d in span], dtype=np.int64)
+                bstart = table[days - lo]
+            elif bucket == "week":
+                bstart = days - (days + 3) % 7
+            else:
+                bstart = days
+            bmin = int(bstart.min())
+            width = int(bstart.max()) - bmin + 1
+            key = key * width + (bstart - bmin)
+            space = width
+            for size in sizes:
+                space *= size
+            if space <= max(1 << 20, 4 * len(key)):
+                dense = np.bincount(key, weights=amount, minlength=space)
+                uniq = np.flatnonzero(np.bincount(key, minlength=space))
+                sums = dense[uniq]
+            else:  # sparse key space: sort-based grouping
+                uniq, inverse = np.unique(key, return_inverse=True)
+                sums = np.bincount(inverse.ravel(), weights=amount, minlength=len(uniq))
+            out: Dict[Tuple[Tuple[int, ...], int], float] = {}
+            for k, v in zip(uniq.tolist(), sums.tolist()):
+                k, b = divmod(k, width)
+                group: List[int] = []
+                for size in reversed(sizes):
+                    k, code = divmod(k, size)
+                    group.append(code)
+                out[(tuple(reversed(group)), b + bmin)] = v
+            return out
+        cols = [store.column(dim) for dim in group_by]
+        dates, amounts = store.date, store.amount
+        month_cache: Dict[int, int] = {}
+        acc: Dict[Tuple[Tuple[int, ...], int], float] = {}
+        for r in rows:
+            d = dates[r]
+            if bucket == "month":
+                b = month_cache.get(d)
+                if b is None:
+                    b = month_cache[d] = _bucket_start(d, "month")
+            else:
+                b = _bucket_start(d, bucket)
+            k = (tuple(col[r] for col in cols), b)
+            acc[k] = acc.get(k, 0.0) + amounts[r]
+        return acc
+
+
+def open_store(source: str, data_dir: str = DATA) -> CostStore:
+    """A SOURCES key -> the collected JSON of that name; a path -> saved store (.bin) or CE JSON file."""
+    path = os.path.join(data_dir, SOURCES[source]) if source in SOURCES else source
+    if source == "service" and os.path.exists(os.path.join(data_dir, "cost_store.bin")):
+        bin_path = os.path.join(data_dir, "cost_store.bin")
+        if not os.path.exists(path) or os.path.getmtime(bin_path) >= os.path.getmtime(path):
+            return CostStore.load(bin_path)
+    if path.endswith(".bin"):
+        return CostStore.load(path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No cost data at {path}")
+    store = CostStore()
+    store.ingest_file(path)
+    return store
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--source", default="service",
+                    help="service | account | service-account (cost_by_<source>_90d.json) | path to .bin/.json")
+    ap.add_argument("--data-dir", default=DATA)
+    ap.add_argument("--where", action="append", default=[], help="dim=v1,v2 or dim~regex; repeatable (AND)")
+    ap.add_argument("--group-by", default=None, help="Comma-separated: service, account (default: the source's)")
+    ap.add_argument("--bucket", choices=BUCKETS, default="total")
+    ap.add_argument("--start", default=None, help="YYYY-MM-DD, inclusive")
+    ap.add_argument("--end", default=None, help="YYYY-MM-DD, exclusive")
+    ap.add_argument("--top", type=int, default=None, help="Keep the N groups with the largest total")
+    ap.add_argument("--movers", type=int, default=None, help="N largest changes between the last two buckets")
+    args = ap.parse_args()
+    group_by = args.group_by or ("account" if args.source == "account" else "service")
+    q = Query(
+        where=parse_where(args.where),
+        group_by=[g.strip() for g in group_by.split(",") if g.strip()],
+        bucket=args.bucket,
+        start=args.start,
+        end=args.end,
+        top=args.top,
+    )
+    engine = QueryEngine(open_store(args.source, args.data_dir))
+    write_stdout_json(engine.movers(q, args.movers) if args.movers else engine.run(q))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""
+Columnar cost store: Cost Explorer ResultsByTime ingested once into flat typed columns.
+- Columns: date (days since 1970-01-01), service and account (dictionary-encoded int32 codes), amount (float64)
+- Persisted as one binary file (JSON header + 8-byte aligned raw columns) that loads through mmap without copying
+- Saved stores are sorted by date and carry a posting index per dimension (row ids grouped by code, CSR layout)
+  that cost_query.py uses to skip straight to the rows a filter selects
+- group_sum/top_n/total run as vectorized bincounts when numpy is installed, as tight array loops otherwise
+- JSON input is streamed (jsonstream.py), one ResultsByTime period at a time
+- Rows are keyed by their period's start day; a store that ingested any multi-day period (MONTHLY results) is
+  marked with that granularity, which daily_matrix refuses instead of reading months as single days
+- CLI: build a store from collected JSON, export the dashboard data, print top-N
+"""
+from __future__ import annotations
+
+import argparse
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import jsonstream
+from common import write_stdout_json
+
+try:  # optional: vectorized queries and zero-copy column views
+    import numpy as np
+except ImportError:  # pragma: no cover - exercised where numpy is absent
+    np = None  # type: ignore[assignment]
+
+MAGIC = b"CSTORE01"
+EPOCH = date(1970, 1, 1).toordinal()
+DIMENSIONS = ("service", "account")
+# CE group-by keys -> store dimension.
+GROUP_KEYS = {"SERVICE": "service", "LINKED_ACCOUNT": "account"}
+_CODE, _AMOUNT = "i", "d"  # int32, float64
+
+
+def day_number(value: str) -> int:
+    return date.fromisoformat(value[:10]).toordinal() - EPOCH
+
+
+def day_string(n: int) -> str:
+    return date.fromordinal(int(n) + EPOCH).isoformat()
+
+
+class Dictionary:
+    """String <-> dense int code mapping; code 0 is the empty string (dimension not present)."""
+
+    def __init__(self, values: Optional[List[str]] = None) -> None:
+        self.values: List[str] = list(values) if values else [""]
+        self.codes: Dict[str, int] = {v: i for i, v in enumerate(self.values)}
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class CostStore:
+    def __init__(self, metric: str = "UnblendedCost", unit: str = "USD") -> None:
+        self.metric = metric
+        self.unit = unit
+        self.granularity = "DAILY"  # MONTHLY once any ingested period spans more than one day
+        self.dicts: Dict[str, Dictionary] = {d: Dictionary() for d in DIMENSIONS}
+        self.date: Any = array(_CODE)
+        self.service: Any = array(_CODE)
+        self.account: Any = array(_CODE)
+        self.amount: Any = array(_AMOUNT)
+        # dimension -> (order, offsets): rows with code c are order[offsets[c]:offsets[c + 1]], ascending.
+        self.indexes: Dict[str, Tuple[Any, Any]] = {}
+        self._mmap: Optional[mmap.mmap] = None
+
+    # --- ingest --------------------------------------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.amount)
+
+    def column(self, name: str) -> Any:
+        return {"date": self.date, "service": self.service, "account": self.account, "amount": self.amount}[name]
+
+    def _writable(self) -> None:
+        if self._mmap is not None:
+            raise ValueError("store was opened read-only from a file; build a new one to ingest")
+
+    def append(self, day: int, service: str, account: str, amount: float) -> None:
+        self._writable()
+        self.date.append(day)
+        self.service.append(self.dicts["service"].encode(service))
+        self.account.append(self.dicts["account"].encode(account))
+        self.amount.append(amount)
+
+    def ingest(self, doc: Dict[str, Any], fixed: Optional[Dict[str, str]] = None) -> int:
+        """
+        Appends one get-cost-and-usage document. Group keys map to dimensions via GroupDefinitions
+        (SERVICE, LINKED_ACCOUNT); `fixed` supplies dimensions the query did not group by. Returns rows added.
+        """
+        dims = self._dims(doc.get("GroupDefinitions"))
+        return sum(self._ingest_period(p, dims, fixed) for p in doc.get("ResultsByTime", []))
+
+    def ingest_file(self, path: str, fixed: Optional[Dict[str, str]] = None) -> int:
+        """Same as ingest() for a JSON file, streamed: only one ResultsByTime period is decoded at a time."""
+        dims: Optional[List[Optional[str]]] = None
+        pending: List[Dict[str, Any]] = []
+        added = 0
+        for where, value in jsonstream.walk(path, [("GroupDefinitions",), ("ResultsByTime", "*")]):
+            if where[0] == "GroupDefinitions":
+                dims = self._dims(value)
+                added += sum(self._ingest_period(p, dims, fixed) for p in pending)
+                pending = []
+            elif dims is None:
+                pending.append(value)  # GroupDefinitions after the results: CLI output never does this
+            else:
+                added += self._ingest_period(value, dims, fixed)
+        dims = dims or self._dims(None)
+        return added + sum(self._ingest_period(p, dims, fixed) for p in pending)
+
+    @staticmethod
+    def _dims(group_definitions: Optional[List[Dict[str, Any]]]) -> List[Optional[str]]:
+        dims = [GROUP_KEYS.get(g.get("Key", "")) for g in group_definitions or []]
+        return dims or ["service"]  # collector output predating GroupDefinitions: the SERVICE query
+
+    def _ingest_period(self, period: Dict[str, Any], dims: List[Optional[str]], fixed: Optional[Dict[str, str]]) -> int:
+        self._writable()
+        fixed = fixed or {}
+        svc_dict, acct_dict = self.dicts["service"], self.dicts["account"]
+        base_svc = svc_dict.encode(fixed.get("service", ""))
+        base_acct = acct_dict.encode(fixed.get("account", ""))
+        span = period.get("TimePeriod") or {}
+        day = day_number(span.get("Start", "1970-01-01"))
+        if span.get("End") and day_number(span["End"]) - day > 1:
+            self.granularity = "MONTHLY"
+        added = 0
+        for g in period.get("Groups", []):
+            m = (g.get("Metrics") or {}).get(self.metric)
+            if not m:
+                continue
+            svc, acct = base_svc, base_acct
+            for dim, key in zip(dims, g.get("Keys", [])):
+                if dim == "service":
+                    svc = svc_dict.encode(key)
+                elif dim == "account":
+                    acct = acct_dict.encode(key)
+            self.date.append(day)
+            self.service.append(svc)
+            self.account.append(acct)
+            self.amount.append(float(m.get("Amount") or 0.0))
+            added += 1
+        return added
+
+    @classmethod
+    def from_results(cls, *docs: Optional[Dict[str, Any]], metric: str = "UnblendedCost") -> "CostStore":
+        store = cls(metric)
+        for doc in docs:
+            if doc:
+                store.ingest(doc)
+        return store
+
+    @classmethod
+    def from_files(cls, *paths: str, metric: str = "UnblendedCost") -> "CostStore":
+        """Streaming counterpart of from_results; missing or unreadable files are skipped."""
+        store = cls(metric)
+        for path in paths:
+            try:
+                store.ingest_file(path)
+            except (OSError, ValueError):
+                continue
+        return store
+
+    # --- persistence ---------------------------------------------------------------------------------
+
+    def sort_by_date(self) -> None:
+        """Stable reorder of all columns by date (a no-op for ingested CE output, which is chronological)."""
+        self._writable()
+        dates = self.date
+        if np is not None:
+            d = np.asarray(dates)
+            if len(d) < 2 or bool(np.all(d[1:] >= d[:-1])):
+                return
+            order = np.argsort(d, kind="stable")
+            for name in ("date", "service", "account", "amount"):
+                col = self.column(name)
+                setattr(self, name, array(col.typecode, np.asarray(col)[order].tobytes()))
+        else:
+            if all(dates[i] <= dates[i + 1] for i in range(len(dates) - 1)):
+                return
+            order = sorted(range(len(dates)), key=dates.__getitem__)
+            for name in ("date", "service", "account", "amount"):
+                col = self.column(name)
+                setattr(self, name, array(col.typecode, (col[i] for i in order)))
+        self.indexes = {}
+
+    def build_indexes(self) -> None:
+        """Counting sort per dimension: O(rows), codes are dense."""
+        for dim in DIMENSIONS:
+            col, size = self.column(dim), len(self.dicts[dim])
+            if np is not None:
+                codes = np.asarray(col)
+                offsets = np.zeros(size + 1, dtype=np.int64)
+                np.cumsum(np.bincount(codes, minlength=size), out=offsets[1:])
+                order = np.argsort(codes, kind="stable").astype(np.int32)
+                self.indexes[dim] = (order, offsets.astype(np.int32))
+                continue
+            counts = [0] * (size + 1)
+            for c in col:
+                counts[c + 1] += 1
+            for i in range(size):
+                counts[i + 1] += counts[i]
+            offsets = array(_CODE, counts)
+            fill = list(counts[:size])
+            order = array(_CODE, bytes(4 * len(col)))
+            for row, c in enumerate(col):
+                order[fill[c]] = row
+                fill[c] += 1
+            self.indexes[dim] = (order, offsets)
+
+    def save(self, path: str) -> None:
+        self.sort_by_date()
+        if not self.indexes:
+            self.build_indexes()
+        cols = [("date", self.date), ("service", self.service), ("account", self.account), ("amount", self.amount)]
+        for dim, (order, offsets) in self.indexes.items():
+            cols += [(f"index.{dim}.order", order), (f"index.{dim}.offsets", offsets)]
+        raw = [(name, _as_bytes(col, name == "amount")) for name, col in cols]
+        header: Dict[str, Any] = {
+            "rows": len(self),
+            "metric": self.metric,
+            "unit": self.unit,
+            "granularity": self.granularity,
+            "dictionaries": {d: self.dicts[d].values for d in DIMENSIONS},
+            "columns": {},
+        }
+        # Offsets depend on the header length, so size it once with placeholders and then fill them in.
+        head_len = len(json.dumps(header)) + 128 * len(raw)
+        offset = _align(len(MAGIC) + 4 + head_len)
+        for name, data in raw:
+            header["columns"][name] = {"type": "f8" if name == "amount" else "i4", "offset": offset,
+                                       "count": len(data) // (8 if name == "amount" else 4)}
+            offset = _align(offset + len(data))
+        head = json.dumps(header).encode("utf-8").ljust(head_len)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC + struct.pack("<I", len(head)) + head)
+            for name, data in raw:
+                f.write(b"\0" * (header["columns"][name]["offset"] - f.tell()))
+                f.write(data)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "CostStore":
+        """Maps the file read-only; columns are views into the mapping (numpy arrays or memoryviews)."""
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:len(MAGIC)] != MAGIC:
+            mm.close()
+            raise ValueError(f"{path} is not a cost store")
+        (head_len,) = struct.unpack_from("<I", mm, len(MAGIC))
+        start = len(MAGIC) + 4
+        header = json.loads(bytes(mm[start:start + head_len]))
+        store = cls(header.get("metric", "UnblendedCost"), header.get("unit", "USD"))
+        store.granularity = header.get("granularity", "DAILY")
+        store.dicts = {d: Dictionary(header["dictionaries"].get(d)) for d in DIMENSIONS}
+        n = int(header["rows"])
+        for name, spec in header["columns"].items():
+            view = _view(mm, spec["offset"], int(spec.get("count", n)), spec["type"])
+            if name.startswith("index."):
+                _, dim, part = name.split(".")
+                order, offsets = store.indexes.get(dim, (None, None))
+                store.indexes[dim] = (view, offsets) if part == "order" else (order, view)
+            else:
+                setattr(store, name, view)
+        store._mmap = mm
+        return store
+
+    # --- queries -------------------------------------------------------------------------------------
+
+    def date_bounds(self) -> Tuple[Optional[int], Optional[int]]:
+        if not len(self):
+            return None, None
+        if np is not None:
+            d = np.asarray(self.date)
+            return int(d.min()), int(d.max())
+        return min(self.date), max(self.date)
+
+    def _selection(self, start: Optional[int], end: Optional[int], where: Optional[Dict[str, Iterable[str]]]) -> Any:
+        """Boolean mask (numpy) or None for "all rows"; stdlib path evaluates filters inside its loop instead."""
+        mask = None
+        d = np.asarray(self.date)
+        if start is not None:
+            mask = d >= start
+        if end is not None:
+            m = d < end
+            mask = m if mask is None else mask & m
+        for dim, values in (where or {}).items():
+            codes = [self.dicts[dim].codes[v] for v in values if v in self.dicts[dim].codes]
+            m = np.isin(np.asarray(self.column(dim)), np.asarray(codes, dtype=np.int32))
+            mask = m if mask is None else mask & m
+        return mask
+
+    def group_sum(
+        self,
+        by: Sequence[str] = ("service",),
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        where: Optional[Dict[str, Iterable[str]]] = None,
+    ) -> Dict[Tuple[str, ...], float]:
+        """Sums amount per combination of `by` (service, account, date) over dates [start, end) and filters."""
+        if not len(self):
+            return {}
+        lo, hi = self.date_bounds()
+        sizes = [len(self.dicts[b]) if b in self.dicts else hi - lo + 1 for b in by]  # type: ignore[operator]
+        if np is not None:
+            mask = self._selection(start, end, where)
+            key = np.zeros(len(self), dtype=np.int64)
+            for b, size in zip(by, sizes):
+                col = np.asarray(self.column(b), dtype=np.int64)
+                key = key * size + (col - lo if b == "date" else col)
+            amount = np.asarray(self.amount)
+            if mask is not None:
+                key, amount = key[mask], amount[mask]
+            total = 1
+            for s in sizes:
+                total *= s
+            if total <= max(1 << 20, 4 * len(key)):
+                sums = np.bincount(key, weights=amount, minlength=total)
+                hits = np.flatnonzero(np.bincount(key, minlength=total))
+                return {self._decode(int(k), by, sizes, lo): float(sums[k]) for k in hits}
+            # Sparse key space (e.g. service x account x date): compact the keys before counting.
+            uniq, inverse = np.unique(key, return_inverse=True)
+            sums = np.bincount(inverse, weights=amount, minlength=len(uniq))
+            return {self._decode(int(k), by, sizes, lo): float(v) for k, v in zip(uniq, sums)}
+        return self._group_sum_loop(by, sizes, lo, start, end, where)
+
+    def _group_sum_loop(
+        self, by: Sequence[str], sizes: List[int], lo: int, start: Optional[int], end: Optional[int],
+        where: Optional[Dict[str, Iterable[str]]],
+    ) -> Dict[Tuple[str, ...], float]:
+        allowed = {dim: {self.dicts[dim].codes[v] for v in vals if v in self.dicts[dim].codes}
+                   for dim, vals in (where or {}).items()}
+        if len(by) == 1 and not allowed:
+            return self._group_sum_one(by[0], sizes[0], lo, start, end)
+        acc: Dict[int, float] = {}
+        cols = [self.column(b) for b in by]
+        offsets = [lo if b == "date" else 0 for b in by]
+        dates, amounts = self.date, self.amount
+        filters = [(self.column(dim), codes) for dim, codes in allowed.items()]
+        get = acc.get
+        for i in range(len(amounts)):
+            d = dates[i]
+            if (start is not None and d < start) or (end is not None and d >= end):
+                continue
+            if filters and not all(col[i] in codes for col, codes in filters):
+                continue
+            k = 0
+            for col, size, off in zip(cols, sizes, offsets):
+                k = k * size + (col[i] - off)
+            acc[k] = get(k, 0.0) + amounts[i]
+        return {self._decode(k, by, sizes, lo): v for k, v in acc.items()}
+
+    def _group_sum_one(
+        self, dim: str, size: int, lo: int, start: Optional[int], end: Optional[int]
+    ) -> Dict[Tuple[str, ...], float]:
+        """Single dimension, date range only: the common report query, kept to one zip loop."""
+        acc = [0.0] * size
+        seen = bytearray(size)
+        off = lo if dim == "date" else 0
+        col, dates, amounts = self.column(dim), self.date, self.amount
+        if start is None and end is None:
+            for c, a in zip(col, amounts):
+                acc[c - off] += a
+                seen[c - off] = 1
+        else:
+            s = -(1 << 31) if start is None else start
+            e = (1 << 31) if end is None else end
+            for d, c, a in zip(dates, col, amounts):
+                if s <= d < e:
+                    acc[c - off] += a
+                    seen[c - off] = 1
+        return {self._decode(k, (dim,), [size], lo): acc[k] for k in range(size) if seen[k]}
+
+    def _decode(self, key: int, by: Sequence[str], sizes: List[int], lo: int) -> Tuple[str, ...]:
+        parts: List[str] = []
+        for b, size in zip(reversed(by), reversed(sizes)):
+            key, code = divmod(key, size)
+            parts.append(day_string(lo + code) if b == "date" else self.dicts[b].values[code])
+        return tuple(reversed(parts))
+
+    def daily_matrix(
+        self, by: Sequence[str] = DIMENSIONS, start: Optional[int] = None, end: Optional[int] = None
+    ) -> Tuple[List[Tuple[str, ...]], int, Any]:
+        """
+        -> (series keys, first day, amounts): one row per combination of `by` seen in [start, end), one column
+        per day, days without a row count as 0. A (series x days) float64 array with numpy, else a list of lists.
+        Raises ValueError on a non-DAILY store: its rows are whole periods, not days.
+        """
+        if self.granularity != "DAILY":
+            raise ValueError(f"{self.granularity} cost data has no daily series; collect it with --granularity DAILY")
+        lo, hi = self.date_bounds()
+        if lo is None:
+            return [], start or 0, (np.zeros((0, 0)) if np is not None else [])
+        start = lo if start is None else start
+        end = hi + 1 if end is None else end  # type: ignore[operator]
+        days = max(end - start, 0)
+        sizes = [len(self.dicts[b]) for b in by]
+        if np is not None:
+            d = np.asarray(self.date)
+            mask = (d >= start) & (d < end)
+            key = np.zeros(int(mask.sum()), dtype=np.int64)
+            for b, size in zip(by, sizes):
+                key = key * size + np.asarray(self.column(b), dtype=np.int64)[mask]
+            uniq, inverse = np.unique(key, return_inverse=True)
+            cell = inverse.astype(np.int64) * days + (d[mask] - start)
+            matrix = np.bincount(cell, weights=np.asarray(self.amount)[mask], minlength=len(uniq) * days)
+            return [self._decode(int(k), by, sizes, lo) for k in uniq], start, matrix.reshape(len(uniq), days)
+        rows: Dict[int, List[float]] = {}
+        cols = [self.column(b) for b in by]
+        for i, (dd, a) in enumerate(zip(self.date, self.amount)):
+            if start <= dd < end:
+                k = 0
+                for col, size in zip(cols, sizes):
+                    k = k * size + col[i]
+                row = rows.get(k)
+                if row is None:
+                    row = rows[k] = [0.0] * days
+                row[dd - start] += a
+        ordered = sorted(rows)
+        return [self._decode(k, by, sizes, lo) for k in ordered], start, [rows[k] for k in ordered]
+
+    def top_n(self, by: Sequence[str] = ("service",), n: int = 10, **kw: Any) -> List[Tuple[Tuple[str, ...], float]]:
+        return heapq.nlargest(n, self.group_sum(by, **kw).items(), key=lambda kv: kv[1])
+
+    def total(self, start: Optional[int] = None, end: Optional[int] = None) -> float:
+        if np is not None:
+            mask = self._selection(start, end, None)
+            amount = np.asarray(self.amount)
+            return float(amount[mask].sum() if mask is not None else amount.sum())
+        return sum(v for v in self.group_sum(("service",), start, end).values())
+
+    def last_days_total(self, days: int) -> float:
+        """Spend over the last `days` dates present in the store (the report's "últimos 30d")."""
+        _, hi = self.date_bounds()
+        return 0.0 if hi is None else self.total(start=hi - days + 1)
+
+
+def _align(n: int) -> int:
+    return (n + 7) & ~7
+
+
+def _as_bytes(col: Any, is_amount: bool) -> bytes:
+    if np is not None:
+        return np.asarray(col, dtype="<f8" if is_amount else "<i4").tobytes()
+    arr = col if isinstance(col, array) else array(_AMOUNT if is_amount else _CODE, col)
+    if sys.byteorder != "little":
+        arr = array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _view(mm: mmap.mmap, offset: int, n: int, kind: str) -> Any:
+    if np is not None:
+        return np.frombuffer(mm, dtype="<" + kind, count=n, offset=offset)
+    size = 8 if kind == "f8" else 4
+    mv = memoryview(mm)[offset:offset + n * size]
+    if sys.byteorder == "little":
+        return mv.cast("d" if kind == "f8" else "i")
+    arr = array("d" if kind == "f8" else "i", bytes(mv))
+    arr.byteswap()
+    return arr
+
+
+def dashboard_export(store: CostStore, top: int = 10) -> Dict[str, Any]:
+    """Precomputed series for dashboard/cost-dashboard.html, so the browser never walks ResultsByTime."""
+    lo, hi = store.date_bounds()
+    daily = store.group_sum(("date",))
+    return {
+        "metric": store.metric,
+        "start": day_string(lo) if lo is not None else None,
+        "end": day_string(hi) if hi is not None else None,
+        "topServices": [{"service": k[0], "amount": round(v, 2)} for k, v in store.top_n(("service",), top)],
+        "daily": [{"date": k[0], "amount": round(v, 2)} for k, v in sorted(daily.items())],
+        "last30Days": round(store.last_days_total(30), 2),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="Ingest get-cost-and-usage JSON files into a store")
+    b.add_argument("--input", action="append", required=True)
+    b.add_argument("--out", required=True)
+    b.add_argument("--metric", default="UnblendedCost")
+    e = sub.add_parser("export-dashboard", help="Write the dashboard's precomputed JSON from a store")
+    e.add_argument("--store", required=True)
+    e.add_argument("--top", type=int, default=10)
+    t = sub.add_parser("top", help="Top-N by a dimension")
+    t.add_argument("--store", required=True)
+    t.add_argument("--by", default="service", help="Comma-separated: service, account, date")
+    t.add_argument("--top", type=int, default=10)
+    t.add_argument("--days", type=int, default=None, help="Only the last N days in the store")
+    args = ap.parse_args()
+    if args.cmd == "build":
+        store = CostStore.from_files(*args.input, metric=args.metric)
+        store.save(args.out)
+        write_stdout_json({"rows": len(store), "services": len(store.dicts["service"]) - 1,
+                           "accounts": len(store.dicts["account"]) - 1, "out": args.out})
+    elif args.cmd == "export-dashboard":
+        write_stdout_json(dashboard_export(CostStore.load(args.store), args.top))
+    else:
+        store = CostStore.load(args.store)
+        _, hi = store.date_bounds()
+        start = hi - args.days + 1 if args.days and hi is not None else None
+        by = [x.strip() for x in args.by.split(",") if x.strip()]
+        write_stdout_json([{"key": list(k), "amount": round(v, 2)} for k, v in store.top_n(by, args.top, start=start)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+CloudWatch metrics for many resources at once, shared by the utilization-based collectors (EC2, RDS, NAT).
+- A Preset names the namespace, the dimension that identifies a resource and the (metric, statistic) pairs;
+  one query per resource and pair, up to MAX_QUERIES per GetMetricData call, calls run concurrently
+- Results land in one dense resources x periods matrix per metric (NaN / None where CloudWatch has no datapoint)
+- stats() and idle_scores() work on whole matrices at once with numpy (per row in plain Python without it):
+  mean, p95, max, sum, data coverage and the fraction of observed hours in which the resource was active
+- --record saves the raw responses with the query layout; --replay scores such a file without calling AWS
+- fetch raises when CloudWatch cannot be read; collectors catch it and keep their other sections (fetch_error)
+"""
+from __future__ import annotations
+
+import contextvars
+import json
+import math
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from common import aws_base, shell_json, with_region
+from cost_store import np
+
+MAX_QUERIES = 500  # GetMetricData limit per call
+PERIOD = 3600
+
+
+@dataclass(frozen=True)
+class Preset:
+    namespace: str
+    dimension: str
+    metrics: Tuple[Tuple[str, str, str], ...]  # (key, CloudWatch metric name, statistic)
+    activity: Tuple[Tuple[str, float], ...] = ()  # (key, threshold): an hour is active when any is reached
+
+
+PRESETS: Dict[str, Preset] = {
+    "ec2": Preset(
+        "AWS/EC2", "InstanceId",
+        (("cpu", "CPUUtilization", "Average"), ("cpuMax", "CPUUtilization", "Maximum"),
+         ("netIn", "NetworkIn", "Sum"), ("netOut", "NetworkOut", "Sum")),
+        (("cpu", 5.0), ("netIn", 5e6), ("netOut", 5e6)),
+    ),
+    "rds": Preset(
+        "AWS/RDS", "DBInstanceIdentifier",
+        (("cpu", "CPUUtilization", "Average"), ("cpuMax", "CPUUtilization", "Maximum"),
+         ("connections", "DatabaseConnections", "Maximum")),
+        (("cpu", 5.0), ("connections", 1.0)),
+    ),
+    "nat": Preset(
+        "AWS/NATGateway", "NatGatewayId",
+        (("bytesOutToDestination", "BytesOutToDestination", "Sum"), ("bytesInFromSource", "BytesInFromSource", "Sum"),
+         ("bytesInFromDestination", "BytesInFromDestination", "Sum"), ("bytesOutToSource", "BytesOutToSource", "Sum"),
+         ("connections", "ActiveConnectionCount", "Maximum")),
+        (("bytesOutToDestination", 1e6), ("connections", 1.0)),
+    ),
+}
+
+
+class MetricSet:
+    """Dense per-metric matrices: rows follow `ids`, column j covers [start + j*period, start + (j+1)*period)."""
+
+    def __init__(self, preset: Preset, ids: Sequence[str], start: int, periods: int, period: int = PERIOD) -> None:
+        self.preset, self.ids, self.start, self.periods, self.period = preset, list(ids), start, periods, period
+        self.dense = np is not None  # numpy matrices, else lists of rows
+        self.data: Dict[str, Any] = {}
+        for key, _, _ in preset.metrics:
+            if self.dense:
+                self.data[key] = np.full((len(self.ids), periods), np.nan)
+            else:
+                self.data[key] = [[None] * periods for _ in self.ids]
+
+    def fill(self, row: int, key: str, timestamps: Sequence[Any], values: Sequence[float]) -> None:
+        cols = [(_epoch(t) - self.start) // self.period for t in timestamps]
+        if self.dense:
+            c, v = np.asarray(cols, dtype=np.int64), np.asarray(values, dtype=np.float64)
+            keep = (c >= 0) & (c < self.periods)
+            self.data[key][row, c[keep]] = v[keep]
+        else:
+            target = self.data[key][row]
+            for col, value in zip(cols, values):
+                if 0 <= col < self.periods:
+                    target[col] = float(value)
+
+
+def _epoch(stamp: Any) -> int:
+    if isinstance(stamp, (int, float)):
+        return int(stamp)
+    value = datetime.fromisoformat(str(stamp).replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def build_queries(preset: Preset, ids: Sequence[str], period: int = PERIOD) -> List[Dict[str, Any]]:
+    """One MetricDataQuery per (resource, metric); Id q<row>_<metric index> maps a result back to its cell."""
+    queries = []
+    for row, rid in enumerate(ids):
+        for m, (_, name, stat) in enumerate(preset.metrics):
+            queries.append({
+                "Id": f"q{row}_{m}",
+                "MetricStat": {
+                    "Metric": {"Namespace": preset.namespace, "MetricName": name,
+                               "Dimensions": [{"Name": preset.dimension, "Value": rid}]},
+                    "Period": period,
+                    "Stat": stat,
+                },
+                "ReturnData": True,
+            })
+    return queries
+
+
+def _window(days: int, end: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    end = end or datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return end - timedelta(days=days), end
+
+
+def _call(region: str, batch: List[Dict[str, Any]], start: datetime, end: datetime) -> Dict[str, Any]:
+    return shell_json(with_region(aws_base() + [
+        "cloudwatch", "get-metric-data", "--metric-data-queries", json.dumps(batch, separators=(",", ":")),
+        "--start-time", start.isoformat(), "--end-time", end.isoformat(), "--scan-by", "TimestampAscending",
+    ], region))
+
+
+def load(mset: MetricSet, responses: Sequence[Dict[str, Any]]) -> MetricSet:
+    keys = [k for k, _, _ in mset.preset.metrics]
+    for doc in responses:
+        for r in doc.get("MetricDataResults") or []:
+            row, m = r.get("Id", "q0_0")[1:].split("_")
+            mset.fill(int(row), keys[int(m)], r.get("Timestamps") or [], r.get("Values") or [])
+    return mset
+
+
+def fetch(
+    region: str, preset: Preset, ids: Sequence[str], days: int = 14, period: int = PERIOD, max_workers: int = 4,
+    end: Optional[datetime] = None, record: Optional[str] = None,
+    call: Optional[Callable[[str, List[Dict[str, Any]], datetime, datetime], Dict[str, Any]]] = None,
+) -> MetricSet:
+    """The preset's metrics for `ids` over the last `days`, MAX_QUERIES queries per call, `max_workers` calls at once."""
+    start, end = _window(days, end)
+    mset = MetricSet(preset, ids, int(start.timestamp()), int((end - start).total_seconds()) // period, period)
+    queries = build_queries(preset, ids, period)
+    batches = [queries[i:i + MAX_QUERIES] for i in range(0, len(queries), MAX_QUERIES)]
+    call = call or _call
+    responses: List[Dict[str, Any]] = []
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as pool:
+            for doc in pool.map(lambda b: contextvars.copy_context().run(call, region, b, start, end), batches):
+                load(mset, [doc])
+                if record:
+                    responses.append(doc)
+    if record:
+        with open(record, "w", encoding="utf-8") as f:
+            json.dump({"preset": preset_name(preset), "ids": list(ids), "start": mset.start, "periods": mset.periods,
+                       "period": period, "responses": responses}, f)
+    return mset
+
+
+def fetch_error(error: Exception) -> str:
+    """A failed fetch's AWS message without the command line, which carries up to MAX_QUERIES queries."""
+    lines = str(error).strip().splitlines()
+    return lines[-1] if lines else type(error).__name__
+
+
+def replay(path: str) -> MetricSet:
+    """A MetricSet from a --record file (recorded GetMetricData responses), without calling AWS."""
+    with open(path, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+    mset = MetricSet(PRESETS[doc["preset"]], doc["ids"], doc["start"], doc["periods"], doc.get("period", PERIOD))
+    return load(mset, doc.get("responses") or [])
+
+
+def preset_name(preset: Preset) -> str:
+    return next((name for name, p in PRESETS.items() if p == preset), preset.namespace)
+
+
+# --- statistics ----------------------------------------------------------------------------------------------
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    pos = q / 100 * (len(sorted_values) - 1)
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+def stats(mset: MetricSet, key: str) -> Dict[str, List[Optional[float]]]:
+    """Per resource mean, p95, max, sum and coverage (share of periods with a datapoint) of one metric."""
+    m = mset.data[key]
+    if mset.dense and mset.periods and len(mset.ids):
+        observed = ~np.isnan(m)
+        count = observed.sum(axis=1)
+        total = np.where(observed, m, 0.0).sum(axis=1)
+        # NaN sorts last, so each row's datapoints are its first `count` sorted cells.
+        srt = np.sort(m, axis=1)
+        rows = np.arange(len(m))
+        last = np.maximum(count - 1, 0)
+        pos = 0.95 * last
+        lo = pos.astype(np.int64)
+        hi = np.minimum(lo + 1, last)
+        p95 = srt[rows, lo] + (srt[rows, hi] - srt[rows, lo]) * (pos - lo)
+        has = (count > 0).tolist()
+        out = {"coverage": (count / mset.periods).tolist(), "sum": total.tolist()}
+        for name, col in (("mean", total / np.maximum(count, 1)), ("p95", p95), ("max", srt[rows, last])):
+            out[name] = [float(v) if h else None for v, h in zip(col.tolist(), has)]
+        return out
+    out = {"mean": [], "p95": [], "max": [], "sum": [], "coverage": []}
+    for row in m:
+        vals = sorted(v for v in row if v is not None)
+        out["coverage"].append(len(vals) / max(mset.periods, 1))
+        out["sum"].append(float(sum(vals)))
+        out["mean"].append(sum(vals) / len(vals) if vals else None)
+        out["p95"].append(_percentile(vals, 95) if vals else None)
+        out["max"].append(vals[-1] if vals else None)
+    return out
+
+
+def active_fraction(mset: MetricSet, activity: Optional[Sequence[Tuple[str, float]]] = None) -> List[Optional[float]]:
+    """Share of observed periods in which any (metric, threshold) of `activity` was reached; None without data."""
+    activity = list(activity if activity is not None else mset.preset.activity)
+    if mset.dense:
+        observed = np.zeros((len(mset.ids), mset.periods), dtype=bool)
+        active = np.zeros_like(observed)
+        for key, threshold in activity:
+            m = mset.data[key]
+            observed |= ~np.isnan(m)
+            with np.errstate(invalid="ignore"):
+                active |= m >= threshold
+        count = observed.sum(axis=1)
+        frac = active.sum(axis=1) / np.maximum(count, 1)
+        return [float(f) if c else None for f, c in zip(frac.tolist(), count.tolist())]
+    out: List[Optional[float]] = []
+    for row in range(len(mset.ids)):
+        seen = hit = 0
+        for col in range(mset.periods):
+            cells = [(mset.data[k][row][col], t) for k, t in activity]
+            if any(v is not None for v, _ in cells):
+                seen += 1
+                hit += any(v is not None and v >= t for v, t in cells)
+        out.append(hit / seen if seen else None)
+    return out
+
+
+def idle_scores(
+    mset: MetricSet, cpu_p95: float = 10.0, max_active: float = 0.05, min_coverage: float = 0.5,
+    activity: Optional[Sequence[Tuple[str, float]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Per resource: cpu p95/max/mean, network totals when the preset has them, activeHourFraction and
+    idleScore = 1 - activeHourFraction. Idle = enough data, cpu p95 below `cpu_p95` and active in under
+    `max_active` of the hours.
+    Sorted most idle first.
+    """
+    keys = {k for k, _, _ in mset.preset.metrics}
+    cpu = stats(mset, "cpu") if "cpu" in keys else None
+    cpu_max = stats(mset, "cpuMax")["max"] if "cpuMax" in keys else (cpu["max"] if cpu else None)
+    sums = {k: stats(mset, k)["sum"] for k in ("netIn", "netOut") if k in keys}
+    active = active_fraction(mset, activity)
+    days = mset.periods * mset.period / 86400
+    out = []
+    for i, rid in enumerate(mset.ids):
+        rec: Dict[str, Any] = {"id": rid, "activeHourFraction": None if active[i] is None else round(active[i], 4)}
+        coverage = 0.0
+        if cpu:
+            coverage = cpu["coverage"][i]
+            rec.update({"cpuMean": _round(cpu["mean"][i]), "cpuP95": _round(cpu["p95"][i]),
+                        "cpuMax": _round(cpu_max[i] if cpu_max else None), "coverage": round(coverage, 3)})
+        for k, col in sums.items():
+            rec[f"{k}MBPerDay"] = round(col[i] / 1e6 / days, 2) if days else 0.0
+        rec["idleScore"] = None if active[i] is None else round(1 - active[i], 4)
+        rec["idle"] = bool(
+            active[i] is not None and coverage >= min_coverage and rec.get("cpuP95") is not None
+            and rec["cpuP95"] < cpu_p95 and active[i] < max_active
+        )
+        out.append(rec)
+    out.sort(key=lambda r: (-(r["idleScore"] if r["idleScore"] is not None else -1), r.get("cpuP95") or 0.0))
+    return out
+
+
+def _round(v: Optional[float], nd: int = 2) -> Optional[float]:
+    return None if v is None or (isinstance(v, float) and math.isnan(v)) else round(v, nd)
+
+
+def add_metrics_args(ap: Any) -> None:
+    ap.add_argument("--days", type=int, default=14, help="CloudWatch lookback")
+    ap.add_argument("--metric-workers", type=int, default=4, help="GetMetricData calls in flight")
+    ap.add_argument("--record", default=None, help="Save the raw GetMetricData responses to this file")
+    ap.add_argument("--replay", default=None, help="Score a --record file instead of calling CloudWatch")
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Change detection between runs: versioned collector outputs as per-item content hashes plus compact deltas.
+- TRACKED names the item lists of each output and how an item is identified (resource id/ARN); lists nested
+  under regions.<region> are tracked per region
+- `record` compares an output with the previous run's hash index and, if anything changed, bumps its version
+  and writes one delta (added/changed items in full, removed ids, the non-list remainder when it changed)
+  under versions/<output stem>/<version>.json
+- Consumers holding version N apply the chain N+1..current (chain/apply) instead of re-reading the output;
+  the work and the history kept are proportional to churn, not fleet size
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from common import write_stdout_json
+
+VERSIONS = "versions"
+KEEP_DELTAS = 168  # a week of hourly runs; an older consumer falls back to a full read
+# Top-level fields that differ every run (timings, timestamps); they alone do not make a new version.
+VOLATILE = {"collectedAt", "scannedAt", "stats"}
+
+
+@dataclass(frozen=True)
+class ListSpec:
+    path: Tuple[str, ...]
+    key: Callable[[Dict[str, Any]], Any]
+    ignore: Tuple[str, ...] = field(default=())  # fields that change every run without meaning a change
+
+
+def _get(name: str) -> Callable[[Dict[str, Any]], Any]:
+    return lambda item: item.get(name)
+
+
+_CO_VOLATILE = ("lastRefreshTimestamp",)
+TRACKED: Dict[str, List[ListSpec]] = {
+    "inventory.json": [ListSpec(("resources",), lambda r: f"{r.get('type')}/{r.get('region')}/{r.get('id')}")],
+    "tag_compliance.json": [ListSpec(("items",), lambda i: f"{i.get('type')}/{i.get('id')}")],
+    "lambda_optimizer.json": [
+        ListSpec(("inventory",), _get("FunctionName")),
+        ListSpec(("computeOptimizer",), _get("functionArn"), _CO_VOLATILE),
+    ],
+    "ebs_optimizer.json": [
+        ListSpec(("unattached",), _get("VolumeId")),
+        ListSpec(("computeOptimizer",), _get("volumeArn"), _CO_VOLATILE),
+    ],
+    "ebs_snapshots.json": [ListSpec(("candidates",), _get("SnapshotId"))],
+    "rds_rightsizing.json": [
+        ListSpec(("inventory",), _get("DBInstanceIdentifier")),
+        ListSpec(("rightsizing", "recommendations"), lambda r: None),  # no stable id: keyed by content
+    ],
+}
+
+
+def digest(value: Any) -> str:
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def _list_paths(doc: Dict[str, Any], spec: ListSpec) -> Iterator[Tuple[str, ...]]:
+    regions = doc.get("regions")
+    if isinstance(regions, dict):
+        for r in regions:
+            yield ("regions", r) + spec.path
+    else:
+        yield spec.path
+
+
+def _at(doc: Any, path: Tuple[str, ...]) -> Any:
+    for k in path:
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(k)
+    return doc
+
+
+def _keyed(items: List[Any], spec: Optional[ListSpec]) -> Dict[str, Tuple[str, Any]]:
+    """{item id: (content hash, item)}; items without an id are keyed by content, repeats get a ~n suffix."""
+    keyed: Dict[str, Tuple[str, Any]] = {}
+    for item in items:
+        if isinstance(item, dict) and spec is not None:
+            h = digest({k: v for k, v in item.items() if k not in spec.ignore} if spec.ignore else item)
+            ident = spec.key(item)
+        else:
+            h, ident = digest(item), None
+        base = str(ident) if ident is not None else f"#{h}"
+        ident, n = base, 1
+        while ident in keyed:
+            ident, n = f"{base}~{n}", n + 1
+        keyed[ident] = (h, item)
+    return keyed
+
+
+def split(doc: Dict[str, Any], specs: List[ListSpec]) -> Tuple[Dict[str, Dict[str, Tuple[str, Any]]], Dict[str, Any]]:
+    """
+    -> ({list name: {item id: (hash, item)}}, remainder). The remainder is the document with tracked lists
+    emptied, i.e. the counters and settings that are small enough to ship whole.
+    """
+    rest = json.loads(json.dumps(doc, default=str))
+    lists: Dict[str, Dict[str, Tuple[str, Any]]] = {}
+    for spec in specs:
+        for path in _list_paths(doc, spec):
+            items = _at(doc, path)
+            if isinstance(items, list):
+                _at(rest, path[:-1])[path[-1]] = []
+                lists["/".join(path)] = _keyed(items, spec)
+    return lists, rest
+
+
+def _stable(rest: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    return {k: v for k, v in rest.items() if k not in VOLATILE} if isinstance(rest, dict) else rest
+
+
+def list_field(list_name: str) -> str:
+    """'regions/us-east-1/rightsizing/recommendations' -> 'rightsizing.recommendations' (generate_analysis names)."""
+    parts = list_name.split("/")
+    if parts[0] == "regions" and len(parts) > 2:
+        parts = parts[2:]
+    return ".".join(parts)
+
+
+def _dir(data_dir: str, name: str) -> str:
+    return os.path.join(data_dir, VERSIONS, os.path.splitext(name)[0])
+
+
+def _read(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path: str, doc: Any) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(json.dumps(doc, separators=(",", ":"), sort_keys=True, default=str))
+    os.replace(tmp, path)
+
+
+def _stamp(path: str) -> List[int]:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def load_head(data_dir: str, name: str) -> Optional[Dict[str, Any]]:
+    """{"version", "stamp" (size and mtime of the output it describes), "rest"}: all a consumer needs to catch up."""
+    return _read(os.path.join(_dir(data_dir, name), "head.json"))
+
+
+def is_current(data_dir: str, name: str, head: Optional[Dict[str, Any]]) -> bool:
+    """True when the output on disk is exactly the one the head was recorded from."""
+    path = os.path.join(data_dir, name)
+    return bool(head) and os.path.exists(path) and head.get("stamp") == _stamp(path)
+
+
+def record(data_dir: str, name: str) -> Optional[Dict[str, Any]]:
+    """Diffs data_dir/name against the previous index; writes the delta and new index. None if untracked/unreadable."""
+    path = os.path.join(data_dir, name)
+    doc = _read(path)
+    if name not in TRACKED or not isinstance(doc, dict) or not doc:
+        return None  # '{}' is a failed collector: keep the last good version rather than recording a wipe
+    lists, rest = split(doc, TRACKED[name])
+    prev = load_head(data_dir, name) or {"version": 0, "rest": None}
+    # Per-item hashes: only record() reads them, so consumers never pay for the fleet-sized index.
+    index = _read(os.path.join(_dir(data_dir, name), "index.json")) if prev["version"] else None
+    old_lists: Dict[str, Dict[str, str]] = (index or {}).get("lists") or {}
+    delta: Dict[str, Any] = {"name": name, "base": prev["version"], "lists": {}}
+    stats = {"added": 0, "changed": 0, "removed": 0, "unchanged": 0}
+    for list_name in sorted(set(lists) | set(old_lists)):
+        new, old = lists.get(list_name, {}), old_lists.get(list_name, {})
+        added = {i: item for i, (h, item) in new.items() if i not in old}
+        changed = {i: item for i, (h, item) in new.items() if i in old and old[i] != h}
+        removed = sorted(i for i in old if i not in new)
+        stats["added"] += len(added)
+        stats["changed"] += len(changed)
+        stats["removed"] += len(removed)
+        stats["unchanged"] += len(new) - len(added) - len(changed)
+        if added or changed or removed:
+            delta["lists"][list_name] = {"added": added, "changed": changed, "removed": removed}
+    if _stable(rest) != _stable(prev.get("rest")):
+        delta["rest"] = rest
+    version = prev["version"]
+    if delta["lists"] or "rest" in delta or not version:
+        version += 1
+        delta["version"] = version
+        if version > 1:  # version 1 is the baseline: nobody can hold an earlier one, so it has no delta
+            _write(os.path.join(_dir(data_dir, name), f"{version}.json"), delta)
+            _prune(data_dir, name, version)
+    _write(os.path.join(_dir(data_dir, name), "index.json"),
+           {"version": version, "lists": {n: {i: h for i, (h, _) in items.items()} for n, items in lists.items()}})
+    _write(os.path.join(_dir(data_dir, name), "head.json"), {"version": version, "stamp": _stamp(path), "rest": rest})
+    return {"version": version, "changedSince": prev["version"] if version != prev["version"] else None, **stats}
+
+
+def _prune(data_dir: str, name: str, version: int) -> None:
+    d = _dir(data_dir, name)
+    for entry in os.listdir(d):
+        stem = entry[:-5] if entry.endswith(".json") else ""
+        if stem.isdigit() and int(stem) <= version - KEEP_DELTAS:
+            os.remove(os.path.join(d, entry))
+
+
+def chain(data_dir: str, name: str, since: int) -> Optional[List[Dict[str, Any]]]:
+    """Deltas since+1..current in order; None if one was pruned (or never recorded) and a full read is needed."""
+    head = load_head(data_dir, name)
+    if not head or since < 1 or since > head["version"]:
+        return None
+    out: List[Dict[str, Any]] = []
+    for v in range(since + 1, head["version"] + 1):
+        d = _read(os.path.join(_dir(data_dir, name), f"{v}.json"))
+        if d is None or d.get("base") != v - 1:
+            return None
+        out.append(d)
+    return out
+
+
+def apply(doc: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Applies one delta to a materialized output of version delta["base"]. Changed items stay in place,
+    added ones are appended, so list order can differ from a fresh collection (contents do not).
+    """
+    specs = {s.path: s for s in TRACKED.get(delta.get("name", ""), [])}
+    out = json.loads(json.dumps(delta["rest"] if "rest" in delta else doc, default=str))
+    current = {"/".join(p): _at(doc, p) for spec in specs.values() for p in _list_paths(doc, spec)}
+    for list_name in set(current) | set(delta.get("lists", {})):
+        path = tuple(list_name.split("/"))
+        parent = _at(out, path[:-1])
+        if not isinstance(parent, dict):
+            continue  # the region (or parent object) is gone in this version
+        spec = specs.get(path[2:] if path[0] == "regions" else path)
+        ch = delta.get("lists", {}).get(list_name, {})
+        gone, changed = set(ch.get("removed", [])), ch.get("changed", {})
+        old = current.get(list_name)
+        items = [changed.get(i, item) for i, (_, item) in _keyed(old if isinstance(old, list) else [], spec).items()
+                 if i not in gone]
+        parent[path[-1]] = items + list(ch.get("added", {}).values())
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("record", help="Version the tracked outputs in a data dir and write their deltas")
+    r.add_argument("--data-dir", required=True)
+    r.add_argument("--names", default=",".join(TRACKED), help="Comma-separated output files to version")
+    c = sub.add_parser("chain", help="Print the deltas of one output since a version")
+    c.add_argument("--data-dir", required=True)
+    c.add_argument("--name", required=True)
+    c.add_argument("--since", type=int, default=1)
+    args = ap.parse_args()
+    if args.cmd == "record":
+        out: Dict[str, Any] = {}
+        for name in [n.strip() for n in args.names.split(",") if n.strip()]:
+            res = record(args.data_dir, name)
+            if res is not None:
+                out[name] = res
+        write_stdout_json(out)
+    else:
+        deltas = chain(args.data_dir, args.name, args.since)
+        if deltas is None:
+            sys.stderr.write(f"[delta] no complete chain for {args.name} since version {args.since}\n")
+            sys.exit(1)
+        write_stdout_json(deltas)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,21 +5,16 @@ List EBS volumes that are unattached or overprovisioned (via Compute Optimizer w
 from __future__ import annotations
 
 import argparse
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
-from common import aws_base, ensure_region, paginate, shell_json, with_region, write_stdout_json
+from common import (
+    add_cache_args, add_region_args, apply_cache_args, aws_base, co_enabled, collect_regions,
+    paginate, with_region, write_stdout_json,
+)
+from inventory import add_inventory_args, resources
 
 
-def co_enabled(region: str) -> bool:
-    try:
-        res = shell_json(with_region(aws_base() + ["compute-optimizer", "get-enrollment-status"], region))
-        return res.get("status") in {"Active", "Pending"}
-    except Exception:
-        return False
-
-
-def unattached_volumes(region: str) -> List[Dict[str, Any]]:
-    vols = paginate(with_region(aws_base() + ["ec2", "describe-volumes", "--max-results", "500"], region), result_key="Volumes")
+def unattached_volumes(region: str, inventory: Optional[str] = None) -> List[Dict[str, Any]]:
     return [
         {
             "VolumeId": v.get("VolumeId"),
@@ -28,7 +23,7 @@ def unattached_volumes(region: str) -> List[Dict[str, Any]]:
             "Iops": v.get("Iops"),
             "Throughput": v.get("Throughput"),
         }
-        for v in vols
+        for v in resources(inventory, "ec2:volume", region)
         if not v.get("Attachments")
     ]
 
@@ -41,15 +36,21 @@ def co_recommendations(region: str) -> List[Dict[str, Any]]:
     return items
 
 
+def collect(region: str, inventory: Optional[str] = None) -> Dict[str, Any]:
+    data: Dict[str, Any] = {"region": region}
+    data["unattached"] = unattached_volumes(region, inventory)
+    data["computeOptimizer"] = co_recommendations(region) if co_enabled(region) else []
+    return data
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--region", default=None)
+    add_region_args(ap)
+    add_cache_args(ap)
+    add_inventory_args(ap)
     args = ap.parse_args()
-    region = ensure_region(args.region)
-    data: Dict[str, Any] = {"region": region}
-    data["unattached"] = unattached_volumes(region)
-    data["computeOptimizer"] = co_recommendations(region) if co_enabled(region) else []
-    write_stdout_json(data)
+    apply_cache_args(args)
+    write_stdout_json(collect_regions(args, lambda region: collect(region, args.inventory)))
 
 
 if __name__ == "__main__":
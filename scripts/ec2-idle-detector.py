@@ -1,23 +1,24 @@
 #!/usr/bin/env python3
 """
 Detect EC2 instances that appear idle and are candidates for stop/rightsizing.
-- Uses Compute Optimizer (if enabled) else falls back to CloudWatch CPU utilization.
+- Uses Compute Optimizer (if enabled) else CloudWatch utilization of every running instance (cw_metrics.py:
+  CPU and network in batched GetMetricData calls, idle scores per instance); --source ce-rightsizing keeps the
+  Cost Explorer rightsizing list, which auto also falls back to when CloudWatch cannot be read
 - Outputs JSON with candidates and rationale.
 """
 from __future__ import annotations
 
 import argparse
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
-from common import aws_base, ensure_region, paginate, shell_json, with_region, write_stdout_json
+import cw_metrics
+from common import (
+    add_cache_args, add_region_args, apply_cache_args, aws_base, co_enabled, collect_regions,
+    paginate, shell_json, with_region, write_stdout_json,
+)
+from inventory import add_inventory_args, resources
 
-
-def co_enabled(region: str) -> bool:
-    try:
-        res = shell_json(with_region(aws_base() + ["compute-optimizer", "get-enrollment-status"], region))
-        return res.get("status") in {"Active", "Pending"}
-    except Exception:
-        return False
+SOURCES = ("auto", "compute-optimizer", "cloudwatch", "ce-rightsizing")
 
 
 def collect_with_compute_optimizer(region: str) -> Dict[str, Any]:
@@ -43,8 +44,36 @@ def collect_with_compute_optimizer(region: str) -> Dict[str, Any]:
     return {"source": "compute-optimizer", "region": region, "count": len(candidates), "candidates": candidates}
 
 
-def collect_with_cw_cpu(region: str) -> Dict[str, Any]:
-    # Lightweight heuristic using CE rightsizing as primary source
+def collect_with_cloudwatch(region: str, inventory: Optional[str] = None, args: Any = None) -> Dict[str, Any]:
+    """Idle scores from two weeks (--days) of hourly CPU and network metrics of every running instance."""
+    if args is not None and args.replay:
+        mset = cw_metrics.replay(args.replay)
+        types: Dict[str, Any] = {}
+    else:
+        running = [i for i in resources(inventory, "ec2:instance", region)
+                   if (i.get("State") or {}).get("Name", "running") == "running" and i.get("InstanceId")]
+        types = {i["InstanceId"]: i.get("InstanceType") for i in running}
+        mset = cw_metrics.fetch(region, cw_metrics.PRESETS["ec2"], list(types), days=getattr(args, "days", 14),
+                                max_workers=getattr(args, "metric_workers", 4), record=getattr(args, "record", None))
+    scores = cw_metrics.idle_scores(mset, cpu_p95=getattr(args, "cpu_p95", 10.0))
+    candidates = []
+    for rec in scores:
+        if rec["idle"]:
+            rid = rec.pop("id")
+            candidates.append({"instanceId": rid, "instanceType": types.get(rid), **rec})
+    return {
+        "source": "cloudwatch",
+        "region": region,
+        "instances": len(mset.ids),
+        "noData": sum(1 for r in scores if r["activeHourFraction"] is None),
+        "days": round(mset.periods * mset.period / 86400, 1),
+        "count": len(candidates),
+        "candidates": candidates,
+    }
+
+
+def collect_with_ce_rightsizing(region: str) -> Dict[str, Any]:
+    """Cost Explorer rightsizing recommendations (no utilization of our own)."""
     try:
         rr = shell_json(
             with_region(
@@ -66,16 +95,33 @@ def collect_with_cw_cpu(region: str) -> Dict[str, Any]:
         return {"source": "none", "region": region, "error": str(e)}
 
 
+def collect(region: str, source: str = "auto", inventory: Optional[str] = None, args: Any = None) -> Dict[str, Any]:
+    if source == "compute-optimizer" or (source == "auto" and co_enabled(region)):
+        return collect_with_compute_optimizer(region)
+    if source == "ce-rightsizing":
+        return collect_with_ce_rightsizing(region)
+    try:
+        return collect_with_cloudwatch(region, inventory, args)
+    except Exception as e:  # no CloudWatch access (or GetMetricData still throttled after the retries)
+        error = cw_metrics.fetch_error(e)
+        if source != "auto":
+            return {"source": "none", "region": region, "error": error}
+        out = collect_with_ce_rightsizing(region)
+        out["cloudwatchError"] = error
+        return out
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--region", default=None)
+    add_region_args(ap)
+    add_cache_args(ap)
+    add_inventory_args(ap)
+    ap.add_argument("--source", choices=SOURCES, default="auto")
+    ap.add_argument("--cpu-p95", type=float, default=10.0, help="Idle when hourly CPU p95 stays below this (%%)")
+    cw_metrics.add_metrics_args(ap)
     args = ap.parse_args()
-    region = ensure_region(args.region)
-    if co_enabled(region):
-        data = collect_with_compute_optimizer(region)
-    else:
-        data = collect_with_cw_cpu(region)
-    write_stdout_json(data)
+    apply_cache_args(args)
+    write_stdout_json(collect_regions(args, lambda region: collect(region, args.source, args.inventory, args)))
 
 
 if __name__ == "__main__":
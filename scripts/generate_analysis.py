@@ -1,18 +1,29 @@
 #!/usr/bin/env python3
 """
 Generate reports/analysis.txt from JSON files in reports/data.
-Robust to missing files; fills N/A gracefully. No external deps.
+Robust to missing files; fills N/A gracefully. No external deps (numpy, when present, speeds up cost queries).
+Cost aggregates come from the columnar store in cost_store.py instead of walking ResultsByTime.
+Collector outputs are streamed (jsonstream.py): only the counters the report prints are kept, never whole documents.
+Outputs versioned by delta.py are not re-read at all when unchanged; after small changes their counts are
+caught up from the deltas (versions/report_figures.json keeps the figures and the version they reflect).
 """
 from __future__ import annotations
 
+import argparse
 import json
 import os
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
+import delta
+import jsonstream
+from cost_store import CostStore
+
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 DATA = os.path.join(ROOT, "reports", "data")
 OUT = os.path.join(ROOT, "reports", "analysis.txt")
+COST_STORE = "cost_store.bin"
+FIGURES_CACHE = os.path.join(delta.VERSIONS, "report_figures.json")
 
 
 def jload(path: str) -> Optional[Dict[str, Any]]:
@@ -23,123 +34,300 @@ def jload(path: str) -> Optional[Dict[str, Any]]:
         return None
 
 
-def first_existing(*names: str) -> Optional[Dict[str, Any]]:
+def first_existing(*names: str, data_dir: str = DATA) -> Optional[Dict[str, Any]]:
     for n in names:
-        p = os.path.join(DATA, n)
+        p = os.path.join(data_dir, n)
         if os.path.exists(p):
             return jload(p)
     return None
 
 
-def cost_by_service_summary(d: Optional[Dict[str, Any]]) -> Dict[str, float]:
-    agg: Dict[str, float] = {}
-    if not d:
-        return agg
-    for period in d.get("ResultsByTime", []):
-        for g in period.get("Groups", []):
-            keys = g.get("Keys", [])
-            svc = keys[0] if keys else "Unknown"
-            amt = float(g.get("Metrics", {}).get("UnblendedCost", {}).get("Amount", 0.0) or 0.0)
-            agg[svc] = agg.get(svc, 0.0) + amt
-    return agg
+def flatten_regions(d: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Collapses a multi-region document ({"regions": {region: doc}}) into one doc shaped like a single
+    region: numbers are summed, lists concatenated; regions that failed are skipped.
+    """
+    regions = d.get("regions") if isinstance(d, dict) else None
+    if not isinstance(regions, dict):
+        return d
+    merged: Dict[str, Any] = {}
+    for doc in regions.values():
+        if not isinstance(doc, dict) or "error" in doc:
+            continue
+        for k, v in doc.items():
+            if isinstance(v, bool) or not isinstance(v, (int, float, list)):
+                merged.setdefault(k, v)
+            elif isinstance(v, list):
+                merged.setdefault(k, []).extend(v)
+            else:
+                merged[k] = merged.get(k, 0) + v
+    merged["region"] = ",".join(regions)
+    return merged
 
 
-def sum_last_30_days(d: Optional[Dict[str, Any]]) -> float:
-    if not d:
-        return 0.0
-    periods = d.get("ResultsByTime", [])
-    last = periods[-30:] if len(periods) > 0 else []
-    total = 0.0
-    for p in last:
-        for g in p.get("Groups", []):
-            total += float(g.get("Metrics", {}).get("UnblendedCost", {}).get("Amount", 0.0) or 0.0)
-    return total
-
-
-def sp_summary(d: Optional[Dict[str, Any]]) -> Dict[str, Any]:
-    if not d:
-        return {"count": 0, "estimatedSavings": 0.0}
-    recs = (d.get("SavingsPlansPurchaseRecommendation", {}).get("SavingsPlansPurchaseRecommendationDetails") or [])
-    savings = 0.0
-    for r in recs:
+def existing_path(*names: str, data_dir: str = DATA) -> Optional[str]:
+    for n in names:
+        p = os.path.join(data_dir, n)
+        if os.path.exists(p):
+            return p
+    return None
+
+
+def stream_summary(path: Optional[str], numbers: List[str] = (), lists: List[str] = ()) -> Dict[str, Any]:
+    """
+    What the report reads from flatten_regions(jload(path)), without loading the document: `numbers` are summed
+    and `lists` counted, both at the top level and under regions.<region>. Dotted names reach nested fields
+    ("rightsizing.recommendations"). Failed regions carry only an error, so they add nothing, as in flatten_regions.
+    """
+    out: Dict[str, Any] = {k: 0 for k in list(numbers) + list(lists)}
+    if not path:
+        return out
+    patterns: List[tuple] = []
+    for k in numbers:
+        parts = tuple(k.split("."))
+        patterns += [parts, ("regions", "*") + parts]
+    for k in lists:
+        parts = tuple(k.split("."))
+        patterns += [parts + ("*",), ("regions", "*") + parts + ("*",)]
+    try:
+        for where, value in jsonstream.walk(path, patterns):
+            keys = where[2:] if where[0] == "regions" else where
+            name = ".".join(str(k) for k in keys)
+            if name in out:
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    out[name] += value
+            else:
+                out[".".join(str(k) for k in keys[:-1])] += 1
+    except (OSError, ValueError):
+        pass
+    return out
+
+
+def _sum_numbers(doc: Dict[str, Any], numbers: List[str]) -> Dict[str, Any]:
+    """The `numbers` half of stream_summary over an in-memory document (a delta.py remainder)."""
+    out: Dict[str, Any] = {k: 0 for k in numbers}
+    regions = doc.get("regions")
+    docs = [doc] + (list(regions.values()) if isinstance(regions, dict) else [])
+    for d in docs:
+        for k in numbers:
+            v: Any = d
+            for part in k.split("."):
+                v = v.get(part) if isinstance(v, dict) else None
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                out[k] += v
+    return out
+
+
+def incremental_summary(
+    data_dir: str, name: str, cache: Dict[str, Any], numbers: List[str] = (), lists: List[str] = ()
+) -> Dict[str, Any]:
+    """
+    stream_summary for one output, reusing `cache` (figures and the delta.py version they were computed at).
+    Same version: nothing is read. Older version with a complete delta chain: list counts move by each delta's
+    added/removed and numbers come from the recorded remainder. Otherwise (untracked list, output not recorded,
+    chain pruned) the file is streamed and the cache reset to its version.
+    """
+    path = existing_path(name, data_dir=data_dir)
+    head = delta.load_head(data_dir, name)
+    tracked = {".".join(spec.path) for spec in delta.TRACKED.get(name, [])}
+    if not path or not delta.is_current(data_dir, name, head) or not set(lists) <= tracked:
+        return stream_summary(path, numbers, lists)
+    key = f"{name}:{','.join(list(numbers) + list(lists))}"
+    entry = cache.get(key)
+    if entry and entry["version"] == head["version"]:
+        return dict(entry["summary"])
+    deltas = delta.chain(data_dir, name, entry["version"]) if entry else None
+    if deltas is not None:
+        out = dict(entry["summary"])
+        for d in deltas:
+            for list_name, ch in d.get("lists", {}).items():
+                field = delta.list_field(list_name)
+                if field in lists:
+                    out[field] += len(ch.get("added", {})) - len(ch.get("removed", []))
+        out.update(_sum_numbers(head.get("rest") or {}, list(numbers)))
+    else:
+        out = stream_summary(path, numbers, lists)
+    cache[key] = {"version": head["version"], "summary": out}
+    return dict(out)
+
+
+def load_cost_store(data_dir: str = DATA) -> CostStore:
+    """
+    The columnar store collect_report.py builds (cost_store.bin) when it is at least as new as
+    cost_by_service_90d.json; otherwise the JSON is ingested into an in-memory store once.
+    """
+    path = os.path.join(data_dir, COST_STORE)
+    src = os.path.join(data_dir, "cost_by_service_90d.json")
+    if os.path.exists(path) and (not os.path.exists(src) or os.path.getmtime(path) >= os.path.getmtime(src)):
         try:
-            savings += float(r.get("EstimatedSavingsAmount", 0.0) or 0.0)
-        except Exception:
+            return CostStore.load(path)
+        except (OSError, ValueError):
             pass
-    return {"count": len(recs), "estimatedSavings": savings}
+    return CostStore.from_files(src)
+
 
+def cost_by_service_summary(store: CostStore) -> Dict[str, float]:
+    return {k[0] or "Unknown": v for k, v in store.group_sum(("service",)).items()}
+
+
+def sum_last_30_days(store: CostStore) -> float:
+    return store.last_days_total(30)
+
+
+def sp_summary(path: Optional[str]) -> Dict[str, Any]:
+    count, savings = 0, 0.0
+    if not path:
+        return {"count": count, "estimatedSavings": savings}
+    pattern = ("SavingsPlansPurchaseRecommendation", "SavingsPlansPurchaseRecommendationDetails", "*")
+    try:
+        for r in jsonstream.iter_path(path, pattern):
+            count += 1
+            try:
+                savings += float(r.get("EstimatedSavingsAmount", 0.0) or 0.0)
+            except Exception:
+                pass
+    except (OSError, ValueError):
+        pass
+    return {"count": count, "estimatedSavings": savings}
 
-def ri_summary(d: Optional[Dict[str, Any]]) -> int:
-    if not d:
-        return 0
+
+def ri_summary(path: Optional[str]) -> int:
     # Different CE shapes; prefer Recommendations
-    if isinstance(d.get("Recommendations"), list):
-        return len(d.get("Recommendations"))
-    if isinstance(d.get("RecommendationSummaries"), list):
-        return len(d.get("RecommendationSummaries"))
-    return 0
+    counts = stream_summary(path, lists=["Recommendations", "RecommendationSummaries"])
+    return counts["Recommendations"] or counts["RecommendationSummaries"]
 
 
-def last_nat_cost(d: Optional[Dict[str, Any]]) -> float:
-    if not d:
-        return 0.0
-    arr = d.get("natServiceCosts", [])
-    if arr:
-        last = arr[-1]
+def last_nat_cost(path: Optional[str]) -> float:
+    """Total of the last natServiceCosts period (of the last region, for multi-region output)."""
+    last: Any = None
+    if path:
         try:
-            return float(last.get("Total", {}).get("UnblendedCost", {}).get("Amount", 0.0) or 0.0)
-        except Exception:
-            return 0.0
-    return 0.0
+            for _, last in jsonstream.walk(path, [("natServiceCosts", "*"), ("regions", "*", "natServiceCosts", "*")]):
+                pass
+        except (OSError, ValueError):
+            pass
+    try:
+        return float(last.get("Total", {}).get("UnblendedCost", {}).get("Amount", 0.0) or 0.0) if last else 0.0
+    except Exception:
+        return 0.0
+
+
+def local_anomalies(path: Optional[str], n: int = 5) -> Dict[str, Any]:
+    """Count and top `n` of cost-anomaly-detector.py --mode local (already ranked and capped, so read whole)."""
+    doc = (jload(path) if path else None) or {}
+    local = doc.get("local", doc)
+    return {"count": int(local.get("count", 0) or 0), "top": (local.get("anomalies") or [])[:n]}
+
+
+def local_forecast(path: Optional[str]) -> Optional[Dict[str, Any]]:
+    """30-day total, its interval and the backtest WAPE of cost-forecasting.py --mode local (None if absent)."""
+    if not path:
+        return None
+    try:
+        total = float(jsonstream.first(path, ("Total", "Amount")) or 0.0)
+        days = list(jsonstream.iter_path(path, ("ForecastResultsByTime", "*")))
+        wape = jsonstream.first(path, ("Backtest", "total", "wape"))
+    except (OSError, ValueError):
+        return None
+    if not days:
+        return None
+    return {
+        "total": total,
+        "lower": sum(float(d.get("PredictionIntervalLowerBound", 0) or 0) for d in days),
+        "upper": sum(float(d.get("PredictionIntervalUpperBound", 0) or 0) for d in days),
+        "days": len(days),
+        "backtestWape": wape,
+    }
 
 
-def write_report(text: str) -> None:
-    os.makedirs(os.path.dirname(OUT), exist_ok=True)
-    with open(OUT, "w", encoding="utf-8") as f:
+def write_report(text: str, out: str = OUT) -> None:
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
         f.write(text)
 
 
+def report_figures(data_dir: str = DATA) -> Dict[str, Any]:
+    """Every figure analysis.txt prints, gathered with at most one streaming pass per collector output."""
+    cache_path = os.path.join(data_dir, FIGURES_CACHE)
+    cache = jload(cache_path) or {}
+
+    def path(name: str) -> Optional[str]:
+        return existing_path(name, data_dir=data_dir)
+
+    def number(name: str, key: str) -> Any:
+        return incremental_summary(data_dir, name, cache, numbers=[key])[key]
+
+    def count(name: str, key: str) -> int:
+        return incremental_summary(data_dir, name, cache, lists=[key])[key]
+
+    identity = first_existing("identity.json", data_dir=data_dir) or {}
+    costs = load_cost_store(data_dir)
+    svc_map = cost_by_service_summary(costs)
+    figures = {
+        "account": identity.get("Account", "N/A"),
+        "last30": sum_last_30_days(costs),
+        "topServices": sorted(svc_map.items(), key=lambda kv: kv[1], reverse=True)[:10],
+        "sp": sp_summary(path("sp_recommendations.json")),
+        "ri": ri_summary(path("ri_ec2_recommendations.json")),
+        "ec2Candidates": number("ec2_idle.json", "count"),
+        "ebsUnattached": count("ebs_optimizer.json", "unattached"),
+        "lambdaRecs": count("lambda_optimizer.json", "computeOptimizer"),
+        "rdsRecs": count("rds_rightsizing.json", "rightsizing.recommendations"),
+        "natGateways": number("nat.json", "totalNatGateways"),
+        "natLastCost": last_nat_cost(path("nat.json")),
+        "logsWithoutRetention": number("logs_retention.json", "withoutRetention"),
+        "s3WithoutLifecycle": number("s3_lifecycle.json", "withoutLifecycle"),
+        "oldSnapshots": number("ebs_snapshots.json", "olderThanThreshold"),
+        "tagsNonCompliant": number("tag_compliance.json", "nonCompliant"),
+        "costAnomalies": local_anomalies(path("cost_anomalies.json")),
+        "forecast": local_forecast(path("forecast_local_30d.json")),
+    }
+    if cache and os.path.isdir(os.path.dirname(cache_path)):
+        with open(cache_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(cache, sort_keys=True))
+    return figures
+
+
 def main() -> None:
-    identity = first_existing("identity.json") or {}
-    cost_by_service = first_existing("cost_by_service_90d.json")
-    forecast = first_existing("forecast_30d.json")
-    sp = first_existing("sp_recommendations.json")
-    ri = first_existing("ri_ec2_recommendations.json")
-    ec2 = first_existing("ec2_idle.json") or {}
-    ebs = first_existing("ebs_optimizer.json") or {}
-    lam = first_existing("lambda_optimizer.json") or {}
-    rds = first_existing("rds_rightsizing.json") or {}
-    nat = first_existing("nat.json") or {}
-    logs = first_existing("logs_retention.json") or {}
-    s3 = first_existing("s3_lifecycle.json") or {}
-    snaps = first_existing("ebs_snapshots.json") or {}
-    tags = first_existing("tag_compliance.json") or {}
-
-    svc_map = cost_by_service_summary(cost_by_service)
-    top = sorted(svc_map.items(), key=lambda kv: kv[1], reverse=True)[:10]
-    last30_sum = sum_last_30_days(cost_by_service)
-    sp_sum = sp_summary(sp)
-    ri_count = ri_summary(ri)
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--data-dir", default=DATA)
+    ap.add_argument("--out", default=OUT)
+    args = ap.parse_args()
+    f = report_figures(args.data_dir)
+    top = f["topServices"]
+    sp_sum, ri_count = f["sp"], f["ri"]
 
     lines: List[str] = []
     lines.append("AWS Cost Optimization – Informe de Análisis")
     lines.append(f"Fecha: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%SZ')}")
     lines.append("")
     lines.append("Resumen ejecutivo")
-    lines.append(f"- Cuenta: {identity.get('Account', 'N/A')}")
-    lines.append(f"- Gasto estimado últimos 30d: ${last30_sum:,.2f}")
+    lines.append(f"- Cuenta: {f['account']}")
+    lines.append(f"- Gasto estimado últimos 30d: ${f['last30']:,.2f}")
     lines.append(f"- Recomendaciones SP: {sp_sum['count']} (ahorro estimado: ${sp_sum['estimatedSavings']:,.2f})")
     lines.append(f"- Recomendaciones RI (EC2): {ri_count}")
-    lines.append(f"- Candidatos EC2 rightsizing: {ec2.get('count', 0)}")
-    lines.append(f"- Volúmenes EBS sin adjuntar: {len(ebs.get('unattached', []) )}")
-    lines.append(f"- Lambda (Compute Optimizer recs): {len(lam.get('computeOptimizer', []) )}")
-    lines.append(f"- RDS rightsizing: {len((rds.get('rightsizing') or {}).get('recommendations', []))}")
-    lines.append(f"- NATs: {nat.get('totalNatGateways', 0)} (último costo: ${last_nat_cost(nat):,.2f})")
-    lines.append(f"- Log groups sin retención: {logs.get('withoutRetention', 0)}")
-    lines.append(f"- Buckets sin lifecycle: {s3.get('withoutLifecycle', 0)}")
-    lines.append(f"- Snapshots EBS > umbral: {snaps.get('olderThanThreshold', 0)}")
-    lines.append(f"- Recursos sin tags requeridos: {tags.get('nonCompliant', 0)}")
+    lines.append(f"- Candidatos EC2 rightsizing: {f['ec2Candidates']}")
+    lines.append(f"- Volúmenes EBS sin adjuntar: {f['ebsUnattached']}")
+    lines.append(f"- Lambda (Compute Optimizer recs): {f['lambdaRecs']}")
+    lines.append(f"- RDS rightsizing: {f['rdsRecs']}")
+    lines.append(f"- NATs: {f['natGateways']} (último costo: ${f['natLastCost']:,.2f})")
+    lines.append(f"- Log groups sin retención: {f['logsWithoutRetention']}")
+    lines.append(f"- Buckets sin lifecycle: {f['s3WithoutLifecycle']}")
+    lines.append(f"- Snapshots EBS > umbral: {f['oldSnapshots']}")
+    lines.append(f"- Recursos sin tags requeridos: {f['tagsNonCompliant']}")
+    lines.append(f"- Anomalías de costo (detección local): {f['costAnomalies']['count']}")
+    if f["forecast"]:
+        fc = f["forecast"]
+        wape = f", error backtest {fc['backtestWape']:.1%}" if fc["backtestWape"] is not None else ""
+        lines.append(f"- Pronóstico local {fc['days']}d: ${fc['total']:,.2f} "
+                     f"(rango ${fc['lower']:,.2f}–${fc['upper']:,.2f}{wape})")
     lines.append("")
+    if f["costAnomalies"]["top"]:
+        lines.append("Anomalías de costo (real vs. esperado)")
+        for a in f["costAnomalies"]["top"]:
+            who = " / ".join(x for x in (a.get("service"), a.get("account")) if x) or "Unknown"
+            lines.append(f"- {a['date']} {who}: ${a['actual']:,.2f} vs ${a['expected']:,.2f} (z={a['zScore']})")
+        lines.append("")
     lines.append("Top servicios por costo (90d)")
     if top:
         for name, val in top:
@@ -148,24 +336,24 @@ def main() -> None:
         lines.append("- Sin datos (habilita Cost Explorer y ejecuta collect_report.sh)")
     lines.append("")
     lines.append("Recomendaciones rápidas (basadas en datos)")
-    if ec2.get("count", 0) > 0:
+    if f["ec2Candidates"] > 0:
         lines.append("- EC2: aplicar rightsizing en candidatos detectados; evaluar migración a Graviton.")
-    if len(ebs.get("unattached", [])) > 0:
+    if f["ebsUnattached"] > 0:
         lines.append("- EBS: eliminar volúmenes sin adjuntar y revisar gp2→gp3.")
-    if logs.get("withoutRetention", 0) > 0:
+    if f["logsWithoutRetention"] > 0:
         lines.append("- Logs: definir retención explícita (30–90d) y exportar a S3.")
-    if s3.get("withoutLifecycle", 0) > 0:
+    if f["s3WithoutLifecycle"] > 0:
         lines.append("- S3: añadir lifecycle (IA/Glacier) y expirar temporales.")
-    if snaps.get("olderThanThreshold", 0) > 0:
+    if f["oldSnapshots"] > 0:
         lines.append("- Snapshots: archivar/eliminar snapshots antiguos.")
-    if tags.get("nonCompliant", 0) > 0:
+    if f["tagsNonCompliant"] > 0:
         lines.append("- Gobernanza: remediar tags (CostCenter/Owner/Environment/Application).")
     if sp_sum["count"] > 0 or ri_count > 0:
         lines.append("- Compromisos: revisar recomendaciones de SP/RI y definir cobertura 70–90% de base.")
-    if nat.get("totalNatGateways", 0) > 0:
+    if f["natGateways"] > 0:
         lines.append("- Red: usar Gateway Endpoints (S3/DynamoDB) y consolidar NAT por AZ.")
 
-    write_report("\n".join(lines) + "\n")
+    write_report("\n".join(lines) + "\n", args.out)
 
 
 if __name__ == "__main__":
@@ -1,39 +1,70 @@
 #!/usr/bin/env python3
 """
-Suggest EC2 instance families to migrate from x86 to Graviton (ARM) based on instance types.
+Suggest EC2 instances to migrate from x86 to Graviton (ARM), with a concrete target type and monthly delta.
+- Architecture and target come from the instance-type catalog (instance_catalog.py): one dict lookup per instance
+- monthlyDelta is target minus current on-demand list price (negative = savings); Windows cannot run on Graviton
 """
 from __future__ import annotations
 
 import argparse
-from typing import Any, Dict, List
+import os
+from typing import Any, Dict, List, Optional
 
-from common import aws_base, ensure_region, paginate, with_region, write_stdout_json
+from common import add_region_args, collect_regions, write_stdout_json
+from instance_catalog import load_catalog
+from inventory import add_inventory_args, resources
 
 
-def collect(region: str) -> Dict[str, Any]:
-    inst = paginate(
-        with_region(aws_base() + ["ec2", "describe-instances", "--max-results", "1000"], region),
-        result_key="Reservations",
-    )
+def collect(region: str, inventory: Optional[str] = None, catalog_path: Optional[str] = None) -> Dict[str, Any]:
+    catalog = load_catalog(catalog_path)
     candidates: List[Dict[str, Any]] = []
-    for r in inst:
-        for i in r.get("Instances", []):
-            itype = i.get("InstanceType", "")
-            # crude heuristic: g* are already Graviton; t4g, m6g, c6g, r6g, m7g, c7g, r7g are ARM
-            if itype and not itype.startswith(("t4g", "m6g", "c6g", "r6g", "m7g", "c7g", "r7g")):
-                candidates.append({
-                    "InstanceId": i.get("InstanceId"),
-                    "InstanceType": itype,
-                    "SuggestedFamily": "m7g/c7g/r7g/t4g (validar compatibilidad ARM)",
-                })
-    return {"region": region, "candidates": candidates}
+    by_type: Dict[str, Dict[str, Any]] = {}
+    graviton = skipped = 0
+    for i in resources(inventory, "ec2:instance", region):
+        itype = i.get("InstanceType", "")
+        if not itype or (i.get("State") or {}).get("Name") == "terminated":
+            continue
+        if (i.get("Architecture") or catalog.architecture(itype)) == "arm64":
+            graviton += 1
+            continue
+        if "windows" in (i.get("PlatformDetails") or "").lower():
+            skipped += 1
+            continue
+        target = catalog.target(itype)
+        delta = catalog.monthly_delta(itype)
+        candidates.append({
+            "InstanceId": i.get("InstanceId"),
+            "InstanceType": itype,
+            "SuggestedType": target.name if target else None,
+            "SuggestedFamily": target.family if target else "sin equivalente Graviton en el catálogo",
+            "MonthlyDelta": round(delta, 2) if delta is not None else None,
+        })
+        agg = by_type.setdefault(itype, {"count": 0, "suggestedType": target.name if target else None,
+                                         "monthlyDelta": 0.0})
+        agg["count"] += 1
+        agg["monthlyDelta"] += delta or 0.0
+    for agg in by_type.values():
+        agg["monthlyDelta"] = round(agg["monthlyDelta"], 2)
+    savings = sum(a["monthlyDelta"] for a in by_type.values() if a["monthlyDelta"] < 0)
+    return {
+        "region": region,
+        "catalog": os.path.basename(catalog.source),
+        "alreadyGraviton": graviton,
+        "skippedWindows": skipped,
+        # Only types whose target is cheaper count; a few (e.g. m5a.24xlarge -> m8g) cost more on ARM.
+        "estimatedMonthlySavings": round(-savings, 2),
+        "byType": dict(sorted(by_type.items(), key=lambda kv: kv[1]["monthlyDelta"])),
+        "candidates": candidates,
+    }
 
 
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--region", default=None)
+    add_region_args(ap)
+    add_inventory_args(ap)
+    ap.add_argument("--catalog", default=None, help="Instance-type catalog CSV (default: bundled snapshot)")
     args = ap.parse_args()
-    write_stdout_json(collect(ensure_region(args.region)))
+    write_stdout_json(collect_regions(args, lambda region: collect(region, args.inventory, args.catalog)))
 
 
 if __name__ == "__main__":
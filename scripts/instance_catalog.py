@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+EC2 instance-type catalog (family, generation, vCPU, memory, architecture, on-demand price) and the x86 ->
+Graviton mapping built on it.
+- The bundled snapshot (data/instance_types.csv, us-east-1 Linux list prices) works offline; `build` refreshes it
+  from describe-instance-types (or a saved copy of it) plus prices from a JSON map or the Price List API
+- The catalog is loaded once per process and every x86 type's target is computed at load, so mapping an
+  instance is a dict lookup whatever the fleet size
+- Target = the cheapest Graviton type of the same class (m, c, r, t, i, x, ...) and at least the source's
+  generation with vCPU >= the source and memory >= MEMORY_TOLERANCE x the source's, fewest vCPU then least memory
+  first; local NVMe (d) and network-optimized (n) variants map to variants with the same feature when one exists
+- Types missing from the catalog are classified from their name (a Graviton family has a `g` after the
+  generation, e.g. c7gn, x2gd, im4gn; a1 is the first Graviton); their vCPU count is read from the size
+  (large = 2, 4xlarge = 16) and the target, without a price delta, is memoized on first use
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from common import aws_base, ensure_region, iter_paginate, with_region, write_stdout_json
+
+SNAPSHOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "instance_types.csv")
+FIELDS = ("instanceType", "family", "generation", "vcpu", "memoryGiB", "architecture", "onDemandHourly")
+ARM = "arm64"
+HOURS_PER_MONTH = 730
+MEMORY_TOLERANCE = 0.75  # c5n.xlarge (10.5 GiB) -> c6gn.xlarge (8 GiB) rather than a size up
+_FAMILY = re.compile(r"^([a-z]+?)(\d+)([a-z\-]*)$")
+_SIZE = re.compile(r"^(\d*)xlarge$")
+_SMALL_SIZES = {"nano": 2, "micro": 2, "small": 2, "medium": 1, "large": 2}
+
+
+@dataclass(frozen=True)
+class InstanceType:
+    name: str
+    family: str
+    generation: int
+    vcpu: int
+    memory: float  # GiB
+    architecture: str
+    price: Optional[float]  # on-demand $/h, None when unknown
+
+
+def parse_family(family: str) -> Optional[Tuple[str, int, str]]:
+    """'c7gn' -> ('c', 7, 'gn'); None for names outside the <class><generation><attributes> scheme."""
+    m = _FAMILY.match(family)
+    return (m.group(1), int(m.group(2)), m.group(3)) if m else None
+
+
+def is_graviton_family(family: str) -> bool:
+    parsed = parse_family(family)
+    return family == "a1" or bool(parsed and "g" in parsed[2].split("-")[0])
+
+
+def size_vcpu(size: str) -> Optional[int]:
+    """vCPUs implied by a size name (medium = 1, large = 2, Nxlarge = 4N); None for metal and the like."""
+    if size in _SMALL_SIZES:
+        return _SMALL_SIZES[size]
+    m = _SIZE.match(size)
+    return 4 * int(m.group(1) or 1) if m else None
+
+
+def _features(attrs: str) -> str:
+    return "".join(f for f in "dn" if f in attrs)
+
+
+class Catalog:
+    def __init__(self, types: Iterable[InstanceType], source: str = "") -> None:
+        self.source = source
+        self.types: Dict[str, InstanceType] = {t.name: t for t in types}
+        self.targets: Dict[str, Optional[InstanceType]] = {}
+        self._arm: Dict[str, List[Tuple[InstanceType, int, str]]] = {}
+        for t in self.types.values():
+            parsed = parse_family(t.family)
+            if t.architecture == ARM and parsed:
+                self._arm.setdefault(parsed[0], []).append((t, parsed[1], _features(parsed[2])))
+        for cands in self._arm.values():
+            cands.sort(key=lambda c: (c[0].vcpu, c[0].memory, c[0].price if c[0].price is not None else float("inf")))
+        for t in self.types.values():
+            parsed = parse_family(t.family)
+            if t.architecture != ARM and parsed:
+                self.targets[t.name] = self._target(t, parsed)
+
+    def _target(self, src: InstanceType, parsed: Tuple[str, int, str]) -> Optional[InstanceType]:
+        cands = self._arm.get(parsed[0], [])
+        fits = [c for c in cands if c[0].vcpu >= src.vcpu and c[0].memory >= MEMORY_TOLERANCE * src.memory]
+        want = _features(parsed[2])
+        # Relaxed in order: same features and generation, same features, anything that fits.
+        for keep in (lambda c: c[1] >= parsed[1] and want in c[2], lambda c: want in c[2], lambda c: True):
+            level = [c[0] for c in fits if keep(c)]
+            if level:
+                # Fewest vCPU, then least memory (the list order), then cheapest among those.
+                first = [t for t in level if (t.vcpu, t.memory) == (level[0].vcpu, level[0].memory)]
+                return min(first, key=lambda t: t.price if t.price is not None else float("inf"))
+        return None
+
+    def architecture(self, name: str) -> Optional[str]:
+        t = self.types.get(name)
+        if t:
+            return t.architecture
+        family = name.split(".")[0]
+        return (ARM if is_graviton_family(family) else "x86_64") if parse_family(family) else None
+
+    def target(self, name: str) -> Optional[InstanceType]:
+        if name not in self.targets:
+            family, _, size = name.partition(".")
+            parsed, vcpu = parse_family(family), size_vcpu(size)
+            guess = None
+            if parsed and vcpu and not is_graviton_family(family):
+                guess = self._target(InstanceType(name, family, parsed[1], vcpu, 0.0, "x86_64", None), parsed)
+            self.targets[name] = guess
+        return self.targets[name]
+
+    def monthly_delta(self, name: str) -> Optional[float]:
+        """Target minus current on-demand cost per month (negative = savings); None without both prices."""
+        src, dst = self.types.get(name), self.target(name)
+        if not src or not dst or src.price is None or dst.price is None:
+            return None
+        return (dst.price - src.price) * HOURS_PER_MONTH
+
+
+def _row_type(row: Dict[str, str]) -> InstanceType:
+    price = row.get("onDemandHourly")
+    return InstanceType(row["instanceType"], row["family"], int(row["generation"]), int(row["vcpu"]),
+                        float(row["memoryGiB"]), row["architecture"], float(price) if price else None)
+
+
+@lru_cache(maxsize=4)
+def load_catalog(path: Optional[str] = None) -> Catalog:
+    """The catalog at `path` (default: the bundled snapshot), parsed and indexed once per process."""
+    path = path or SNAPSHOT
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        return Catalog((_row_type(r) for r in csv.DictReader(f)), source=path)
+
+
+def write_catalog(types: Iterable[InstanceType], path: str) -> int:
+    rows = sorted(types, key=lambda t: t.name)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f, lineterminator="\n")
+        w.writerow(FIELDS)
+        for t in rows:
+            w.writerow([t.name, t.family, t.generation, t.vcpu, f"{t.memory:g}", t.architecture,
+                        "" if t.price is None else f"{t.price:.6g}"])
+    return len(rows)
+
+
+def from_describe(items: Iterable[Dict[str, Any]], prices: Dict[str, float]) -> Iterable[InstanceType]:
+    """InstanceType rows from describe-instance-types items; names outside the family scheme are skipped."""
+    for item in items:
+        name = item.get("InstanceType", "")
+        family = name.split(".")[0]
+        parsed = parse_family(family)
+        if not parsed:
+            continue
+        archs = (item.get("ProcessorInfo") or {}).get("SupportedArchitectures") or []
+        yield InstanceType(
+            name, family, parsed[1], int((item.get("VCpuInfo") or {}).get("DefaultVCpus", 0)),
+            round((item.get("MemoryInfo") or {}).get("SizeInMiB", 0) / 1024, 3),
+            ARM if ARM in archs else "x86_64", prices.get(name),
+        )
+
+
+def describe_instance_types(region: str) -> Iterable[Dict[str, Any]]:
+    return iter_paginate(with_region(aws_base() + ["ec2", "describe-instance-types"], region), "InstanceTypes",
+                         page_items=100)
+
+
+def build(region: str, describe: Optional[str], prices_path: Optional[str], fetch_prices: bool, out: str) -> Dict[str, Any]:
+    if describe:
+        with open(describe, "r", encoding="utf-8") as f:
+            items = list(json.load(f).get("InstanceTypes", []))
+    else:
+        items = list(describe_instance_types(region))
+    if prices_path:
+        with open(prices_path, "r", encoding="utf-8") as f:
+            prices = {k: float(v) for k, v in json.load(f).items()}
+    elif fetch_prices:
+        from spot_analytics import on_demand_prices  # one Price List query per type, cached for a week
+
+        prices = on_demand_prices(region, [i.get("InstanceType", "") for i in items])
+    else:  # keep the prices we already have
+        prices = {t.name: t.price for t in load_catalog().types.values() if t.price is not None}
+    types = list(from_describe(items, prices))
+    return {"path": out, "types": write_catalog(types, out), "priced": sum(1 for t in types if t.price is not None),
+            "graviton": sum(1 for t in types if t.architecture == ARM)}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="Rebuild the catalog snapshot")
+    b.add_argument("--region", default=None)
+    b.add_argument("--describe", default=None, help="Saved describe-instance-types JSON instead of calling AWS")
+    b.add_argument("--prices", default=None, help='JSON {"m5.large": 0.096, ...}; default: keep the bundled prices')
+    b.add_argument("--fetch-prices", action="store_true", help="Price every type with the Price List API")
+    b.add_argument("--out", default=SNAPSHOT)
+    m = sub.add_parser("map", help="Graviton target of instance types")
+    m.add_argument("types", nargs="+")
+    m.add_argument("--catalog", default=None)
+    args = ap.parse_args()
+    if args.cmd == "build":
+        write_stdout_json(build(ensure_region(args.region), args.describe, args.prices, args.fetch_prices, args.out))
+    else:
+        catalog = load_catalog(args.catalog)
+        write_stdout_json({name: {"architecture": catalog.architecture(name),
+                                  "target": getattr(catalog.target(name), "name", None),
+                                  "monthlyDelta": catalog.monthly_delta(name)} for name in args.types})
+
+
+if __name__ == "__main__":
+    main()
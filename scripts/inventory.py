@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Resource inventory shared by the EC2-side collectors, so a run enumerates each resource type once per region.
+- One describe-* pass per (region, type); items are projected to the fields collectors read (AWS key names kept)
+  and de-duplicated by (type, region, id)
+- Indexed by id, type/region, tag key, VPC and subnet (Inventory)
+- The JSON it prints is what consumers load via --inventory (collect_report.py writes inventory.json);
+  anything the snapshot does not cover is fetched live, so a missing or failed inventory only costs API calls
+- EBS snapshots are describable (--types ec2:snapshot) but not in DEFAULT_TYPES: only snapshot-cleanup.py reads
+  them and it streams its own pass, while every consumer loads the whole document
+"""
+from __future__ import annotations
+
+import argparse
+import contextvars
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from common import (
+    STATS, add_region_args, aws_base, aws_error_code, current_aws_env, ensure_region, iter_paginate, resolve_regions,
+    with_region, write_stdout_json,
+)
+from response_cache import caller_identity
+
+
+@dataclass(frozen=True)
+class ResourceType:
+    cmd: Tuple[str, ...]
+    result_key: str
+    id_key: str
+    fields: Tuple[str, ...]
+    page_items: int
+    nested: Optional[str] = None  # describe-instances nests items under Reservations[].Instances
+
+
+TYPES: Dict[str, ResourceType] = {
+    "ec2:instance": ResourceType(
+        ("ec2", "describe-instances", "--max-results", "1000"), "Reservations", "InstanceId",
+        ("InstanceId", "InstanceType", "State", "LaunchTime", "Placement", "Architecture", "PlatformDetails",
+         "VpcId", "SubnetId", "Tags"),
+        1000, nested="Instances",
+    ),
+    "ec2:volume": ResourceType(
+        ("ec2", "describe-volumes", "--max-results", "500"), "Volumes", "VolumeId",
+        ("VolumeId", "Size", "VolumeType", "Iops", "Throughput", "State", "Attachments", "AvailabilityZone",
+         "CreateTime", "SnapshotId", "Tags"),
+        500,
+    ),
+    "ec2:snapshot": ResourceType(
+        ("ec2", "describe-snapshots", "--owner-ids", "self", "--max-results", "1000"), "Snapshots", "SnapshotId",
+        ("SnapshotId", "StartTime", "VolumeId", "VolumeSize", "FullSnapshotSizeInBytes", "StorageTier", "State",
+         "Description", "Tags"),
+        1000,
+    ),
+    "ec2:nat-gateway": ResourceType(
+        ("ec2", "describe-nat-gateways", "--max-results", "1000"), "NatGateways", "NatGatewayId",
+        ("NatGatewayId", "State", "SubnetId", "VpcId", "ConnectivityType", "CreateTime", "Tags"),
+        1000,
+    ),
+}
+DEFAULT_TYPES = ("ec2:instance", "ec2:volume", "ec2:nat-gateway")
+
+
+def _record(rtype: str, region: str, item: Dict[str, Any]) -> Dict[str, Any]:
+    spec = TYPES[rtype]
+    data = {k: item[k] for k in spec.fields if k in item}
+    return {
+        "id": item.get(spec.id_key),
+        "type": rtype,
+        "region": region,
+        "vpcId": item.get("VpcId"),
+        "subnetId": item.get("SubnetId"),
+        "tags": {t.get("Key"): t.get("Value") for t in item.get("Tags") or [] if t.get("Key")},
+        "data": data,
+    }
+
+
+def describe(rtype: str, region: str) -> Iterable[Dict[str, Any]]:
+    """Streams one resource type of one region as inventory records."""
+    spec = TYPES[rtype]
+    items = iter_paginate(
+        with_region(aws_base() + list(spec.cmd), region), result_key=spec.result_key, page_items=spec.page_items,
+        prefetch=2,
+    )
+    for item in items:
+        for sub in (item.get(spec.nested, []) if spec.nested else [item]):
+            yield _record(rtype, region, sub)
+
+
+class Inventory:
+    """De-duplicated resource records plus the indexes collectors query. `coverage` says what was enumerated."""
+
+    def __init__(self) -> None:
+        self.by_key: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self.by_id: Dict[str, List[Dict[str, Any]]] = {}
+        self.by_type: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self.by_tag_key: Dict[str, List[Dict[str, Any]]] = {}
+        self.by_vpc: Dict[str, List[Dict[str, Any]]] = {}
+        self.by_subnet: Dict[str, List[Dict[str, Any]]] = {}
+        self.coverage: Dict[str, Set[str]] = {}
+        self.errors: Dict[str, Dict[str, str]] = {}
+        self.collected_at: Optional[str] = None
+        self._guard = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.by_key)
+
+    def add(self, rec: Dict[str, Any]) -> bool:
+        """False for a duplicate (an item repeated across pages, or a region described twice)."""
+        key = (rec["type"], rec["region"], rec["id"])
+        if rec["id"] is None or key in self.by_key:
+            return False
+        self.by_key[key] = rec
+        self.by_id.setdefault(rec["id"], []).append(rec)
+        self.by_type.setdefault((rec["type"], rec["region"]), []).append(rec)
+        for tag in rec.get("tags") or {}:
+            self.by_tag_key.setdefault(tag, []).append(rec)
+        if rec.get("vpcId"):
+            self.by_vpc.setdefault(rec["vpcId"], []).append(rec)
+        if rec.get("subnetId"):
+            self.by_subnet.setdefault(rec["subnetId"], []).append(rec)
+        return True
+
+    def covers(self, rtype: str, region: str) -> bool:
+        return rtype in self.coverage.get(region, ())
+
+    def fill(self, rtype: str, region: str) -> int:
+        """Enumerates (region, type) live and marks it covered; returns the number of new records."""
+        recs = list(describe(rtype, region))
+        with self._guard:
+            added = sum(1 for rec in recs if self.add(rec))
+            self.coverage.setdefault(region, set()).add(rtype)
+        return added
+
+    def get(self, resource_id: str) -> List[Dict[str, Any]]:
+        return self.by_id.get(resource_id, [])
+
+    def of_type(self, rtype: str, region: str) -> List[Dict[str, Any]]:
+        return self.by_type.get((rtype, region), [])
+
+    def with_tag_key(self, key: str, rtype: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [r for r in self.by_tag_key.get(key, []) if rtype is None or r["type"] == rtype]
+
+    def in_vpc(self, vpc_id: str) -> List[Dict[str, Any]]:
+        return self.by_vpc.get(vpc_id, [])
+
+    def in_subnet(self, subnet_id: str) -> List[Dict[str, Any]]:
+        return self.by_subnet.get(subnet_id, [])
+
+    def to_doc(self) -> Dict[str, Any]:
+        counts: Dict[str, Dict[str, int]] = {}
+        for (rtype, region), recs in self.by_type.items():
+            counts.setdefault(region, {})[rtype] = len(recs)
+        return {
+            "collectedAt": self.collected_at,
+            "coverage": {r: sorted(t) for r, t in sorted(self.coverage.items())},
+            "counts": counts,
+            "errors": self.errors,
+            "resources": list(self.by_key.values()),
+        }
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "Inventory":
+        inv = cls()
+        inv.collected_at = doc.get("collectedAt")
+        for rec in doc.get("resources") or []:
+            inv.add(rec)
+        inv.coverage = {r: set(t) for r, t in (doc.get("coverage") or {}).items()}
+        inv.errors = doc.get("errors") or {}
+        return inv
+
+
+def collect_inventory(types: Iterable[str], regions: Iterable[str], max_workers: int = 8) -> Inventory:
+    """All (region, type) pairs on one pool. A failed pair is recorded in errors and left uncovered."""
+    types, regions = list(types), list(regions)
+    unknown = [t for t in types if t not in TYPES]
+    if unknown:
+        raise ValueError(f"Unknown type(s): {', '.join(unknown)}; choose from {', '.join(TYPES)}")
+    inv = Inventory()
+    inv.collected_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    def one(pair: Tuple[str, str]) -> Tuple[str, str, List[Dict[str, Any]]]:
+        region, rtype = pair
+        return region, rtype, list(describe(rtype, region))
+
+    pairs = [(r, t) for r in regions for t in types]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pairs) or 1))) as pool:
+        # A fresh context copy per task keeps aws_env credentials (account fan-out) on worker threads.
+        futures = {pool.submit(contextvars.copy_context().run, one, p): p for p in pairs}
+        for fut, (region, rtype) in futures.items():
+            try:
+                _, _, recs = fut.result()
+            except Exception as e:
+                inv.errors.setdefault(region, {})[rtype] = aws_error_code(e) or str(e).strip()[-300:]
+                continue
+            for rec in recs:
+                inv.add(rec)
+            inv.coverage.setdefault(region, set()).add(rtype)
+    return inv
+
+
+# Keyed by (path, caller identity): accounts fanned out with aws_env (accounts.py) never share an inventory.
+_LOADED: Dict[Tuple[str, Tuple[str, str]], Inventory] = {}
+_FILLS: Dict[Tuple[Tuple[str, Tuple[str, str]], str, str], threading.Lock] = {}
+_LOCK = threading.Lock()
+
+
+def load_or_collect(path: Optional[str], types: Iterable[str], region: Optional[str]) -> Inventory:
+    """
+    The snapshot at `path` (--inventory), loaded once per process and caller identity, topped up live with
+    whatever (region, type) it does not cover. Without a path the live inventory is still shared within the
+    process. A failed upstream task leaves '{}' behind, which simply covers nothing. Under an aws_env override
+    the snapshot (taken with the ambient credentials) is ignored and that account is described live.
+    """
+    region = ensure_region(region)
+    env = current_aws_env()
+    key = (path or "", caller_identity(env))
+    with _LOCK:
+        inv = _LOADED.get(key)
+        if inv is None:
+            inv = Inventory()
+            if path and env is None:
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        inv = Inventory.from_doc(json.load(f))
+                except (OSError, ValueError, KeyError, TypeError):
+                    inv = Inventory()
+            _LOADED[key] = inv
+    for rtype in types:
+        # Regions fan out on threads: each (region, type) is described once, different ones concurrently.
+        with _LOCK:
+            fill_lock = _FILLS.setdefault((key, rtype, region), threading.Lock())
+        with fill_lock:
+            if not inv.covers(rtype, region):
+                inv.fill(rtype, region)
+    return inv
+
+
+def resources(path: Optional[str], rtype: str, region: Optional[str]) -> List[Dict[str, Any]]:
+    """Projected AWS items (the records' `data`) of one type in one region."""
+    region = ensure_region(region)
+    return [rec["data"] for rec in load_or_collect(path, [rtype], region).of_type(rtype, region)]
+
+
+def add_inventory_args(ap: Any) -> None:
+    ap.add_argument("--inventory", default=None, help="Reuse an inventory.py snapshot instead of describing again")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    add_region_args(ap)
+    ap.add_argument("--types", default=",".join(DEFAULT_TYPES), help=f"Comma-separated: {', '.join(TYPES)}")
+    args = ap.parse_args()
+    started = time.monotonic()
+    regions = resolve_regions(args.regions) or [ensure_region(args.region)]
+    types = [t.strip() for t in args.types.split(",") if t.strip()]
+    inv = collect_inventory(types, regions, args.region_workers)
+    doc = inv.to_doc()
+    doc["stats"] = {"seconds": round(time.monotonic() - started, 3), **STATS.snapshot()}
+    write_stdout_json(doc)
+
+
+if __name__ == "__main__":
+    main()
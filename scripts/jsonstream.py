@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Incremental JSON reader: walks a document in fixed-size chunks and yields only the values at requested paths.
+- Paths are tuples of object keys and "*" (every array element / every object value),
+  e.g. ("ResultsByTime", "*") or ("regions", "*", "computeOptimizer", "*")
+- Matched values are decoded one at a time with the C decoder (json.JSONDecoder.raw_decode); everything
+  else is skipped one element at a time, so peak memory is one chunk plus the largest single element
+- Stdlib only; one pass serves any number of paths (see walk)
+"""
+from __future__ import annotations
+
+import json
+import re
+from typing import IO, Any, Iterator, List, Optional, Sequence, Tuple, Union
+
+CHUNK = 1 << 16
+Path = Tuple[Union[str, int], ...]
+_WS = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+_DELIMITERS = frozenset(" \t\n\r,:]}")
+
+
+class _Reader:
+    """Sliding text window over a file; `pos` indexes into `buf`, consumed text is dropped as it goes."""
+
+    def __init__(self, fp: IO[str], chunk: int = CHUNK) -> None:
+        self.fp = fp
+        self.chunk = chunk
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, want: int) -> bool:
+        if self.eof:
+            return False
+        if self.pos > self.chunk:
+            self.buf, self.pos = self.buf[self.pos:], 0
+        data = self.fp.read(max(self.chunk, want))
+        if not data:
+            self.eof = True
+            return False
+        self.buf += data
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character ('' at end of input), without consuming it."""
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill(self.chunk):
+                return ""
+
+    def expect(self, ch: str) -> None:
+        if self.peek() != ch:
+            raise ValueError(f"Expected {ch!r} at offset ~{self.pos}, got {self.peek()!r}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decodes one complete JSON value, pulling more input (geometrically) until it parses."""
+        self.peek()
+        want = self.chunk
+        while True:
+            try:
+                obj, end = _DECODER.raw_decode(self.buf, self.pos)
+                # A number cut at the window edge ("-2." of "-2.5") still decodes; only trust a value
+                # that is followed by a delimiter.
+                if self.eof or (end < len(self.buf) and self.buf[end] in _DELIMITERS):
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            want *= 2
+            self._fill(want)
+
+
+def _children(r: _Reader) -> Iterator[Union[str, int]]:
+    """Enters the container at the cursor and yields each child's key (or index) with the cursor on its value;
+    the consumer must consume that value before asking for the next key."""
+    ch = r.peek()
+    if ch not in ("{", "["):
+        raise ValueError(f"Expected an object or array at offset ~{r.pos}, got {ch!r}")
+    r.pos += 1
+    close = "}" if ch == "{" else "]"
+    if r.peek() == close:
+        r.pos += 1
+        return
+    i = 0
+    while True:
+        if close == "}":
+            key = r.value()
+            r.expect(":")
+            yield key
+        else:
+            yield i
+            i += 1
+        ch = r.peek()
+        r.pos += 1
+        if ch == close:
+            return
+        if ch != ",":
+            raise ValueError(f"Expected ',' or {close!r} at offset ~{r.pos}")
+
+
+def _skip(r: _Reader) -> None:
+    """Skips one value. Containers go one direct child at a time, each through the C decoder, so a skipped
+    subtree costs at most its largest element in memory and stays near json.load speed."""
+    if r.peek() not in ("{", "["):
+        r.value()
+        return
+    for _ in _children(r):
+        r.value()
+
+
+def _walk(r: _Reader, path: List[Any], patterns: Sequence[Tuple[str, ...]]) -> Iterator[Tuple[Path, Any]]:
+    """`patterns` all extend `path` and match it so far; the cursor is on the value at `path`."""
+    if r.peek() not in ("{", "["):
+        r.value()  # a scalar where the patterns expect a container
+        return
+    depth = len(path)
+    for key in _children(r):
+        live = [p for p in patterns if p[depth] == "*" or p[depth] == key]
+        path.append(key)
+        if not live:
+            _skip(r)
+        elif any(len(p) == depth + 1 for p in live):
+            yield tuple(path), r.value()
+        else:
+            yield from _walk(r, path, live)
+        path.pop()
+
+
+def walk(source: Union[str, IO[str]], patterns: Sequence[Sequence[str]], chunk: int = CHUNK) -> Iterator[Tuple[Path, Any]]:
+    """
+    Yields (concrete path, value) for every value whose path matches one of `patterns`, in document order.
+    Array positions appear as ints in the concrete path, object keys as strings.
+    """
+    pats = [tuple(p) for p in patterns]
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8") as fp:
+            yield from walk(fp, pats, chunk)
+        return
+    r = _Reader(source, chunk)
+    if r.peek() == "":
+        return
+    if () in pats:
+        yield (), r.value()
+        return
+    yield from _walk(r, [], pats)
+
+
+def iter_path(source: Union[str, IO[str]], pattern: Sequence[str], chunk: int = CHUNK) -> Iterator[Any]:
+    for _, value in walk(source, [pattern], chunk):
+        yield value
+
+
+def first(source: Union[str, IO[str]], pattern: Sequence[str]) -> Optional[Any]:
+    return next(iter_path(source, pattern), None)
@@ -7,15 +7,10 @@ from __future__ import annotations
 import argparse
 from typing import Any, Dict, List
 
-from common import aws_base, ensure_region, paginate, shell_json, with_region, write_stdout_json
-
-
-def co_enabled(region: str) -> bool:
-    try:
-        res = shell_json(with_region(aws_base() + ["compute-optimizer", "get-enrollment-status"], region))
-        return res.get("status") in {"Active", "Pending"}
-    except Exception:
-        return False
+from common import (
+    add_cache_args, add_region_args, apply_cache_args, aws_base, co_enabled, collect_regions,
+    paginate, with_region, write_stdout_json,
+)
 
 
 def lambda_inventory(region: str) -> List[Dict[str, Any]]:
@@ -43,14 +38,19 @@ def co_lambda_recs(region: str) -> List[Dict[str, Any]]:
     return recs
 
 
+def collect(region: str) -> Dict[str, Any]:
+    data: Dict[str, Any] = {"region": region, "inventory": lambda_inventory(region)}
+    data["computeOptimizer"] = co_lambda_recs(region) if co_enabled(region) else []
+    return data
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--region", default=None)
+    add_region_args(ap)
+    add_cache_args(ap)
     args = ap.parse_args()
-    region = ensure_region(args.region)
-    data: Dict[str, Any] = {"region": region, "inventory": lambda_inventory(region)}
-    data["computeOptimizer"] = co_lambda_recs(region) if co_enabled(region) else []
-    write_stdout_json(data)
+    apply_cache_args(args)
+    write_stdout_json(collect_regions(args, collect))
 
 
 if __name__ == "__main__":
@@ -1,26 +1,131 @@
 #!/usr/bin/env python3
 """
-List CloudWatch Log Groups without explicit retention and suggest retention policies.
+CloudWatch Log Groups: monthly storage cost per group and the savings of candidate retention policies.
+- describe-log-groups is streamed page by page (50 groups per page, next page fetched ahead); only counters,
+  per-policy totals and a top-N heap stay in memory, so 200k groups cost what --top does
+- Ingestion rate per group = storedBytes / days of data held, i.e. the group's age capped at its current retention
+- Under a policy of P days a group holds about rate x P bytes; the saving is what it stores beyond that at
+  STORAGE_GB_MONTH (or --gb-month-price). Groups whose retention is already <= P save nothing
+- Groups are ranked by the saving under --target days; --out writes every group with its simulation as JSONL
 """
 from __future__ import annotations
 
 import argparse
-from typing import Any, Dict, List
+import contextlib
+import heapq
+import json
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, TextIO, Tuple
 
-from common import aws_base, ensure_region, paginate, with_region, write_stdout_json, shell_json
+from common import add_region_args, aws_base, collect_regions, iter_paginate, with_region, write_stdout_json
 
+POLICIES = (7, 30, 90, 365)
+STORAGE_GB_MONTH = 0.03  # USD per GB-month of archived log data
+GB = 1024 ** 3
+DAY_MS = 86_400_000
 
-def collect(region: str) -> Dict[str, Any]:
-    # Use a large max-items to reduce pagination complexity; CLI v2 supports generic paginator
-    groups = shell_json(with_region(aws_base() + ["logs", "describe-log-groups", "--max-items", "10000"], region)).get("logGroups", [])
-    missing = [g for g in groups if not g.get("retentionInDays")]
+
+def log_groups(region: str) -> Iterable[Dict[str, Any]]:
+    """Every log group of the region, streamed (describe-log-groups returns at most 50 per page)."""
+    return iter_paginate(with_region(aws_base() + ["logs", "describe-log-groups"], region), "logGroups",
+                         token_key="nextToken", page_items=50, prefetch=1)
+
+
+def simulate(group: Dict[str, Any], now_ms: int, policies: Sequence[int], price: float) -> Dict[str, Any]:
+    """Cost and per-policy savings of one log group (USD per month)."""
+    stored = group.get("storedBytes") or 0
+    retention = group.get("retentionInDays")
+    age = max((now_ms - (group.get("creationTime") or now_ms)) / DAY_MS, 1.0)
+    held = min(age, retention) if retention else age
+    rate = stored / held  # bytes per day
+    savings = {}
+    for days in policies:
+        keep = stored if retention and retention <= days else min(stored, rate * days)
+        savings[days] = (stored - keep) / GB * price
+    return {
+        "logGroupName": group.get("logGroupName"),
+        "retentionInDays": retention,
+        "storedGB": stored / GB,
+        "ingestGBPerDay": rate / GB,
+        "monthlyCost": stored / GB * price,
+        # Without retention the stored data, and its cost, keeps growing by a month of ingestion every month.
+        "monthlyGrowth": 0.0 if retention else rate * 30 / GB * price,
+        "savings": savings,
+    }
+
+
+def _rounded(rec: Dict[str, Any]) -> Dict[str, Any]:
+    return {**rec, "storedGB": round(rec["storedGB"], 3), "ingestGBPerDay": round(rec["ingestGBPerDay"], 4),
+            "monthlyCost": round(rec["monthlyCost"], 2), "monthlyGrowth": round(rec["monthlyGrowth"], 2),
+            "savings": {str(d): round(v, 2) for d, v in rec["savings"].items()}}
+
+
+class RetentionScan:
+    """Running totals over a stream of simulated groups plus the `top` groups with the largest target saving."""
+
+    def __init__(self, policies: Sequence[int], target: int, top: int = 200, out: Optional[TextIO] = None) -> None:
+        self.policies, self.target, self.top, self.out = list(policies), target, top, out
+        self.groups = 0
+        self.without_retention = 0
+        self.stored_gb = 0.0
+        self.monthly_cost = 0.0
+        self.monthly_growth = 0.0
+        self.savings = {d: 0.0 for d in self.policies}
+        self.by_retention: Dict[str, int] = {}
+        self._heap: List[Tuple[float, int, Dict[str, Any]]] = []
+
+    def add(self, rec: Dict[str, Any]) -> None:
+        self.groups += 1
+        retention = rec["retentionInDays"]
+        self.without_retention += not retention
+        key = str(retention or "never")
+        self.by_retention[key] = self.by_retention.get(key, 0) + 1
+        self.stored_gb += rec["storedGB"]
+        self.monthly_cost += rec["monthlyCost"]
+        self.monthly_growth += rec["monthlyGrowth"]
+        for d, v in rec["savings"].items():
+            self.savings[d] += v
+        if self.out is not None:
+            self.out.write(json.dumps(_rounded(rec)) + "\n")
+        saving = rec["savings"][self.target]
+        if self.top and saving > 0:
+            entry = (saving, self.groups, rec)
+            if len(self._heap) < self.top:
+                heapq.heappush(self._heap, entry)
+            elif entry[0] > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def ranked(self) -> List[Dict[str, Any]]:
+        return [_rounded(rec) for _, _, rec in sorted(self._heap, key=lambda e: (-e[0], e[1]))]
+
+
+def scan(groups: Iterable[Dict[str, Any]], policies: Sequence[int] = POLICIES, target: int = 30, top: int = 200,
+         price: float = STORAGE_GB_MONTH, out: Optional[TextIO] = None, now_ms: Optional[int] = None) -> RetentionScan:
+    now_ms = now_ms or int(time.time() * 1000)
+    result = RetentionScan(policies, target, top, out)
+    for g in groups:
+        result.add(simulate(g, now_ms, result.policies, price))
+    return result
+
+
+def collect(region: str, policies: Sequence[int] = POLICIES, target: int = 30, top: int = 200,
+            price: float = STORAGE_GB_MONTH, out: Optional[str] = None) -> Dict[str, Any]:
+    with contextlib.ExitStack() as stack:
+        fh = stack.enter_context(open(out.replace("{region}", region), "w", encoding="utf-8")) if out else None
+        s = scan(log_groups(region), policies, target, top, price, fh)
     return {
         "region": region,
-        "totalLogGroups": len(groups),
-        "withoutRetention": len(missing),
-        "candidates": [{"logGroupName": g.get("logGroupName"), "storedBytes": g.get("storedBytes", 0)} for g in missing],
+        "totalLogGroups": s.groups,
+        "withoutRetention": s.without_retention,
+        "byRetentionDays": dict(sorted(s.by_retention.items(), key=lambda kv: -kv[1])),
+        "storedGB": round(s.stored_gb, 2),
+        "monthlyStorageCost": round(s.monthly_cost, 2),
+        "monthlyGrowthWithoutRetention": round(s.monthly_growth, 2),
+        "savingsByPolicy": {str(d): round(v, 2) for d, v in s.savings.items()},
+        "targetRetentionDays": target,
+        "candidates": s.ranked(),
         "recommendation": {
-            "defaultRetentionDays": 30,
+            "defaultRetentionDays": target,
             "notes": "Aplicar al menos 30-90 días según criticidad; exportar a S3 con ciclo de vida para histórico.",
         },
     }
@@ -28,11 +133,16 @@ def collect(region: str) -> Dict[str, Any]:
 
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--region", default=None)
+    add_region_args(ap)
+    ap.add_argument("--policies", default=",".join(map(str, POLICIES)), help="Retention days to simulate")
+    ap.add_argument("--target", type=int, default=30, help="Policy whose savings rank the candidates")
+    ap.add_argument("--top", type=int, default=200, help="Candidates to include in the output")
+    ap.add_argument("--gb-month-price", type=float, default=STORAGE_GB_MONTH)
+    ap.add_argument("--out", default=None, help="Write every group as JSONL here ({region} is replaced)")
     args = ap.parse_args()
-    region = ensure_region(args.region)
-    data = collect(region)
-    write_stdout_json(data)
+    policies = sorted({int(p) for p in args.policies.split(",") if p.strip()} | {args.target})
+    write_stdout_json(collect_regions(
+        args, lambda region: collect(region, policies, args.target, args.top, args.gb_month_price, args.out)))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Run inventory collectors across AWS Organizations member accounts x regions.
+Assumes --role-name into each account (credentials cached until shortly before expiry) and merges
+results per collector, account and region. Collectors must expose collect(region).
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import os
+from typing import Any, Callable, Dict
+
+from accounts import CredentialCache, resolve_accounts, run_across_accounts
+from common import add_cache_args, apply_cache_args, write_stdout_json
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+COLLECTORS = (
+    "ec2-idle-detector",
+    "ebs-volume-optimizer",
+    "snapshot-cleanup",
+    "nat-gateway-optimizer",
+    "graviton-migration",
+    "lambda-cost-optimizer",
+    "logs-retention-optimizer",
+    "aurora-serverless-migration",
+    "eks-cost-optimizer",
+)
+
+
+def load_collector(name: str) -> Callable[[str], Any]:
+    if name not in COLLECTORS:
+        raise SystemExit(f"Unknown collector {name!r}; choose from: {', '.join(COLLECTORS)}")
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_"), os.path.join(SCRIPTS, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)  # type: ignore[arg-type]
+    spec.loader.exec_module(module)  # type: ignore[union-attr]
+    return module.collect
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--collectors", required=True, help=f"Comma-separated: {', '.join(COLLECTORS)}")
+    ap.add_argument("--accounts", default="all", help="all (Organizations list-accounts) | comma-separated IDs")
+    ap.add_argument("--region", default=None)
+    ap.add_argument("--regions", default=None, help="all | comma-separated regions (default: --region)")
+    ap.add_argument("--role-name", default="OrganizationAccountAccessRole")
+    ap.add_argument("--external-id", default=None)
+    ap.add_argument("--sts-endpoint-url", default=None)
+    ap.add_argument("--max-workers", type=int, default=16, help="Global cap on concurrent account x region runs")
+    add_cache_args(ap)
+    args = ap.parse_args()
+    apply_cache_args(args)
+
+    cache = CredentialCache(args.role_name, external_id=args.external_id, sts_endpoint_url=args.sts_endpoint_url)
+    accounts = resolve_accounts(args.accounts)
+    data: Dict[str, Any] = {"roleName": args.role_name, "collectors": {}}
+    for name in [c.strip() for c in args.collectors.split(",") if c.strip()]:
+        data["collectors"][name] = run_across_accounts(
+            load_collector(name), accounts, args.regions, cache, args.max_workers, args.region
+        )
+    write_stdout_json(data)
+
+
+if __name__ == "__main__":
+    main()
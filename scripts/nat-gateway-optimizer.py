@@ -1,27 +1,53 @@
 #!/usr/bin/env python3
 """
-Inventory NAT Gateways and estimate cost hotspots. Suggests S3/DynamoDB gateway endpoints and consolidation.
+Per-gateway NAT Gateway cost attribution. Suggests S3/DynamoDB gateway endpoints and fixing cross-AZ routes.
+- Bytes processed per gateway (BytesInFromSource + BytesInFromDestination) come from batched GetMetricData
+  calls (cw_metrics.py "nat" preset), fetched while the route tables, subnets and gateway endpoints are described
+- Monthly cost = 730 h x hourly rate + processed GB per day x 30 x per-GB rate (regional list prices in
+  NAT_RATES, or --hourly-rate / --gb-rate); gateways are ranked by it
+- cross-az: subnets in another AZ route through the gateway; the transfer estimate assumes their share of the
+  traffic is their share of the routed subnets, at CROSS_AZ_GB both ways
+- s3-endpoint / dynamodb-endpoint: a public gateway whose route tables lack that gateway endpoint
+- idle: an available gateway that processed under IDLE_GB_PER_DAY; its hourly charge is the whole cost
+- The Cost Explorer AWSNATGateway total is kept to reconcile the estimate
+- Without CloudWatch access every gateway is costed at the hourly rate only and flagged no-metrics (metricsError)
 """
 from __future__ import annotations
 
 import argparse
-from typing import Any, Dict, List
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
-from common import aws_base, ensure_region, paginate, shell_json, with_region, write_stdout_json
+import cw_metrics
+from common import (
+    add_region_args, aws_base, collect_regions, iter_paginate, shell_json, with_region, write_stdout_json,
+)
+from inventory import add_inventory_args, resources
 
+HOURS_PER_MONTH = 730
+# (hourly, per GB processed) USD, public list prices.
+NAT_RATES: Dict[str, Tuple[float, float]] = {
+    "us-east-1": (0.045, 0.045), "us-east-2": (0.045, 0.045), "us-west-1": (0.048, 0.048),
+    "us-west-2": (0.045, 0.045), "ca-central-1": (0.05, 0.05), "sa-east-1": (0.093, 0.093),
+    "eu-west-1": (0.048, 0.048), "eu-west-2": (0.05, 0.05), "eu-west-3": (0.05, 0.05),
+    "eu-central-1": (0.052, 0.052), "eu-north-1": (0.046, 0.046), "eu-south-1": (0.05, 0.05),
+    "ap-south-1": (0.056, 0.056), "ap-southeast-1": (0.059, 0.059), "ap-southeast-2": (0.059, 0.059),
+    "ap-northeast-1": (0.062, 0.062), "ap-northeast-2": (0.059, 0.059), "ap-northeast-3": (0.062, 0.062),
+}
+DEFAULT_RATES = (0.045, 0.045)
+CROSS_AZ_GB = 0.02  # 0.01 out of one AZ + 0.01 into the other
+IDLE_GB_PER_DAY = 0.1
+GB = 1024 ** 3
+ENDPOINT_SERVICES = ("s3", "dynamodb")
 
-def collect(region: str) -> Dict[str, Any]:
-    ngws = paginate(
-        with_region(aws_base() + ["ec2", "describe-nat-gateways", "--max-results", "1000"], region),
-        result_key="NatGateways",
-    )
-    # Cost by service (AWSNATGateway) last 30d
-    costs: Dict[str, Any] = {}
-    try:
-        from datetime import date, timedelta
 
-        end = date.today()
-        start = end - timedelta(days=30)
+def nat_service_costs(region: str) -> List[Dict[str, Any]]:
+    """Cost Explorer AWSNATGateway cost for the last 30 days (empty when CE is not reachable)."""
+    end = date.today()
+    start = end - timedelta(days=30)
+    try:
         ce = shell_json(
             with_region(
                 aws_base()
@@ -40,38 +66,166 @@ def collect(region: str) -> Dict[str, Any]:
                 region,
             )
         )
-        costs = ce.get("ResultsByTime", [])
+        return ce.get("ResultsByTime", [])
     except Exception:
-        costs = {}
+        return []
+
+
+def describe_topology(region: str) -> Dict[str, Any]:
+    """Route tables, subnet AZs and gateway endpoints of the region, one paginated pass each."""
+    def stream(*cmd: str, key: str) -> Iterable[Dict[str, Any]]:
+        return iter_paginate(with_region(aws_base() + ["ec2", *cmd], region), key, page_items=100)
+
+    subnets = {s["SubnetId"]: (s.get("VpcId"), s.get("AvailabilityZone"))
+               for s in stream("describe-subnets", key="Subnets") if s.get("SubnetId")}
+    tables = [{"id": t.get("RouteTableId"), "vpc": t.get("VpcId"),
+               "nats": {r["NatGatewayId"] for r in t.get("Routes") or [] if r.get("NatGatewayId")},
+               "subnets": [a["SubnetId"] for a in t.get("Associations") or [] if a.get("SubnetId")],
+               "main": any(a.get("Main") for a in t.get("Associations") or [])}
+              for t in stream("describe-route-tables", key="RouteTables")]
+    endpoints: Dict[str, Set[str]] = {}  # "s3" / "dynamodb" -> route table ids
+    for e in stream("describe-vpc-endpoints", "--filters", "Name=vpc-endpoint-type,Values=Gateway", key="VpcEndpoints"):
+        service = (e.get("ServiceName") or "").rsplit(".", 1)[-1]
+        if service in ENDPOINT_SERVICES:
+            endpoints.setdefault(service, set()).update(e.get("RouteTableIds") or [])
+    return {"subnets": subnets, "tables": tables, "endpoints": endpoints}
+
+
+def routes_by_gateway(topology: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """{nat id: {"tables": [...], "subnets": set()}}; a main route table also serves the VPC's unassociated subnets."""
+    subnets, tables = topology["subnets"], topology["tables"]
+    associated = {s for t in tables for s in t["subnets"]}
+    implicit: Dict[str, List[str]] = {}
+    for sid, (vpc, _) in subnets.items():
+        if sid not in associated:
+            implicit.setdefault(vpc, []).append(sid)
+    out: Dict[str, Dict[str, Any]] = {}
+    for t in tables:
+        served = t["subnets"] + (implicit.get(t["vpc"], []) if t["main"] else [])
+        for nat in t["nats"]:
+            entry = out.setdefault(nat, {"tables": [], "subnets": set()})
+            entry["tables"].append(t["id"])
+            entry["subnets"].update(served)
+    return out
+
+
+def attribute(
+    gateways: List[Dict[str, Any]], mset: cw_metrics.MetricSet, topology: Dict[str, Any], rates: Tuple[float, float],
+) -> List[Dict[str, Any]]:
+    """One costed record per gateway, most expensive first."""
+    hourly, per_gb = rates
+    days = mset.periods * mset.period / 86400 or 1.0
+    from_source = cw_metrics.stats(mset, "bytesInFromSource")
+    processed = [a + b for a, b in zip(from_source["sum"], cw_metrics.stats(mset, "bytesInFromDestination")["sum"])]
+    out_dest = cw_metrics.stats(mset, "bytesOutToDestination")["sum"]
+    connections = cw_metrics.stats(mset, "connections")["max"]
+    rows = {rid: i for i, rid in enumerate(mset.ids)}
+    subnets, endpoints = topology["subnets"], topology["endpoints"]
+    routes = routes_by_gateway(topology)
+    items = []
+    for n in gateways:
+        nid = n.get("NatGatewayId")
+        i = rows.get(nid)
+        az = (subnets.get(n.get("SubnetId")) or (None, None))[1]
+        gb_day = processed[i] / GB / days if i is not None else 0.0
+        hourly_cost, data_cost = HOURS_PER_MONTH * hourly, gb_day * 30 * per_gb
+        routed = routes.get(nid, {"tables": [], "subnets": set()})
+        rec: Dict[str, Any] = {
+            "NatGatewayId": nid,
+            "VpcId": n.get("VpcId"),
+            "SubnetId": n.get("SubnetId"),
+            "AvailabilityZone": az,
+            "ConnectivityType": n.get("ConnectivityType"),
+            "Tags": n.get("Tags", []),
+            "processedGBPerDay": round(gb_day, 3),
+            "outToDestinationGBPerDay": round(out_dest[i] / GB / days, 3) if i is not None else 0.0,
+            "maxConnections": int(connections[i]) if i is not None and connections[i] is not None else None,
+            "monthlyHourlyCost": round(hourly_cost, 2),
+            "monthlyDataCost": round(data_cost, 2),
+            "monthlyCost": round(hourly_cost + data_cost, 2),
+            "routeTables": sorted(routed["tables"]),
+            "routedSubnets": len(routed["subnets"]),
+            "flags": [],
+        }
+        if i is None or not from_source["coverage"][i]:
+            rec["flags"].append("no-metrics")
+        elif gb_day < IDLE_GB_PER_DAY:
+            rec["flags"].append("idle")
+        remote = sorted({subnets[s][1] for s in routed["subnets"] if s in subnets and subnets[s][1] != az})
+        if az and remote:
+            share = sum(1 for s in routed["subnets"] if s in subnets and subnets[s][1] != az) / len(routed["subnets"])
+            rec["crossAz"] = {"azs": remote, "subnetShare": round(share, 3),
+                              "monthlyTransferEstimate": round(gb_day * 30 * share * CROSS_AZ_GB, 2)}
+            rec["flags"].append("cross-az")
+        if (n.get("ConnectivityType") or "public") == "public" and routed["tables"]:
+            for service in ENDPOINT_SERVICES:
+                if not endpoints.get(service, set()).issuperset(routed["tables"]):
+                    rec["flags"].append(f"{service}-endpoint")
+        items.append(rec)
+    items.sort(key=lambda r: -r["monthlyCost"])
+    return items
+
+
+RECOMMENDATIONS = {
+    "idle": "NAT Gateways sin tráfico: eliminarlos o consolidarlos (el cargo por hora es todo su costo).",
+    "cross-az": "Subnets enrutadas a un NAT de otra AZ: usar un NAT por AZ o mover las rutas para evitar tráfico cross-AZ.",
+    "s3-endpoint": "Agregar un Gateway Endpoint de S3 (sin costo) a las route tables que salen por NAT.",
+    "dynamodb-endpoint": "Agregar un Gateway Endpoint de DynamoDB (sin costo) a las route tables que salen por NAT.",
+}
+
 
+def collect(region: str, inventory: Optional[str] = None, args: Any = None) -> Dict[str, Any]:
+    gateways = [n for n in resources(inventory, "ec2:nat-gateway", region)
+                if (n.get("State") or "available") == "available" and n.get("NatGatewayId")]
+    ids = [n["NatGatewayId"] for n in gateways]
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        topology = pool.submit(contextvars.copy_context().run, describe_topology, region)
+        costs = pool.submit(contextvars.copy_context().run, nat_service_costs, region)
+        metrics_error = None
+        if args is not None and args.replay:
+            mset = cw_metrics.replay(args.replay)
+        else:
+            try:
+                mset = cw_metrics.fetch(region, cw_metrics.PRESETS["nat"], ids, days=getattr(args, "days", 14),
+                                        max_workers=getattr(args, "metric_workers", 4),
+                                        record=getattr(args, "record", None))
+            except Exception as e:  # no CloudWatch access: hourly cost only, every gateway flagged no-metrics
+                metrics_error = cw_metrics.fetch_error(e)
+                mset = cw_metrics.MetricSet(cw_metrics.PRESETS["nat"], [], 0, 0)
+        try:
+            topo = topology.result()
+        except Exception:  # no ec2:Describe* permission: cost ranking without routing flags
+            topo = {"subnets": {}, "tables": [], "endpoints": {}}
+        service_costs = costs.result()
+    rates = NAT_RATES.get(region, DEFAULT_RATES)
+    rates = (getattr(args, "hourly_rate", None) or rates[0], getattr(args, "gb_rate", None) or rates[1])
+    items = attribute(gateways, mset, topo, rates)
+    flagged = {f: sum(1 for r in items if f in r["flags"]) for f in ("idle", "cross-az", "s3-endpoint",
+                                                                      "dynamodb-endpoint", "no-metrics")}
     return {
         "region": region,
-        "totalNatGateways": len(ngws),
-        "items": [
-            {
-                "NatGatewayId": n.get("NatGatewayId"),
-                "State": n.get("State"),
-                "SubnetId": n.get("SubnetId"),
-                "VpcId": n.get("VpcId"),
-                "ConnectivityType": n.get("ConnectivityType"),
-                "Tags": n.get("Tags", []),
-            }
-            for n in ngws
-        ],
-        "natServiceCosts": costs,
-        "recommendations": [
-            "Usar Gateway Endpoints para S3/DynamoDB en VPCs con NAT para reducir egress.",
-            "Consolidar NAT por AZ y evitar tráfico cross-AZ.",
-            "Revisar rutas por defecto y endpoints privados (Interface Endpoints).",
-        ],
+        "totalNatGateways": len(items),
+        "rates": {"hourly": rates[0], "perGB": rates[1]},
+        "days": round(mset.periods * mset.period / 86400, 1),
+        "estimatedMonthlyCost": round(sum(r["monthlyCost"] for r in items), 2),
+        "estimatedIdleMonthlyCost": round(sum(r["monthlyCost"] for r in items if "idle" in r["flags"]), 2),
+        "flagged": flagged,
+        "items": items,
+        "natServiceCosts": service_costs,
+        "metricsError": metrics_error,
+        "recommendations": [f"{flagged[f]} NAT Gateway(s) - {text}" for f, text in RECOMMENDATIONS.items() if flagged[f]],
     }
 
 
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--region", default=None)
+    add_region_args(ap)
+    add_inventory_args(ap)
+    cw_metrics.add_metrics_args(ap)
+    ap.add_argument("--hourly-rate", type=float, default=None, help="USD per gateway-hour (default: NAT_RATES)")
+    ap.add_argument("--gb-rate", type=float, default=None, help="USD per GB processed (default: NAT_RATES)")
     args = ap.parse_args()
-    data = collect(ensure_region(args.region))
+    data = collect_regions(args, lambda region: collect(region, args.inventory, args))
     write_stdout_json(data)
 
 
@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 """
 Pull RDS rightsizing recommendations from Cost Explorer. If none, lists RDS instances for manual review.
+- Also scores every instance's CloudWatch utilization (CPU, connections; cw_metrics.py) so idle databases show up
+  even where Cost Explorer has no recommendation; without CloudWatch access that section only carries the error
 """
 from __future__ import annotations
 
 import argparse
 from typing import Any, Dict, List
 
+import cw_metrics
 from common import aws_base, ensure_region, paginate, shell_json, with_region, write_stdout_json
 
 
@@ -44,14 +47,35 @@ def rds_inventory(region: str) -> List[Dict[str, Any]]:
     ]
 
 
+def utilization(region: str, inv: List[Dict[str, Any]], args: Any) -> Dict[str, Any]:
+    """Idle scores per DB instance; idle = CPU p95 under --cpu-p95 and a connection in under 5% of the hours."""
+    if args.replay:
+        mset = cw_metrics.replay(args.replay)
+    else:
+        ids = [d["DBInstanceIdentifier"] for d in inv if d.get("DBInstanceIdentifier")]
+        try:
+            mset = cw_metrics.fetch(region, cw_metrics.PRESETS["rds"], ids, days=args.days,
+                                    max_workers=args.metric_workers, record=args.record)
+        except Exception as e:  # GetMetricData denied or still throttled: keep the CE and inventory sections
+            return {"days": args.days, "error": cw_metrics.fetch_error(e)}
+    scores = cw_metrics.idle_scores(mset, cpu_p95=args.cpu_p95)
+    return {"days": args.days, "idle": [s for s in scores if s["idle"]], "instances": scores}
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--region", default=None)
+    ap.add_argument("--no-utilization", action="store_true", help="Skip the CloudWatch utilization scores")
+    ap.add_argument("--cpu-p95", type=float, default=10.0)
+    cw_metrics.add_metrics_args(ap)
     args = ap.parse_args()
     region = ensure_region(args.region)
     ce = ce_rds_rightsizing(region)
     inv = rds_inventory(region)
-    write_stdout_json({"region": region, "rightsizing": ce, "inventory": inv})
+    out: Dict[str, Any] = {"region": region, "rightsizing": ce, "inventory": inv}
+    if not args.no_utilization:
+        out["utilization"] = utilization(region, inv, args)
+    write_stdout_json(out)
 
 
 if __name__ == "__main__":
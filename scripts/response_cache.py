@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Response cache for slow-changing AWS API calls, used by common.shell_json.
+- Content-addressed: key = sha256 of the normalized argv, region and caller identity (never the secret)
+- Per-API TTLs (CACHE_TTLS); operations without a TTL are never cached
+- Two tiers: a small in-memory LRU per process and an on-disk store shared by every collector process
+- The disk store is evicted least-recently-used by total size (reads refresh an entry's mtime)
+- Modes: off (bypass), read (serve fresh entries, store misses), refresh (ignore entries stored before the run
+  started, then behave like read, so one refreshed response is shared by the rest of the run)
+"""
+from __future__ import annotations
+
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+try:  # POSIX only; without it concurrent processes may both fetch a cold key, which is harmless.
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore[assignment]
+
+MODES = ("off", "read", "refresh")
+HOUR = 3600
+# Seconds a response stays fresh, by "<cli service> <cli operation>".
+CACHE_TTLS: Dict[str, int] = {
+    "ce get-savings-plans-purchase-recommendation": 24 * HOUR,  # recomputed by AWS about once a day
+    "ce get-reservation-purchase-recommendation": 24 * HOUR,
+    "ce get-cost-and-usage": 6 * HOUR,  # Cost Explorer data lands a few times a day
+    "ce get-cost-forecast": 6 * HOUR,
+    "compute-optimizer get-enrollment-status": 1 * HOUR,
+    "compute-optimizer get-ec2-instance-recommendations": 12 * HOUR,
+    "compute-optimizer get-ebs-volume-recommendations": 12 * HOUR,
+    "compute-optimizer get-lambda-function-recommendations": 12 * HOUR,
+    "ec2 describe-regions": 24 * HOUR,
+    "ec2 describe-instance-types": 7 * 24 * HOUR,
+    "organizations list-accounts": 1 * HOUR,
+    "pricing get-products": 7 * 24 * HOUR,  # list prices change rarely
+    "sts get-caller-identity": 1 * HOUR,
+}
+# Argv noise that does not change the response.
+_IGNORED_OPTIONS = {"--output": 1, "--no-cli-pager": 0, "--color": 1}
+
+
+def default_cache_dir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "aws-cost-optimization", "responses")
+
+
+def operation_of(cmd: List[str]) -> str:
+    """'<service> <operation>' of an `aws ...` argv, skipping global options."""
+    positionals: List[str] = []
+    i = 1
+    while i < len(cmd) and len(positionals) < 2:
+        tok = cmd[i]
+        if tok.startswith("--"):
+            i += 2 if tok in {"--output", "--region", "--endpoint-url", "--profile", "--color"} else 1
+            continue
+        positionals.append(tok)
+        i += 1
+    return " ".join(positionals)
+
+
+def normalize(cmd: List[str]) -> List[str]:
+    out: List[str] = [os.path.basename(cmd[0])] if cmd else []
+    i = 1
+    while i < len(cmd):
+        skip = _IGNORED_OPTIONS.get(cmd[i])
+        if skip is not None:
+            i += 1 + skip
+            continue
+        out.append(cmd[i])
+        i += 1
+    return out
+
+
+def caller_identity(env: Optional[Dict[str, str]] = None) -> Tuple[str, str]:
+    """(access key id, profile) AWS calls run as with `env` layered over os.environ; never the secret."""
+    env = env or {}
+    return (
+        env.get("AWS_ACCESS_KEY_ID") or os.environ.get("AWS_ACCESS_KEY_ID") or "",
+        env.get("AWS_PROFILE") or os.environ.get("AWS_PROFILE") or "",
+    )
+
+
+def cache_key(cmd: List[str], region: str, env: Optional[Dict[str, str]] = None) -> str:
+    """Same command against a different region, account or profile is a different entry."""
+    raw = json.dumps({"cmd": normalize(cmd), "region": region, "who": caller_identity(env)}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    get_or_fetch(cmd, region, env, fetch) returns a cached response when one is fresh, otherwise calls
+    fetch() and stores its result. Failures are never cached. Thread-safe; cross-process safe on POSIX
+    (a per-key file lock means one process fetches while the others wait and then read its entry).
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        mode: str = "read",
+        max_bytes: int = 256 * 2**20,
+        memory_entries: int = 256,
+        ttls: Optional[Dict[str, int]] = None,
+        clock: Callable[[], float] = time.time,
+        refresh_since: Optional[float] = None,
+    ) -> None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}; choose from {', '.join(MODES)}")
+        self.directory = directory or default_cache_dir()
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.ttls = dict(CACHE_TTLS if ttls is None else ttls)
+        self.clock = clock
+        # Entries stored before this instant are stale regardless of TTL (refresh mode).
+        self.since = 0.0 if mode != "refresh" else (clock() if refresh_since is None else refresh_since)
+        self._memory: "OrderedDict[str, Tuple[float, float, Any]]" = OrderedDict()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self._disk_bytes: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    def ttl_for(self, cmd: List[str]) -> int:
+        return self.ttls.get(operation_of(cmd), 0)
+
+    def cacheable(self, cmd: List[str]) -> bool:
+        return self.mode != "off" and self.ttl_for(cmd) > 0
+
+    # --- storage -------------------------------------------------------------------------------------
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        with self._guard:
+            hit = self._memory.get(key)
+            if hit is None:
+                return None
+            if not self._valid(hit[0], hit[1]):
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return hit[2]
+
+    def _memory_put(self, key: str, stored: float, expires: float, response: Any) -> None:
+        with self._guard:
+            self._memory[key] = (stored, expires, response)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _valid(self, stored: float, expires: float) -> bool:
+        return stored >= self.since and expires > self.clock()
+
+    def _disk_get(self, key: str) -> Optional[Tuple[float, float, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        stored, expires = float(entry.get("storedAt") or 0), float(entry.get("expiresAt") or 0)
+        if not self._valid(stored, expires):
+            return None
+        try:
+            os.utime(path)  # mtime doubles as last-access time for LRU eviction
+        except OSError:
+            pass
+        return stored, expires, entry.get("response")
+
+    def _disk_put(self, key: str, cmd: List[str], stored: float, expires: float, response: Any) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"operation": operation_of(cmd), "storedAt": stored, "expiresAt": expires, "response": response}
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps(entry, separators=(",", ":"), default=str))
+        os.replace(tmp, path)
+        with self._guard:
+            if self._disk_bytes is not None:
+                self._disk_bytes += os.path.getsize(path)
+        self.evict()
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        out: List[Tuple[float, int, str]] = []
+        if not os.path.isdir(self.directory):
+            return out
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for e in os.scandir(shard.path):
+                if e.name.endswith(".json"):
+                    try:
+                        st = e.stat()
+                    except OSError:
+                        continue
+                    out.append((st.st_mtime, st.st_size, e.path))
+        return out
+
+    def evict(self) -> int:
+        """Drops least-recently-used entries until the store is under 90% of max_bytes; returns bytes freed."""
+        with self._guard:
+            if self._disk_bytes is not None and self._disk_bytes <= self.max_bytes:
+                return 0
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        if total > self.max_bytes:
+            target = int(self.max_bytes * 0.9)
+            for _, size, path in sorted(entries):
+                if total - freed <= target:
+                    break
+                try:
+                    os.remove(path)
+                    freed += size
+                except OSError:
+                    pass
+        with self._guard:
+            self._disk_bytes = total - freed
+        return freed
+
+    def clear(self) -> None:
+        with self._guard:
+            self._memory.clear()
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._guard:
+            self._disk_bytes = 0
+
+    @contextmanager
+    def _key_lock(self, key: str) -> Iterator[None]:
+        with self._guard:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            # One lock file per shard keeps the number of lock files bounded (256).
+            shard = os.path.dirname(self._path(key))
+            os.makedirs(shard, exist_ok=True)
+            with open(os.path.join(shard, ".lock"), "a") as fh:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    # --- public --------------------------------------------------------------------------------------
+
+    def lookup(self, key: str) -> Optional[Any]:
+        if self.mode == "off":
+            return None
+        hit = self._memory_get(key)
+        if hit is None:
+            disk = self._disk_get(key)
+            if disk is not None:
+                self._memory_put(key, *disk)
+                hit = disk[2]
+        return hit
+
+    def get_or_fetch(
+        self, cmd: List[str], region: str, env: Optional[Dict[str, str]], fetch: Callable[[], Any]
+    ) -> Tuple[Any, bool]:
+        """Returns (response, served_from_cache). Callers get their own copy and may mutate it."""
+        if not self.cacheable(cmd):
+            return fetch(), False
+        key = cache_key(cmd, region, env)
+        hit = self.lookup(key)
+        if hit is None:
+            with self._key_lock(key):
+                # Another thread or process may have filled the entry while we waited for the lock.
+                hit = self.lookup(key)
+                if hit is None:
+                    response = fetch()
+                    stored = self.clock()
+                    expires = stored + self.ttl_for(cmd)
+                    self._memory_put(key, stored, expires, response)
+                    try:
+                        self._disk_put(key, cmd, stored, expires, response)
+                    except OSError:
+                        pass  # a read-only or full disk degrades to the in-memory tier
+                    with self._guard:
+                        self.misses += 1
+                    return copy.deepcopy(response), False
+        with self._guard:
+            self.hits += 1
+        return copy.deepcopy(hit), True
+
+
+def cache_from_env() -> ResponseCache:
+    """
+    AWS_COLLECTOR_CACHE=off|read|refresh (default off), AWS_COLLECTOR_CACHE_DIR, AWS_COLLECTOR_CACHE_MAX_MB.
+    AWS_COLLECTOR_CACHE_SINCE (epoch seconds) lets an orchestrator give all its processes one refresh cut-off.
+    """
+    since = os.environ.get("AWS_COLLECTOR_CACHE_SINCE")
+    return ResponseCache(
+        directory=os.environ.get("AWS_COLLECTOR_CACHE_DIR") or None,
+        mode=os.environ.get("AWS_COLLECTOR_CACHE", "off"),
+        max_bytes=int(float(os.environ.get("AWS_COLLECTOR_CACHE_MAX_MB", "256")) * 2**20),
+        refresh_since=float(since) if since else None,
+    )
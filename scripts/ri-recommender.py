@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 """
 Fetch RI purchase recommendations via Cost Explorer for EC2/RDS where applicable.
+- With --usage (hourly usage per instance family) or --fetch, simulates standard RIs per family locally instead
+  (commitment_sim.py)
 """
 from __future__ import annotations
 
 import argparse
 from typing import Any, Dict
 
+import commitment_sim
 from common import aws_base, ensure_region, shell_json, with_region, write_stdout_json
 
 
@@ -40,7 +43,11 @@ def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--region", default=None)
     ap.add_argument("--service", default="AmazonEC2")
+    commitment_sim.add_simulator_args(ap)
     args = ap.parse_args()
+    if args.usage or args.fetch:
+        write_stdout_json(commitment_sim.run_from_args(args, ["standard-ri"]))
+        return
     data = ce_ri_recommendations(ensure_region(args.region), args.service)
     write_stdout_json(data)
 
@@ -5,32 +5,16 @@ Report S3 buckets missing lifecycle configuration and suggest lifecycle policies
 from __future__ import annotations
 
 import argparse
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
-from common import aws_base, ensure_region, shell_json, write_stdout_json
+from common import write_stdout_json
+from s3_scan import load_or_scan
 
 
-def list_buckets() -> List[Dict[str, Any]]:
-    return shell_json(aws_base() + ["s3api", "list-buckets"]).get("Buckets", [])
-
-
-def bucket_has_lifecycle(name: str, region: str) -> bool:
-    try:
-        shell_json(["aws", "s3api", "get-bucket-lifecycle-configuration", "--bucket", name, "--output", "json"])
-        return True
-    except Exception:
-        return False
-
-
-def collect(region: str) -> Dict[str, Any]:
-    buckets = list_buckets()
-    missing: List[str] = []
-    for b in buckets:
-        name = b.get("Name")
-        if not name:
-            continue
-        if not bucket_has_lifecycle(name, region):
-            missing.append(name)
+def collect(region: str, bucket_scan: Optional[str] = None, max_workers: int = 16) -> Dict[str, Any]:
+    scan = load_or_scan(bucket_scan, ["lifecycle"], max_workers)
+    buckets = scan.get("buckets", [])
+    missing: List[str] = [b["name"] for b in buckets if not b.get("lifecycle")]
     return {
         "region": region,
         "totalBuckets": len(buckets),
@@ -45,8 +29,10 @@ def collect(region: str) -> Dict[str, Any]:
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--region", default=None)
+    ap.add_argument("--bucket-scan", default=None, help="Reuse an s3_scan.py result instead of scanning again")
+    ap.add_argument("--max-workers", type=int, default=16)
     args = ap.parse_args()
-    data = collect(args.region or "us-east-1")
+    data = collect(args.region or "us-east-1", args.bucket_scan, args.max_workers)
     write_stdout_json(data)
 
 
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Single-pass S3 bucket scan shared by s3-lifecycle-optimizer.py and tag-compliance-checker.py.
+- Lists buckets once, resolves each bucket's home region, then fetches the requested per-bucket
+  configurations (lifecycle, tagging, encryption, versioning) on a worker pool
+- Adaptive throttling comes from common.shell_json: per-region token buckets halve their rate on SlowDown
+- The JSON it prints is what consumers load via --bucket-scan (collect_report.py writes s3_buckets.json)
+"""
+from __future__ import annotations
+
+import argparse
+import contextvars
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from common import STATS, aws_base, aws_error_code, shell_json, write_stdout_json
+
+FIELDS = ("lifecycle", "tagging", "encryption", "versioning")
+# Error codes meaning "this bucket simply has no such configuration".
+ABSENT = {
+    "lifecycle": {"NoSuchLifecycleConfiguration"},
+    "tagging": {"NoSuchTagSet"},
+    "encryption": {"ServerSideEncryptionConfigurationNotFoundError"},
+    "versioning": set(),
+}
+
+
+def list_buckets() -> List[Dict[str, Any]]:
+    return shell_json(aws_base() + ["s3api", "list-buckets"]).get("Buckets", [])
+
+
+def _region_from_location(loc: Optional[str]) -> str:
+    # get-bucket-location returns null for us-east-1 and the legacy "EU" alias for eu-west-1.
+    if not loc:
+        return "us-east-1"
+    return "eu-west-1" if loc == "EU" else loc
+
+
+def _fetch(field: str, bucket: str, region: str) -> Any:
+    base = aws_base() + ["s3api"]
+    tail = ["--bucket", bucket, "--region", region]
+    if field == "region":
+        return _region_from_location(shell_json(base + ["get-bucket-location", "--bucket", bucket]).get("LocationConstraint"))
+    if field == "lifecycle":
+        return bool(shell_json(base + ["get-bucket-lifecycle-configuration"] + tail).get("Rules"))
+    if field == "tagging":
+        return shell_json(base + ["get-bucket-tagging"] + tail).get("TagSet", [])
+    if field == "encryption":
+        rules = (shell_json(base + ["get-bucket-encryption"] + tail).get("ServerSideEncryptionConfiguration") or {}).get("Rules", [])
+        algos = [((r.get("ApplyServerSideEncryptionByDefault") or {}).get("SSEAlgorithm")) for r in rules]
+        return next((a for a in algos if a), None)
+    if field == "versioning":
+        return shell_json(base + ["get-bucket-versioning"] + tail).get("Status") or "Disabled"
+    raise ValueError(f"Unknown field {field!r}")
+
+
+_ABSENT_VALUE = {"lifecycle": False, "tagging": [], "encryption": None, "versioning": "Disabled", "region": None}
+
+
+class BucketScanner:
+    def __init__(self, fields: Iterable[str], max_workers: int = 16) -> None:
+        self.fields = tuple(fields)
+        unknown = [f for f in self.fields if f not in FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}; choose from {', '.join(FIELDS)}")
+        self.max_workers = max_workers
+
+    @staticmethod
+    def _call(field: str, bucket: str, region: str) -> Tuple[Any, Optional[str]]:
+        """
+        Returns (value, error). Missing configuration is a value, not an error. Pacing and throttle retries
+        happen in common.shell_json, whose per-(s3api, region) bucket slows down when S3 answers SlowDown.
+        """
+        try:
+            return _fetch(field, bucket, region), None
+        except Exception as e:
+            code = aws_error_code(e)
+            if code in ABSENT.get(field, ()):
+                return _ABSENT_VALUE[field], None
+            return _ABSENT_VALUE[field], code or str(e).strip().splitlines()[-1][:300]
+
+    def scan_one(self, b: Dict[str, Any]) -> Dict[str, Any]:
+        name = b["Name"]
+        rec: Dict[str, Any] = {"name": name, "creationDate": b.get("CreationDate")}
+        errors: Dict[str, str] = {}
+        region, err = self._call("region", name, "us-east-1")
+        if err:
+            errors["region"] = err
+        rec["region"] = region or "us-east-1"
+        for field in self.fields:
+            value, err = self._call(field, name, rec["region"])
+            rec[field] = value
+            if err:
+                errors[field] = err
+        if errors:
+            rec["errors"] = errors
+        return rec
+
+    def scan(self) -> Dict[str, Any]:
+        started = time.monotonic()
+        buckets = [b for b in list_buckets() if b.get("Name")]
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as pool:
+            # A fresh context copy per bucket keeps aws_env credentials (account fan-out) on worker threads.
+            futures = [pool.submit(contextvars.copy_context().run, self.scan_one, b) for b in buckets]
+            records = [f.result() for f in futures]
+        return {
+            "scannedAt": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "fields": list(self.fields),
+            "totalBuckets": len(records),
+            "buckets": records,
+            "stats": {"seconds": round(time.monotonic() - started, 3), **STATS.snapshot()},
+        }
+
+
+def scan_buckets(fields: Iterable[str], max_workers: int = 16) -> Dict[str, Any]:
+    return BucketScanner(fields, max_workers).scan()
+
+
+def load_or_scan(path: Optional[str], fields: Iterable[str], max_workers: int = 16) -> Dict[str, Any]:
+    """
+    Reuses a scan written earlier in the run (--bucket-scan) when it covers `fields`;
+    otherwise scans now. A failed upstream scan leaves '{}' behind, which also triggers a fresh scan.
+    """
+    fields = tuple(fields)
+    if path:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+            if isinstance(doc.get("buckets"), list) and set(fields) <= set(doc.get("fields", [])):
+                return doc
+        except (OSError, ValueError):
+            pass
+    return scan_buckets(fields, max_workers)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--fields", default="lifecycle,tagging", help=f"Comma-separated: {', '.join(FIELDS)}")
+    ap.add_argument("--max-workers", type=int, default=16)
+    args = ap.parse_args()
+    fields = [f.strip() for f in args.fields.split(",") if f.strip()]
+    write_stdout_json(scan_buckets(fields, args.max_workers))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 """
 Fetch AWS Savings Plans purchase recommendations (Compute/EC2). Outputs JSON.
+- With --usage (hourly usage file) or --fetch, simulates commitments locally instead (commitment_sim.py):
+  every term and payment option, optimal commitment, savings, coverage and utilization curves
 """
 from __future__ import annotations
 
 import argparse
 from typing import Any, Dict
 
+import commitment_sim
 from common import aws_base, ensure_region, shell_json, with_region, write_stdout_json
 
 
@@ -39,7 +42,12 @@ def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--region", default=None)
     ap.add_argument("--type", default="COMPUTE_SP", choices=["COMPUTE_SP", "EC2_INSTANCE_SP"])
+    commitment_sim.add_simulator_args(ap)
     args = ap.parse_args()
+    if args.usage or args.fetch:
+        plan = "compute-sp" if args.type == "COMPUTE_SP" else "ec2-instance-sp"
+        write_stdout_json(commitment_sim.run_from_args(args, [plan]))
+        return
     write_stdout_json(sp_recommendations(ensure_region(args.region), args.type))
 
 
@@ -1,42 +1,51 @@
 #!/usr/bin/env python3
 """
-List EBS snapshots older than a threshold (default 90 days) that are candidates for archival/cleanup.
+EBS snapshot cleanup candidates from the snapshot lineage (snapshot_lineage.py), not per-snapshot VolumeSize.
+- Snapshots are grouped by source volume in time order; the estimated reclaimable bytes account for the blocks
+  later snapshots still share
+- Orphans (source volume gone, no AMI reference) are reclaimable whatever their age; other snapshots older than
+  --days are, except those an AMI uses and the newest snapshot of each live volume
+- describe-snapshots is always streamed straight into the compact index (1M snapshots ~ 34 MB of arrays);
+  --inventory only supplies the live volumes
 """
 from __future__ import annotations
 
 import argparse
-from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, List
-
-from common import aws_base, ensure_region, paginate, with_region, write_stdout_json
-
-
-def collect(region: str, days: int) -> Dict[str, Any]:
-    cutoff = datetime.now(timezone.utc) - timedelta(days=days)
-    snaps = paginate(
-        with_region(aws_base() + ["ec2", "describe-snapshots", "--owner-ids", "self", "--max-results", "1000"], region),
-        result_key="Snapshots",
-    )
-    old = [
-        {
-            "SnapshotId": s.get("SnapshotId"),
-            "StartTime": s.get("StartTime"),
-            "VolumeId": s.get("VolumeId"),
-            "VolumeSize": s.get("VolumeSize"),
-            "StorageTier": s.get("StorageTier"),
-        }
-        for s in snaps
-        if s.get("StartTime") and datetime.fromisoformat(str(s["StartTime"]).replace("Z", "+00:00")) < cutoff
-    ]
-    return {"region": region, "thresholdDays": days, "totalSnapshots": len(snaps), "olderThanThreshold": len(old), "candidates": old[:500]}
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from common import add_region_args, collect_regions, write_stdout_json
+from inventory import add_inventory_args, resources
+from snapshot_lineage import CHANGE_RATE, ami_snapshot_ids, analyze, build_index, stream_snapshots
+
+
+def collect(region: str, days: int = 90, max_candidates: int = 500, inventory: Optional[str] = None,
+            change_rate: float = CHANGE_RATE, top_chains: int = 100) -> Dict[str, Any]:
+    cutoff = int(time.time()) - days * 86400
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        volumes = pool.submit(contextvars.copy_context().run,
+                              lambda: {v.get("VolumeId") for v in resources(inventory, "ec2:volume", region)})
+        amis = pool.submit(contextvars.copy_context().run, ami_snapshot_ids, region)
+        index = build_index(stream_snapshots(region))
+        live, ami_refs = volumes.result(), amis.result()
+    result = analyze(index, live, ami_refs, cutoff, change_rate, max_candidates, top_chains)
+    return {"region": region, "thresholdDays": days, "changeRatePerDay": change_rate,
+            "indexMiB": round(index.nbytes() / 2**20, 2), **result}
 
 
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--region", default=None)
+    add_region_args(ap)
     ap.add_argument("--days", type=int, default=90)
+    ap.add_argument("--change-rate", type=float, default=CHANGE_RATE, help="Share of a volume's blocks changed per day")
+    ap.add_argument("--max-candidates", type=int, default=500, help="Deletable snapshots to list, largest saving first")
+    ap.add_argument("--top-chains", type=int, default=100, help="Orphan chains to list")
+    add_inventory_args(ap)
     args = ap.parse_args()
-    data = collect(ensure_region(args.region), args.days)
+    data = collect_regions(args, lambda region: collect(region, args.days, args.max_candidates, args.inventory,
+                                                        args.change_rate, args.top_chains))
     write_stdout_json(data)
 
 
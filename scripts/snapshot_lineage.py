@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+EBS snapshot lineage: snapshots grouped by source volume in time order, with incremental size estimates.
+- EBS snapshots are incremental: the first snapshot of a volume stores its data, each later one only the blocks
+  changed since the previous one, and deleting a snapshot frees only the blocks no later snapshot still needs
+- describe-snapshots is streamed and each snapshot becomes 34 bytes in its chain's arrays (start time, full size,
+  id + storage tier), never a record
+- Full size = FullSnapshotSizeInBytes when AWS reports it, else VolumeSize (an upper bound: provisioned, not used)
+- Incremental size assumes blocks change uniformly at `change_rate` per day: a snapshot taken g days after the
+  previous one stores full x (1 - exp(-rate x g)). Deleting it frees the part of that overwritten before the next
+  snapshot that is kept; with none kept after it, all of it
+- Orphan chain: the source volume no longer exists and no AMI references any of its snapshots; all of it is
+  reclaimable. Otherwise snapshots older than the cutoff are deletable unless an AMI references them, and the
+  newest snapshot of a live volume is always kept
+- Archive-tier snapshots are full copies billed at ARCHIVE_GB_MONTH; snapshots copied from another snapshot
+  (VolumeId vol-ffffffff) each form their own chain
+"""
+from __future__ import annotations
+
+import heapq
+import math
+from array import array
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from common import aws_base, iter_paginate, with_region
+
+STANDARD_GB_MONTH = 0.05
+ARCHIVE_GB_MONTH = 0.0125
+CHANGE_RATE = 0.01  # share of a volume's blocks rewritten per day
+COPIED_VOLUME = "vol-ffffffff"
+GIB = 1024 ** 3
+_ID_WIDTH = 17  # hex digits of a snap- id; 8-digit legacy ids are space-padded
+_ARCHIVE = ord("a")
+_STANDARD = ord("s")
+
+
+class Chain:
+    """Snapshots of one volume as parallel arrays; `ids` holds 17 id characters plus one tier byte per snapshot."""
+
+    __slots__ = ("times", "sizes", "ids")
+
+    def __init__(self) -> None:
+        self.times = array("q")
+        self.sizes = array("q")
+        self.ids = bytearray()
+
+    def add(self, start: int, size: int, snapshot_id: str, archive: bool) -> None:
+        self.times.append(start)
+        self.sizes.append(size)
+        self.ids += snapshot_id[5:].ljust(_ID_WIDTH).encode("ascii")
+        self.ids.append(_ARCHIVE if archive else _STANDARD)
+
+    def snapshot_id(self, k: int) -> str:
+        at = k * (_ID_WIDTH + 1)
+        return "snap-" + self.ids[at:at + _ID_WIDTH].decode("ascii").rstrip()
+
+    def archived(self, k: int) -> bool:
+        return self.ids[k * (_ID_WIDTH + 1) + _ID_WIDTH] == _ARCHIVE
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+
+class LineageIndex:
+    def __init__(self) -> None:
+        self.chains: Dict[str, Chain] = {}
+        self.snapshots = 0
+
+    def add(self, snap: Dict[str, Any]) -> None:
+        sid, volume = snap.get("SnapshotId") or "", snap.get("VolumeId") or COPIED_VOLUME
+        if not sid.startswith("snap-"):
+            return
+        key = sid if volume == COPIED_VOLUME else volume
+        chain = self.chains.get(key)
+        if chain is None:
+            chain = self.chains[key] = Chain()
+        size = snap.get("FullSnapshotSizeInBytes") or (snap.get("VolumeSize") or 0) * GIB
+        chain.add(_epoch(snap.get("StartTime")), int(size), sid, (snap.get("StorageTier") or "").lower() == "archive")
+        self.snapshots += 1
+
+    def nbytes(self) -> int:
+        return sum(c.times.itemsize * len(c) * 2 + len(c.ids) for c in self.chains.values())
+
+
+def _epoch(stamp: Any) -> int:
+    if not stamp:
+        return 0
+    if isinstance(stamp, (int, float)):
+        return int(stamp)
+    value = datetime.fromisoformat(str(stamp).replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def build_index(snapshots: Iterable[Dict[str, Any]]) -> LineageIndex:
+    index = LineageIndex()
+    for s in snapshots:
+        index.add(s)
+    return index
+
+
+def stream_snapshots(region: str) -> Iterator[Dict[str, Any]]:
+    """describe-snapshots of the account (owner self), projected to the fields the index reads."""
+    fields = ("SnapshotId", "VolumeId", "StartTime", "VolumeSize", "FullSnapshotSizeInBytes", "StorageTier")
+    return iter_paginate(
+        with_region(aws_base() + ["ec2", "describe-snapshots", "--owner-ids", "self"], region), "Snapshots",
+        page_items=1000, prefetch=1, select=lambda s: {k: s[k] for k in fields if k in s},
+    )
+
+
+def ami_snapshot_ids(region: str) -> Set[str]:
+    """Snapshots referenced by a block device mapping of one of the account's AMIs."""
+    refs: Set[str] = set()
+    for image in iter_paginate(with_region(aws_base() + ["ec2", "describe-images", "--owners", "self"], region),
+                               "Images", page_items=1000):
+        for bdm in image.get("BlockDeviceMappings") or []:
+            sid = (bdm.get("Ebs") or {}).get("SnapshotId")
+            if sid:
+                refs.add(sid)
+    return refs
+
+
+def analyze_chain(
+    key: str, chain: Chain, live: bool, ami_refs: Set[str], cutoff: int, rate: float = CHANGE_RATE,
+) -> Tuple[Dict[str, Any], List[Tuple[float, int]]]:
+    """Chain summary plus (estimated freed bytes, index) of each deletable snapshot: one forward, one reverse pass."""
+    times, sizes = chain.times, chain.sizes
+    order = sorted(range(len(chain)), key=times.__getitem__)
+    referenced = [k for k in order if ami_refs and chain.snapshot_id(k) in ami_refs]
+    orphan = not live and not referenced and key.startswith("vol-")
+    stored = [0.0] * len(chain)
+    prev: Optional[int] = None
+    standard_bytes = archive_bytes = 0.0
+    for k in order:
+        if chain.archived(k):
+            stored[k] = float(sizes[k])
+            archive_bytes += stored[k]
+            continue
+        stored[k] = float(sizes[k]) if prev is None else sizes[k] * -math.expm1(-rate * (times[k] - prev) / 86400)
+        standard_bytes += stored[k]
+        prev = times[k]
+    keep = set(referenced)
+    if live:
+        newest = next((k for k in reversed(order) if not chain.archived(k)), None)
+        if newest is not None:
+            keep.add(newest)
+    deletable: List[Tuple[float, int]] = []
+    next_kept: Optional[int] = None
+    for k in reversed(order):
+        if k in keep or not (orphan or times[k] < cutoff):
+            if not chain.archived(k):
+                next_kept = times[k]
+            continue
+        if chain.archived(k) or next_kept is None:
+            freed = stored[k]
+        else:
+            freed = stored[k] * -math.expm1(-rate * (next_kept - times[k]) / 86400)
+        deletable.append((freed, k))
+    summary = {
+        "key": key,
+        "snapshots": len(chain),
+        "orphan": orphan,
+        "amiReferenced": len(referenced),
+        "oldest": times[order[0]],
+        "newest": times[order[-1]],
+        "standardBytes": standard_bytes,
+        "archiveBytes": archive_bytes,
+        "reclaimableBytes": sum(f for f, _ in deletable),
+        "reclaimableCost": sum(f / GIB * (ARCHIVE_GB_MONTH if chain.archived(k) else STANDARD_GB_MONTH)
+                               for f, k in deletable),
+    }
+    return summary, deletable
+
+
+def _iso(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+
+def _gib(v: float) -> float:
+    return round(v / GIB, 2)
+
+
+def analyze(
+    index: LineageIndex, live_volumes: Set[str], ami_refs: Set[str], cutoff: int, rate: float = CHANGE_RATE,
+    max_candidates: int = 500, top_chains: int = 100,
+) -> Dict[str, Any]:
+    """Totals over every chain; only the top deletable snapshots and orphan chains are materialized."""
+    totals = {"standard": 0.0, "archive": 0.0, "orphan": 0.0, "aged": 0.0, "cost": 0.0}
+    orphan_chains = orphan_snapshots = deletable_count = older = copies = 0
+    candidates: List[Tuple[float, str, int]] = []  # min-heap of (freed bytes, chain key, index)
+    orphans: List[Tuple[float, str, Dict[str, Any]]] = []
+    orphan_keys: Set[str] = set()
+    for key, chain in index.chains.items():
+        summary, deletable = analyze_chain(key, chain, key in live_volumes, ami_refs, cutoff, rate)
+        totals["standard"] += summary["standardBytes"]
+        totals["archive"] += summary["archiveBytes"]
+        totals["cost"] += summary["reclaimableCost"]
+        totals["orphan" if summary["orphan"] else "aged"] += summary["reclaimableBytes"]
+        older += sum(1 for t in chain.times if t < cutoff)
+        copies += not key.startswith("vol-")
+        deletable_count += len(deletable)
+        if summary["orphan"]:
+            orphan_chains += 1
+            orphan_keys.add(key)
+            orphan_snapshots += len(chain)
+            entry = (summary["reclaimableBytes"], key, summary)
+            if len(orphans) < top_chains:
+                heapq.heappush(orphans, entry)
+            elif entry[0] > orphans[0][0]:
+                heapq.heapreplace(orphans, entry)
+        for freed, k in deletable:
+            entry = (freed, key, k)
+            if len(candidates) < max_candidates:
+                heapq.heappush(candidates, entry)
+            elif entry[0] > candidates[0][0]:
+                heapq.heapreplace(candidates, entry)
+    items = []
+    for freed, key, k in sorted(candidates, key=lambda e: (-e[0], e[1], e[2])):
+        chain = index.chains[key]
+        items.append({
+            "SnapshotId": chain.snapshot_id(k),
+            "StartTime": _iso(chain.times[k]),
+            "VolumeId": key if key.startswith("vol-") else COPIED_VOLUME,
+            "VolumeSize": round(chain.sizes[k] / GIB),
+            "StorageTier": "archive" if chain.archived(k) else "standard",
+            "reason": "orphan" if key in orphan_keys else "age",
+            "estimatedReclaimableGiB": _gib(freed),
+        })
+    return {
+        "totalSnapshots": index.snapshots,
+        "chains": len(index.chains),
+        "copiedSnapshots": copies,
+        "olderThanThreshold": older,
+        "deletableSnapshots": deletable_count,
+        "orphanChains": orphan_chains,
+        "orphanSnapshots": orphan_snapshots,
+        "amiReferencedSnapshots": len(ami_refs),
+        "estimatedStoredGiB": {"standard": _gib(totals["standard"]), "archive": _gib(totals["archive"])},
+        "estimatedReclaimableGiB": {"orphans": _gib(totals["orphan"]), "olderThanThreshold": _gib(totals["aged"])},
+        "estimatedMonthlySavings": round(totals["cost"], 2),
+        "orphans": [{"VolumeId": key, "snapshots": s["snapshots"], "oldest": _iso(s["oldest"]),
+                     "newest": _iso(s["newest"]), "estimatedReclaimableGiB": _gib(s["reclaimableBytes"])}
+                    for _, key, s in sorted(orphans, key=lambda e: (-e[0], e[1]))],
+        "candidates": items,
+    }
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 """
 Suggest spot diversification by listing recent spot price history for a given instance type.
+- --types / --from-inventory rank every (type, AZ) pool of many types instead (spot_analytics.py: streamed
+  history, hourly statistics, savings vs on-demand, interruption proxy and a diversified pool selection)
 """
 from __future__ import annotations
 
@@ -8,7 +10,9 @@ import argparse
 from datetime import datetime, timedelta, timezone
 from typing import Any, Dict
 
-from common import aws_base, ensure_region, shell_json, with_region, write_stdout_json
+import spot_analytics
+from common import add_region_args, aws_base, collect_regions, ensure_region, shell_json, with_region, write_stdout_json
+from inventory import add_inventory_args
 
 
 def spot_prices(region: str, instance_type: str, days: int = 3) -> Dict[str, Any]:
@@ -37,10 +41,15 @@ def spot_prices(region: str, instance_type: str, days: int = 3) -> Dict[str, Any
 
 def main() -> None:
     ap = argparse.ArgumentParser()
-    ap.add_argument("--region", default=None)
+    add_region_args(ap)
     ap.add_argument("--type", default="m6g.large")
+    add_inventory_args(ap)
+    spot_analytics.add_analytics_args(ap)
     args = ap.parse_args()
-    write_stdout_json(spot_prices(ensure_region(args.region), args.type))
+    if args.types or args.from_inventory:
+        write_stdout_json(collect_regions(args, lambda region: spot_analytics.run_from_args(args, region)))
+    else:
+        write_stdout_json(spot_prices(ensure_region(args.region), args.type))
 
 
 if __name__ == "__main__":
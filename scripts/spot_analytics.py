@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Spot price analytics across many instance types and AZs ("pools").
+- describe-spot-price-history is streamed page by page for batches of types on a bounded pool of workers;
+  each price point is appended to its pool's compact (timestamp, price) arrays, never kept as a record
+- Prices are step functions (a price holds until the next change), so every pool is resampled to an hourly
+  grid and the statistics are one vectorized pass over the pools x hours matrix: mean, p95, min/max,
+  volatility (std / mean), changes per day, savings vs on-demand and an interruption proxy
+- Interruption proxy: share of hours priced above SPIKE x the pool's median or NEAR_ON_DEMAND x on-demand,
+  the conditions under which capacity tends to be reclaimed; AWS publishes no per-pool interruption data
+- Pools are ranked by score = savings x (1 - interruption proxy) / (1 + volatility), and a diversified set
+  takes the best pools with at most `per_type` per instance type and spread across AZs
+"""
+from __future__ import annotations
+
+import argparse
+import contextvars
+import json
+import math
+import threading
+from array import array
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from common import add_region_args, aws_base, collect_regions, iter_paginate, shell_json, with_region, write_stdout_json
+from cost_store import np
+from inventory import add_inventory_args, resources
+
+HOUR = 3600
+SPIKE = 1.25
+NEAR_ON_DEMAND = 0.9
+PRODUCT = "Linux/UNIX"
+PRICING_REGION = "us-east-1"  # the Price List API is only served from a few regions
+Pool = Tuple[str, str]
+
+
+def _epoch(stamp: Any) -> int:
+    if isinstance(stamp, (int, float)):
+        return int(stamp)
+    value = datetime.fromisoformat(str(stamp).replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+class SpotHistory:
+    """Price points per (instance type, AZ) in flat arrays: 16 bytes per point instead of a JSON record."""
+
+    def __init__(self) -> None:
+        self.pools: Dict[Pool, Tuple[Any, Any]] = {}
+        self.records = 0
+        self._guard = threading.Lock()
+
+    def add(self, instance_type: str, az: str, stamp: Any, price: Any) -> None:
+        cols = self.pools.get((instance_type, az))
+        if cols is None:
+            cols = self.pools.setdefault((instance_type, az), (array("q"), array("d")))
+        cols[0].append(_epoch(stamp))
+        cols[1].append(float(price))
+        self.records += 1
+
+    def merge(self, other: "SpotHistory") -> None:
+        with self._guard:
+            for pool, (ts, prices) in other.pools.items():
+                mine = self.pools.setdefault(pool, (array("q"), array("d")))
+                mine[0].extend(ts)
+                mine[1].extend(prices)
+            self.records += other.records
+
+    def nbytes(self) -> int:
+        return sum(ts.itemsize * len(ts) + p.itemsize * len(p) for ts, p in self.pools.values())
+
+
+def _history_cmd(region: str, types: Sequence[str], start: datetime, end: datetime, product: str) -> List[str]:
+    return with_region(aws_base() + [
+        "ec2", "describe-spot-price-history", "--instance-types", *types,
+        "--product-descriptions", product,
+        "--start-time", start.isoformat(), "--end-time", end.isoformat(),
+    ], region)
+
+
+def _select(item: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    return item.get("InstanceType", ""), item.get("AvailabilityZone", ""), item.get("Timestamp", ""), item.get("SpotPrice", "0")
+
+
+def collect_history(
+    region: str, types: Sequence[str], days: int = 30, product: str = PRODUCT, batch: int = 10,
+    max_workers: int = 4, end: Optional[datetime] = None,
+) -> Tuple[SpotHistory, datetime, datetime]:
+    """
+    Streams the history of `types` (batches of `batch` types per paginated query, `max_workers` queries at once).
+    The API also returns the price in effect at the start time, so every pool has a value from the first hour.
+    """
+    end = end or datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    history = SpotHistory()
+    batches = [list(types[i:i + batch]) for i in range(0, len(types), batch)]
+
+    def one(chunk: List[str]) -> SpotHistory:
+        part = SpotHistory()
+        for rec in iter_paginate(_history_cmd(region, chunk, start, end, product), "SpotPriceHistory",
+                                 page_items=1000, select=_select, prefetch=1):
+            part.add(*rec)
+        return part
+
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as pool:
+            for part in pool.map(lambda c: contextvars.copy_context().run(one, c), batches):
+                history.merge(part)
+    return history, start, end
+
+
+def on_demand_prices(region: str, types: Iterable[str], max_workers: int = 4) -> Dict[str, float]:
+    """Linux shared-tenancy on-demand $/h per type from the Price List API; types it cannot price are left out."""
+
+    def one(itype: str) -> Tuple[str, Optional[float]]:
+        filters = {"instanceType": itype, "regionCode": region, "operatingSystem": "Linux", "tenancy": "Shared",
+                   "preInstalledSw": "NA", "capacitystatus": "Used", "licenseModel": "No License required"}
+        cmd = with_region(aws_base() + ["pricing", "get-products", "--service-code", "AmazonEC2", "--filters"]
+                          + [f"Type=TERM_MATCH,Field={k},Value={v}" for k, v in filters.items()], PRICING_REGION)
+        try:
+            doc = shell_json(cmd)
+        except Exception:
+            return itype, None
+        prices = []
+        for raw in doc.get("PriceList") or []:
+            product = json.loads(raw) if isinstance(raw, str) else raw
+            for term in ((product.get("terms") or {}).get("OnDemand") or {}).values():
+                for dim in (term.get("priceDimensions") or {}).values():
+                    usd = float((dim.get("pricePerUnit") or {}).get("USD", 0) or 0)
+                    if usd > 0:
+                        prices.append(usd)
+        return itype, min(prices) if prices else None
+
+    types = sorted(set(types))
+    out: Dict[str, float] = {}
+    if types:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(types)))) as pool:
+            for itype, price in pool.map(lambda t: contextvars.copy_context().run(one, t), types):
+                if price is not None:
+                    out[itype] = price
+    return out
+
+
+# --- statistics ----------------------------------------------------------------------------------------------
+
+def hourly_matrix(history: SpotHistory, start: int, end: int) -> Tuple[List[Pool], Any, List[int]]:
+    """
+    -> (pools, pools x hours prices on the grid start, start+1h, ..., price changes per pool in the window).
+    Each hour takes the last price at or before it; hours before a pool's first point take that first price.
+    """
+    pools = sorted(history.pools)
+    grid = list(range(start, end, HOUR))
+    changes: List[int] = []
+    rows: List[Any] = []
+    for pool in pools:
+        ts, prices = history.pools[pool]
+        if np is not None:
+            t, p = np.asarray(ts), np.asarray(prices)
+            order = np.argsort(t, kind="stable")
+            t, p = t[order], p[order]
+            idx = np.clip(np.searchsorted(t, np.asarray(grid), side="right") - 1, 0, len(t) - 1)
+            rows.append(p[idx])
+            inside = p[(t >= start) & (t < end)]
+            changes.append(int((np.diff(inside) != 0).sum()) if len(inside) > 1 else 0)
+        else:
+            pts = sorted(zip(ts, prices))
+            t = [x for x, _ in pts]
+            rows.append([pts[max(bisect_right(t, g) - 1, 0)][1] for g in grid])
+            inside = [pr for x, pr in pts if start <= x < end]
+            changes.append(sum(1 for a, b in zip(inside, inside[1:]) if a != b))
+    matrix = np.vstack(rows) if np is not None and rows else rows
+    return pools, matrix, changes
+
+
+def pool_stats(pools: Sequence[Pool], matrix: Any, changes: Sequence[int], on_demand: Dict[str, float]) -> List[Dict[str, Any]]:
+    """Per pool statistics over the hourly matrix; vectorized across pools with numpy."""
+    if not len(pools):
+        return []
+    hours = len(matrix[0])
+    od = [on_demand.get(itype) for itype, _ in pools]
+    if np is not None:
+        m = np.asarray(matrix, dtype=np.float64)
+        mean, std = m.mean(axis=1), m.std(axis=1)
+        median, p95 = np.median(m, axis=1), np.percentile(m, 95, axis=1)
+        od_arr = np.array([v if v else np.nan for v in od])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            risky = (m > SPIKE * median[:, None]) | (m >= NEAR_ON_DEMAND * od_arr[:, None])
+            cols = {
+                "mean": mean, "p95": p95, "min": m.min(axis=1), "max": m.max(axis=1), "last": m[:, -1],
+                "volatility": np.where(mean > 0, std / np.where(mean > 0, mean, 1), 0.0),
+                "interruptionProxy": risky.mean(axis=1),
+                "savingsVsOnDemand": 1 - mean / od_arr,
+            }
+        cols = {k: v.tolist() for k, v in cols.items()}
+    else:
+        cols = {k: [] for k in ("mean", "p95", "min", "max", "last", "volatility", "interruptionProxy",
+                                "savingsVsOnDemand")}
+        for row, o in zip(matrix, od):
+            srt = sorted(row)
+            mean = sum(row) / hours
+            std = math.sqrt(sum((x - mean) ** 2 for x in row) / hours)
+            median = (srt[(hours - 1) // 2] + srt[hours // 2]) / 2
+            pos = 0.95 * (hours - 1)
+            lo = int(pos)
+            p95 = srt[lo] + (srt[min(lo + 1, hours - 1)] - srt[lo]) * (pos - lo)
+            risky = sum(1 for x in row if x > SPIKE * median or (o and x >= NEAR_ON_DEMAND * o))
+            for k, v in (("mean", mean), ("p95", p95), ("min", srt[0]), ("max", srt[-1]), ("last", row[-1]),
+                         ("volatility", std / mean if mean > 0 else 0.0), ("interruptionProxy", risky / hours),
+                         ("savingsVsOnDemand", 1 - mean / o if o else float("nan"))):
+                cols[k].append(v)
+    days = hours / 24
+    out = []
+    for i, (itype, az) in enumerate(pools):
+        savings = cols["savingsVsOnDemand"][i]
+        known = savings == savings  # NaN when the on-demand price is unknown
+        rec: Dict[str, Any] = {"instanceType": itype, "availabilityZone": az}
+        rec.update({k: round(cols[k][i], 6) for k in ("mean", "p95", "min", "max", "last")})
+        rec.update({
+            "volatility": round(cols["volatility"][i], 4),
+            "changesPerDay": round(changes[i] / days, 2) if days else 0.0,
+            "interruptionProxy": round(cols["interruptionProxy"][i], 4),
+            "onDemand": od[i],
+            "savingsVsOnDemand": round(savings, 4) if known else None,
+        })
+        # Without an on-demand price, rank on stability alone.
+        rec["score"] = round((savings if known else 1.0) * (1 - rec["interruptionProxy"]) / (1 + rec["volatility"]), 4)
+        out.append(rec)
+    out.sort(key=lambda r: r["score"], reverse=True)
+    return out
+
+
+def diversify(ranked: Sequence[Dict[str, Any]], count: int = 10, per_type: int = 2) -> List[Dict[str, Any]]:
+    """
+    Best pools with at most `per_type` per instance type, spread across AZs: a first pass also caps each AZ at
+    its even share of `count`, a second pass fills what is left by score alone.
+    """
+    candidates = [r for r in ranked if r["score"] > 0]
+    az_cap = math.ceil(count / max(len({r["availabilityZone"] for r in candidates}), 1))
+    picked: List[Dict[str, Any]] = []
+    per: Dict[str, int] = {}
+    azs: Dict[str, int] = {}
+    for spread in (True, False):
+        for r in candidates:
+            if len(picked) >= count:
+                return picked
+            if r in picked or per.get(r["instanceType"], 0) >= per_type:
+                continue
+            if spread and azs.get(r["availabilityZone"], 0) >= az_cap:
+                continue
+            picked.append(r)
+            per[r["instanceType"]] = per.get(r["instanceType"], 0) + 1
+            azs[r["availabilityZone"]] = azs.get(r["availabilityZone"], 0) + 1
+    return picked
+
+
+def analyze(history: SpotHistory, start: datetime, end: datetime, on_demand: Dict[str, float],
+            top: int = 50, count: int = 10, per_type: int = 2) -> Dict[str, Any]:
+    s, e = _epoch(start.isoformat()), _epoch(end.isoformat())
+    pools, matrix, changes = hourly_matrix(history, s - s % HOUR, e - e % HOUR)
+    ranked = pool_stats(pools, matrix, changes, on_demand)
+    by_type: Dict[str, Dict[str, Any]] = {}
+    for r in ranked:  # ranked order: the first pool seen for a type is its best
+        t = by_type.setdefault(r["instanceType"], {"pools": 0, "bestAz": r["availabilityZone"], "bestScore": r["score"],
+                                                   "savingsVsOnDemand": r["savingsVsOnDemand"]})
+        t["pools"] += 1
+    return {
+        "window": {"start": start.isoformat(), "end": end.isoformat(), "hours": len(matrix[0]) if len(pools) else 0},
+        "types": len(by_type),
+        "pools": len(pools),
+        "records": history.records,
+        "historyBytes": history.nbytes(),
+        "diversified": diversify(ranked, count, per_type),
+        "ranked": ranked[:top] if top else ranked,
+        "byType": dict(sorted(by_type.items())),
+    }
+
+
+def stream_records(records: Iterable[Tuple[str, str, Any, Any]]) -> SpotHistory:
+    """A SpotHistory from (type, AZ, timestamp, price) tuples, e.g. a saved describe-spot-price-history."""
+    history = SpotHistory()
+    for rec in records:
+        history.add(*rec)
+    return history
+
+
+def fleet_types(inventory: Optional[str], region: str) -> List[str]:
+    return sorted({i.get("InstanceType") for i in resources(inventory, "ec2:instance", region) if i.get("InstanceType")})
+
+
+def run(region: str, types: Sequence[str], days: int = 30, on_demand: Optional[Dict[str, float]] = None,
+        batch: int = 10, max_workers: int = 4, top: int = 50, count: int = 10, per_type: int = 2) -> Dict[str, Any]:
+    history, start, end = collect_history(region, types, days, batch=batch, max_workers=max_workers)
+    prices = dict(on_demand) if on_demand is not None else on_demand_prices(region, types, max_workers)
+    out = analyze(history, start, end, prices, top, count, per_type)
+    out["region"] = region
+    out["requestedTypes"] = len(types)
+    return out
+
+
+def add_analytics_args(ap: Any) -> None:
+    ap.add_argument("--types", default=None, help="Comma-separated instance types to analyze")
+    ap.add_argument("--from-inventory", action="store_true", help="Analyze every instance type running in the fleet")
+    ap.add_argument("--days", type=int, default=30)
+    ap.add_argument("--on-demand", default=None, help='JSON {"m5.large": 0.096, ...}; default: Price List API')
+    ap.add_argument("--batch", type=int, default=10, help="Instance types per paginated history query")
+    ap.add_argument("--workers", type=int, default=4, help="History queries in flight")
+    ap.add_argument("--top", type=int, default=50, help="Ranked pools to print (0 = all)")
+    ap.add_argument("--pools", type=int, default=10, help="Size of the diversified selection")
+    ap.add_argument("--per-type", type=int, default=2, help="Max pools per instance type in that selection")
+
+
+def run_from_args(args: Any, region: str) -> Dict[str, Any]:
+    types = [t.strip() for t in (args.types or "").split(",") if t.strip()]
+    if args.from_inventory:
+        types = sorted(set(types) | set(fleet_types(getattr(args, "inventory", None), region)))
+    on_demand = None
+    if args.on_demand:
+        with open(args.on_demand, "r", encoding="utf-8") as f:
+            on_demand = json.load(f)
+    return run(region, types, args.days, on_demand, args.batch, args.workers, args.top, args.pools, args.per_type)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    add_region_args(ap)
+    add_inventory_args(ap)
+    add_analytics_args(ap)
+    args = ap.parse_args()
+    write_stdout_json(collect_regions(args, lambda region: run_from_args(args, region)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,75 @@
 #!/usr/bin/env python3
 """
-Check tag compliance across core services for required keys: CostCenter, Owner, Environment, Application.
+Check tag compliance of every taggable resource in a region against a tag policy (tag_policy.py).
+- Default policy: required keys CostCenter, Owner, Environment, Application; --policy adds value regexes and
+  per-resource-type overrides
+- One streaming pass of the Resource Groups Tagging API; --out writes every offender (--all: every resource) as JSONL
+- The Tagging API omits resources that never had a tag: --include-untagged adds EC2 instances, EBS volumes and S3
+  buckets from the inventory / bucket scan that the pass did not return
 """
 from __future__ import annotations
 
 import argparse
-from typing import Any, Dict, List
+import contextlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from common import aws_base, ensure_region, paginate, with_region, write_stdout_json
+from common import ensure_region, write_stdout_json
+from inventory import add_inventory_args, resources
+from s3_scan import load_or_scan
+from tag_policy import Evaluation, TagPolicy, evaluate_mappings, tagged_resources
 
-REQUIRED = {"CostCenter", "Owner", "Environment", "Application"}
+UNTAGGED_TYPES = ("ec2:instance", "ec2:volume", "s3:bucket")
 
 
-def missing(required: set, tags: List[Dict[str, str]]) -> List[str]:
-    present = {t.get("Key") for t in (tags or [])}
-    return sorted(list(required - present))
+def _tags(tags: Optional[List[Dict[str, str]]]) -> Dict[str, str]:
+    return {t.get("Key"): t.get("Value", "") for t in tags or [] if t.get("Key")}
 
 
-def ec2_instances(region: str) -> List[Dict[str, Any]]:
-    res = paginate(with_region(aws_base() + ["ec2", "describe-instances", "--max-results", "1000"], region), result_key="Reservations")
-    items: List[Dict[str, Any]] = []
-    for r in res:
-        for i in r.get("Instances", []):
-            items.append({"id": i.get("InstanceId"), "type": "ec2", "missing": missing(REQUIRED, i.get("Tags", []))})
-    return items
-
-
-def ebs_volumes(region: str) -> List[Dict[str, Any]]:
-    vols = paginate(with_region(aws_base() + ["ec2", "describe-volumes", "--max-results", "500"], region), result_key="Volumes")
-    return [{"id": v.get("VolumeId"), "type": "ebs", "missing": missing(REQUIRED, v.get("Tags", []))} for v in vols]
-
-
-def s3_buckets(region: str) -> List[Dict[str, Any]]:
-    # S3 tagging via get-bucket-tagging per bucket
-    out: List[Dict[str, Any]] = []
-    import subprocess, json
-    code, stdout = subprocess.getstatusoutput("aws s3api list-buckets --output json")
-    if code == 0:
-        for b in json.loads(stdout).get("Buckets", []):
-            name = b.get("Name")
-            if not name:
-                continue
-            # ignore errors (no tags)
-            rc, so = subprocess.getstatusoutput(
-                f"aws s3api get-bucket-tagging --bucket {name} --output json 2>/dev/null || echo '{{}}'"
-            )
-            try:
-                tags = json.loads(so).get("TagSet", [])
-            except Exception:
-                tags = []
-            out.append({"id": name, "type": "s3", "missing": missing(REQUIRED, tags)})
-    return out
+def untagged_candidates(region: str, inventory: Optional[str], bucket_scan: Optional[str]
+                        ) -> Iterator[Tuple[str, str, Dict[str, str]]]:
+    """(type, id, tags) of EC2 instances, EBS volumes and S3 buckets from the inventory and bucket scan."""
+    for i in resources(inventory, "ec2:instance", region):
+        yield "ec2:instance", i.get("InstanceId"), _tags(i.get("Tags"))
+    for v in resources(inventory, "ec2:volume", region):
+        yield "ec2:volume", v.get("VolumeId"), _tags(v.get("Tags"))
+    for b in load_or_scan(bucket_scan, ["tagging"], 16).get("buckets", []):
+        yield "s3:bucket", b["name"], _tags(b.get("tagging"))
 
 
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--region", default=None)
+    ap.add_argument("--policy", default=None, help="Tag policy JSON (see tag_policy.py); default: the four required keys")
+    ap.add_argument("--resource-types", default=None, help="Comma-separated Tagging API filters, e.g. ec2:instance,s3")
+    ap.add_argument("--out", default=None, help="Write every non-compliant resource here as JSONL")
+    ap.add_argument("--all", action="store_true", help="With --out, also write compliant resources")
+    ap.add_argument("--max-items", type=int, default=500, help="Non-compliant items to include in the output")
+    ap.add_argument("--include-untagged", action="store_true",
+                    help="Also check EC2/EBS/S3 resources the Tagging API does not return (never tagged)")
+    ap.add_argument("--bucket-scan", default=None, help="Reuse an s3_scan.py result instead of scanning again")
+    add_inventory_args(ap)
     args = ap.parse_args()
     region = ensure_region(args.region)
-    items = ec2_instances(region) + ebs_volumes(region) + s3_buckets(region)
-    non_compliant = [i for i in items if i.get("missing")]
-    write_stdout_json({"region": region, "checked": len(items), "nonCompliant": len(non_compliant), "items": non_compliant[:500]})
+    policy = TagPolicy.load(args.policy)
+    types = [t.strip() for t in (args.resource_types or "").split(",") if t.strip()] or None
+    with contextlib.ExitStack() as stack:
+        out = stack.enter_context(open(args.out, "w", encoding="utf-8")) if args.out else None
+        evaluation = Evaluation(out, args.max_items, args.all)
+        wanted = [t for t in UNTAGGED_TYPES if not types or t in types or t.split(":")[0] in types]
+        seen: Optional[Dict[str, set]] = {t: set() for t in wanted} if args.include_untagged else None
+        evaluate_mappings(policy, tagged_resources(region, types), evaluation, seen)
+        added = 0
+        if seen is not None:
+            for rtype, rid, tags in untagged_candidates(region, args.inventory, args.bucket_scan):
+                if rid and rtype in seen and rid not in seen[rtype]:
+                    evaluation.add(rtype, rid, policy.for_type(rtype), tags)
+                    added += 1
+    result: Dict[str, Any] = {"region": region, "rules": policy.rule_count(), **evaluation.summary()}
+    if seen is not None:
+        result["untaggedAdded"] = added
+    if args.out:
+        result["output"] = args.out
+    write_stdout_json(result)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Tag policy engine: rules are compiled once per resource type and evaluated over one streaming pass of the
+Resource Groups Tagging API (every taggable resource type in the region, 100 per page).
+- Policy JSON: {"required": [keys], "values": {key: regex}, "overrides": {"ec2:instance" | "ec2:*": {...}}}
+  An override may replace "required", drop keys via "optional", add or replace "values", or "skip" the type.
+  Overrides apply service-wide ("ec2:*") first, then per type ("ec2:volume")
+- Values must fully match their regex; a key with a value rule that is absent is only reported as missing
+  when it is also required
+- A (key, value) pair that passes is remembered, so once the common values have been seen a resource costs two
+  set operations on its tags (required keys missing, pairs not known to pass), whatever the number of rules
+- Results stream to a JSONL file as they are evaluated; only counters and the first N offenders stay in memory
+"""
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from common import aws_base, iter_paginate, with_region
+
+DEFAULT_POLICY: Dict[str, Any] = {"required": ["Application", "CostCenter", "Environment", "Owner"]}
+# ARNs whose resource part is a bare name (arn:aws:s3:::bucket).
+BARE_RESOURCE_TYPES = {"s3": "bucket", "sns": "topic", "sqs": "queue"}
+VERDICT_CACHE = 1_000_000  # (key, value) pairs remembered per resource type
+
+
+@dataclass
+class Rules:
+    """Effective rules for one resource type."""
+
+    required: FrozenSet[str]
+    values: Dict[str, Any]  # key -> compiled regex
+    skip: bool = False
+    # (key, value) pairs known to pass, so a resource whose pairs are all known costs one C-level superset test,
+    # and pairs known to fail. Capped so unique values (Name tags) cannot grow them without bound.
+    _good: set = field(default_factory=set, repr=False)
+    _bad: set = field(default_factory=set, repr=False)
+
+    def check(self, tags: Dict[str, str]) -> Tuple[List[str], List[str]]:
+        """(missing required keys, keys whose value fails its regex) for one resource's tags."""
+        missing = self.required.difference(tags)
+        invalid: List[str] = []
+        if self.values and not self._good.issuperset(tags.items()):
+            good, bad = self._good, self._bad
+            remember = len(good) + len(bad) < VERDICT_CACHE
+            for pair in tags.items():
+                if pair in good:
+                    continue
+                if pair in bad:
+                    invalid.append(pair[0])
+                    continue
+                rx = self.values.get(pair[0])
+                if rx is not None and rx.fullmatch(pair[1]) is None:
+                    invalid.append(pair[0])
+                    if remember:
+                        bad.add(pair)
+                elif remember:
+                    good.add(pair)
+            invalid.sort()
+        return sorted(missing) if missing else [], invalid
+
+
+class TagPolicy:
+    def __init__(self, doc: Optional[Dict[str, Any]] = None) -> None:
+        doc = doc or DEFAULT_POLICY
+        self.required = frozenset(doc.get("required") or [])
+        self.values = {k: re.compile(v) for k, v in (doc.get("values") or {}).items()}
+        self.overrides: Dict[str, Dict[str, Any]] = {}
+        for pattern, spec in (doc.get("overrides") or {}).items():
+            self.overrides[pattern[:-2] if pattern.endswith(":*") else pattern] = {
+                **spec, "values": {k: re.compile(v) for k, v in (spec.get("values") or {}).items()},
+            }
+        self._rules: Dict[str, Rules] = {}
+
+    @classmethod
+    def load(cls, path: Optional[str]) -> "TagPolicy":
+        if not path:
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def rule_count(self) -> int:
+        return len(self.required) + len(self.values) + sum(
+            len(o.get("required") or []) + len(o.get("optional") or []) + len(o["values"]) + bool(o.get("skip"))
+            for o in self.overrides.values())
+
+    def for_type(self, rtype: str) -> Rules:
+        """Rules for `rtype` ("service:type"), compiled on first use."""
+        rules = self._rules.get(rtype)
+        if rules is None:
+            required, values, skip = set(self.required), dict(self.values), False
+            for spec in (self.overrides.get(rtype.split(":")[0]), self.overrides.get(rtype)):
+                if not spec:
+                    continue
+                if "required" in spec:
+                    required = set(spec["required"])
+                required -= set(spec.get("optional") or [])
+                values.update(spec["values"])
+                skip = bool(spec.get("skip", skip))
+            rules = self._rules[rtype] = Rules(frozenset(required), values, skip)
+        return rules
+
+
+def parse_arn(arn: str) -> Tuple[str, str, str]:
+    """(resource type "service:type", resource id, region) of an ARN."""
+    parts = arn.split(":", 5)
+    if len(parts) < 6:
+        return "unknown", arn, ""
+    service, region, resource = parts[2], parts[3], parts[5]
+    for sep in ("/", ":"):
+        if sep in resource:
+            rtype, rid = resource.split(sep, 1)
+            return f"{service}:{rtype}", rid, region
+    return f"{service}:{BARE_RESOURCE_TYPES.get(service, service)}", resource, region
+
+
+def tagged_resources(region: str, resource_types: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    """Streams get-resources (ResourceARN + Tags) for the region; only resources that have or had tags appear."""
+    cmd = aws_base() + ["resourcegroupstaggingapi", "get-resources"]
+    if resource_types:
+        cmd += ["--resource-type-filters", *resource_types]
+    return iter_paginate(with_region(cmd, region), "ResourceTagMappingList", page_items=100, prefetch=2)
+
+
+class Evaluation:
+    """Counters plus the first `keep` offenders; every evaluated resource goes to `out` when given."""
+
+    def __init__(self, out: Optional[TextIO] = None, keep: int = 500, write_compliant: bool = False) -> None:
+        self.out, self.keep, self.write_compliant = out, keep, write_compliant
+        self.checked = 0
+        self.non_compliant = 0
+        self.skipped = 0
+        self.by_type: Dict[str, Dict[str, int]] = {}
+        self.missing_by_key: Dict[str, int] = {}
+        self.invalid_by_key: Dict[str, int] = {}
+        self.items: List[Dict[str, Any]] = []
+
+    def add(self, rtype: str, rid: str, rules: Rules, tags: Dict[str, str], arn: Optional[str] = None) -> None:
+        if rules.skip:
+            self.skipped += 1
+            return
+        missing, invalid = rules.check(tags)
+        self.checked += 1
+        counts = self.by_type.get(rtype)
+        if counts is None:
+            counts = self.by_type[rtype] = {"checked": 0, "nonCompliant": 0}
+        counts["checked"] += 1
+        if not missing and not invalid:
+            if self.out is not None and self.write_compliant:
+                self.out.write(json.dumps({"type": rtype, "id": rid, "arn": arn, "compliant": True}) + "\n")
+            return
+        self.non_compliant += 1
+        counts["nonCompliant"] += 1
+        for k in missing:
+            self.missing_by_key[k] = self.missing_by_key.get(k, 0) + 1
+        for k in invalid:
+            self.invalid_by_key[k] = self.invalid_by_key.get(k, 0) + 1
+        item: Dict[str, Any] = {"id": rid, "type": rtype, "missing": missing}
+        if invalid:
+            item["invalid"] = {k: tags[k] for k in invalid}
+        if arn:
+            item["arn"] = arn
+        if self.out is not None:
+            self.out.write(json.dumps(item) + "\n")
+        if len(self.items) < self.keep:
+            self.items.append(item)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "checked": self.checked,
+            "nonCompliant": self.non_compliant,
+            "skipped": self.skipped,
+            "byType": dict(sorted(self.by_type.items())),
+            "missingByKey": dict(sorted(self.missing_by_key.items(), key=lambda kv: -kv[1])),
+            "invalidByKey": dict(sorted(self.invalid_by_key.items(), key=lambda kv: -kv[1])),
+            "items": self.items,
+        }
+
+
+def evaluate_mappings(policy: TagPolicy, mappings: Iterable[Dict[str, Any]], evaluation: Evaluation,
+                      seen: Optional[Dict[str, set]] = None) -> Evaluation:
+    """
+    One pass over get-resources items. `seen` ({resource type: set()}) collects the ids of those types so a
+    later pass over other sources can add the resources the Tagging API never returned.
+    """
+    for m in mappings:
+        arn = m.get("ResourceARN", "")
+        rtype, rid, _ = parse_arn(arn)
+        tags = {t["Key"]: t["Value"] for t in m.get("Tags") or ()}
+        evaluation.add(rtype, rid, policy.for_type(rtype), tags, arn)
+        if seen is not None and rtype in seen:
+            seen[rtype].add(rid)
+    return evaluation
@@ -0,0 +1,25 @@
+"""Shared fixtures: the scripts directory is not a package, so it goes on sys.path like the collectors run it."""
+from __future__ import annotations
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import common  # noqa: E402
+
+
+@pytest.fixture
+def aws_state(monkeypatch):
+    """Fresh call counters, rate limiters and retry policy, no response cache; backend restored afterwards."""
+    monkeypatch.delenv("AWS_COLLECTOR_CACHE", raising=False)
+    monkeypatch.setattr(common, "STATS", common.CallStats())
+    monkeypatch.setattr(common, "_buckets", {})
+    monkeypatch.setattr(common, "_backend", None)
+    monkeypatch.setattr(common, "_retry_policy", common.RetryPolicy(max_attempts=4, base_delay=0.01, max_delay=0.05))
+    monkeypatch.setattr(common.random, "uniform", lambda lo, hi: hi)  # deterministic backoff: the full delay
+    common.set_cache(None)
+    yield common
+    common.set_cache(None)
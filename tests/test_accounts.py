@@ -0,0 +1,117 @@
+"""CredentialCache and run_across_accounts against a stand-in STS and a fake clock."""
+from __future__ import annotations
+
+import threading
+from datetime import datetime, timezone
+
+import pytest
+
+import accounts
+import inventory
+
+ME = "111111111111"
+MEMBERS = ["222222222222", "333333333333"]
+DURATION = 3600
+
+
+class Clock:
+    def __init__(self, now: float = 1_750_000_000.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class StandInSTS:
+    """
+    assume-role hands out AKIA<account> keys expiring DURATION after the clock; get-caller-identity is ME.
+    Everything else is describe-instances, answered with one instance named after the caller's access key.
+    """
+
+    name = "fake"
+
+    def __init__(self, clock: Clock) -> None:
+        self.clock = clock
+        self.assumed = []
+        self.lock = threading.Lock()
+
+    def call(self, cmd, env=None):
+        if "assume-role" in cmd:
+            assert env is None, "assume-role must run with the caller's own credentials"
+            account = cmd[cmd.index("--role-arn") + 1].split(":")[4]
+            with self.lock:
+                self.assumed.append(account)
+            expiration = datetime.fromtimestamp(self.clock() + DURATION, timezone.utc).isoformat()
+            return {"Credentials": {"AccessKeyId": f"AKIA{account}", "SecretAccessKey": "secret",
+                                    "SessionToken": "token", "Expiration": expiration}}
+        if "get-caller-identity" in cmd:
+            return {"Account": ME}
+        key = (env or {}).get("AWS_ACCESS_KEY_ID", f"AKIA{ME}")
+        region = cmd[cmd.index("--region") + 1]
+        return {"Reservations": [{"Instances": [{"InstanceId": f"i-{key[4:]}-{region}"}]}]}
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def sts(aws_state, clock, monkeypatch):
+    monkeypatch.setattr(inventory, "_LOADED", {})
+    monkeypatch.setattr(inventory, "_FILLS", {})
+    backend = StandInSTS(clock)
+    aws_state.set_backend(backend)
+    return backend
+
+
+def test_one_assume_role_per_account_within_the_margin(sts, clock):
+    cache = accounts.CredentialCache("Audit", refresh_margin=300, clock=clock)
+    first = cache.get(MEMBERS[0])
+    assert first.access_key_id == f"AKIA{MEMBERS[0]}"
+    clock.now += DURATION - 301  # still outside the refresh margin
+    assert cache.get(MEMBERS[0]) is first
+    cache.get(MEMBERS[1])
+    assert sts.assumed == MEMBERS
+    assert cache.assume_calls == 2
+
+
+def test_credentials_are_refreshed_near_expiry(sts, clock):
+    cache = accounts.CredentialCache("Audit", refresh_margin=300, clock=clock)
+    first = cache.get(MEMBERS[0])
+    clock.now += DURATION - 299  # inside the margin
+    second = cache.get(MEMBERS[0])
+    assert second is not first and second.expiration > first.expiration
+    assert sts.assumed == [MEMBERS[0], MEMBERS[0]]
+
+
+def test_concurrent_requests_share_one_assume_role(sts, clock):
+    cache = accounts.CredentialCache("Audit", clock=clock)
+    threads = [threading.Thread(target=cache.get, args=(MEMBERS[0],)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sts.assumed == [MEMBERS[0]]
+
+
+def test_fn_runs_under_each_accounts_credentials(sts, clock, aws_state):
+    seen = set()
+
+    def fn(region):
+        env = aws_state.current_aws_env()
+        seen.add((env or {}).get("AWS_ACCESS_KEY_ID"))
+        # The shared inventory is what every EC2-side collector reads.
+        return [i["InstanceId"] for i in inventory.resources(None, "ec2:instance", region)]
+
+    cache = accounts.CredentialCache("Audit", clock=clock)
+    out = accounts.run_across_accounts(fn, [ME] + MEMBERS, "us-east-1,eu-west-1", cache, max_workers=4)
+    assert out["failed"] == []
+    for account in [ME] + MEMBERS:
+        assert out["accounts"][account]["regions"] == {
+            region: [f"i-{account}-{region}"] for region in ("eu-west-1", "us-east-1")
+        }
+    # The caller's own account runs with ambient credentials; members with their assumed ones.
+    assert seen == {None, *(f"AKIA{a}" for a in MEMBERS)}
+    assert sorted(sts.assumed) == MEMBERS
+    assert out["assumeRoleCalls"] == 2
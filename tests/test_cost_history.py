@@ -0,0 +1,102 @@
+"""Incremental cost history driven by an injected fetch and `today`: only missing or open days are re-queried."""
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+import cost_history
+from cost_history import CostHistory, coalesce
+
+
+class FakeCE:
+    """Daily periods for [start, end); CE still marks the last two days before `today` Estimated."""
+
+    def __init__(self, today: date) -> None:
+        self.today = today
+        self.windows = []
+
+    def __call__(self, start, end, metrics, group_by):
+        self.windows.append((start.isoformat(), end.isoformat()))
+        d = start
+        while d < end:
+            yield {
+                "TimePeriod": {"Start": d.isoformat(), "End": (d + timedelta(days=1)).isoformat()},
+                "Groups": [{"Keys": ["Amazon EC2"], "Metrics": {"UnblendedCost": {"Amount": "1.5", "Unit": "USD"}}}],
+                "Estimated": d >= self.today - timedelta(days=2),
+            }
+            d += timedelta(days=1)
+
+
+def _history(path, today):
+    ce = FakeCE(today)
+    return CostHistory(str(path), ["UnblendedCost"], ["SERVICE"], open_days=3, today=today, fetch=ce), ce
+
+
+def test_coalesce_merges_adjacent_days():
+    days = [date(2025, 10, d) for d in (4, 1, 2, 7, 5)]
+    assert coalesce(days) == [
+        (date(2025, 10, 1), date(2025, 10, 3)),
+        (date(2025, 10, 4), date(2025, 10, 6)),
+        (date(2025, 10, 7), date(2025, 10, 8)),
+    ]
+
+
+def test_second_run_refetches_only_open_days(tmp_path):
+    path = tmp_path / "daily_service_unblendedcost.json"
+    first_day = date(2025, 9, 30)
+    history, ce = _history(path, date(2025, 10, 10))
+    stats = history.update(first_day, history.today)
+    history.save()
+    assert ce.windows == [("2025-09-30", "2025-10-10")]
+    assert (stats["ceWindows"], stats["daysFetched"], stats["daysReused"]) == (1, 10, 0)
+
+    # Two days later: 10-08 and 10-09 were still Estimated, 10-10 and 10-11 were never fetched.
+    history, ce = _history(path, date(2025, 10, 12))
+    stats = history.update(date(2025, 10, 2), history.today)
+    assert ce.windows == [("2025-10-08", "2025-10-12")]
+    assert (stats["ceWindows"], stats["daysFetched"], stats["daysReused"]) == (1, 4, 6)
+    assert [p["TimePeriod"]["Start"] for p in history.results(date(2025, 10, 2), history.today)] == [
+        (date(2025, 10, 2) + timedelta(days=n)).isoformat() for n in range(10)
+    ]
+
+
+def test_gaps_are_backfilled_in_their_own_windows(tmp_path):
+    path = tmp_path / "daily_service_unblendedcost.json"
+    history, _ = _history(path, date(2025, 10, 20))
+    history.update(date(2025, 10, 1), history.today)
+    for day in ("2025-10-03", "2025-10-04", "2025-10-09"):  # lost, e.g. by a failed run
+        del history.days[day]
+    history.save()
+    history, ce = _history(path, date(2025, 10, 20))
+    stats = history.update(date(2025, 10, 1), history.today)
+    assert ce.windows == [("2025-10-03", "2025-10-05"), ("2025-10-09", "2025-10-10"), ("2025-10-18", "2025-10-20")]
+    assert stats["ceWindows"] == 3
+
+
+def _period(day, service):
+    return {"TimePeriod": {"Start": day, "End": ""}, "Groups": [{"Keys": [service], "Metrics": {}}]}
+
+
+class PagedCE:
+    """get-cost-and-usage in two pages, the second day's groups split across them."""
+
+    name = "fake"
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def call(self, cmd, env=None):
+        token = cmd[cmd.index("--next-page-token") + 1] if "--next-page-token" in cmd else None
+        self.calls.append(token)
+        if token is None:
+            return {"ResultsByTime": [_period("2025-10-01", "EC2"), _period("2025-10-02", "EC2")],
+                    "NextPageToken": "p2"}
+        return {"ResultsByTime": [_period("2025-10-02", "S3")]}
+
+
+def test_one_window_can_take_several_requests(aws_state):
+    backend = PagedCE()
+    aws_state.set_backend(backend)
+    periods = list(cost_history.fetch_cost_and_usage(date(2025, 10, 1), date(2025, 10, 3), ["UnblendedCost"],
+                                                     ["SERVICE"]))
+    assert backend.calls == [None, "p2"]
+    assert [[g["Keys"][0] for g in p["Groups"]] for p in periods] == [["EC2"], ["EC2", "S3"]]
@@ -0,0 +1,72 @@
+"""CostStore granularity: daily series only come out of DAILY cost data."""
+from __future__ import annotations
+
+import json
+
+import pytest
+
+import cost_anomaly
+import cost_forecast
+from cost_store import CostStore, day_number
+
+
+def _doc(periods, group_by=("SERVICE", "LINKED_ACCOUNT")):
+    return {
+        "GroupDefinitions": [{"Type": "DIMENSION", "Key": k} for k in group_by],
+        "ResultsByTime": [{
+            "TimePeriod": {"Start": start, "End": end},
+            "Groups": [{"Keys": list(keys), "Metrics": {"UnblendedCost": {"Amount": str(amount), "Unit": "USD"}}}
+                       for keys, amount in groups],
+        } for start, end, groups in periods],
+    }
+
+
+DAILY = _doc([
+    ("2025-10-01", "2025-10-02", [(("Amazon EC2", "111111111111"), 10.0), (("Amazon S3", "222222222222"), 2.0)]),
+    ("2025-10-03", "2025-10-04", [(("Amazon EC2", "111111111111"), 12.0)]),
+])
+MONTHLY = _doc([
+    ("2025-09-01", "2025-10-01", [(("111111111111",), 900.0)]),
+    ("2025-10-01", "2025-10-27", [(("111111111111",), 780.0)]),
+], group_by=("LINKED_ACCOUNT",))
+
+
+def test_daily_matrix_per_service_and_account():
+    store = CostStore.from_results(DAILY)
+    assert store.granularity == "DAILY"
+    keys, first_day, matrix = store.daily_matrix()
+    assert keys == [("Amazon EC2", "111111111111"), ("Amazon S3", "222222222222")]
+    assert first_day == day_number("2025-10-01")
+    assert [list(map(float, row)) for row in matrix] == [[10.0, 0.0, 12.0], [2.0, 0.0, 0.0]]
+
+
+def test_monthly_periods_are_refused():
+    store = CostStore.from_results(MONTHLY)
+    assert store.granularity == "MONTHLY"
+    with pytest.raises(ValueError, match="MONTHLY"):
+        store.daily_matrix()
+
+
+def test_granularity_survives_save_and_load(tmp_path):
+    path = str(tmp_path / "monthly.bin")
+    CostStore.from_results(MONTHLY).save(path)
+    loaded = CostStore.load(path)
+    assert loaded.granularity == "MONTHLY"
+    with pytest.raises(ValueError):
+        loaded.daily_matrix()
+
+
+def test_anomaly_run_reports_monthly_source(tmp_path):
+    path = tmp_path / "cost_by_account_90d.json"
+    path.write_text(json.dumps(MONTHLY))
+    out = cost_anomaly.run("account", str(tmp_path))
+    assert "MONTHLY" in out["error"]
+    assert "anomalies" not in out
+
+
+def test_forecast_run_reports_monthly_source(tmp_path):
+    path = tmp_path / "cost_by_account_90d.json"
+    path.write_text(json.dumps(MONTHLY))
+    out = cost_forecast.run("account", str(tmp_path))
+    assert "MONTHLY" in out["error"]
+    assert "ForecastResultsByTime" not in out
@@ -0,0 +1,106 @@
+"""GetMetricData batching, the q<row>_<metric> id mapping and --record/--replay, against fake backends."""
+from __future__ import annotations
+
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import cw_metrics
+
+END = datetime(2025, 10, 1, tzinfo=timezone.utc)
+START = int((END - timedelta(days=1)).timestamp())
+
+
+class MetricsBackend:
+    """get-metric-data: every query gets 24 hourly datapoints valued row * 10 + metric index."""
+
+    name = "fake"
+
+    def __init__(self) -> None:
+        self.batches = []
+
+    def call(self, cmd, env=None):
+        queries = json.loads(cmd[cmd.index("--metric-data-queries") + 1])
+        self.batches.append(len(queries))
+        stamps = [START + h * 3600 for h in range(24)]
+        results = []
+        for q in queries:
+            row, m = map(int, q["Id"][1:].split("_"))
+            results.append({"Id": q["Id"], "Timestamps": stamps, "Values": [row * 10.0 + m] * 24})
+        return {"MetricDataResults": results}
+
+
+# A --record file: i-idle barely moves, i-busy runs hot; the last two hours of i-busy have no datapoints.
+RECORDED = {
+    "preset": "ec2", "ids": ["i-busy", "i-idle"], "start": START, "periods": 24, "period": 3600,
+    "responses": [{"MetricDataResults": [
+        {"Id": "q0_0", "Timestamps": [START + h * 3600 for h in range(22)], "Values": [60.0] * 22},
+        {"Id": "q0_1", "Timestamps": [START + h * 3600 for h in range(22)], "Values": [90.0] * 22},
+        {"Id": "q0_2", "Timestamps": [START + h * 3600 for h in range(22)], "Values": [2e7] * 22},
+        {"Id": "q1_0", "Timestamps": [START + h * 3600 for h in range(24)], "Values": [1.0] * 23 + [8.0]},
+        {"Id": "q1_1", "Timestamps": [START + h * 3600 for h in range(24)], "Values": [3.0] * 24},
+        {"Id": "q1_2", "Timestamps": [START + h * 3600 for h in range(24)], "Values": [1e5] * 24},
+        {"Id": "q1_3", "Timestamps": [START + h * 3600 for h in range(24)], "Values": [1e5] * 24},
+    ]}],
+}
+
+
+def test_build_queries_ids_map_rows_and_metrics():
+    preset = cw_metrics.PRESETS["rds"]
+    queries = cw_metrics.build_queries(preset, ["db-a", "db-b"])
+    assert [q["Id"] for q in queries] == ["q0_0", "q0_1", "q0_2", "q1_0", "q1_1", "q1_2"]
+    stat = queries[4]["MetricStat"]
+    assert stat["Metric"]["Dimensions"] == [{"Name": "DBInstanceIdentifier", "Value": "db-b"}]
+    assert (stat["Metric"]["MetricName"], stat["Stat"]) == ("CPUUtilization", "Maximum")
+
+
+def test_fetch_batches_500_queries_and_fills_each_cell(aws_state):
+    backend = MetricsBackend()
+    aws_state.set_backend(backend)
+    ids = [f"i-{n:03d}" for n in range(130)]  # 130 x 4 metrics = 520 queries
+    mset = cw_metrics.fetch("us-east-1", cw_metrics.PRESETS["ec2"], ids, days=1, end=END, max_workers=2)
+    assert sorted(backend.batches) == [20, cw_metrics.MAX_QUERIES]
+    assert mset.periods == 24
+    for row in (0, 77, 129):
+        for m, key in enumerate(("cpu", "cpuMax", "netIn", "netOut")):
+            assert list(map(float, mset.data[key][row])) == [row * 10.0 + m] * 24
+
+
+@pytest.fixture(params=["numpy", "stdlib"])
+def array_mode(request, monkeypatch):
+    if request.param == "stdlib":
+        monkeypatch.setattr(cw_metrics, "np", None)
+    elif cw_metrics.np is None:
+        pytest.skip("numpy not installed")
+    return request.param
+
+
+def test_replay_scores_a_recorded_fixture(tmp_path, array_mode):
+    path = tmp_path / "ec2_metrics.json"
+    path.write_text(json.dumps(RECORDED))
+    mset = cw_metrics.replay(str(path))
+    scores = {s["id"]: s for s in cw_metrics.idle_scores(mset, cpu_p95=10.0)}
+    idle, busy = scores["i-idle"], scores["i-busy"]
+    assert idle["idle"] and not busy["idle"]
+    assert idle["activeHourFraction"] == pytest.approx(1 / 24, abs=1e-4)  # the one 8% hour
+    assert idle["cpuMax"] == 3.0 and idle["coverage"] == 1.0
+    assert busy["coverage"] == pytest.approx(22 / 24, abs=1e-3)
+    assert busy["activeHourFraction"] == 1.0 and busy["cpuP95"] == 60.0
+    assert busy["netInMBPerDay"] == pytest.approx(22 * 20.0)
+    assert "netOutMBPerDay" in busy and busy["netOutMBPerDay"] == 0.0
+
+
+def test_record_then_replay_round_trips(aws_state, tmp_path):
+    aws_state.set_backend(MetricsBackend())
+    path = str(tmp_path / "rds.json")
+    live = cw_metrics.fetch("us-east-1", cw_metrics.PRESETS["rds"], ["db-a", "db-b"], days=1, end=END, record=path)
+    replayed = cw_metrics.replay(path)
+    assert (replayed.ids, replayed.start, replayed.periods) == (live.ids, live.start, live.periods)
+    assert cw_metrics.idle_scores(replayed) == cw_metrics.idle_scores(live)
+
+
+def test_fetch_error_keeps_the_aws_message():
+    error = RuntimeError("Command failed: aws cloudwatch get-metric-data --metric-data-queries '[...]'\n"
+                         "An error occurred (AccessDenied) when calling the GetMetricData operation: denied\n")
+    assert cw_metrics.fetch_error(error).startswith("An error occurred (AccessDenied)")
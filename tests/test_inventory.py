@@ -0,0 +1,60 @@
+"""Process-wide inventory sharing must stay per account when collectors fan out with aws_env."""
+from __future__ import annotations
+
+import json
+
+import pytest
+
+import inventory
+
+REGION = "us-east-1"
+
+
+class AccountsBackend:
+    """describe-instances answers with one instance per account, picked by the caller's access key."""
+
+    name = "fake"
+
+    def __init__(self) -> None:
+        self.calls = []
+
+    def call(self, cmd, env=None):
+        key = (env or {}).get("AWS_ACCESS_KEY_ID", "ambient")
+        self.calls.append(key)
+        return {"Reservations": [{"Instances": [{"InstanceId": f"i-{key}", "InstanceType": "m5.large"}]}]}
+
+
+@pytest.fixture
+def backend(aws_state, monkeypatch):
+    monkeypatch.setattr(inventory, "_LOADED", {})
+    monkeypatch.setattr(inventory, "_FILLS", {})
+    fake = AccountsBackend()
+    aws_state.set_backend(fake)
+    return fake
+
+
+def _instances(path=None):
+    return [i["InstanceId"] for i in inventory.resources(path, "ec2:instance", REGION)]
+
+
+def test_each_account_gets_its_own_inventory(aws_state, backend):
+    with aws_state.aws_env({"AWS_ACCESS_KEY_ID": "222222222222"}):
+        assert _instances() == ["i-222222222222"]
+    with aws_state.aws_env({"AWS_ACCESS_KEY_ID": "333333333333"}):
+        assert _instances() == ["i-333333333333"]
+    # Still shared within one account: no second describe for a repeat lookup.
+    with aws_state.aws_env({"AWS_ACCESS_KEY_ID": "222222222222"}):
+        assert _instances() == ["i-222222222222"]
+    assert backend.calls == ["222222222222", "333333333333"]
+
+
+def test_snapshot_file_only_serves_ambient_credentials(aws_state, backend, tmp_path):
+    snap = inventory.Inventory()
+    snap.add(inventory._record("ec2:instance", REGION, {"InstanceId": "i-from-file"}))
+    snap.coverage[REGION] = {"ec2:instance"}
+    path = tmp_path / "inventory.json"
+    path.write_text(json.dumps(snap.to_doc()))
+    assert _instances(str(path)) == ["i-from-file"]
+    with aws_state.aws_env({"AWS_ACCESS_KEY_ID": "333333333333"}):
+        assert _instances(str(path)) == ["i-333333333333"]
+    assert backend.calls == ["333333333333"]
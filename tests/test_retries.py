@@ -0,0 +1,133 @@
+"""shell_json retries, throttle accounting and adaptive rate limiting against deterministic fake backends."""
+from __future__ import annotations
+
+import os
+import stat
+import sys
+import textwrap
+
+import pytest
+
+import common
+
+CMD = ["aws", "--output", "json", "ec2", "describe-volumes", "--region", "us-east-1"]
+THROTTLED = ("An error occurred (ThrottlingException) when calling the DescribeVolumes operation "
+             "(reached max retries: 0): Rate exceeded")
+DENIED = "An error occurred (UnauthorizedOperation) when calling the DescribeVolumes operation: not authorized"
+
+
+class FlakyBackend:
+    """Fails with `error` the first `failures` calls, then returns `result`."""
+
+    name = "fake"
+
+    def __init__(self, failures: int, error: str = THROTTLED, result=None) -> None:
+        self.failures, self.error, self.result, self.calls = failures, error, result or {"Volumes": []}, 0
+
+    def call(self, cmd, env=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError(f"Command failed: {' '.join(cmd)}\n{self.error}")
+        return self.result
+
+
+def test_classify_error(aws_state):
+    assert aws_state.classify_error(RuntimeError(THROTTLED)) == "throttle"
+    assert aws_state.classify_error(RuntimeError("An error occurred (RequestLimitExceeded) when ...")) == "throttle"
+    assert aws_state.classify_error(RuntimeError("Read timeout on endpoint URL")) == "transient"
+    assert aws_state.classify_error(RuntimeError("An error occurred (ServiceUnavailable) when ...")) == "transient"
+    assert aws_state.classify_error(RuntimeError(DENIED)) == "fatal"
+
+
+def test_throttled_calls_are_retried_and_counted(aws_state):
+    backend = FlakyBackend(failures=3)
+    aws_state.set_backend(backend)
+    assert aws_state.shell_json(CMD) == {"Volumes": []}
+    assert backend.calls == 4
+    totals = aws_state.STATS.snapshot()
+    assert (totals["calls"], totals["retries"], totals["throttles"], totals["failures"]) == (4, 3, 3, 0)
+    # Backoff 0.01, 0.02, 0.04 (full jitter pinned to its upper bound) on top of any token wait.
+    assert totals["waitSeconds"] >= 0.07
+    assert totals["byService"]["ec2/us-east-1"]["throttles"] == 3
+
+
+def test_fatal_error_is_raised_without_retry(aws_state):
+    backend = FlakyBackend(failures=10, error=DENIED)
+    aws_state.set_backend(backend)
+    with pytest.raises(RuntimeError, match="UnauthorizedOperation"):
+        aws_state.shell_json(CMD)
+    assert backend.calls == 1
+    totals = aws_state.STATS.snapshot()
+    assert (totals["calls"], totals["retries"], totals["throttles"], totals["failures"]) == (1, 0, 0, 1)
+    assert aws_state.limiter_for("ec2", "us-east-1").rate == aws_state.RATE_LIMITS["ec2"]
+
+
+def test_retries_stop_at_max_attempts(aws_state):
+    backend = FlakyBackend(failures=10)
+    aws_state.set_backend(backend)
+    with pytest.raises(RuntimeError, match="ThrottlingException"):
+        aws_state.shell_json(CMD)
+    assert backend.calls == 4
+    totals = aws_state.STATS.snapshot()
+    assert (totals["calls"], totals["retries"], totals["throttles"], totals["failures"]) == (4, 3, 4, 1)
+
+
+def test_transient_errors_retry_without_slowing_down(aws_state):
+    aws_state.set_backend(FlakyBackend(failures=2, error="Could not connect to the endpoint URL"))
+    aws_state.shell_json(CMD)
+    totals = aws_state.STATS.snapshot()
+    assert (totals["retries"], totals["throttles"]) == (2, 0)
+    assert aws_state.limiter_for("ec2", "us-east-1").rate == aws_state.RATE_LIMITS["ec2"]
+
+
+def test_throttles_halve_the_rate_and_successes_recover_it(aws_state):
+    base = aws_state.RATE_LIMITS["ec2"]
+    aws_state.set_backend(FlakyBackend(failures=3))
+    aws_state.shell_json(CMD)
+    bucket = aws_state.limiter_for("ec2", "us-east-1")
+    # Three throttles: base / 8, then the final success wins back 5% of base.
+    assert bucket.rate == pytest.approx(base / 8 + base * 0.05)
+    for _ in range(20):
+        bucket.succeeded()
+    assert bucket.rate == base
+
+
+def test_rate_never_drops_below_floor():
+    bucket = common.TokenBucket(1.0, floor=0.2)
+    for _ in range(10):
+        bucket.throttled()
+    assert bucket.rate == 0.2
+
+
+def test_token_bucket_waits_once_the_burst_is_spent():
+    bucket = common.TokenBucket(50.0, burst=1.0)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(0.02, abs=0.015)
+
+
+def test_stub_aws_cli_on_path_throttles_then_succeeds(aws_state, tmp_path, monkeypatch):
+    """The subprocess backend against a fake `aws` that answers ThrottlingException twice, then JSON."""
+    counter = tmp_path / "calls"
+    script = tmp_path / "aws"
+    script.write_text(textwrap.dedent(f"""\
+        #!{sys.executable}
+        import json, sys
+        path = {str(counter)!r}
+        try:
+            n = int(open(path).read())
+        except OSError:
+            n = 0
+        open(path, "w").write(str(n + 1))
+        if n < 2:
+            sys.stderr.write({THROTTLED!r} + "\\n")
+            sys.exit(255)
+        print(json.dumps({{"Volumes": [{{"VolumeId": "vol-1"}}]}}))
+    """))
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ.get('PATH', '')}")
+    aws_state.set_backend("subprocess")
+    assert aws_state.shell_json(CMD) == {"Volumes": [{"VolumeId": "vol-1"}]}
+    assert counter.read_text() == "3"
+    totals = aws_state.STATS.snapshot()
+    assert (totals["calls"], totals["retries"], totals["throttles"], totals["failures"]) == (3, 2, 2, 0)
+    assert aws_state.limiter_for("ec2", "us-east-1").rate < aws_state.RATE_LIMITS["ec2"]